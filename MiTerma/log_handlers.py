@@ -0,0 +1,93 @@
+"""
+Handlers y formatters de logging del proyecto.
+
+QueueListenerHandler desacopla la escritura de logs del request: el hilo que
+loguea solo encola el registro y un QueueListener en segundo plano lo formatea
+y lo escribe en el stream de salida.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+VERBOSE_FORMAT = '{levelname} {asctime} {module} {process:d} {thread:d} {message}'
+
+
+class JSONFormatter(logging.Formatter):
+    """Formatea cada registro como un objeto JSON en una sola línea."""
+
+    def format(self, record):
+        datos = {
+            'timestamp': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            datos['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            datos['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Handler no bloqueante: encola los registros y un QueueListener propio
+    los escribe desde un hilo de fondo.
+
+    Args:
+        json_format: Si es True, escribe JSON por línea; si no, formato verbose
+        stream: Stream de destino (por defecto sys.stderr)
+    """
+
+    def __init__(self, json_format=False, stream=None):
+        # SimpleQueue (implementada en C) es la cola más barata para el productor
+        super().__init__(queue.SimpleQueue())
+
+        destino = logging.StreamHandler(stream or sys.stderr)
+        if json_format:
+            destino.setFormatter(JSONFormatter())
+        else:
+            destino.setFormatter(logging.Formatter(VERBOSE_FORMAT, style='{'))
+
+        self.listener = QueueListener(self.queue, destino, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self._detener_listener)
+
+        # Los hilos no sobreviven a un fork (p. ej. gunicorn --preload):
+        # el proceso hijo necesita su propio hilo listener
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reiniciar_listener)
+
+    def _reiniciar_listener(self):
+        # Solo si el handler seguía activo en el proceso padre
+        if self.listener._thread is not None:
+            self.listener._thread = None
+            self.listener.start()
+
+    def _detener_listener(self):
+        # stop() vacía la cola antes de terminar; es idempotente aquí
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        """
+        Fija el mensaje en el hilo que loguea (los args podrían mutar) y deja
+        el formateo completo, incluidas las excepciones, al hilo listener.
+
+        Este handler es el último de la cadena de propagación, así que no hace
+        falta copiar el registro antes de modificarlo.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def close(self):
+        self._detener_listener()
+        super().close()
@@ -177,6 +177,8 @@ def get_or_create_qr_key():
 QR_ENCRYPTION_KEY = get_or_create_qr_key()
 
 MIDDLEWARE = [
+    # Mide duración y tiempo SQL por vista (expuesto en /metrics)
+    'core.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -212,7 +214,10 @@ SESSION_TIMEOUT_MINUTES = 60
 
 # Configuración de sesiones más segura
 SESSION_COOKIE_AGE = 3600  # 1 hora
-SESSION_SAVE_EVERY_REQUEST = True
+# No guardar la sesión en cada request: CleanRequestMiddleware renueva la
+# expiración como máximo una vez cada SESSION_REFRESH_INTERVAL_MINUTES
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL_MINUTES = config('SESSION_REFRESH_INTERVAL_MINUTES', default=5, cast=int)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_COOKIE_HTTPONLY = True
 
@@ -316,65 +321,52 @@ LOGOUT_REDIRECT_URL = '/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Logging configuration
+# Un único handler (en el logger raíz) recibe cada registro una sola vez: los
+# loggers de las apps solo definen su nivel y propagan. El handler encola los
+# registros y un hilo de fondo los formatea y escribe, sin bloquear el request.
+LOG_LEVEL = config('LOG_LEVEL', default='DEBUG' if DEBUG else 'INFO')
+DJANGO_LOG_LEVEL = config('DJANGO_LOG_LEVEL', default='INFO')
+LOG_FORMAT = config('LOG_FORMAT', default='text')  # 'text' o 'json'
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
-            'style': '{',
-        },
-        'simple': {
-            'format': '{levelname} {message}',
-            'style': '{',
-        },
-    },
     'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+        'queue': {
+            'class': 'MiTerma.log_handlers.QueueListenerHandler',
+            'json_format': LOG_FORMAT == 'json',
         },
     },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'WARNING',
+    },
     'loggers': {
         'django': {
-            'handlers': ['console'],
-            'level': 'INFO',
+            'handlers': [],
+            'level': DJANGO_LOG_LEVEL,
             'propagate': True,
         },
         'ventas': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'level': LOG_LEVEL,
         },
         'security': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'level': LOG_LEVEL,
         },
         'usuarios': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
-        },
-        'usuarios.views': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'level': LOG_LEVEL,
         },
         'termas': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'level': LOG_LEVEL,
         },
-        'termas.views': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+        'entradas': {
+            'level': LOG_LEVEL,
         },
-        'termas.email_utils': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
-            'propagate': True,
+        'core': {
+            'level': LOG_LEVEL,
+        },
+        'cache': {
+            'level': LOG_LEVEL,
         },
     },
 }
@@ -399,21 +391,63 @@ MERCADOPAGO_CLIENT_ID = config('MERCADOPAGO_CLIENT_ID_TEST', default='')
 MERCADOPAGO_CLIENT_SECRET = config('MERCADOPAGO_CLIENT_SECRET_TEST', default='')
 MERCADOPAGO_REDIRECT_URI = config('MERCADOPAGO_REDIRECT_URI', default='')
 
-# Configuración de Cache - Usando LocMemCache con timeouts cortos para evitar problemas
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'miterma-cache',
-        'TIMEOUT': 60,  # 1 minuto por defecto
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,  # Limitar entradas para evitar crecimiento
-            'CULL_FREQUENCY': 3,  # Limpiar cada 3 accesos cuando se llena
+# Ciclo de pago a termas: cada terma recibe como máximo un pago (que agrupa
+# todas sus distribuciones procesadas) por cada intervalo de estas horas.
+CICLO_PAGO_TERMAS_HORAS = config('CICLO_PAGO_TERMAS_HORAS', default=24, cast=int)
+
+# Reserva de una compra pendiente: mientras no pase este tiempo desde
+# fecha_compra sus entradas cuentan contra la disponibilidad del día; después
+# dejan de contar aunque nadie la haya cancelado todavía.
+RESERVA_COMPRA_PENDIENTE_MINUTOS = config('RESERVA_COMPRA_PENDIENTE_MINUTOS', default=60, cast=int)
+
+# Configuración de Cache
+# CACHE_BACKEND=redis usa un cache compartido entre todos los workers/procesos
+# (necesario para rate limiting e invalidación consistentes en producción).
+# CACHE_BACKEND=locmem (por defecto) es un cache local por proceso, útil en
+# desarrollo y tests.
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/1')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'TIMEOUT': 60,  # 1 minuto por defecto
+            'KEY_PREFIX': 'miterma',
         }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'miterma-cache',
+            'TIMEOUT': 60,  # 1 minuto por defecto
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,  # Limitar entradas para evitar crecimiento
+                'CULL_FREQUENCY': 3,  # Limpiar cada 3 accesos cuando se llena
+            }
+        }
+    }
+
+# Motor de sesiones: cached_db lee desde el cache y solo escribe en la BD cuando
+# la sesión cambia. Requiere un cache compartido; con locmem por proceso se usa
+# el backend de BD para que un logout sea visible en todos los workers.
+# También puede usarse 'django.contrib.sessions.backends.signed_cookies'.
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default=(
+        'django.contrib.sessions.backends.cached_db'
+        if CACHE_BACKEND == 'redis'
+        else 'django.contrib.sessions.backends.db'
+    ),
+)
 
 # Auto-limpieza de cache cada cierto tiempo
 CACHE_AUTO_CLEAN = {
     'enabled': True,
     'interval': 300,  # 5 minutos
-}  
\ No newline at end of file
+}  
+# Token para que un recolector local lea /metrics sin sesión
+# (header 'Authorization: Bearer <token>'). Vacío = solo administradores.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
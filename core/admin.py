@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import EjecucionTarea
+
+
+@admin.register(EjecucionTarea)
+class EjecucionTareaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'proxima_ejecucion', 'ultima_ejecucion', 'ultima_duracion', 'ejecuciones', 'fallos')
+    readonly_fields = ('ultima_ejecucion', 'ultima_duracion', 'ultimo_error', 'ejecuciones', 'fallos', 'duracion_total')
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        """Conecta los signals que invalidan los KPIs de la plataforma"""
+        from . import kpis
+        kpis.conectar_signals()
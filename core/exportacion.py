@@ -0,0 +1,67 @@
+"""
+Respuestas de exportación con memoria acotada.
+
+Los CSV se generan fila a fila con StreamingHttpResponse, y los XLSX se
+escriben con openpyxl en modo write-only a un archivo temporal que luego se
+envía por bloques con FileResponse. En ambos casos la memoria del worker no
+crece con la cantidad de filas.
+"""
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+
+# Filas leídas por viaje a la BD en los exports
+CHUNK_SIZE_EXPORTACION = 2000
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: retorna la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def respuesta_csv_streaming(nombre_archivo, encabezados, filas):
+    """
+    Crea una respuesta CSV que se genera a medida que se envía.
+
+    Args:
+        nombre_archivo: Nombre sugerido para la descarga
+        encabezados: Lista con la fila de encabezados
+        filas: Iterable (idealmente un generador) de filas
+    """
+    writer = csv.writer(_Eco())
+
+    def generar():
+        yield '\ufeff'  # BOM para UTF-8 (Excel)
+        yield writer.writerow(encabezados)
+        for fila in filas:
+            yield writer.writerow(fila)
+
+    response = StreamingHttpResponse(generar(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+    return response
+
+
+def respuesta_xlsx(workbook, nombre_archivo):
+    """
+    Guarda un workbook (en modo write-only) en un archivo temporal y lo envía
+    por bloques.
+
+    Args:
+        workbook: openpyxl.Workbook creado con write_only=True
+        nombre_archivo: Nombre sugerido para la descarga
+    """
+    # FileResponse cierra (y por lo tanto elimina) el temporal al terminar
+    archivo = tempfile.TemporaryFile()
+    workbook.save(archivo)
+    archivo.seek(0)
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=nombre_archivo,
+        content_type=CONTENT_TYPE_XLSX,
+    )
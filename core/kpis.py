@@ -0,0 +1,135 @@
+"""
+KPIs globales de la plataforma para los paneles del administrador general.
+
+Cada sección (usuarios, termas, distribuciones) se calcula con una sola
+consulta de agregación condicional sobre su tabla y se guarda en cache por
+separado. Los signals de cada modelo invalidan solo su sección (al confirmar
+la transacción), así que la siguiente lectura recalcula una consulta y el
+resto sale del cache.
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Los signals invalidan al instante; el TTL acota lo que no pasa por signals
+# (bulk_create, update()).
+TTL_KPIS = 120
+
+PREFIJO_CACHE = 'kpis_plataforma'
+
+
+def _kpis_usuarios():
+    from usuarios.models import Usuario
+    return Usuario.objects.aggregate(
+        total_usuarios=Count('id'),
+        usuarios_activos=Count('id', filter=Q(estado=True)),
+        usuarios_inactivos=Count('id', filter=Q(estado=False)),
+        admins_terma=Count('id', filter=Q(rol__nombre='administrador_terma')),
+        clientes=Count('id', filter=Q(rol__nombre='cliente')),
+    )
+
+
+def _kpis_termas():
+    from termas.models import Terma
+    primer_dia_mes = timezone.localdate().replace(day=1)
+    return Terma.objects.aggregate(
+        total_termas=Count('id'),
+        termas_activas=Count('id', filter=Q(estado_suscripcion='activa')),
+        termas_inactivas=Count('id', filter=Q(estado_suscripcion='inactiva')),
+        termas_mes=Count('id', filter=Q(fecha_suscripcion__gte=primer_dia_mes)),
+    )
+
+
+def _kpis_distribuciones():
+    from ventas.models import DistribucionPago
+    return DistribucionPago.objects.aggregate(
+        total_ventas=Sum('monto_total'),
+        total_comisiones=Sum('monto_comision_plataforma'),
+        total_pagado_termas=Sum('monto_para_terma'),
+        total_transacciones=Count('id'),
+    )
+
+
+# sección -> función que la calcula
+SECCIONES = {
+    'usuarios': _kpis_usuarios,
+    'termas': _kpis_termas,
+    'distribuciones': _kpis_distribuciones,
+}
+
+
+def _clave(seccion):
+    return f'{PREFIJO_CACHE}:{seccion}'
+
+
+def obtener_kpis(*secciones):
+    """
+    Retorna las secciones pedidas (todas si no se indica ninguna) desde el
+    cache, calculando solo las que falten.
+
+    Args:
+        *secciones: Nombres de SECCIONES ('usuarios', 'termas', 'distribuciones')
+
+    Returns:
+        dict: {seccion: {kpi: valor}}
+    """
+    secciones = secciones or tuple(SECCIONES)
+    en_cache = cache.get_many([_clave(s) for s in secciones])
+
+    kpis = {}
+    faltantes = {}
+    for seccion in secciones:
+        valor = en_cache.get(_clave(seccion))
+        if valor is None:
+            valor = SECCIONES[seccion]()
+            faltantes[_clave(seccion)] = valor
+        kpis[seccion] = valor
+
+    if faltantes:
+        cache.set_many(faltantes, TTL_KPIS)
+    return kpis
+
+
+def invalidar_kpis(*secciones):
+    """
+    Descarta del cache las secciones indicadas cuando se confirme la
+    transacción actual.
+
+    Args:
+        *secciones: Nombres de SECCIONES
+    """
+    claves = [_clave(s) for s in secciones]
+    transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+# sección -> (modelo 'app.Modelo', campos que afectan sus KPIs)
+CAMPOS_POR_SECCION = {
+    'usuarios': ('usuarios.Usuario', {'estado', 'rol'}),
+    'termas': ('termas.Terma', {'estado_suscripcion', 'fecha_suscripcion'}),
+    'distribuciones': ('ventas.DistribucionPago', {'monto_total', 'monto_comision_plataforma', 'monto_para_terma'}),
+}
+
+
+def conectar_signals():
+    """Conecta los signals que invalidan cada sección al cambiar su tabla."""
+    from django.apps import apps
+    from django.db.models.signals import post_delete, post_save
+
+    for seccion, (modelo, campos) in CAMPOS_POR_SECCION.items():
+        def al_guardar(sender, update_fields=None, seccion=seccion, campos=campos, **kwargs):
+            # Guardados parciales que no tocan los KPIs (p. ej. last_login)
+            if update_fields and not campos.intersection(update_fields):
+                return
+            invalidar_kpis(seccion)
+
+        def al_eliminar(sender, seccion=seccion, **kwargs):
+            invalidar_kpis(seccion)
+
+        modelo = apps.get_model(modelo)
+        post_save.connect(al_guardar, sender=modelo, weak=False, dispatch_uid=f'kpis_guardar_{seccion}')
+        post_delete.connect(al_eliminar, sender=modelo, weak=False, dispatch_uid=f'kpis_eliminar_{seccion}')
@@ -0,0 +1,99 @@
+"""
+Comando de larga duración que ejecuta las tareas periódicas de core/programador.py.
+
+Reemplaza las tareas programadas del sistema operativo: basta con dejarlo
+corriendo (p. ej. como servicio de systemd) en uno o más nodos; solo el que
+tiene el lock de líder ejecuta tareas y los demás quedan de respaldo.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import EjecucionTarea
+from core.programador import TAREAS, Liderazgo, Programador
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta en un solo proceso las tareas periódicas (emails, limpiezas, pagos, reportes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=30.0,
+            help='Máximo de segundos entre revisiones de tareas vencidas (default: 30)'
+        )
+        parser.add_argument(
+            '--tareas',
+            nargs='+',
+            default=None,
+            help='Ejecutar solo estas tareas del registro (por nombre)'
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Ejecutar las tareas vencidas una vez y terminar'
+        )
+        parser.add_argument(
+            '--listar',
+            action='store_true',
+            help='Mostrar las tareas registradas con su estado y métricas, sin ejecutar nada'
+        )
+
+    def handle(self, *args, **options):
+        tareas = TAREAS
+        if options['tareas']:
+            desconocidas = set(options['tareas']) - {tarea.nombre for tarea in TAREAS}
+            if desconocidas:
+                raise CommandError(f"Tareas desconocidas: {', '.join(sorted(desconocidas))}")
+            tareas = [tarea for tarea in TAREAS if tarea.nombre in options['tareas']]
+
+        if options['listar']:
+            self.listar(tareas)
+            return
+
+        programador = Programador(tareas, stdout=self.stdout)
+        liderazgo = Liderazgo()
+        self.stdout.write(f"⏰ Programador iniciado con {len(tareas)} tareas")
+
+        es_lider = False
+        try:
+            while True:
+                if liderazgo.adquirir():
+                    if not es_lider:
+                        self.stdout.write(self.style.SUCCESS("👑 Este proceso es el líder del programador"))
+                        es_lider = True
+                    for nombre in programador.ejecutar_pendientes():
+                        self.stdout.write(f"   ▶️ {nombre}")
+                    espera = programador.segundos_hasta_proxima(options['intervalo'])
+                else:
+                    if es_lider or options['una_vez']:
+                        self.stdout.write(self.style.WARNING("⏸️ Otro proceso tiene el lock de líder"))
+                    es_lider = False
+                    espera = options['intervalo']
+
+                if options['una_vez']:
+                    break
+                time.sleep(espera)
+        except KeyboardInterrupt:
+            self.stdout.write("🛑 Programador detenido")
+        finally:
+            liderazgo.liberar()
+
+    def listar(self, tareas):
+        estados = EjecucionTarea.objects.in_bulk([tarea.nombre for tarea in tareas], field_name='nombre')
+        for tarea in tareas:
+            comando = ' '.join((tarea.comando,) + tarea.argumentos)
+            self.stdout.write(f"📋 {tarea.nombre}: {comando} ({tarea.frecuencia})")
+            estado = estados.get(tarea.nombre)
+            if estado is None or not estado.ejecuciones:
+                self.stdout.write("   Sin ejecuciones")
+                continue
+            self.stdout.write(
+                f"   Última: {estado.ultima_ejecucion:%d/%m/%Y %H:%M} ({estado.ultima_duracion:.2f}s) - "
+                f"Próxima: {estado.proxima_ejecucion:%d/%m/%Y %H:%M} - "
+                f"Ejecuciones: {estado.ejecuciones}, fallos: {estado.fallos}, "
+                f"promedio: {estado.duracion_promedio:.2f}s"
+            )
+            if estado.ultimo_error:
+                self.stdout.write(self.style.ERROR(f"   ❌ {estado.ultimo_error}"))
@@ -0,0 +1,183 @@
+"""
+Instrumentación liviana de rutas críticas.
+
+Cada proceso mantiene en memoria histogramas de duración por nombre de span
+(p. ej. 'generar_pdf_entrada') y por vista. Los percentiles se calculan sobre
+una ventana de las últimas muestras, y la vista /metrics los expone en
+formato de texto de Prometheus.
+
+Uso:
+    from core.metrics import span
+
+    @span('generar_qr')
+    def generar_qr(datos):
+        ...
+
+    with span('mercadopago_payment_get'):
+        payment_info = sdk.payment().get(payment_id)
+
+Los histogramas son por proceso: con varios workers cada scrape refleja solo
+el worker que atendió la petición.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator
+
+# Muestras recientes usadas para calcular percentiles en cada histograma
+TAMANO_VENTANA = 1024
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Familias de métricas: (nombre Prometheus, etiqueta, descripción)
+FAMILIAS = {
+    'span': (
+        'miterma_span_duration_seconds', 'span',
+        'Duración de operaciones instrumentadas en rutas críticas',
+    ),
+    'request': (
+        'miterma_request_duration_seconds', 'view',
+        'Duración total de la request por vista',
+    ),
+    'request_db': (
+        'miterma_request_db_seconds', 'view',
+        'Tiempo acumulado en consultas SQL por request y vista',
+    ),
+}
+
+
+class Histograma:
+    """
+    Acumula count/sum totales y una ventana de muestras recientes.
+
+    Es seguro entre hilos: observar() solo toma el lock para un append.
+    """
+
+    def __init__(self, tamano_ventana=TAMANO_VENTANA):
+        self._lock = threading.Lock()
+        self._muestras = deque(maxlen=tamano_ventana)
+        self.count = 0
+        self.sum = 0.0
+        self.errores = 0
+
+    def observar(self, segundos, error=False):
+        with self._lock:
+            self._muestras.append(segundos)
+            self.count += 1
+            self.sum += segundos
+            if error:
+                self.errores += 1
+
+    def snapshot(self):
+        """Retorna (count, sum, errores, {percentil: valor}) consistente."""
+        with self._lock:
+            muestras = sorted(self._muestras)
+            count, total, errores = self.count, self.sum, self.errores
+
+        percentiles = {}
+        if muestras:
+            for p in PERCENTILES:
+                # Rango más cercano sobre la ventana ordenada
+                indice = min(len(muestras) - 1, max(0, int(round(p * len(muestras))) - 1))
+                percentiles[p] = muestras[indice]
+        return count, total, errores, percentiles
+
+
+_registro = {}
+_registro_lock = threading.Lock()
+
+
+def obtener_histograma(familia, nombre):
+    """
+    Retorna (creándolo si hace falta) el histograma de una familia y nombre.
+
+    Args:
+        familia: Clave de FAMILIAS ('span', 'request', 'request_db')
+        nombre: Valor de la etiqueta (nombre del span o de la vista)
+    """
+    clave = (familia, nombre)
+    histograma = _registro.get(clave)
+    if histograma is None:
+        with _registro_lock:
+            histograma = _registro.setdefault(clave, Histograma())
+    return histograma
+
+
+def observar(familia, nombre, segundos, error=False):
+    """Registra una duración en el histograma correspondiente."""
+    obtener_histograma(familia, nombre).observar(segundos, error)
+
+
+def reiniciar():
+    """Elimina todos los histogramas del proceso (útil en tests)."""
+    with _registro_lock:
+        _registro.clear()
+
+
+class span(ContextDecorator):
+    """
+    Mide la duración de un bloque o función y la registra en la familia 'span'.
+
+    Funciona como context manager y como decorador. Las excepciones se
+    registran como error y se propagan sin cambios.
+
+    Args:
+        nombre: Nombre del span (etiqueta 'span' en /metrics)
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self._inicios = threading.local()
+
+    def __enter__(self):
+        # Pila por hilo: la misma instancia puede usarse de forma anidada o concurrente
+        pila = getattr(self._inicios, 'pila', None)
+        if pila is None:
+            pila = self._inicios.pila = []
+        pila.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        inicio = self._inicios.pila.pop()
+        observar('span', self.nombre, time.perf_counter() - inicio, error=exc_type is not None)
+        return False
+
+
+def _escapar_etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exportar_prometheus():
+    """
+    Retorna todas las métricas del proceso en formato de texto de Prometheus.
+
+    Cada familia se expone como summary (percentiles, _sum y _count) y los
+    errores de cada span como un contador aparte.
+    """
+    with _registro_lock:
+        items = sorted(_registro.items())
+
+    lineas = []
+    errores_por_span = []
+    for familia, (metrica, etiqueta, descripcion) in FAMILIAS.items():
+        series = [(nombre, h.snapshot()) for (fam, nombre), h in items if fam == familia]
+        if not series:
+            continue
+
+        lineas.append(f'# HELP {metrica} {descripcion}')
+        lineas.append(f'# TYPE {metrica} summary')
+        for nombre, (count, total, errores, percentiles) in series:
+            label = f'{etiqueta}="{_escapar_etiqueta(nombre)}"'
+            for p, valor in percentiles.items():
+                lineas.append(f'{metrica}{{{label},quantile="{p}"}} {valor:.6f}')
+            lineas.append(f'{metrica}_sum{{{label}}} {total:.6f}')
+            lineas.append(f'{metrica}_count{{{label}}} {count}')
+            if familia == 'span':
+                errores_por_span.append((label, errores))
+
+    if errores_por_span:
+        lineas.append('# HELP miterma_span_errors_total Spans terminados con excepción')
+        lineas.append('# TYPE miterma_span_errors_total counter')
+        for label, errores in errores_por_span:
+            lineas.append(f'miterma_span_errors_total{{{label}}} {errores}')
+
+    return '\n'.join(lineas) + '\n'
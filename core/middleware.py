@@ -0,0 +1,41 @@
+"""
+Middleware de medición de tiempos por request.
+"""
+import time
+
+from django.db import connection
+
+from .metrics import observar
+
+
+class RequestTimingMiddleware:
+    """
+    Registra la duración total de cada request y el tiempo acumulado en SQL,
+    agrupados por nombre de vista, en los histogramas de core.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tiempo_db = [0.0]
+
+        def medir_consulta(execute, sql, params, many, context):
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                tiempo_db[0] += time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(medir_consulta):
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        # Usar el nombre de la vista mantiene acotada la cantidad de series
+        match = getattr(request, 'resolver_match', None)
+        vista = match.view_name if match else 'sin_resolver'
+        observar('request', vista, duracion, error=response.status_code >= 500)
+        observar('request_db', vista, tiempo_db[0])
+
+        return response
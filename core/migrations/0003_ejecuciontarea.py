@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0002_delete_ciudad_delete_region'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EjecucionTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('proxima_ejecucion', models.DateTimeField(blank=True, null=True)),
+                ('ultima_ejecucion', models.DateTimeField(blank=True, null=True)),
+                ('ultima_duracion', models.FloatField(blank=True, help_text='Segundos', null=True)),
+                ('ultimo_error', models.TextField(blank=True, null=True)),
+                ('ejecuciones', models.PositiveIntegerField(default=0)),
+                ('fallos', models.PositiveIntegerField(default=0)),
+                ('duracion_total', models.FloatField(default=0, help_text='Segundos acumulados')),
+            ],
+            options={
+                'verbose_name': 'Ejecución de Tarea',
+                'verbose_name_plural': 'Ejecuciones de Tareas',
+                'ordering': ['nombre'],
+            },
+        ),
+    ]
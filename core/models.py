@@ -1,3 +1,31 @@
 from django.db import models
 
 
+class EjecucionTarea(models.Model):
+    """
+    Estado persistente de una tarea periódica de core/programador.py.
+
+    Guarda cuándo toca la próxima ejecución (así, tras una caída, el
+    programador sabe qué tareas quedaron atrasadas) y las métricas acumuladas
+    de duración y fallos, visibles desde cualquier nodo.
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    proxima_ejecucion = models.DateTimeField(null=True, blank=True)
+    ultima_ejecucion = models.DateTimeField(null=True, blank=True)
+    ultima_duracion = models.FloatField(null=True, blank=True, help_text="Segundos")
+    ultimo_error = models.TextField(null=True, blank=True)
+    ejecuciones = models.PositiveIntegerField(default=0)
+    fallos = models.PositiveIntegerField(default=0)
+    duracion_total = models.FloatField(default=0, help_text="Segundos acumulados")
+
+    class Meta:
+        verbose_name = "Ejecución de Tarea"
+        verbose_name_plural = "Ejecuciones de Tareas"
+        ordering = ['nombre']
+
+    def __str__(self):
+        return f"{self.nombre} (próxima: {self.proxima_ejecucion})"
+
+    @property
+    def duracion_promedio(self):
+        return self.duracion_total / self.ejecuciones if self.ejecuciones else None
@@ -0,0 +1,253 @@
+"""
+Paginación por keyset (seek) para listados grandes.
+
+Paginator usa OFFSET, que obliga a la BD a recorrer y descartar todas las
+filas anteriores (las páginas profundas son cada vez más lentas), y además
+ejecuta un COUNT(*) sobre el filtro completo en cada página. Aquí cada página
+continúa desde la clave de la última fila mostrada, p. ej.
+WHERE (fecha_calculo, id) < (:fecha, :id), y el índice llega directo.
+
+Uso en una vista:
+
+    pagina = paginar_keyset(request, queryset, ('-fecha_calculo', '-id'), 20)
+
+La página se recorre como una lista y expone has_next/has_previous y las URLs
+url_siguiente/url_anterior/url_primera/url_ultima (conservan los demás
+parámetros GET).
+El último campo del orden debe ser único (normalmente el id).
+"""
+import base64
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+
+# Parámetro GET con el cursor de la página
+PARAMETRO_CURSOR = 'cursor'
+
+# Con conteo 'aproximado', bajo este estimado se cuenta exacto (es barato)
+UMBRAL_CONTEO_EXACTO = 10000
+
+
+class PaginaKeyset:
+    """Página de resultados de paginar_keyset()."""
+
+    def __init__(self, object_list, has_next, has_previous, urls, total=None, total_aproximado=False):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.url_siguiente, self.url_anterior, self.url_primera, self.url_ultima = urls
+        self.total = total
+        self.total_aproximado = total_aproximado
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+# =================== CURSORES ===================
+
+class _CodificadorCursor(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder recorta horas y fechas-hora a milisegundos: filas que
+    comparten milisegundo quedarían fuera del `< cursor`. Aquí se conservan
+    los microsegundos (y la zona horaria, que to_python() restituye).
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _codificar_cursor(direccion, valores):
+    contenido = json.dumps({'d': direccion, 'v': valores}, cls=_CodificadorCursor, separators=(',', ':'))
+    return base64.urlsafe_b64encode(contenido.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decodificar_cursor(cursor, campos):
+    """Retorna (dirección, valores) o None si el cursor no es válido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if datos['d'] not in ('s', 'a'):
+            return None
+        if datos['v'] is None:
+            # Cursor 'a' sin valores: la última página
+            return datos['d'], None
+        if len(datos['v']) != len(campos):
+            return None
+        valores = [
+            None if valor is None else campo.to_python(valor)
+            for campo, valor in zip(campos, datos['v'])
+        ]
+        return datos['d'], valores
+    except Exception:
+        return None
+
+
+# =================== CONSULTA ===================
+
+def _orden(claves, invertir):
+    """
+    ORDER BY de la clave. En campos que admiten NULL estos van al final del
+    avance (al inicio si se invierte); en los demás se deja el orden por
+    defecto para que coincida con los índices.
+    """
+    expresiones = []
+    for nombre, descendente, nulo in claves:
+        extremos = {}
+        if nulo:
+            extremos = {'nulls_first': True} if invertir else {'nulls_last': True}
+        if descendente != invertir:
+            expresiones.append(F(nombre).desc(**extremos))
+        else:
+            expresiones.append(F(nombre).asc(**extremos))
+    return expresiones
+
+
+def _filtro_seek(claves, valores, despues):
+    """
+    Condición para las filas estrictamente después (o antes) de `valores` en el
+    orden de avance, comparando la clave en forma lexicográfica.
+    """
+    condiciones = []
+    iguales = Q()
+    for (nombre, descendente, nulo), valor in zip(claves, valores):
+        if valor is None:
+            # Los NULL van al final del avance: después de ellos no hay nada
+            paso = None if despues else Q(**{f'{nombre}__isnull': False})
+            igual = Q(**{f'{nombre}__isnull': True})
+        else:
+            mayor = despues != descendente
+            paso = Q(**{f"{nombre}__{'gt' if mayor else 'lt'}": valor})
+            if despues and nulo:
+                paso |= Q(**{f'{nombre}__isnull': True})
+            igual = Q(**{nombre: valor})
+
+        if paso is not None:
+            condiciones.append(iguales & paso)
+        iguales &= igual
+
+    if not condiciones:
+        return Q(pk__in=[])
+    return reduce(operator.or_, condiciones)
+
+
+# =================== CONTEO ===================
+
+def _estimar_filas(queryset):
+    """Filas estimadas por el planificador de PostgreSQL (sin ejecutar la consulta)."""
+    conexion = connections[queryset.db]
+    if conexion.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with conexion.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def contar_filas(queryset, aproximado=True, umbral_exacto=UMBRAL_CONTEO_EXACTO):
+    """
+    Cuenta las filas de un queryset, usando las estadísticas de PostgreSQL
+    cuando el conjunto es grande.
+
+    Args:
+        queryset: QuerySet ya filtrado
+        aproximado: Si es True, usa el estimado del planificador cuando supera
+            el umbral (en otros motores siempre cuenta exacto)
+        umbral_exacto: Bajo este estimado se hace COUNT(*) exacto
+
+    Returns:
+        tuple: (total, es_aproximado)
+    """
+    if aproximado:
+        estimado = _estimar_filas(queryset)
+        if estimado is not None and estimado >= umbral_exacto:
+            return estimado, True
+    return queryset.count(), False
+
+
+# =================== PAGINACIÓN ===================
+
+def _url_con_cursor(request, cursor):
+    parametros = request.GET.copy()
+    parametros.pop(PARAMETRO_CURSOR, None)
+    parametros.pop('page', None)
+    if cursor:
+        parametros[PARAMETRO_CURSOR] = cursor
+    consulta = parametros.urlencode()
+    return f'?{consulta}' if consulta else '?'
+
+
+def paginar_keyset(request, queryset, orden, por_pagina, conteo=None):
+    """
+    Obtiene la página indicada por el parámetro GET 'cursor'.
+
+    Args:
+        request: HttpRequest (se leen y conservan sus parámetros GET)
+        queryset: QuerySet filtrado (su orden se reemplaza por `orden`)
+        orden: Campos del modelo, con '-' para descendente; el último debe
+            ser único, p. ej. ('-fecha_calculo', '-id')
+        por_pagina: Filas por página
+        conteo: None (sin total), 'exacto' o 'aproximado' (ver contar_filas)
+
+    Returns:
+        PaginaKeyset
+    """
+    campos = [queryset.model._meta.get_field(campo.lstrip('-')) for campo in orden]
+    claves = [
+        (campo.name, nombre.startswith('-'), campo.null)
+        for campo, nombre in zip(campos, orden)
+    ]
+
+    cursor = request.GET.get(PARAMETRO_CURSOR)
+    decodificado = _decodificar_cursor(cursor, campos) if cursor else None
+    direccion, valores = decodificado or ('s', None)
+    hacia_atras = direccion == 'a'
+
+    pagina = queryset
+    if valores is not None:
+        pagina = pagina.filter(_filtro_seek(claves, valores, despues=not hacia_atras))
+    filas = list(pagina.order_by(*_orden(claves, invertir=hacia_atras))[:por_pagina + 1])
+
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if hacia_atras:
+        filas.reverse()
+        has_previous, has_next = hay_mas, valores is not None
+    else:
+        has_previous, has_next = valores is not None, hay_mas
+
+    def clave_de(fila):
+        return [getattr(fila, campo.attname) for campo in campos]
+
+    url_primera = _url_con_cursor(request, None)
+    url_ultima = _url_con_cursor(request, _codificar_cursor('a', None))
+    url_siguiente = url_anterior = None
+    if has_next:
+        url_siguiente = _url_con_cursor(request, _codificar_cursor('s', clave_de(filas[-1]))) if filas else url_ultima
+    if has_previous:
+        url_anterior = _url_con_cursor(request, _codificar_cursor('a', clave_de(filas[0]))) if filas else url_primera
+    urls = (url_siguiente, url_anterior, url_primera, url_ultima)
+
+    total, total_aproximado = None, False
+    if conteo:
+        total, total_aproximado = contar_filas(queryset, aproximado=(conteo == 'aproximado'))
+
+    return PaginaKeyset(filas, has_next, has_previous, urls, total, total_aproximado)
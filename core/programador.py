@@ -0,0 +1,281 @@
+"""
+Programador de tareas periódicas dentro del proceso de Django.
+
+Reemplaza las tareas programadas del sistema operativo (cada una pagaba el
+arranque completo de Django): el comando run_scheduler queda corriendo y
+ejecuta los comandos de TAREAS con call_command según su intervalo o su
+expresión cron.
+
+- Un solo líder: cada nodo intenta tomar un lock consultivo de PostgreSQL en
+  una conexión propia; solo quien lo tiene ejecuta tareas. Si el líder muere,
+  su conexión se cierra, el lock se libera y otro nodo lo toma.
+- Ponerse al día: la próxima ejecución de cada tarea se guarda en
+  EjecucionTarea. Si el programador estuvo detenido, las tareas atrasadas se
+  ejecutan una sola vez al volver (no una por cada ejecución perdida).
+- Métricas: la duración de cada ejecución se registra como span
+  'tarea_<nombre>' en /metrics y, acumulada con los fallos, en EjecucionTarea.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import close_old_connections, connection, connections
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import span
+from .models import EjecucionTarea
+
+logger = logging.getLogger(__name__)
+
+# Clave del lock consultivo (pg_try_advisory_lock) que identifica al líder
+CLAVE_LOCK_PROGRAMADOR = 7_411_026
+
+
+class ExpresionCron:
+    """
+    Expresión cron de 5 campos (minuto hora día mes día_semana) en la hora
+    local de settings.TIME_ZONE. Acepta *, valores, rangos a-b, listas a,b y
+    pasos */n o a-b/n. En día_semana 0 es domingo.
+    """
+
+    RANGOS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expresion):
+        partes = expresion.split()
+        if len(partes) != 5:
+            raise ValueError(f"La expresión cron '{expresion}' debe tener 5 campos")
+        self.expresion = expresion
+        self.minutos, self.horas, self.dias, self.meses, self.dias_semana = (
+            self._campo(parte, minimo, maximo) for parte, (minimo, maximo) in zip(partes, self.RANGOS)
+        )
+        # Como en cron: si se restringen día y día_semana, basta que coincida uno
+        self._dia_libre = partes[2] == '*'
+        self._semana_libre = partes[4] == '*'
+
+    @staticmethod
+    def _campo(texto, minimo, maximo):
+        valores = set()
+        for parte in texto.split(','):
+            rango, _, paso = parte.partition('/')
+            paso = int(paso) if paso else 1
+            if rango == '*':
+                inicio, fin = minimo, maximo
+            elif '-' in rango:
+                inicio, fin = (int(valor) for valor in rango.split('-', 1))
+            else:
+                inicio = int(rango)
+                fin = maximo if paso > 1 else inicio
+            if paso < 1 or inicio < minimo or fin > maximo or inicio > fin:
+                raise ValueError(f"Campo cron fuera de rango: '{parte}'")
+            valores.update(range(inicio, fin + 1, paso))
+        return frozenset(valores)
+
+    def _coincide_dia(self, momento):
+        dia = momento.day in self.dias
+        semana = (momento.weekday() + 1) % 7 in self.dias_semana
+        if self._dia_libre:
+            return semana
+        if self._semana_libre:
+            return dia
+        return dia or semana
+
+    def siguiente(self, desde):
+        """
+        Primer minuto que cumple la expresión estrictamente después de `desde`.
+
+        Args:
+            desde: datetime aware
+        """
+        momento = timezone.localtime(desde).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limite = momento + timedelta(days=366 * 5)
+        while momento < limite:
+            if momento.month not in self.meses:
+                año, mes = divmod(momento.month, 12)
+                momento = momento.replace(year=momento.year + año, month=mes + 1, day=1, hour=0, minute=0)
+            elif not self._coincide_dia(momento):
+                momento = momento.replace(hour=0, minute=0) + timedelta(days=1)
+            elif momento.hour not in self.horas:
+                momento = momento.replace(minute=0) + timedelta(hours=1)
+            elif momento.minute not in self.minutos:
+                momento += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(momento)
+        raise ValueError(f"La expresión cron '{self.expresion}' nunca se cumple")
+
+
+class Tarea:
+    """
+    Entrada del registro: un comando de manage.py con sus argumentos y cada
+    cuánto ejecutarlo (`cada`, un timedelta, o `cron`, una expresión de 5 campos).
+    """
+
+    def __init__(self, nombre, comando, *argumentos, cada=None, cron=None):
+        if (cada is None) == (cron is None):
+            raise ImproperlyConfigured(f"La tarea '{nombre}' necesita 'cada' o 'cron' (solo uno)")
+        self.nombre = nombre
+        self.comando = comando
+        self.argumentos = argumentos
+        self.cada = cada
+        self.cron = ExpresionCron(cron) if cron else None
+
+    @property
+    def frecuencia(self):
+        return f"cada {self.cada}" if self.cada else f"cron '{self.cron.expresion}'"
+
+    def siguiente_ejecucion(self, desde):
+        if self.cada:
+            return desde + self.cada
+        return self.cron.siguiente(desde)
+
+    def ejecutar(self, stdout=None):
+        call_command(self.comando, *self.argumentos, stdout=stdout)
+
+
+# Registro de tareas periódicas (antes: tareas programadas de Windows)
+TAREAS = [
+    Tarea('emails_finalizacion', 'enviar_emails_finalizacion', cada=timedelta(minutes=10)),
+    # La disponibilidad ya ignora las reservas vencidas: esto solo repone cupos
+    Tarea('compras_vencidas', 'limpiar_compras_vencidas', cada=timedelta(minutes=15)),
+    Tarea('liquidar_compras', 'gestionar_distribuciones', '--procesar-pendientes', cada=timedelta(minutes=10)),
+    # ejecutar_ciclo_pagos ya respeta settings.CICLO_PAGO_TERMAS_HORAS por terma
+    Tarea('ciclo_pagos_termas', 'gestionar_distribuciones', '--simular-pagos', cron='0 * * * *'),
+    Tarea('reportes', 'procesar_reportes', cada=timedelta(minutes=1)),
+    Tarea('imagenes', 'procesar_imagenes', cada=timedelta(minutes=1)),
+    Tarea('purgar_reportes', 'procesar_reportes', '--purgar-dias', '30', '--limite', '0', cron='15 4 * * *'),
+    Tarea('limpiar_cache', 'limpiar_cache', '--sessions', cron='30 3 * * *'),
+    # Corrige desvíos de los agregados de calificaciones (borrados fuera del ORM, etc.)
+    Tarea('reconciliar_calificaciones', 'reconciliar_calificaciones', cron='45 3 * * *'),
+]
+
+
+class Liderazgo:
+    """
+    Lock consultivo de sesión (pg_try_advisory_lock) tomado en una conexión
+    aparte, para que cerrar las conexiones de las tareas no lo suelte.
+    Con otros motores no hay coordinación y el proceso siempre es líder.
+    """
+
+    def __init__(self, alias='default', clave=CLAVE_LOCK_PROGRAMADOR):
+        self.alias = alias
+        self.clave = clave
+        self._conexion = None
+
+    def adquirir(self):
+        """Retorna True si este proceso es (o acaba de volverse) el líder."""
+        if connections[self.alias].vendor != 'postgresql':
+            return True
+        if self._conexion is not None:
+            if self._conexion.is_usable():
+                return True
+            # Conexión perdida: el servidor ya soltó el lock
+            logger.warning("Programador: se perdió la conexión del lock de líder")
+            self.liberar()
+
+        conexion = connections.create_connection(self.alias)
+        with conexion.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [self.clave])
+            es_lider = cursor.fetchone()[0]
+        if es_lider:
+            self._conexion = conexion
+        else:
+            conexion.close()
+        return es_lider
+
+    def liberar(self):
+        if self._conexion is not None:
+            try:
+                self._conexion.close()
+            except Exception:
+                pass
+            self._conexion = None
+
+
+def _renovar_conexiones():
+    # Un proceso de larga vida no pasa por el ciclo de request que renueva las
+    # conexiones vencidas o rotas. Dentro de una transacción no se toca nada.
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
+class Programador:
+    """
+    Ejecuta las tareas vencidas del registro. El bucle de espera y el
+    liderazgo quedan en el comando run_scheduler.
+
+    Args:
+        tareas: Lista de Tarea (default: TAREAS)
+        stdout: Destino de la salida de los comandos
+    """
+
+    def __init__(self, tareas=None, stdout=None):
+        self.tareas = TAREAS if tareas is None else tareas
+        self.stdout = stdout
+
+    def _estados(self):
+        """{nombre: EjecucionTarea}, creando las filas que falten."""
+        nombres = [tarea.nombre for tarea in self.tareas]
+        estados = EjecucionTarea.objects.in_bulk(nombres, field_name='nombre')
+        faltantes = [EjecucionTarea(nombre=nombre) for nombre in nombres if nombre not in estados]
+        if faltantes:
+            EjecucionTarea.objects.bulk_create(faltantes, ignore_conflicts=True)
+            estados = EjecucionTarea.objects.in_bulk(nombres, field_name='nombre')
+        return estados
+
+    def ejecutar_pendientes(self, ahora=None):
+        """
+        Ejecuta una vez cada tarea cuya próxima ejecución ya pasó (o que nunca
+        se ha ejecutado) y agenda la siguiente a partir de ahora.
+
+        Returns:
+            list: Nombres de las tareas ejecutadas
+        """
+        ahora = ahora or timezone.now()
+        estados = self._estados()
+        ejecutadas = []
+        for tarea in self.tareas:
+            estado = estados[tarea.nombre]
+            if estado.proxima_ejecucion and estado.proxima_ejecucion > ahora:
+                continue
+            if estado.proxima_ejecucion and ahora - estado.proxima_ejecucion > (tarea.cada or timedelta(minutes=1)):
+                logger.info(f"Tarea {tarea.nombre} atrasada desde {estado.proxima_ejecucion}: se ejecuta ahora")
+            self._ejecutar(tarea)
+            ejecutadas.append(tarea.nombre)
+        return ejecutadas
+
+    def _ejecutar(self, tarea):
+        _renovar_conexiones()
+        inicio = timezone.now()
+        inicio_reloj = time.perf_counter()
+        error = None
+        try:
+            with span(f'tarea_{tarea.nombre}'):
+                tarea.ejecutar(stdout=self.stdout)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Tarea {tarea.nombre} falló")
+        segundos = time.perf_counter() - inicio_reloj
+        _renovar_conexiones()
+
+        EjecucionTarea.objects.filter(nombre=tarea.nombre).update(
+            proxima_ejecucion=tarea.siguiente_ejecucion(timezone.now()),
+            ultima_ejecucion=inicio,
+            ultima_duracion=segundos,
+            ultimo_error=error,
+            ejecuciones=F('ejecuciones') + 1,
+            fallos=F('fallos') + (1 if error else 0),
+            duracion_total=F('duracion_total') + segundos,
+        )
+        logger.info(f"Tarea {tarea.nombre} {'falló' if error else 'completada'} en {segundos:.2f}s")
+        return error is None
+
+    def segundos_hasta_proxima(self, maximo):
+        """Segundos hasta la próxima tarea vencida, acotado a `maximo`."""
+        proxima = EjecucionTarea.objects.filter(
+            nombre__in=[tarea.nombre for tarea in self.tareas]
+        ).order_by(F('proxima_ejecucion').asc(nulls_first=True)).values_list('proxima_ejecucion', flat=True).first()
+        if proxima is None:
+            return 0
+        return min(maximo, max(0.0, (proxima - timezone.now()).total_seconds()))
@@ -0,0 +1,60 @@
+// Reportes en segundo plano: los enlaces con data-reporte-url encolan el
+// reporte, consultan su estado cada pocos segundos y descargan el archivo al
+// terminar. Si algo falla, se usa el href original (exportación directa).
+(function () {
+  const INTERVALO_MS = 2000;
+
+  function consultarEstado(url, enlace, textoOriginal) {
+    fetch(url, { headers: { "X-Requested-With": "XMLHttpRequest" } })
+      .then((r) => r.json())
+      .then((datos) => {
+        if (datos.estado === "completado") {
+          enlace.innerHTML = textoOriginal;
+          enlace.classList.remove("opacity-60", "pointer-events-none");
+          window.location = datos.url_descarga;
+        } else if (datos.estado === "error") {
+          enlace.innerHTML = textoOriginal;
+          enlace.classList.remove("opacity-60", "pointer-events-none");
+          alert(datos.error || "No se pudo generar el reporte.");
+        } else {
+          setTimeout(() => consultarEstado(url, enlace, textoOriginal), INTERVALO_MS);
+        }
+      })
+      .catch(() => {
+        window.location = enlace.href;
+      });
+  }
+
+  document.addEventListener("click", function (evento) {
+    const enlace = evento.target.closest("[data-reporte-url]");
+    if (!enlace) return;
+    evento.preventDefault();
+
+    const datos = new FormData();
+    Object.entries(enlace.dataset).forEach(([clave, valor]) => {
+      // data-param-fecha-inicio -> fecha_inicio
+      if (clave.startsWith("param")) {
+        const nombre = clave.slice(5).replace(/[A-Z]/g, (l) => "_" + l.toLowerCase()).slice(1);
+        datos.append(nombre, valor);
+      }
+    });
+
+    const textoOriginal = enlace.innerHTML;
+    enlace.innerHTML = '<i class="fas fa-spinner fa-spin mr-2"></i>Generando...';
+    enlace.classList.add("opacity-60", "pointer-events-none");
+
+    fetch(enlace.dataset.reporteUrl, {
+      method: "POST",
+      body: datos,
+      headers: { "X-CSRFToken": enlace.dataset.csrf },
+    })
+      .then((r) => {
+        if (!r.ok) throw new Error("HTTP " + r.status);
+        return r.json();
+      })
+      .then((trabajo) => consultarEstado(trabajo.url_estado, enlace, textoOriginal))
+      .catch(() => {
+        window.location = enlace.href;
+      });
+  });
+})();
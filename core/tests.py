@@ -1,3 +1,262 @@
-from django.test import TestCase
+from datetime import date
 
-# Create your tests here.
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import metrics
+from .paginacion import contar_filas, paginar_keyset
+
+
+class MetricsTest(TestCase):
+    """Tests de los histogramas por proceso y del endpoint /metrics."""
+
+    def setUp(self):
+        metrics.reiniciar()
+
+    def test_percentiles_sobre_ventana(self):
+        histograma = metrics.Histograma()
+        for ms in range(1, 101):
+            histograma.observar(ms / 1000)
+
+        count, total, errores, percentiles = histograma.snapshot()
+
+        self.assertEqual(count, 100)
+        self.assertAlmostEqual(total, 5.05)
+        self.assertEqual(errores, 0)
+        self.assertAlmostEqual(percentiles[0.5], 0.050)
+        self.assertAlmostEqual(percentiles[0.95], 0.095)
+        self.assertAlmostEqual(percentiles[0.99], 0.099)
+
+    def test_span_registra_errores_y_propaga(self):
+        @metrics.span('operacion')
+        def falla():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            falla()
+        with metrics.span('operacion'):
+            pass
+
+        count, _, errores, _ = metrics.obtener_histograma('span', 'operacion').snapshot()
+        self.assertEqual((count, errores), (2, 1))
+
+    def test_endpoint_requiere_admin(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secreto')
+    def test_endpoint_formato_prometheus_con_token(self):
+        with metrics.span('generar_qr'):
+            pass
+        self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer otro')
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secreto')
+
+        self.assertEqual(response.status_code, 200)
+        contenido = response.content.decode()
+        self.assertIn('# TYPE miterma_span_duration_seconds summary', contenido)
+        self.assertIn('miterma_span_duration_seconds_count{span="generar_qr"} 1', contenido)
+        self.assertIn('miterma_span_errors_total{span="generar_qr"} 0', contenido)
+        # El intento rechazado quedó registrado por el middleware
+        self.assertIn('miterma_request_duration_seconds_count{view="core:metrics"}', contenido)
+
+    @override_settings(METRICS_TOKEN='secreto')
+    def test_endpoint_rechaza_token_no_ascii(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer señal')
+        self.assertEqual(response.status_code, 403)
+
+
+class PaginacionKeysetTest(TestCase):
+    """Paginación por keyset con claves repetidas y nulas."""
+
+    def setUp(self):
+        from termas.models import Terma
+
+        # Fechas repetidas y sin fecha: el id desempata
+        fechas = [date(2025, 1, 1), date(2025, 3, 1), None, date(2025, 3, 1), None, date(2024, 6, 1), date(2025, 3, 1)]
+        for i, fecha in enumerate(fechas):
+            Terma.objects.create(nombre_terma=f'Terma {i}', fecha_suscripcion=fecha)
+        self.queryset = Terma.objects.all()
+        self.esperado = list(
+            Terma.objects.order_by('-fecha_suscripcion', '-id').exclude(fecha_suscripcion=None).values_list('id', flat=True)
+        ) + list(Terma.objects.filter(fecha_suscripcion=None).order_by('-id').values_list('id', flat=True))
+
+    def pagina(self, url='?'):
+        request = RequestFactory().get('/termas/' + url)
+        return paginar_keyset(request, self.queryset, ('-fecha_suscripcion', '-id'), 3, conteo='exacto')
+
+    def test_recorre_hacia_adelante_y_atras(self):
+        vistos, pagina = [], self.pagina()
+        self.assertFalse(pagina.has_previous)
+        while True:
+            vistos += [terma.id for terma in pagina]
+            if not pagina.has_next:
+                break
+            pagina = self.pagina(pagina.url_siguiente)
+        self.assertEqual(vistos, self.esperado)
+        self.assertEqual(pagina.total, 7)
+
+        vistos, pagina = [], self.pagina(pagina.url_ultima)
+        self.assertFalse(pagina.has_next)
+        while True:
+            vistos = [terma.id for terma in pagina] + vistos
+            if not pagina.has_previous:
+                break
+            pagina = self.pagina(pagina.url_anterior)
+        self.assertEqual(vistos, self.esperado)
+
+    def test_conserva_filtros_e_ignora_cursor_invalido(self):
+        pagina = self.pagina('?estado=activa&cursor=basura')
+
+        self.assertEqual([terma.id for terma in pagina], self.esperado[:3])
+        self.assertIn('estado=activa', pagina.url_siguiente)
+
+    def test_conteo_aproximado_usa_estadisticas(self):
+        total, aproximado = contar_filas(self.queryset, umbral_exacto=0)
+        self.assertTrue(aproximado)
+        self.assertGreater(total, 0)
+        self.assertEqual(contar_filas(self.queryset), (7, False))
+
+    def test_fechas_hora_en_el_mismo_milisegundo(self):
+        from datetime import datetime, timezone as tz
+        from usuarios.models import Usuario
+
+        # Microsegundos distintos dentro del mismo milisegundo
+        base = datetime(2025, 5, 1, 12, 0, 0, 123000, tzinfo=tz.utc)
+        for i in range(6):
+            usuario = Usuario.objects.create_user(f'ms{i}@keyset.cl', 'Mili', f'Segundo {i}')
+            Usuario.objects.filter(pk=usuario.pk).update(fecha_registro=base.replace(microsecond=123000 + i * 100))
+        queryset = Usuario.objects.filter(email__endswith='@keyset.cl')
+        esperado = list(queryset.order_by('-fecha_registro', '-id').values_list('id', flat=True))
+
+        vistos, url = [], '?'
+        while url:
+            pagina = paginar_keyset(RequestFactory().get('/usuarios/' + url), queryset, ('-fecha_registro', '-id'), 2)
+            vistos += [usuario.id for usuario in pagina]
+            url = pagina.url_siguiente if pagina.has_next else None
+        self.assertEqual(vistos, esperado)
+
+
+class KpisPlataformaTest(TestCase):
+    """Snapshot de KPIs: una consulta por tabla e invalidación por sección."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from usuarios.models import Rol, Usuario
+
+        cache.clear()
+        self.rol_cliente = Rol.objects.create(nombre='cliente')
+        Usuario.objects.create_user('uno@kpi.cl', 'Uno', 'Cliente', rol=self.rol_cliente)
+
+    def test_snapshot_cacheado_e_invalidado_por_seccion(self):
+        from usuarios.models import Usuario
+        from .kpis import obtener_kpis
+
+        with self.assertNumQueries(3):
+            kpis = obtener_kpis()
+        self.assertEqual(kpis['usuarios']['clientes'], 1)
+        self.assertEqual(kpis['termas']['total_termas'], 0)
+
+        with self.assertNumQueries(0):
+            obtener_kpis()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.create_user('dos@kpi.cl', 'Dos', 'Cliente', rol=self.rol_cliente)
+
+        # Solo se recalcula la sección de usuarios
+        with self.assertNumQueries(1):
+            kpis = obtener_kpis()
+        self.assertEqual(kpis['usuarios']['total_usuarios'], 2)
+
+    def test_guardado_parcial_sin_kpis_no_invalida(self):
+        from django.utils import timezone
+        from usuarios.models import Usuario
+        from .kpis import obtener_kpis
+
+        obtener_kpis('usuarios')
+        usuario = Usuario.objects.get()
+        usuario.last_login = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            usuario.save(update_fields=['last_login'])
+
+        with self.assertNumQueries(0):
+            obtener_kpis('usuarios')
+
+
+class ProgramadorTareasTest(TestCase):
+    """Registro de tareas, expresiones cron, puesta al día y liderazgo."""
+
+    def _tarea(self, nombre, ejecuciones, falla=False, **frecuencia):
+        from django.core.management.base import BaseCommand
+
+        from .programador import Tarea
+
+        class Comando(BaseCommand):
+            def handle(self, *args, **options):
+                ejecuciones.append(nombre)
+                if falla:
+                    raise RuntimeError('sin conexión')
+
+        return Tarea(nombre, Comando(), **frecuencia)
+
+    def test_cron_siguiente_ejecucion(self):
+        from datetime import datetime
+
+        from django.utils import timezone
+
+        from .programador import ExpresionCron
+
+        desde = timezone.make_aware(datetime(2025, 3, 14, 10, 7))  # viernes
+        self.assertEqual(ExpresionCron('*/15 * * * *').siguiente(desde),
+                         timezone.make_aware(datetime(2025, 3, 14, 10, 15)))
+        self.assertEqual(ExpresionCron('30 3 * * *').siguiente(desde),
+                         timezone.make_aware(datetime(2025, 3, 15, 3, 30)))
+        self.assertEqual(ExpresionCron('0 9 * * 1-5').siguiente(desde),
+                         timezone.make_aware(datetime(2025, 3, 17, 9, 0)))
+        with self.assertRaises(ValueError):
+            ExpresionCron('61 * * * *')
+
+    def test_tareas_atrasadas_se_ejecutan_una_vez(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .models import EjecucionTarea
+        from .programador import Programador
+
+        ejecuciones = []
+        programador = Programador([
+            self._tarea('atrasada', ejecuciones, cada=timedelta(minutes=10)),
+            self._tarea('al_dia', ejecuciones, cada=timedelta(minutes=10)),
+            self._tarea('rota', ejecuciones, falla=True, cron='0 * * * *'),
+        ])
+        ahora = timezone.now()
+        EjecucionTarea.objects.create(nombre='atrasada', proxima_ejecucion=ahora - timedelta(hours=5))
+        EjecucionTarea.objects.create(nombre='al_dia', proxima_ejecucion=ahora + timedelta(minutes=5))
+
+        with self.assertLogs('core.programador', 'ERROR'):
+            self.assertEqual(programador.ejecutar_pendientes(ahora), ['atrasada', 'rota'])
+        self.assertEqual(programador.ejecutar_pendientes(ahora), [])
+        self.assertEqual(ejecuciones, ['atrasada', 'rota'])
+
+        atrasada = EjecucionTarea.objects.get(nombre='atrasada')
+        self.assertEqual((atrasada.ejecuciones, atrasada.fallos), (1, 0))
+        self.assertGreater(atrasada.proxima_ejecucion, ahora + timedelta(minutes=9))
+        rota = EjecucionTarea.objects.get(nombre='rota')
+        self.assertEqual((rota.ejecuciones, rota.fallos), (1, 1))
+        self.assertIn('sin conexión', rota.ultimo_error)
+        count, _, errores, _ = metrics.obtener_histograma('span', 'tarea_rota').snapshot()
+        self.assertEqual((count, errores), (1, 1))
+
+    def test_un_solo_lider(self):
+        from .programador import Liderazgo
+
+        primero, segundo = Liderazgo(clave=424242), Liderazgo(clave=424242)
+        try:
+            self.assertTrue(primero.adquirir())
+            self.assertTrue(primero.adquirir())
+            self.assertFalse(segundo.adquirir())
+            primero.liberar()
+            self.assertTrue(segundo.adquirir())
+        finally:
+            primero.liberar()
+            segundo.liberar()
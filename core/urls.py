@@ -14,6 +14,9 @@ urlpatterns = [
     path('api/comunas/<int:region_id>/', views.get_comunas, name='get_comunas'),
     path('api/comunas-por-region/', views.obtener_comunas_por_region, name='obtener_comunas_por_region'),
     
+    # Métricas de rendimiento del proceso (formato Prometheus)
+    path('metrics', views.metrics, name='metrics'),
+    
     # Vistas de error personalizadas (para uso programático)
     path('error/', error_views.custom_error_page, name='custom_error'),
     
@@ -15,9 +15,11 @@ def mostrar_termas(request):
     calificacion_filtro = request.GET.get('calificacion')
     precio_filtro = request.GET.get('precio')
     
-    # Filtro por nombre (búsqueda parcial, insensible a mayúsculas)
+    # Filtro por texto (nombre, comuna, región o descripción; sin tildes y
+    # por prefijo), ordenado por relevancia
     if nombre_filtro:
-        termas_query = termas_query.filter(nombre_terma__icontains=nombre_filtro)
+        from termas.busqueda import filtrar_termas_por_texto
+        termas_query = filtrar_termas_por_texto(termas_query, nombre_filtro)
     
     # Filtro por comuna
     if comuna_filtro:
@@ -65,7 +67,6 @@ def mostrar_termas(request):
     termas_raw = termas_query.prefetch_related(
         'entradatipo_set',
         'imagenes',  
-        'calificacion_set',
         'comuna__region'
     ).distinct()
 
@@ -100,8 +101,7 @@ def home(request):
     # Obtener termas destacadas
     termas_destacadas = Terma.objects.prefetch_related(
         'entradatipo_set',
-        'imagenes',  
-        'calificacion_set'
+        'imagenes'
     ).select_related('comuna__region').all()[:3]  # Primeras 3 termas
     
     context = {
@@ -183,3 +183,35 @@ def solicitud_terma(request):
         }
         return render(request, 'solicitud_terma.html', context)
 
+
+
+def metrics(request):
+    """
+    Expone los histogramas de core.metrics en formato de texto de Prometheus.
+
+    Acceso restringido a administradores generales con sesión iniciada, o a
+    un recolector local que envíe 'Authorization: Bearer <METRICS_TOKEN>'.
+    """
+    import hmac
+    from django.conf import settings
+    from django.http import HttpResponse, HttpResponseForbidden
+    from .metrics import exportar_prometheus
+
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    token_valido = bool(token) and hmac.compare_digest(auth.encode(), f'Bearer {token}'.encode())
+
+    user = request.user
+    es_admin = (
+        user.is_authenticated
+        and getattr(user, 'rol', None) is not None
+        and user.rol.nombre == 'administrador_general'
+    )
+
+    if not (token_valido or es_admin):
+        return HttpResponseForbidden('Acceso denegado')
+
+    return HttpResponse(
+        exportar_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,4 +1,6 @@
 # Script PowerShell para crear la tarea programada automáticamente
+# Alternativa sin tareas programadas del sistema: `python manage.py run_scheduler`
+# ejecuta este y los demás comandos periódicos (ver core/programador.py).
 # Ejecutar este script como administrador
 
 $TaskName = "MiTerma-Email-Finalizacion"
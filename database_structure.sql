@@ -470,14 +470,21 @@ INSERT INTO termas_plansuscripcion (nombre, descripcion, porcentaje_comision, li
 -- ============================================
 
 -- Índices para consultas frecuentes
-CREATE INDEX idx_compra_fecha ON ventas_compra(fecha_compra);
-CREATE INDEX idx_compra_estado ON ventas_compra(estado_pago);
-CREATE INDEX idx_compra_terma_fecha ON ventas_compra(terma_id, fecha_compra);
 CREATE INDEX idx_disponibilidad_fecha ON entradas_disponibilidaddiaria(fecha);
 CREATE INDEX idx_terma_estado ON termas_terma(estado_suscripcion);
 CREATE INDEX idx_calificacion_fecha ON termas_calificacion(fecha);
 CREATE INDEX idx_distribucion_estado ON ventas_distribucionpago(estado);
 
+-- Las migraciones crean además estos índices (Meta.indexes de cada modelo):
+--   ventas 0021: compra_terma_visita_idx, compra_terma_estado_idx,
+--     compra_usuario_fecha_idx, compra_mp_id_idx, compra_payment_id_idx,
+--     compra_pendiente_fecha_idx, escaneo_qr_exitoso_idx,
+--     distribucion_terma_fecha_idx, distribucion_fecha_id_idx,
+--     distribucion_por_pagar_idx
+--   ventas 0023: compra_reserva_vigente_idx
+--   termas 0023: calificacion_terma_fecha_idx
+--   entradas 0009: entradatipo_terma_estado_idx
+
 -- ============================================
 -- COMENTARIOS FINALES
 -- ============================================
@@ -1,5 +1,7 @@
 @echo off
 REM Script para ejecutar el comando de emails de finalizacion
+REM Alternativa sin tareas programadas del sistema: `python manage.py run_scheduler`
+REM ejecuta este y los demas comandos periódicos (ver core/programador.py).
 REM Configurar este archivo para ejecutarse cada 10-15 minutos
 
 cd /d "C:\Users\natal\OneDrive\Escritorio\Proyecto_titulo\MITERMA2"
@@ -0,0 +1,62 @@
+"""
+Comando para crear por adelantado el inventario por fecha de las entradas
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from entradas.models import EntradaTipo
+from termas.models import Terma
+
+
+class Command(BaseCommand):
+    help = 'Crea las entradas por fecha (con sus cupos y servicios) de una temporada completa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--terma',
+            help='UUID de la terma (por defecto, todas las termas activas)'
+        )
+        parser.add_argument(
+            '--desde',
+            type=date.fromisoformat,
+            default=None,
+            help='Fecha inicial AAAA-MM-DD (default: hoy)'
+        )
+        parser.add_argument(
+            '--hasta',
+            type=date.fromisoformat,
+            default=None,
+            help='Fecha final AAAA-MM-DD, inclusive (default: --dias desde la fecha inicial)'
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=365,
+            help='Días a materializar si no se indica --hasta (default: 365)'
+        )
+
+    def handle(self, *args, **options):
+        desde = options['desde'] or timezone.localdate()
+        hasta = options['hasta'] or desde + timedelta(days=options['dias'] - 1)
+        if hasta < desde:
+            raise CommandError('--hasta no puede ser anterior a --desde')
+
+        if options['terma']:
+            termas = Terma.objects.filter(uuid=options['terma'])
+            if not termas.exists():
+                raise CommandError(f"No existe la terma {options['terma']}")
+        else:
+            termas = Terma.objects.filter(estado_suscripcion='activa')
+
+        self.stdout.write(f"📅 Materializando entradas del {desde} al {hasta}")
+
+        total = 0
+        for terma in termas.order_by('id'):
+            creadas = EntradaTipo.materializar_temporada(terma, desde, hasta)
+            total += creadas
+            if creadas:
+                self.stdout.write(f"   🎟️ {terma.nombre_terma}: {creadas} entradas creadas")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} entradas por fecha creadas"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('entradas', '0008_entradatipo_uuid'),
+        ('termas', '0023_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entradatipo',
+            index=models.Index(fields=['terma', 'estado', 'fecha'], name='entradatipo_terma_estado_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Least
 import uuid
+from datetime import timedelta
 from termas.models import Terma
 from usuarios.models import Usuario
 
@@ -39,6 +42,10 @@ class EntradaTipo(models.Model):
     class Meta:
         # Permitir múltiples entradas por fecha, pero únicas por terma, nombre y fecha
         unique_together = ['terma', 'nombre', 'fecha']
+        indexes = [
+            # Entradas activas de una terma para una fecha
+            models.Index(fields=['terma', 'estado', 'fecha'], name='entradatipo_terma_estado_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # Set default duracion_horas based on duracion_tipo if not specified
@@ -64,39 +71,71 @@ class EntradaTipo(models.Model):
         return self.nombre
 
     def crear_instancia_para_fecha(self, fecha):
-        """Crea una instancia específica de esta entrada para una fecha determinada."""
-        instancia, created = EntradaTipo.objects.get_or_create(
-            terma=self.terma,
-            nombre=self.nombre,
-            fecha=fecha,
-            defaults={
-                'descripcion': self.descripcion,
-                'precio': self.precio,
-                'duracion_horas': self.duracion_horas,
-                'duracion_tipo': self.duracion_tipo,
-                'estado': self.estado,
-                'cupos_totales': self.terma.limite_ventas_diario,
-                'cupos_disponibles': self.terma.limite_ventas_diario
-            }
-        )
+        """
+        Crea una instancia específica de esta entrada para una fecha determinada.
         
-        if created:
-            # Copiar servicios de la entrada template
-            instancia.servicios.set(self.servicios.all())
+        Es segura ante llamadas simultáneas: unique_together (terma, nombre,
+        fecha) hace que solo una cree la fila (get_or_create relee la del
+        ganador), y la instancia se confirma junto con sus servicios.
+        """
+        with transaction.atomic():
+            instancia, created = EntradaTipo.objects.get_or_create(
+                terma=self.terma,
+                nombre=self.nombre,
+                fecha=fecha,
+                defaults={
+                    'descripcion': self.descripcion,
+                    'precio': self.precio,
+                    'duracion_horas': self.duracion_horas,
+                    'duracion_tipo': self.duracion_tipo,
+                    'estado': self.estado,
+                    'cupos_totales': self.terma.limite_ventas_diario,
+                    'cupos_disponibles': self.terma.limite_ventas_diario
+                }
+            )
+            
+            if created:
+                # Copiar servicios de la entrada template
+                instancia.servicios.set(self.servicios.all())
             
         return instancia
 
     def reducir_cupos(self, cantidad):
-        """Reduce los cupos disponibles en la cantidad especificada."""
-        if self.cupos_disponibles is not None:
-            self.cupos_disponibles = max(0, self.cupos_disponibles - cantidad)
-            self.save(update_fields=['cupos_disponibles'])
+        """
+        Descuenta cupos con un solo UPDATE condicional
+        (... SET cupos_disponibles = cupos_disponibles - n WHERE cupos_disponibles >= n),
+        así dos compras simultáneas no se pisan ni dejan el saldo negativo.
+        Sin límite de cupos (NULL) siempre se concede.
+        
+        Returns:
+            bool: False si no quedaban cupos suficientes
+        """
+        reservado = EntradaTipo.objects.filter(pk=self.pk).filter(
+            Q(cupos_disponibles__isnull=True) | Q(cupos_disponibles__gte=cantidad)
+        ).update(cupos_disponibles=F('cupos_disponibles') - cantidad)
+        self.refresh_from_db(fields=['cupos_disponibles'])
+        return bool(reservado)
 
     def aumentar_cupos(self, cantidad):
-        """Aumenta los cupos disponibles en la cantidad especificada."""
-        if self.cupos_disponibles is not None and self.cupos_totales is not None:
-            self.cupos_disponibles = min(self.cupos_totales, self.cupos_disponibles + cantidad)
-            self.save(update_fields=['cupos_disponibles'])
+        """Devuelve cupos (compra cancelada o vencida) sin superar cupos_totales."""
+        EntradaTipo.liberar_cupos({self.pk: cantidad})
+        self.refresh_from_db(fields=['cupos_disponibles'])
+
+    @classmethod
+    def liberar_cupos(cls, cantidades):
+        """
+        Devuelve cupos a varias entradas, un UPDATE atómico por entrada.
+        
+        Args:
+            cantidades: {entrada_tipo_id: cupos a devolver}
+        """
+        for entrada_id, cantidad in cantidades.items():
+            if not cantidad:
+                continue
+            liberado = F('cupos_disponibles') + cantidad
+            cls.objects.filter(pk=entrada_id, cupos_disponibles__isnull=False).update(
+                cupos_disponibles=Least(liberado, Coalesce(F('cupos_totales'), liberado))
+            )
 
     def tiene_cupos_suficientes(self, cantidad):
         """Verifica si hay cupos suficientes para la cantidad solicitada."""
@@ -123,3 +162,70 @@ class EntradaTipo(models.Model):
             return template.crear_instancia_para_fecha(fecha)
         
         return None
+
+    @classmethod
+    def materializar_temporada(cls, terma, desde, hasta, tamaño_lote=1000):
+        """
+        Crea de una vez las instancias por fecha de todas las entradas template
+        de la terma entre `desde` y `hasta` (inclusive), con sus servicios.
+        
+        Usa bulk_create(ignore_conflicts=True) para las entradas y para las
+        filas de la tabla intermedia de servicios: un año de inventario son
+        unas pocas sentencias. Las fechas que ya existían (creadas antes o en
+        paralelo por una compra) no se tocan.
+        
+        Args:
+            terma: Terma cuyas entradas se materializan
+            desde: Fecha inicial
+            hasta: Fecha final (inclusive)
+            tamaño_lote: Filas por INSERT
+        
+        Returns:
+            int: Cantidad de instancias creadas
+        """
+        plantillas = list(
+            cls.objects.filter(terma=terma, fecha__isnull=True).prefetch_related('servicios')
+        )
+        if not plantillas or hasta < desde:
+            return 0
+        
+        fechas = [desde + timedelta(days=dia) for dia in range((hasta - desde).days + 1)]
+        nombres = [plantilla.nombre for plantilla in plantillas]
+        en_rango = cls.objects.filter(terma=terma, nombre__in=nombres, fecha__range=(desde, hasta))
+        
+        with transaction.atomic():
+            existentes = set(en_rango.values_list('nombre', 'fecha'))
+            cls.objects.bulk_create([
+                cls(
+                    terma=terma,
+                    nombre=plantilla.nombre,
+                    fecha=fecha,
+                    descripcion=plantilla.descripcion,
+                    precio=plantilla.precio,
+                    duracion_horas=plantilla.duracion_horas,
+                    duracion_tipo=plantilla.duracion_tipo,
+                    estado=plantilla.estado,
+                    cupos_totales=terma.limite_ventas_diario,
+                    cupos_disponibles=terma.limite_ventas_diario,
+                )
+                for plantilla in plantillas
+                for fecha in fechas
+                if (plantilla.nombre, fecha) not in existentes
+            ], batch_size=tamaño_lote, ignore_conflicts=True)
+            
+            # ignore_conflicts no devuelve los ids: se leen las filas nuevas
+            servicios_por_nombre = {p.nombre: [s.pk for s in p.servicios.all()] for p in plantillas}
+            creadas = [
+                (pk, nombre)
+                for pk, nombre, fecha in en_rango.values_list('pk', 'nombre', 'fecha')
+                if (nombre, fecha) not in existentes
+            ]
+            
+            Servicios = cls.servicios.through
+            Servicios.objects.bulk_create([
+                Servicios(entradatipo_id=pk, servicioterma_id=servicio_id)
+                for pk, nombre in creadas
+                for servicio_id in servicios_por_nombre[nombre]
+            ], batch_size=tamaño_lote, ignore_conflicts=True)
+        
+        return len(creadas)
@@ -1,3 +1,125 @@
-from django.test import TestCase
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from .models import EntradaTipo
+
+
+class CuposAtomicosTest(TestCase):
+    """Reserva y devolución de cupos con UPDATE condicional."""
+
+    def setUp(self):
+        from termas.models import Terma
+
+        terma = Terma.objects.create(nombre_terma='Termas Cupo', estado_suscripcion='activa', limite_ventas_diario=3)
+        self.entrada = EntradaTipo.objects.create(terma=terma, nombre='General', precio=Decimal('5000'),
+                                                  fecha=date.today())
+
+    def test_no_reserva_mas_de_lo_disponible(self):
+        self.assertTrue(self.entrada.reducir_cupos(2))
+        self.assertFalse(self.entrada.reducir_cupos(2))
+        self.assertEqual(self.entrada.cupos_disponibles, 1)
+
+    def test_devolucion_no_supera_el_total(self):
+        self.entrada.reducir_cupos(1)
+        self.entrada.aumentar_cupos(5)
+        self.assertEqual(self.entrada.cupos_disponibles, 3)
+
+    def test_compra_vencida_devuelve_sus_cupos(self):
+        from ventas.disponibilidad_utils import limpiar_compras_pendientes_vencidas
+        from ventas.models import Compra, DetalleCompra
+        from usuarios.models import Usuario
+
+        cliente = Usuario.objects.create_user('cliente@cupo.cl', 'Cora', 'Cliente')
+        compra = Compra.objects.create(usuario=cliente, terma=self.entrada.terma, total=Decimal('10000'),
+                                       estado_pago='pendiente', cantidad=2)
+        DetalleCompra.objects.create(compra=compra, entrada_tipo=self.entrada, cantidad=2,
+                                     precio_unitario=Decimal('5000'), subtotal=Decimal('10000'))
+        self.entrada.reducir_cupos(2)
+        Compra.objects.filter(pk=compra.pk).update(fecha_compra=compra.fecha_compra - timedelta(hours=2))
+
+        self.assertEqual(limpiar_compras_pendientes_vencidas(1), 1)
+        self.entrada.refresh_from_db()
+        self.assertEqual(self.entrada.cupos_disponibles, 3)
+        self.assertEqual(Compra.objects.get().estado_pago, 'cancelado_timeout')
+
+
+class MaterializarTemporadaTest(TestCase):
+    """Inventario de una temporada creado en pocas sentencias."""
+
+    def test_crea_fechas_faltantes_con_servicios(self):
+        from termas.models import ServicioTerma, Terma
+
+        terma = Terma.objects.create(nombre_terma='Termas Temporada', estado_suscripcion='activa',
+                                     limite_ventas_diario=40)
+        piscina = ServicioTerma.objects.create(terma=terma, servicio='Piscina', precio='0')
+        for nombre in ('General', 'Nocturna'):
+            plantilla = EntradaTipo.objects.create(terma=terma, nombre=nombre, precio=Decimal('9000'))
+            plantilla.servicios.add(piscina)
+        desde = date(2030, 1, 1)
+        # Una fecha ya materializada por una compra no se duplica
+        EntradaTipo.objects.get(nombre='General').crear_instancia_para_fecha(desde)
+
+        hasta = desde + timedelta(days=364)
+        # Plantillas, sus servicios, existentes, INSERT, nuevas, INSERT M2M (más savepoint)
+        with self.assertNumQueries(8):
+            creadas = EntradaTipo.materializar_temporada(terma, desde, hasta)
+
+        self.assertEqual(creadas, 2 * 365 - 1)
+        self.assertEqual(EntradaTipo.objects.filter(fecha__isnull=False).count(), 2 * 365)
+        self.assertEqual(EntradaTipo.servicios.through.objects.count(), 2 + 2 * 365)
+        ultima = EntradaTipo.objects.get(nombre='Nocturna', fecha=hasta)
+        self.assertEqual((ultima.cupos_disponibles, ultima.duracion_horas), (40, 12))
+
+        # Repetirlo no crea nada
+        self.assertEqual(EntradaTipo.materializar_temporada(terma, desde, hasta), 0)
+
+
+class CuposConcurrentesTest(TransactionTestCase):
+    """Compradores simultáneos contra PostgreSQL: los cupos nunca quedan negativos."""
+
+    HILOS = 12
+    CUPOS = 5
+
+    def setUp(self):
+        from termas.models import Terma
+
+        self.terma = Terma.objects.create(nombre_terma='Termas Carrera', estado_suscripcion='activa',
+                                          limite_ventas_diario=self.CUPOS)
+        self.plantilla = EntradaTipo.objects.create(terma=self.terma, nombre='General', precio=Decimal('5000'))
+
+    def en_paralelo(self, funcion):
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def ejecutar():
+            try:
+                barrera.wait()
+                resultados.append(funcion())
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=ejecutar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resultados
+
+    def test_materializar_y_reservar_en_paralelo(self):
+        fecha = date.today() + timedelta(days=7)
+
+        def comprar():
+            entrada = EntradaTipo.get_entrada_para_fecha(self.terma, 'General', fecha)
+            return entrada.pk, entrada.reducir_cupos(1)
+
+        resultados = self.en_paralelo(comprar)
+
+        # Una sola instancia para la fecha y exactamente CUPOS reservas exitosas
+        self.assertEqual(len({pk for pk, _ in resultados}), 1)
+        self.assertEqual(sum(reservado for _, reservado in resultados), self.CUPOS)
+        entrada = EntradaTipo.objects.get(fecha=fecha)
+        self.assertEqual(entrada.cupos_disponibles, 0)
@@ -56,7 +56,8 @@ class CalificacionAdmin(admin.ModelAdmin):
 
 @admin.register(ImagenTerma)
 class ImagenTermaAdmin(admin.ModelAdmin):
-    list_display = ['terma', 'descripcion']
+    list_display = ['terma', 'descripcion', 'estado_variantes']
+    list_filter = ['estado_variantes']
     search_fields = ['terma__nombre_terma', 'descripcion']
 
 @admin.register(ServicioTerma)
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class TermasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'termas'
+
+    def ready(self):
+        """
+        Conecta los signals que mantienen el índice de búsqueda, los agregados
+        de calificaciones y el cache de servicios populares
+        """
+        from django.db.models.signals import post_delete, post_save
+
+        from . import busqueda
+        from .models import Calificacion, Terma
+        busqueda.conectar_signals()
+        post_delete.connect(Calificacion.al_eliminar, sender=Calificacion, dispatch_uid='calificacion_agregados_terma')
+        post_save.connect(Terma.invalidar_servicios_populares, sender='ventas.Compra', dispatch_uid='terma_servicios_populares')
@@ -0,0 +1,184 @@
+"""
+Búsqueda de termas por texto.
+
+Cada terma guarda un documento desnormalizado (nombre, comuna, región y
+descripción, sin tildes y en minúsculas) y su tsvector ponderado en
+`vector_busqueda`, indexado con GIN. Las búsquedas normalizan el texto de la
+misma forma, así que "nuble" encuentra "Ñuble" y "termas de chillan"
+encuentra "Termas de Chillán".
+
+El índice se actualiza por signals cuando cambia una terma, su comuna o su
+región (ver conectar_signals). Para reconstruirlo completo:
+    python manage.py reindexar_busqueda_termas
+"""
+import re
+import unicodedata
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Value
+from django.urls import reverse
+
+# Diccionario sin stemming: los nombres propios no se deben derivar
+CONFIG_BUSQUEDA = 'simple'
+
+# Campos de Terma que forman parte del documento de búsqueda
+CAMPOS_INDEXADOS = {'nombre_terma', 'descripcion_terma', 'comuna', 'comuna_id'}
+
+LIMITE_SUGERENCIAS = 8
+
+
+def normalizar_texto(texto):
+    """
+    Pasa a minúsculas y elimina tildes y diacríticos (á -> a, ñ -> n).
+
+    Args:
+        texto: Texto a normalizar (None se trata como vacío)
+    """
+    if not texto:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def _partes_documento(terma):
+    """Retorna (nombre, lugar, descripción) normalizados de una terma."""
+    lugar = ''
+    if terma.comuna_id:
+        comuna = terma.comuna
+        lugar = f"{comuna.nombre} {comuna.region.nombre}"
+    return (
+        normalizar_texto(terma.nombre_terma),
+        normalizar_texto(lugar),
+        normalizar_texto(terma.descripcion_terma),
+    )
+
+
+def reindexar_terma(terma):
+    """
+    Recalcula el documento y el tsvector de una terma.
+
+    Usa update() para no disparar de nuevo post_save. El nombre pesa más que
+    la ubicación, y la ubicación más que la descripción.
+
+    Args:
+        terma: Instancia de Terma (también sirve el modelo histórico de una migración)
+    """
+    nombre, lugar, descripcion = _partes_documento(terma)
+    documento = ' '.join(p for p in (nombre, lugar, descripcion) if p)
+
+    vector = (
+        SearchVector(Value(nombre), weight='A', config=CONFIG_BUSQUEDA)
+        + SearchVector(Value(lugar), weight='B', config=CONFIG_BUSQUEDA)
+        + SearchVector(Value(descripcion), weight='C', config=CONFIG_BUSQUEDA)
+    )
+    type(terma)._default_manager.filter(pk=terma.pk).update(documento_busqueda=documento, vector_busqueda=vector)
+    terma.documento_busqueda = documento
+
+
+def reindexar_termas(queryset):
+    """
+    Reindexa todas las termas de un queryset y retorna cuántas procesó.
+
+    Args:
+        queryset: QuerySet de Terma
+    """
+    total = 0
+    for terma in queryset.select_related('comuna__region').iterator(chunk_size=200):
+        reindexar_terma(terma)
+        total += 1
+    return total
+
+
+def construir_consulta(texto):
+    """
+    Convierte el texto del usuario en un SearchQuery con prefijos.
+
+    Cada palabra se busca como prefijo ("chil" -> "chillan") y todas deben
+    aparecer. Retorna None si el texto no tiene palabras.
+
+    Args:
+        texto: Texto ingresado por el usuario
+    """
+    # Solo caracteres de palabra: evita inyectar operadores de tsquery
+    palabras = re.findall(r'\w+', normalizar_texto(texto))
+    if not palabras:
+        return None
+    consulta = ' & '.join(f"{palabra}:*" for palabra in palabras)
+    return SearchQuery(consulta, search_type='raw', config=CONFIG_BUSQUEDA)
+
+
+def filtrar_termas_por_texto(queryset, texto):
+    """
+    Filtra un queryset de termas por texto y lo ordena por relevancia.
+
+    Args:
+        queryset: QuerySet de Terma a filtrar
+        texto: Texto de búsqueda
+    """
+    consulta = construir_consulta(texto)
+    if consulta is None:
+        return queryset
+    return queryset.filter(vector_busqueda=consulta).annotate(
+        relevancia=SearchRank(F('vector_busqueda'), consulta)
+    ).order_by('-relevancia', 'nombre_terma')
+
+
+def sugerir_termas(texto, limite=LIMITE_SUGERENCIAS):
+    """
+    Retorna sugerencias de autocompletado para termas activas.
+
+    Args:
+        texto: Prefijo escrito por el usuario
+        limite: Cantidad máxima de sugerencias
+    """
+    from .models import Terma
+
+    termas = filtrar_termas_por_texto(
+        Terma.objects.filter(estado_suscripcion='activa'), texto
+    ).values('uuid', 'nombre_terma', 'comuna__nombre', 'comuna__region__nombre')[:limite]
+
+    return [
+        {
+            'uuid': str(terma['uuid']),
+            'nombre': terma['nombre_terma'],
+            'comuna': terma['comuna__nombre'],
+            'region': terma['comuna__region__nombre'],
+            'url': reverse('termas:vista_terma', args=[terma['uuid']]),
+        }
+        for terma in termas
+    ]
+
+
+# =================== SIGNALS ===================
+
+def reindexar_al_guardar_terma(sender, instance, update_fields=None, **kwargs):
+    """Reindexa la terma si cambió (o pudo cambiar) un campo indexado."""
+    if update_fields is not None and not CAMPOS_INDEXADOS.intersection(update_fields):
+        return
+    reindexar_terma(instance)
+
+
+def reindexar_al_guardar_comuna(sender, instance, created=False, **kwargs):
+    """Reindexa las termas de una comuna renombrada o movida de región."""
+    if created:
+        return
+    from .models import Terma
+    reindexar_termas(Terma.objects.filter(comuna=instance))
+
+
+def reindexar_al_guardar_region(sender, instance, created=False, **kwargs):
+    """Reindexa las termas de las comunas de una región renombrada."""
+    if created:
+        return
+    from .models import Terma
+    reindexar_termas(Terma.objects.filter(comuna__region=instance))
+
+
+def conectar_signals():
+    """Conecta los signals que mantienen actualizado el índice de búsqueda."""
+    from django.db.models.signals import post_save
+    from .models import Terma, Comuna, Region
+
+    post_save.connect(reindexar_al_guardar_terma, sender=Terma, dispatch_uid='busqueda_terma')
+    post_save.connect(reindexar_al_guardar_comuna, sender=Comuna, dispatch_uid='busqueda_comuna')
+    post_save.connect(reindexar_al_guardar_region, sender=Region, dispatch_uid='busqueda_region')
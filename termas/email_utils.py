@@ -190,23 +190,32 @@ def enviar_email_entrada_finalizada(cliente, compra, registro_escaneo):
     """
     Envía un email al cliente cuando su entrada se finaliza,
     solicitando comentarios sobre su experiencia.
+    
+    Args:
+        cliente: Usuario (o compra.usuario del grafo)
+        compra: Compra o CompraGraph (ver ventas/grafo_compra.py)
+        registro_escaneo: RegistroEscaneo que inició la visita
     """
+    from ventas.grafo_compra import CompraGraph
+    
     try:
         logger.info(f"Enviando email de entrada finalizada a {cliente.email}")
         
-        subject = f"¡Esperamos que hayas disfrutado tu visita a {compra.terma.nombre_terma}!"
+        compra = CompraGraph.de(compra)
+        terma = compra.terma
+        subject = f"¡Esperamos que hayas disfrutado tu visita a {terma.nombre_terma}!"
         
-        # Contexto para el template
+        # Contexto para el template (Terma aún no tiene redes sociales)
         context = {
             'nombre_cliente': f"{cliente.nombre} {cliente.apellido}",
-            'nombre_terma': compra.terma.nombre_terma,
+            'nombre_terma': terma.nombre_terma,
             'fecha_visita': compra.fecha_visita.strftime("%d de %B de %Y"),
-            'email_terma': compra.terma.email_contacto if hasattr(compra.terma, 'email_contacto') else "info@miterma.cl",
-            'telefono_terma': compra.terma.telefono if hasattr(compra.terma, 'telefono') else None,
-            'direccion_terma': compra.terma.comuna.nombre if hasattr(compra.terma, 'comuna') and compra.terma.comuna else None,
-            'facebook_url': compra.terma.facebook_url if hasattr(compra.terma, 'facebook_url') else None,
-            'instagram_url': compra.terma.instagram_url if hasattr(compra.terma, 'instagram_url') else None,
-            'whatsapp_numero': compra.terma.whatsapp if hasattr(compra.terma, 'whatsapp') else None,
+            'email_terma': terma.email_terma or "info@miterma.cl",
+            'telefono_terma': terma.telefono_terma,
+            'direccion_terma': terma.comuna,
+            'facebook_url': None,
+            'instagram_url': None,
+            'whatsapp_numero': None,
             'current_year': timezone.now().year,
         }
         
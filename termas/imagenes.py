@@ -0,0 +1,216 @@
+"""
+Procesamiento de las fotos de las termas.
+
+Flujo:
+    1. subir_fotos valida la imagen con Pillow y la guarda con
+       guardar_original(): el archivo subido se copia al storage por
+       bloques (chunks), sin leerlo completo en memoria.
+    2. La ImagenTerma queda con estado_variantes='pendiente'. El comando
+       `python manage.py procesar_imagenes` (tarea 'imagenes' de
+       run_scheduler) genera versiones reducidas en WebP y en el formato de
+       respaldo (JPEG, o PNG si la foto tiene transparencia) y guarda los
+       srcset en la imagen.
+    3. Los templates usan partials/imagen_terma.html: <picture> con el
+       srcset WebP y el de respaldo; mientras no haya variantes se muestra
+       el original.
+"""
+import io
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Anchos (px) de las variantes: tarjetas del catálogo, tablets y carrusel
+ANCHOS_VARIANTES = (320, 640, 1280)
+
+CALIDAD_WEBP = 80
+CALIDAD_JPEG = 82
+
+CARPETA_ORIGINALES = 'fotos_termas'
+CARPETA_VARIANTES = 'fotos_termas/variantes'
+
+# Tope de píxeles (ancho x alto). Un PNG de pocos KB puede declarar 20000x20000:
+# decodificarlo ocuparía cientos de MB en el proceso del programador
+MAX_PIXELES = 40_000_000
+
+# Valores EXIF de orientación que giran la imagen 90° (intercambian ancho y alto)
+ORIENTACIONES_GIRADAS = (5, 6, 7, 8)
+
+
+def validar_imagen(archivo):
+    """
+    Comprueba que el archivo sea una imagen que Pillow puede abrir (el
+    content_type lo declara el navegador) y que no supere MAX_PIXELES. Solo
+    lee la cabecera.
+
+    Args:
+        archivo: UploadedFile
+
+    Returns:
+        bool: True si es una imagen válida
+    """
+    try:
+        with Image.open(archivo) as imagen:
+            ancho, alto = imagen.size
+            if ancho * alto > MAX_PIXELES:
+                return False
+            imagen.verify()
+        return True
+    except (Image.DecompressionBombError, UnidentifiedImageError, OSError, SyntaxError):
+        return False
+    finally:
+        archivo.seek(0)
+
+
+def guardar_original(archivo):
+    """
+    Guarda la foto subida en el storage con un nombre único. El storage la
+    escribe recorriendo archivo.chunks(), así que una subida grande (que
+    Django ya dejó en un archivo temporal) no se carga en memoria.
+
+    Args:
+        archivo: UploadedFile
+
+    Returns:
+        str: URL pública del archivo guardado
+    """
+    extension = os.path.splitext(archivo.name)[1].lower()
+    ruta = default_storage.save(f"{CARPETA_ORIGINALES}/{uuid.uuid4()}{extension}", archivo)
+    return f"{settings.MEDIA_URL}{ruta}"
+
+
+def _ruta_storage(url):
+    return url[len(settings.MEDIA_URL):] if url.startswith(settings.MEDIA_URL) else url
+
+
+def _tiene_transparencia(imagen):
+    return imagen.mode in ('RGBA', 'LA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+
+
+def _guardar_variante(imagen, ruta, formato, **opciones):
+    buffer = io.BytesIO()
+    imagen.save(buffer, formato, **opciones)
+    ruta = default_storage.save(ruta, ContentFile(buffer.getvalue()))
+    return f"{settings.MEDIA_URL}{ruta}"
+
+
+def generar_variantes(imagen_terma):
+    """
+    Genera las variantes reducidas (WebP y respaldo) de una ImagenTerma y
+    actualiza sus dimensiones, variantes y srcset. No guarda el modelo.
+
+    Args:
+        imagen_terma: ImagenTerma con url_imagen en el storage
+    """
+    with default_storage.open(_ruta_storage(imagen_terma.url_imagen), 'rb') as archivo:
+        with Image.open(archivo) as original:
+            ancho, alto = original.size
+            if ancho * alto > MAX_PIXELES:
+                raise ValueError(f"La imagen de {ancho}x{alto} px supera el máximo de {MAX_PIXELES} píxeles")
+            if original.getexif().get(ExifTags.Base.Orientation) in ORIENTACIONES_GIRADAS:
+                ancho, alto = alto, ancho
+
+            # En JPEG decodifica directo a una escala reducida (no menor que
+            # la variante más grande): mucha menos memoria que la foto completa
+            original.draft('RGB', (max(ANCHOS_VARIANTES),) * 2)
+            # Respeta la orientación EXIF de las fotos de celular
+            original = ImageOps.exif_transpose(original)
+            transparente = _tiene_transparencia(original)
+            original = original.convert('RGBA' if transparente else 'RGB')
+
+            # Nunca se agranda: si la foto es más chica que todos los anchos,
+            # queda una sola variante de su tamaño
+            anchos = [a for a in ANCHOS_VARIANTES if a < ancho] or [ancho]
+            variantes = {'webp': {}, 'respaldo': {}}
+            base = f"{CARPETA_VARIANTES}/{imagen_terma.uuid}"
+            for ancho_variante in anchos:
+                reducida = original.resize(
+                    (ancho_variante, max(1, round(alto * ancho_variante / ancho))),
+                    Image.Resampling.LANCZOS
+                )
+                variantes['webp'][ancho_variante] = _guardar_variante(
+                    reducida, f"{base}_{ancho_variante}.webp", 'WEBP', quality=CALIDAD_WEBP, method=6
+                )
+                if transparente:
+                    variantes['respaldo'][ancho_variante] = _guardar_variante(
+                        reducida, f"{base}_{ancho_variante}.png", 'PNG', optimize=True
+                    )
+                else:
+                    variantes['respaldo'][ancho_variante] = _guardar_variante(
+                        reducida, f"{base}_{ancho_variante}.jpg", 'JPEG',
+                        quality=CALIDAD_JPEG, optimize=True, progressive=True
+                    )
+
+    imagen_terma.ancho, imagen_terma.alto = ancho, alto
+    imagen_terma.variantes = {
+        formato: {str(a): url for a, url in urls.items()} for formato, urls in variantes.items()
+    }
+    imagen_terma.srcset = ', '.join(f"{url} {a}w" for a, url in variantes['respaldo'].items())
+    imagen_terma.srcset_webp = ', '.join(f"{url} {a}w" for a, url in variantes['webp'].items())
+
+
+def eliminar_archivos(imagen_terma):
+    """Elimina del storage el original y las variantes de una ImagenTerma."""
+    urls = [imagen_terma.url_imagen]
+    for por_ancho in (imagen_terma.variantes or {}).values():
+        urls.extend(por_ancho.values())
+    for url in urls:
+        try:
+            ruta = _ruta_storage(url)
+            if default_storage.exists(ruta):
+                default_storage.delete(ruta)
+        except Exception as e:
+            logger.error(f"Error al eliminar archivo {url}: {e}")
+
+
+def _procesar_siguiente():
+    """
+    Procesa la imagen pendiente más antigua. La fila queda bloqueada
+    (skip_locked) mientras se generan las variantes: otros workers toman
+    la siguiente y, si el proceso muere, el bloqueo se suelta solo.
+
+    Returns:
+        ImagenTerma procesada, o None si no quedan pendientes
+    """
+    from .models import ImagenTerma
+
+    with transaction.atomic():
+        imagen = ImagenTerma.objects.select_for_update(skip_locked=True).filter(
+            estado_variantes='pendiente'
+        ).order_by('id').first()
+        if imagen is None:
+            return None
+        try:
+            generar_variantes(imagen)
+            imagen.estado_variantes = 'listo'
+        except Exception:
+            logger.exception(f"No se pudieron generar las variantes de la imagen {imagen.uuid}")
+            imagen.estado_variantes = 'error'
+        imagen.save(update_fields=['estado_variantes', 'ancho', 'alto', 'variantes', 'srcset', 'srcset_webp'])
+        return imagen
+
+
+def procesar_imagenes_pendientes(limite=None):
+    """
+    Genera las variantes de las imágenes pendientes hasta vaciar la cola (o
+    llegar al límite). Es seguro ejecutarlo en varios procesos a la vez.
+
+    Args:
+        limite: Máximo de imágenes a procesar (None = todas)
+
+    Returns:
+        int: Cantidad de imágenes procesadas
+    """
+    procesadas = 0
+    while limite is None or procesadas < limite:
+        if _procesar_siguiente() is None:
+            break
+        procesadas += 1
+    return procesadas
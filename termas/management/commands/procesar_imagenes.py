@@ -0,0 +1,35 @@
+"""
+Comando worker que genera las variantes reducidas (WebP y respaldo) de las fotos de las termas
+"""
+from django.core.management.base import BaseCommand
+
+from termas.imagenes import procesar_imagenes_pendientes
+from termas.models import ImagenTerma
+
+
+class Command(BaseCommand):
+    help = 'Genera miniaturas y variantes WebP de las fotos de termas pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=None,
+            help='Máximo de imágenes a procesar en esta ejecución'
+        )
+        parser.add_argument(
+            '--reprocesar',
+            action='store_true',
+            help='Vuelve a encolar todas las imágenes (por ejemplo, tras cambiar los anchos)'
+        )
+
+    def handle(self, *args, **options):
+        if options['reprocesar']:
+            encoladas = ImagenTerma.objects.exclude(estado_variantes='pendiente').update(estado_variantes='pendiente')
+            self.stdout.write(f"🔁 Imágenes encoladas de nuevo: {encoladas}")
+
+        procesadas = procesar_imagenes_pendientes(options['limite'])
+        errores = ImagenTerma.objects.filter(estado_variantes='error').count()
+        if errores:
+            self.stdout.write(self.style.WARNING(f"⚠️ Imágenes con error: {errores}"))
+        self.stdout.write(self.style.SUCCESS(f"✅ {procesadas} imágenes procesadas"))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from termas.models import Calificacion, Terma
+
+
+class Command(BaseCommand):
+    help = 'Compara los agregados de calificaciones de cada terma con sus calificaciones y corrige las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--terma',
+            help='UUID de la terma (por defecto, todas)'
+        )
+        parser.add_argument(
+            '--solo-revisar',
+            action='store_true',
+            help='Solo informa las termas con diferencias, sin corregirlas'
+        )
+
+    def handle(self, *args, **options):
+        termas = Terma.objects.all()
+        if options['terma']:
+            termas = termas.filter(uuid=options['terma'])
+            if not termas.exists():
+                raise CommandError(f"No existe la terma {options['terma']}")
+
+        self.stdout.write("⭐ Revisando agregados de calificaciones...")
+
+        # Una consulta agrupada para todas las termas; solo se bloquean las que difieren
+        vacio = {campo: 0 for campo in Terma.CAMPOS_CALIFICACIONES}
+        reales = {
+            fila.pop('terma'): fila
+            for fila in Calificacion.objects.filter(terma__in=termas).values('terma').annotate(
+                **Terma.agregados_calificaciones()
+            ).order_by()
+        }
+        desviadas = [
+            terma for terma in termas.only('id', 'nombre_terma', *Terma.CAMPOS_CALIFICACIONES).order_by('id')
+            if {campo: getattr(terma, campo) for campo in Terma.CAMPOS_CALIFICACIONES} != reales.get(terma.id, vacio)
+        ]
+
+        corregidas = 0
+        for terma in desviadas:
+            if options['solo_revisar']:
+                self.stdout.write(f"   ⚠️ {terma.nombre_terma}: agregados desactualizados")
+            elif terma.reconciliar_calificaciones():
+                corregidas += 1
+                self.stdout.write(f"   🔧 {terma.nombre_terma}: {terma.calificaciones_total} calificaciones")
+
+        if options['solo_revisar']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(desviadas)} termas con diferencias"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {corregidas} termas corregidas"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from termas.busqueda import reindexar_termas
+from termas.models import Terma
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda por texto de todas las termas'
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔎 Reindexando búsqueda de termas...")
+        total = reindexar_termas(Terma.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} termas reindexadas"))
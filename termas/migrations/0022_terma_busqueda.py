@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+
+
+def poblar_indice_busqueda(apps, schema_editor):
+    from termas.busqueda import reindexar_termas
+    Terma = apps.get_model('termas', 'Terma')
+    reindexar_termas(Terma.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0021_imagenterma_uuid_servicioterma_uuid_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='terma',
+            name='documento_busqueda',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Nombre, comuna, región y descripción sin tildes ni mayúsculas'),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='vector_busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='terma',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vector_busqueda'], name='terma_vector_busqueda_gin'),
+        ),
+        migrations.RunPython(poblar_indice_busqueda, migrations.RunPython.noop),
+    ]
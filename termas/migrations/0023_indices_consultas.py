@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0022_terma_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calificacion',
+            index=models.Index(fields=['terma', 'fecha'], name='calificacion_terma_fecha_idx'),
+        ),
+    ]
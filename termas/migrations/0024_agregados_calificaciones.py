@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+
+def calcular_agregados(apps, schema_editor):
+    """Carga suma, total e histograma de las calificaciones existentes."""
+    Terma = apps.get_model('termas', 'Terma')
+    Calificacion = apps.get_model('termas', 'Calificacion')
+    por_terma = Calificacion.objects.values('terma_id').annotate(
+        total=models.Count('id'),
+        suma=models.Sum('puntuacion'),
+        **{f'e{i}': models.Count('id', filter=models.Q(puntuacion=i)) for i in range(1, 6)},
+    )
+    for fila in por_terma:
+        Terma.objects.filter(pk=fila['terma_id']).update(
+            calificaciones_total=fila['total'],
+            calificaciones_suma=fila['suma'],
+            **{f'calificaciones_{i}': fila[f'e{i}'] for i in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0023_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_suma',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='terma',
+            name='calificaciones_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_agregados, migrations.RunPython.noop),
+    ]
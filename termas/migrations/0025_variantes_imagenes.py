@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0024_agregados_calificaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagenterma',
+            name='alto',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagenterma',
+            name='ancho',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagenterma',
+            name='estado_variantes',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('listo', 'Listo'), ('error', 'Error')], db_index=True, default='pendiente', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='imagenterma',
+            name='srcset',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='imagenterma',
+            name='srcset_webp',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='imagenterma',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict, help_text="{'webp'|'respaldo': {ancho: url}}"),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from usuarios.models import Usuario
 from django.utils import timezone
 from datetime import timedelta, datetime
@@ -42,6 +44,31 @@ class Terma(models.Model):
         default=5,
         help_text="Límite actual de fotos basado en el plan (-1 para ilimitado)"
     )
+    
+    # Índice de búsqueda desnormalizado (ver termas/busqueda.py)
+    documento_busqueda = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Nombre, comuna, región y descripción sin tildes ni mayúsculas"
+    )
+    vector_busqueda = SearchVectorField(null=True, editable=False)
+
+    # Agregados de calificaciones desnormalizados: los mantiene Calificacion con
+    # UPDATE atómicos (F()) al crear/eliminar y los corrige el comando
+    # reconciliar_calificaciones. calificacion_promedio se deriva de suma/total.
+    calificaciones_total = models.PositiveIntegerField(default=0, editable=False)
+    calificaciones_suma = models.PositiveIntegerField(default=0, editable=False)
+    calificaciones_1 = models.PositiveIntegerField(default=0, editable=False)
+    calificaciones_2 = models.PositiveIntegerField(default=0, editable=False)
+    calificaciones_3 = models.PositiveIntegerField(default=0, editable=False)
+    calificaciones_4 = models.PositiveIntegerField(default=0, editable=False)
+    calificaciones_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['vector_busqueda'], name='terma_vector_busqueda_gin'),
+        ]
 
     def __str__(self):
         return self.nombre_terma
@@ -145,15 +172,105 @@ class Terma(models.Model):
     
     #para calcualr el promedio de calificacion 
     def promedio_calificacion(self):
-        """Calcula el promedio de las puntuaciones de calificación"""
-        from django.db.models import Avg
-        resultado = self.calificacion_set.aggregate(promedio=Avg('puntuacion'))
-        return resultado['promedio'] if resultado['promedio'] else None
+        """Promedio de las puntuaciones (desde los agregados, sin consultar la BD)"""
+        if not self.calificaciones_total:
+            return None
+        return self.calificaciones_suma / self.calificaciones_total
 
     #para obtener el nuemro de calificaciones
     def total_calificaciones(self):
         """Retorna el número total de calificaciones"""
-        return self.calificacion_set.count()
+        return self.calificaciones_total
+
+    def distribucion_calificaciones(self):
+        """
+        Cantidad y porcentaje de calificaciones por estrella, de 5 a 1.
+
+        Returns:
+            dict: {estrellas: {'count': int, 'porcentaje': float}}
+        """
+        distribucion = {}
+        for estrellas in range(5, 0, -1):
+            cantidad = getattr(self, f'calificaciones_{estrellas}')
+            porcentaje = cantidad / self.calificaciones_total * 100 if self.calificaciones_total else 0
+            distribucion[estrellas] = {'count': cantidad, 'porcentaje': round(porcentaje, 1)}
+        return distribucion
+
+    @classmethod
+    def registrar_calificacion(cls, terma_id, puntuacion, signo=1):
+        """
+        Suma (signo=1) o resta (signo=-1) una calificación de los agregados de
+        la terma con un único UPDATE atómico, sin recalcular sobre todas sus
+        calificaciones.
+
+        Args:
+            terma_id: ID de la terma
+            puntuacion: Puntuación de la calificación
+            signo: 1 al crear, -1 al eliminar
+        """
+        from django.db.models import DecimalField, F
+        from django.db.models.functions import Cast, Greatest, NullIf
+
+        # En el SET, las F() leen los valores previos de la fila. Si los
+        # agregados se desfasaron (p. ej. filas borradas con SQL), la resta
+        # se detiene en 0 en vez de violar el CHECK de los campos positivos;
+        # reconciliar_calificaciones corrige el desfase después
+        nueva_suma = Greatest(F('calificaciones_suma') + signo * puntuacion, 0)
+        nuevo_total = Greatest(F('calificaciones_total') + signo, 0)
+        campos = {
+            'calificaciones_suma': nueva_suma,
+            'calificaciones_total': nuevo_total,
+            'calificacion_promedio': Cast(nueva_suma, DecimalField(max_digits=12, decimal_places=4)) / NullIf(nuevo_total, 0),
+        }
+        if 1 <= puntuacion <= 5:
+            campo = f'calificaciones_{puntuacion}'
+            campos[campo] = Greatest(F(campo) + signo, 0)
+        cls.objects.filter(pk=terma_id).update(**campos)
+
+    CAMPOS_CALIFICACIONES = (
+        'calificaciones_total', 'calificaciones_suma', 'calificaciones_1',
+        'calificaciones_2', 'calificaciones_3', 'calificaciones_4', 'calificaciones_5',
+    )
+
+    @staticmethod
+    def agregados_calificaciones():
+        """Expresiones de aggregate()/annotate() que recalculan los agregados desde Calificacion."""
+        from django.db.models import Count, Q, Sum
+        from django.db.models.functions import Coalesce
+
+        agregados = {
+            'calificaciones_total': Count('id'),
+            'calificaciones_suma': Coalesce(Sum('puntuacion'), 0),
+        }
+        for estrellas in range(1, 6):
+            agregados[f'calificaciones_{estrellas}'] = Count('id', filter=Q(puntuacion=estrellas))
+        return agregados
+
+    def reconciliar_calificaciones(self):
+        """
+        Recalcula los agregados de calificaciones desde cero y corrige los que
+        se hayan desviado. La fila de la terma queda bloqueada mientras tanto,
+        así los UPDATE con F() concurrentes se aplican después sobre el valor
+        corregido.
+
+        Returns:
+            bool: True si había diferencias
+        """
+        from decimal import Decimal
+        from django.db import transaction
+
+        with transaction.atomic():
+            actuales = Terma.objects.select_for_update().filter(pk=self.pk).values(*self.CAMPOS_CALIFICACIONES).first()
+            reales = self.calificacion_set.aggregate(**self.agregados_calificaciones())
+            if actuales is None or actuales == reales:
+                return False
+            total = reales['calificaciones_total']
+            promedio = (Decimal(reales['calificaciones_suma']) / total).quantize(Decimal('0.01')) if total else None
+            Terma.objects.filter(pk=self.pk).update(**reales, calificacion_promedio=promedio)
+        for campo, valor in reales.items():
+            setattr(self, campo, valor)
+        self.calificacion_promedio = promedio
+        return True
 
     def ingresos_totales(self):
         """Calcula los ingresos totales del mes actual de la terma"""
@@ -243,86 +360,111 @@ class Terma(models.Model):
 
     def estadisticas_calificaciones(self):
         """Retorna estadísticas de calificaciones por período"""
-        from django.db.models import Count, Avg
+        from django.db.models import Avg, Count, Q
         ahora = timezone.now()
+        ultimo_mes = Q(fecha__gte=ahora - timedelta(days=30))
 
+        # Totales desde los agregados; las ventanas de tiempo, en una sola consulta
+        recientes = self.calificacion_set.filter(ultimo_mes).aggregate(
+            ultimos_7_dias=Count('id', filter=Q(fecha__gte=ahora - timedelta(days=7))),
+            ultimo_mes=Count('id'),
+            promedio_ultimo_mes=Avg('puntuacion'),
+        )
         return {
-            'total': self.calificacion_set.count(),
-            'ultimos_7_dias': self.calificacion_set.filter(
-                fecha__gte=ahora - timedelta(days=7)
-            ).count(),
-            'ultimo_mes': self.calificacion_set.filter(
-                fecha__gte=ahora - timedelta(days=30)
-            ).count(),
-            'promedio_general': self.calificacion_set.aggregate(
-                promedio=Avg('puntuacion')
-            )['promedio'] or 0,
-            'promedio_ultimo_mes': self.calificacion_set.filter(
-                fecha__gte=ahora - timedelta(days=30)
-            ).aggregate(
-                promedio=Avg('puntuacion')
-            )['promedio'] or 0,    
+            'total': self.calificaciones_total,
+            'ultimos_7_dias': recientes['ultimos_7_dias'],
+            'ultimo_mes': recientes['ultimo_mes'],
+            'promedio_general': self.promedio_calificacion() or 0,
+            'promedio_ultimo_mes': recientes['promedio_ultimo_mes'] or 0,
         }
 
-    def servicios_populares(self):
-        """Retorna estadísticas de servicios más utilizados"""
-        from collections import Counter
-        from ventas.models import ServicioExtraDetalle, DetalleCompra
+    # Las ventas pagadas invalidan antes; el TTL acota cambios que no pasan por save()
+    TTL_SERVICIOS_POPULARES = 60 * 60
+
+    @staticmethod
+    def namespace_servicios_populares(terma_id):
+        return f'servicios_populares_{terma_id}'
+
+    def servicios_populares(self, desde=None, hasta=None):
+        """
+        Retorna estadísticas de servicios más utilizados, ponderados por la
+        cantidad de entradas vendidas. Se calcula con dos consultas agrupadas
+        (servicios incluidos vía la tabla intermedia de la entrada y servicios
+        extra) y se guarda en cache por terma hasta la próxima venta pagada.
+
+        Args:
+            desde: Fecha de compra inicial (opcional)
+            hasta: Fecha de compra final, inclusive (opcional)
+        """
+        from django.core.cache import cache
         from django.db.models import Sum
-        
-        servicios_stats = {}
-        
-        # 1. Servicios incluidos en entradas vendidas
-        entradas_vendidas = DetalleCompra.objects.filter(
+        from usuarios.cache_utils import namespaced_key
+        from ventas.models import DetalleCompra, ServicioExtraDetalle
+        from ventas.utils import rango_de_dias
+
+        clave = namespaced_key(self.namespace_servicios_populares(self.pk), f"{desde}_{hasta}")
+        resultado = cache.get(clave)
+        if resultado is not None:
+            return resultado
+
+        # Límites en datetime local: compra__fecha_compra__date aplicaría
+        # una función a la columna e impediría usar sus índices
+        ventana = {}
+        if desde:
+            ventana['compra__fecha_compra__gte'] = rango_de_dias(desde, desde)[0]
+        if hasta:
+            ventana['compra__fecha_compra__lt'] = rango_de_dias(hasta, hasta)[1]
+
+        # 1. Servicios incluidos en entradas vendidas (cada fila del JOIN con
+        #    entradatipo_servicios suma la cantidad de su detalle)
+        incluidos = DetalleCompra.objects.filter(
             entrada_tipo__terma=self,
-            compra__estado_pago='pagado'
-        ).select_related('entrada_tipo')
-        
-        for detalle in entradas_vendidas:
-            # Validar que entrada_tipo no sea None
-            if not detalle.entrada_tipo:
-                continue
-                
-            servicios_incluidos = detalle.entrada_tipo.servicios.all()
-            cantidad_entradas = detalle.cantidad
-            
-            for servicio in servicios_incluidos:
-                if servicio.servicio not in servicios_stats:
-                    servicios_stats[servicio.servicio] = 0
-                servicios_stats[servicio.servicio] += cantidad_entradas
-        
+            compra__estado_pago='pagado',
+            **ventana
+        ).values('entrada_tipo__servicios__servicio').annotate(
+            total_cantidad=Sum('cantidad')
+        ).order_by()
+
         # 2. Servicios extra vendidos por separado
-        servicios_extra = ServicioExtraDetalle.objects.filter(
+        extras = ServicioExtraDetalle.objects.filter(
             detalle_compra__entrada_tipo__terma=self,
-            detalle_compra__compra__estado_pago='pagado'
-        ).select_related('servicio').values('servicio__servicio').annotate(
+            detalle_compra__compra__estado_pago='pagado',
+            **{f'detalle_compra__{campo}': valor for campo, valor in ventana.items()}
+        ).values('servicio__servicio').annotate(
             total_cantidad=Sum('cantidad')
-        )
-        
-        for servicio_extra in servicios_extra:
-            nombre_servicio = servicio_extra['servicio__servicio']
-            cantidad = servicio_extra['total_cantidad']
-            
-            # Validar que nombre_servicio no sea None
-            if not nombre_servicio:
-                continue
-                
-            if nombre_servicio not in servicios_stats:
-                servicios_stats[nombre_servicio] = 0
-            servicios_stats[nombre_servicio] += cantidad
-        
+        ).order_by()
+
+        servicios_stats = {}
+        filas = [(fila['entrada_tipo__servicios__servicio'], fila['total_cantidad']) for fila in incluidos]
+        filas += [(fila['servicio__servicio'], fila['total_cantidad']) for fila in extras]
+        for nombre_servicio, cantidad in filas:
+            if nombre_servicio and cantidad:
+                servicios_stats[nombre_servicio] = servicios_stats.get(nombre_servicio, 0) + cantidad
+
         # Convertir a lista ordenada para el gráfico
         servicios_ordenados = sorted(servicios_stats.items(), key=lambda x: x[1], reverse=True)
         
         # Tomar los top 5 servicios
         top_servicios = servicios_ordenados[:5]
         
-        return {
+        resultado = {
             'labels': [servicio[0] for servicio in top_servicios],
             'data': [servicio[1] for servicio in top_servicios],
             'total_servicios': len(servicios_stats),
             'detalle_completo': servicios_ordenados
         }
+        cache.set(clave, resultado, self.TTL_SERVICIOS_POPULARES)
+        return resultado
+
+    @classmethod
+    def invalidar_servicios_populares(cls, sender, instance, **kwargs):
+        """post_save de Compra: una venta pagada invalida las estadísticas de su terma."""
+        from django.db import transaction
+        from usuarios.cache_utils import bump_namespace_version
+
+        if instance.estado_pago == 'pagado' and instance.terma_id:
+            namespace = cls.namespace_servicios_populares(instance.terma_id)
+            transaction.on_commit(lambda: bump_namespace_version(namespace))
 
 
 class Calificacion(models.Model):
@@ -336,44 +478,71 @@ class Calificacion(models.Model):
         verbose_name = "Calificación"
         verbose_name_plural = "Calificaciones"
         ordering = ['-fecha']
+        indexes = [
+            # Opiniones recientes de una terma
+            models.Index(fields=['terma', 'fecha'], name='calificacion_terma_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.usuario.get_full_name()} - {self.terma.nombre_terma} ({self.puntuacion}★)"
 
     def save(self, *args, **kwargs):
-        """Sobrescribir save para actualizar calificacion_promedio de la terma."""
-        super().save(*args, **kwargs)
-        self.actualizar_promedio_terma()
-    
-    def delete(self, *args, **kwargs):
-        """Sobrescribir delete para actualizar calificacion_promedio de la terma."""
-        terma = self.terma
-        super().delete(*args, **kwargs)
-        self.actualizar_promedio_terma_manual(terma)
-    
-    def actualizar_promedio_terma(self):
-        """Actualiza el promedio de calificación de la terma asociada."""
-        from django.db.models import Avg
-        promedio = self.terma.calificacion_set.aggregate(promedio=Avg('puntuacion'))['promedio']
-        self.terma.calificacion_promedio = promedio
-        self.terma.save(update_fields=['calificacion_promedio'])
-    
-    @staticmethod
-    def actualizar_promedio_terma_manual(terma):
-        """Actualiza el promedio de calificación para una terma específica."""
-        from django.db.models import Avg
-        promedio = terma.calificacion_set.aggregate(promedio=Avg('puntuacion'))['promedio']
-        terma.calificacion_promedio = promedio
-        terma.save(update_fields=['calificacion_promedio'])
+        """Sobrescribir save para mantener los agregados de calificaciones de la terma."""
+        from django.db import transaction
+
+        with transaction.atomic():
+            anterior = None
+            if not self._state.adding:
+                anterior = Calificacion.objects.filter(pk=self.pk).values('terma_id', 'puntuacion').first()
+            super().save(*args, **kwargs)
 
+            if anterior is None:
+                Terma.registrar_calificacion(self.terma_id, self.puntuacion)
+            elif (anterior['terma_id'], anterior['puntuacion']) != (self.terma_id, self.puntuacion):
+                Terma.registrar_calificacion(anterior['terma_id'], anterior['puntuacion'], -1)
+                Terma.registrar_calificacion(self.terma_id, self.puntuacion)
+
+    @staticmethod
+    def al_eliminar(sender, instance, **kwargs):
+        """
+        post_delete: descuenta la calificación de la terma. Como signal (y no
+        en delete()) cubre también los borrados en cascada y por queryset.
+        """
+        Terma.registrar_calificacion(instance.terma_id, instance.puntuacion, -1)
 
 
 class ImagenTerma(models.Model):
+    ESTADOS_VARIANTES = [
+        ('pendiente', 'Pendiente'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+    # Ancho de variante que se usa como src por defecto (tarjetas del catálogo)
+    ANCHO_MINIATURA = 640
+
     uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, db_index=True)
     terma = models.ForeignKey(Terma, on_delete=models.CASCADE, related_name="imagenes")
     url_imagen = models.TextField()
     descripcion = models.TextField(null=True, blank=True)
 
+    # Variantes reducidas generadas en segundo plano (ver termas/imagenes.py)
+    estado_variantes = models.CharField(max_length=20, choices=ESTADOS_VARIANTES, default='pendiente', db_index=True)
+    ancho = models.PositiveIntegerField(null=True, blank=True)
+    alto = models.PositiveIntegerField(null=True, blank=True)
+    variantes = models.JSONField(default=dict, blank=True, help_text="{'webp'|'respaldo': {ancho: url}}")
+    srcset = models.TextField(blank=True, default='')
+    srcset_webp = models.TextField(blank=True, default='')
+
+    @property
+    def url_miniatura(self):
+        """Variante de respaldo más cercana a ANCHO_MINIATURA (o el original si aún no hay)."""
+        respaldo = (self.variantes or {}).get('respaldo')
+        if not respaldo:
+            return self.url_imagen
+        anchos = sorted(int(ancho) for ancho in respaldo)
+        ancho = next((a for a in anchos if a >= self.ANCHO_MINIATURA), anchos[-1])
+        return respaldo[str(ancho)]
+
 
 class ServicioTerma(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, db_index=True)
@@ -1,3 +1,270 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from usuarios.models import Usuario
+
+from .busqueda import filtrar_termas_por_texto, normalizar_texto
+from .models import Calificacion, Comuna, Region, Terma
+
+
+class BusquedaTermasTest(TestCase):
+    """Tests del índice de búsqueda por texto de termas."""
+
+    def setUp(self):
+        self.region = Region.objects.create(nombre='Ñuble')
+        self.comuna = Comuna.objects.create(nombre='Pinto', region=self.region)
+        self.chillan = Terma.objects.create(
+            nombre_terma='Termas de Chillán',
+            descripcion_terma='Aguas volcánicas',
+            comuna=self.comuna,
+            estado_suscripcion='activa',
+        )
+        self.valle = Terma.objects.create(
+            nombre_terma='Valle Hermoso',
+            descripcion_terma='Cerca de los volcanes de Chillán',
+            comuna=self.comuna,
+            estado_suscripcion='activa',
+        )
+
+    def buscar(self, texto):
+        return list(filtrar_termas_por_texto(Terma.objects.all(), texto))
+
+    def test_normalizar_elimina_tildes(self):
+        self.assertEqual(normalizar_texto('Ñuble Chillán'), 'nuble chillan')
+
+    def test_busqueda_sin_tildes_y_por_prefijo(self):
+        self.assertEqual(set(self.buscar('nuble')), {self.chillan, self.valle})
+        self.assertEqual(self.buscar('herm'), [self.valle])
+
+    def test_nombre_pesa_mas_que_descripcion(self):
+        self.assertEqual(self.buscar('chillan'), [self.chillan, self.valle])
+
+    def test_cambio_de_comuna_reindexa_termas(self):
+        self.comuna.nombre = 'Coihueco'
+        self.comuna.save()
+
+        self.assertEqual(len(self.buscar('coihueco')), 2)
+        self.assertEqual(self.buscar('pinto'), [])
+
+    def test_endpoint_sugerencias(self):
+        response = self.client.get('/termas/api/sugerencias/', {'q': 'val'})
+
+        sugerencias = response.json()['sugerencias']
+        self.assertEqual([s['nombre'] for s in sugerencias], ['Valle Hermoso'])
+        self.assertEqual(sugerencias[0]['region'], 'Ñuble')
+
+
+class AgregadosCalificacionesTest(TestCase):
+    """Agregados de calificaciones mantenidos con F() y reconciliados."""
+
+    def setUp(self):
+        self.terma = Terma.objects.create(nombre_terma='Termas Estrellas', estado_suscripcion='activa')
+        self.usuario = Usuario.objects.create_user('opina@estrellas.cl', 'Olga', 'Opina')
+
+    def calificar(self, *puntuaciones):
+        return [
+            Calificacion.objects.create(usuario=self.usuario, terma=self.terma, puntuacion=puntuacion)
+            for puntuacion in puntuaciones
+        ]
+
+    def test_crear_editar_y_eliminar_actualizan_agregados(self):
+        calificaciones = self.calificar(5, 4, 4, 1)
+        self.terma.refresh_from_db()
+        self.assertEqual(self.terma.total_calificaciones(), 4)
+        self.assertEqual(self.terma.calificacion_promedio, Decimal('3.50'))
+        self.assertEqual(self.terma.distribucion_calificaciones()[4], {'count': 2, 'porcentaje': 50.0})
+
+        calificaciones[3].puntuacion = 3
+        calificaciones[3].save()
+        Calificacion.objects.filter(pk=calificaciones[0].pk).delete()
+        self.terma.refresh_from_db()
+        self.assertEqual((self.terma.calificaciones_total, self.terma.calificaciones_suma), (3, 11))
+        self.assertEqual((self.terma.calificaciones_1, self.terma.calificaciones_3, self.terma.calificaciones_5), (0, 1, 0))
+        self.assertEqual(self.terma.calificacion_promedio, Decimal('3.67'))
+
+        # Borrado en cascada (el usuario se elimina)
+        self.usuario.delete()
+        self.terma.refresh_from_db()
+        self.assertEqual(self.terma.total_calificaciones(), 0)
+        self.assertIsNone(self.terma.calificacion_promedio)
+        self.assertIsNone(self.terma.promedio_calificacion())
+
+    def test_reconciliar_corrige_desvios(self):
+        self.calificar(5, 2)
+        Terma.objects.filter(pk=self.terma.pk).update(calificaciones_total=7, calificaciones_2=0)
+        call_command('reconciliar_calificaciones', stdout=StringIO())
+        self.terma.refresh_from_db()
+        self.assertEqual((self.terma.calificaciones_total, self.terma.calificaciones_2), (2, 1))
+        self.assertEqual(self.terma.calificacion_promedio, Decimal('3.50'))
+        self.assertFalse(self.terma.reconciliar_calificaciones())
+
+    def test_eliminar_con_agregados_desfasados_no_baja_de_cero(self):
+        calificacion, = self.calificar(4)
+        Terma.objects.filter(pk=self.terma.pk).update(
+            calificaciones_total=0, calificaciones_suma=0, calificaciones_4=0
+        )
+        calificacion.delete()
+        self.terma.refresh_from_db()
+        self.assertEqual(
+            (self.terma.calificaciones_total, self.terma.calificaciones_suma, self.terma.calificaciones_4), (0, 0, 0)
+        )
+        self.assertIsNone(self.terma.calificacion_promedio)
+
+
+class ServiciosPopularesTest(TestCase):
+    """Servicios populares calculados con consultas agrupadas y en cache."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from entradas.models import EntradaTipo
+        from .models import ServicioTerma
+
+        cache.clear()
+        self.terma = Terma.objects.create(nombre_terma='Termas Populares', estado_suscripcion='activa')
+        piscina = ServicioTerma.objects.create(terma=self.terma, servicio='Piscina', precio='0')
+        sauna = ServicioTerma.objects.create(terma=self.terma, servicio='Sauna', precio='0')
+        self.masaje = ServicioTerma.objects.create(terma=self.terma, servicio='Masaje', precio='10.000')
+        self.entrada = EntradaTipo.objects.create(terma=self.terma, nombre='Full', precio=Decimal('15000'))
+        self.entrada.servicios.add(piscina, sauna)
+        self.usuario = Usuario.objects.create_user('compra@populares.cl', 'Pía', 'Popular')
+
+        self.vender(3, masajes=2)
+        self.vender(5, estado='pendiente')
+
+    def vender(self, cantidad, masajes=0, estado='pagado'):
+        from ventas.models import Compra, DetalleCompra, ServicioExtraDetalle
+
+        compra = Compra.objects.create(usuario=self.usuario, terma=self.terma, total=Decimal('1'),
+                                       estado_pago=estado, cantidad=cantidad)
+        detalle = DetalleCompra.objects.create(compra=compra, entrada_tipo=self.entrada, cantidad=cantidad,
+                                               precio_unitario=Decimal('1'), subtotal=Decimal('1'))
+        if masajes:
+            ServicioExtraDetalle.objects.create(detalle_compra=detalle, servicio=self.masaje, cantidad=masajes,
+                                                precio_unitario=Decimal('10000'))
+        return compra
+
+    def test_agrupa_por_cantidad_y_usa_cache(self):
+        with self.assertNumQueries(2):
+            datos = self.terma.servicios_populares()
+        self.assertEqual(dict(datos['detalle_completo']), {'Piscina': 3, 'Sauna': 3, 'Masaje': 2})
+        self.assertEqual(datos['total_servicios'], 3)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.terma.servicios_populares(), datos)
+
+        # Una nueva venta pagada invalida el cache de la terma al confirmarse
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vender(1)
+        self.assertEqual(dict(self.terma.servicios_populares()['detalle_completo'])['Piscina'], 4)
+
+    def test_ventana_de_fechas(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        manana = timezone.localdate() + timedelta(days=1)
+        self.assertEqual(self.terma.servicios_populares(desde=manana)['total_servicios'], 0)
+        self.assertEqual(self.terma.servicios_populares(hasta=manana)['total_servicios'], 3)
+
+    def test_ventana_usa_el_dia_local(self):
+        from datetime import date, datetime
+        from django.utils import timezone
+        from ventas.models import Compra
+
+        # 23:30 del 10 de marzo en Chile ya es 11 de marzo en UTC
+        compra = self.vender(2)
+        Compra.objects.filter(pk=compra.pk).update(
+            fecha_compra=timezone.make_aware(datetime(2026, 3, 10, 23, 30))
+        )
+        datos = self.terma.servicios_populares(desde=date(2026, 3, 10), hasta=date(2026, 3, 10))
+        self.assertEqual(dict(datos['detalle_completo']), {'Piscina': 2, 'Sauna': 2})
+        self.assertEqual(self.terma.servicios_populares(desde=date(2026, 3, 11))['total_servicios'], 3)
+
+
+class ImagenesTermaTest(TestCase):
+    """Subida por bloques y variantes reducidas de las fotos."""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        ajustes = override_settings(MEDIA_ROOT=media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.terma = Terma.objects.create(nombre_terma='Termas Foto', estado_suscripcion='activa')
+
+    def foto(self, nombre='foto.jpg', tamaño=(2000, 1000)):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', tamaño, (30, 120, 200)).save(buffer, 'JPEG')
+        return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_genera_variantes_y_srcset(self):
+        from django.core.files.storage import default_storage
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        from .imagenes import guardar_original, procesar_imagenes_pendientes, validar_imagen
+        from .models import ImagenTerma
+
+        foto = self.foto()
+        self.assertTrue(validar_imagen(foto))
+        self.assertFalse(validar_imagen(SimpleUploadedFile('falsa.jpg', b'no es imagen')))
+        imagen = ImagenTerma.objects.create(terma=self.terma, url_imagen=guardar_original(foto))
+        self.assertEqual(imagen.url_miniatura, imagen.url_imagen)
+
+        self.assertEqual(procesar_imagenes_pendientes(), 1)
+        imagen.refresh_from_db()
+        self.assertEqual(imagen.estado_variantes, 'listo')
+        self.assertEqual((imagen.ancho, imagen.alto), (2000, 1000))
+        self.assertEqual(sorted(imagen.variantes['webp'], key=int), ['320', '640', '1280'])
+        self.assertTrue(imagen.srcset_webp.endswith('1280w'))
+        self.assertTrue(imagen.url_miniatura.endswith('_640.jpg'))
+
+        with default_storage.open(imagen.variantes['webp']['320'][len('/media/'):]) as archivo:
+            with Image.open(archivo) as variante:
+                self.assertEqual((variante.format, variante.size), ('WEBP', (320, 160)))
+
+    def test_foto_chica_no_se_agranda(self):
+        from .imagenes import guardar_original, procesar_imagenes_pendientes
+        from .models import ImagenTerma
+
+        imagen = ImagenTerma.objects.create(terma=self.terma, url_imagen=guardar_original(self.foto(tamaño=(200, 100))))
+        procesar_imagenes_pendientes()
+        imagen.refresh_from_db()
+        self.assertEqual(list(imagen.variantes['respaldo']), ['200'])
+
+    def test_rechaza_imagenes_con_demasiados_pixeles(self):
+        import struct
+        import zlib
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .imagenes import validar_imagen
+
+        def png_declarado(ancho, alto):
+            # Solo la cabecera: pocos bytes que declaran una imagen enorme
+            def bloque(tipo, datos):
+                return struct.pack('>I', len(datos)) + tipo + datos + struct.pack('>I', zlib.crc32(tipo + datos))
+            cabecera = bloque(b'IHDR', struct.pack('>IIBBBBB', ancho, alto, 1, 0, 0, 0, 0))
+            contenido = b'\x89PNG\r\n\x1a\n' + cabecera + bloque(b'IDAT', zlib.compress(b'')) + bloque(b'IEND', b'')
+            return SimpleUploadedFile('enorme.png', contenido, content_type='image/png')
+
+        # Sobre el límite de Pillow (DecompressionBombError) y sobre MAX_PIXELES
+        self.assertFalse(validar_imagen(png_declarado(20000, 20000)))
+        self.assertFalse(validar_imagen(png_declarado(8000, 6000)))
+
+    def test_jpeg_grande_se_decodifica_reducido(self):
+        from .imagenes import guardar_original, procesar_imagenes_pendientes
+        from .models import ImagenTerma
+
+        imagen = ImagenTerma.objects.create(terma=self.terma, url_imagen=guardar_original(self.foto(tamaño=(3000, 1500))))
+        procesar_imagenes_pendientes()
+        imagen.refresh_from_db()
+        self.assertEqual((imagen.ancho, imagen.alto), (3000, 1500))
+        self.assertEqual(sorted(imagen.variantes['webp'], key=int), ['320', '640', '1280'])
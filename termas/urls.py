@@ -8,6 +8,7 @@ urlpatterns = [
     path('', views.lista_termas, name='lista'),
     path('detalle/<uuid:uuid>/', views.detalle_terma, name='detalle'),
     path('buscar/', views.buscar_termas, name='buscar'),
+    path('api/sugerencias/', views.sugerencias_termas, name='sugerencias'),
     path('subir-fotos/', views.subir_fotos, name='subir_fotos'),
     path('eliminar-foto/<uuid:foto_uuid>/', views.eliminar_foto, name='eliminar_foto'),
     
@@ -21,6 +22,7 @@ urlpatterns = [
     path('admin/reporte-comisiones-diarias/', views_admin.reporte_comisiones_diarias, name='reporte_comisiones_diarias'),
     path('admin/detalle-distribucion/<uuid:distribucion_uuid>/', views_admin.ver_detalle_distribucion, name='ver_detalle_distribucion'),
     path('admin/exportar-comisiones-diarias-csv/', views_admin.exportar_comisiones_diarias_csv, name='exportar_comisiones_diarias_csv'),
+    path('admin/reporte-comisiones-diarias/solicitar/', views_admin.solicitar_reporte_comisiones, name='solicitar_reporte_comisiones'),
     
     # URL para filtrar comentarios AJAX
     path('comentarios-filtrados/<uuid:terma_uuid>/', cargar_comentarios_filtrados, name='comentarios_filtrados'),
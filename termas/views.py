@@ -6,6 +6,7 @@ from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.utils.html import escape
 from .models import Terma, Region, Comuna, ImagenTerma
+from .busqueda import filtrar_termas_por_texto, sugerir_termas
 from usuarios.models import Usuario
 from usuarios.decorators import admin_terma_required
 import os
@@ -55,13 +56,6 @@ def buscar_termas(request):
         # Construir query de búsqueda
         query = Q(estado_suscripcion='activa')
         # Si hay filtros, agregarlos al query
-        if busqueda:
-            query &= (
-                Q(nombre_terma__icontains=busqueda) |
-                Q(descripcion_terma__icontains=busqueda) |
-                Q(comuna__nombre__icontains=busqueda) |
-                Q(comuna__region__nombre__icontains=busqueda)
-            )
         if region_id:
             query &= Q(comuna__region__id=region_id)
         if comuna_id:
@@ -69,6 +63,9 @@ def buscar_termas(request):
 
         # Ejecutar la consulta (si no hay filtros, muestra todas las termas activas)
         termas_activas = Terma.objects.filter(query).select_related('comuna', 'comuna__region')
+        if busqueda:
+            # Índice de texto: sin tildes, por prefijo y ordenado por relevancia
+            termas_activas = filtrar_termas_por_texto(termas_activas, busqueda)
 
         # Ofertas Destacadas: 4 termas con el precio de entrada más barato
         # Filtrar termas con precio mínimo válido
@@ -104,6 +101,13 @@ def buscar_termas(request):
     except Usuario.DoesNotExist:
         messages.error(request, 'Sesión inválida.')
         return redirect('core:home')
+
+def sugerencias_termas(request):
+    """API JSON de autocompletado: termas activas cuyo texto empieza con 'q'."""
+    texto = request.GET.get('q', '').strip()
+    if len(texto) < 2:
+        return JsonResponse({'sugerencias': []})
+    return JsonResponse({'sugerencias': sugerir_termas(texto)})
     
 @admin_terma_required
 def subir_fotos(request):
@@ -179,22 +183,20 @@ def subir_fotos(request):
                 messages.error(request, error_msg)
                 return redirect('termas:subir_fotos')
             
+            from .imagenes import guardar_original, validar_imagen
+
+            # El content_type lo declara el navegador: confirmar que Pillow la puede abrir
+            if not validar_imagen(foto):
+                error_msg = 'El archivo no es una imagen válida.'
+                if is_ajax:
+                    return JsonResponse({'success': False, 'message': error_msg})
+                messages.error(request, error_msg)
+                return redirect('termas:subir_fotos')
+            
             try:
-                # Generar nombre único para el archivo
-                import uuid
-                from django.core.files.storage import default_storage
-                from django.core.files.base import ContentFile
-                
-                # Generar nombre único
-                extension = os.path.splitext(foto.name)[1]
-                filename = f"fotos_termas/{uuid.uuid4()}{extension}"
-                
-                # Guardar archivo
-                saved_path = default_storage.save(filename, ContentFile(foto.read()))
-                
-                # Crear URL completa
-                from django.conf import settings
-                url_completa = f"{settings.MEDIA_URL}{saved_path}"
+                # Guardar el original por bloques; las variantes reducidas las
+                # genera después el comando procesar_imagenes
+                url_completa = guardar_original(foto)
                 
                 # Crear nueva imagen en la base de datos
                 nueva_imagen = ImagenTerma.objects.create(
@@ -266,15 +268,9 @@ def eliminar_foto(request, foto_uuid):
         # Obtener la imagen y verificar que pertenezca a la terma del usuario
         imagen = get_object_or_404(ImagenTerma, uuid=foto_uuid, terma=terma)
         
-        # Eliminar el archivo físico si existe
-        try:
-            from django.core.files.storage import default_storage
-            # Extraer el path del archivo desde la URL
-            file_path = imagen.url_imagen.replace('/media/', '')
-            if default_storage.exists(file_path):
-                default_storage.delete(file_path)
-        except Exception as e:
-            logger.error(f"Error al eliminar archivo físico: {e}")
+        # Eliminar el archivo original y sus variantes
+        from .imagenes import eliminar_archivos
+        eliminar_archivos(imagen)
         
         # Eliminar el registro de la base de datos
         imagen.delete()
@@ -391,8 +387,8 @@ def analisis_terma(request):
         tipos_labels = list(tipos.keys())
         tipos_values = list(tipos.values())
 
-            # Análisis de servicios más vendidos usando el nuevo método del modelo
-        servicios_data = terma.servicios_populares()
+        # Servicios más vendidos en el mismo rango que el resto del análisis
+        servicios_data = terma.servicios_populares(desde=fecha_inicio, hasta=hoy)
         servicios_populares = [
             {
                 'servicio': label,
@@ -904,7 +900,6 @@ def vista_terma(request, terma_uuid):
     
     entradas = terma.get_tipos_entrada()
     imagenes = ImagenTerma.objects.filter(terma=terma)
-    calificacion_promedio = terma.promedio_calificacion()
 
     from django.core import serializers
     import json
@@ -956,6 +951,10 @@ def vista_terma(request, terma_uuid):
         puntuacion = int(request.POST.get('puntuacion'))
         comentario = request.POST.get('comentario')
         
+        if not 1 <= puntuacion <= 5:
+            messages.error(request, 'La puntuación debe estar entre 1 y 5 estrellas.')
+            return redirect(request.path)
+
         if request.user.is_authenticated:
             from termas.models import Calificacion
             from django.db import IntegrityError, transaction
@@ -988,18 +987,10 @@ def vista_terma(request, terma_uuid):
             return redirect('usuarios:inicio')
 
     opiniones = terma.calificacion_set.select_related('usuario').order_by('-fecha')
+    # Promedio, total y distribución salen de los agregados de la terma
     calificacion_promedio = terma.promedio_calificacion()
     cantidad_opiniones = terma.total_calificaciones()
-    
-    # Calcular distribución real de calificaciones por estrella
-    distribucion_estrellas = {}
-    for i in range(1, 6):
-        count = terma.calificacion_set.filter(puntuacion=i).count()
-        porcentaje = (count / cantidad_opiniones * 100) if cantidad_opiniones > 0 else 0
-        distribucion_estrellas[i] = {
-            'count': count,
-            'porcentaje': round(porcentaje, 1)
-        }
+    distribucion_estrellas = terma.distribucion_calificaciones()
     
     context = {
         'terma': terma,
@@ -267,8 +267,7 @@ def detalles_solicitud(request, solicitud_uuid):
 def ver_distribuciones_pago(request):
     """Vista para que los administradores vean las distribuciones de pago"""
     from ventas.models import DistribucionPago, ResumenComisionesPlataforma
-    from django.db.models import Sum, Count
-    from django.core.paginator import Paginator
+    from core.paginacion import paginar_keyset
     import json
     
     # Filtros
@@ -297,7 +296,7 @@ def ver_distribuciones_pago(request):
     # Query base
     distribuciones = DistribucionPago.objects.select_related(
         'compra', 'terma', 'plan_utilizado'
-    ).order_by('-fecha_calculo')
+    )
     
     # Aplicar filtros
     if estado_filtro:
@@ -312,19 +311,15 @@ def ver_distribuciones_pago(request):
     if año_filtro:
         distribuciones = distribuciones.filter(fecha_calculo__year=año_filtro)
     
-    # Paginación
-    paginator = Paginator(distribuciones, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Estadísticas generales
-    stats = DistribucionPago.objects.aggregate(
-        total_ventas=Sum('monto_total'),
-        total_comisiones=Sum('monto_comision_plataforma'),
-        total_pagado_termas=Sum('monto_para_terma'),
-        total_transacciones=Count('id')
+    # Paginación por keyset; el total se estima si el conjunto es grande
+    page_obj = paginar_keyset(
+        request, distribuciones, ('-fecha_calculo', '-id'), 20, conteo='aproximado'
     )
     
+    # Estadísticas generales (snapshot cacheado, ver core/kpis.py)
+    from core.kpis import obtener_kpis
+    stats = obtener_kpis('distribuciones')['distribuciones']
+    
     # Resúmenes mensuales recientes
     resumenes = ResumenComisionesPlataforma.objects.order_by('-año', '-mes')[:12]
     
@@ -519,7 +514,6 @@ def exportar_comisiones_diarias_csv(request):
     """Exporta el reporte de comisiones diarias a CSV para el administrador general."""
     from datetime import datetime
     from django.http import HttpResponse
-    import csv
 
     fecha_inicio_str = request.GET.get('fecha_inicio')
     fecha_fin_str = request.GET.get('fecha_fin')
@@ -542,48 +536,62 @@ def exportar_comisiones_diarias_csv(request):
         except (ValueError, TypeError):
             terma_id = None
 
-    # Obtener datos usando la utilidad existente
-    from ventas.utils import obtener_reporte_comisiones_diarias
-    reporte = obtener_reporte_comisiones_diarias(fecha_inicio, fecha_fin, terma_id)
+    # Generar el CSV en streaming: las distribuciones se leen por bloques
+    from core.exportacion import CHUNK_SIZE_EXPORTACION, respuesta_csv_streaming
+    from ventas.utils import iterar_comisiones_diarias
 
-    # Crear respuesta CSV
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = (
-        f'attachment; filename="comisiones_diarias_{fecha_inicio}_{fecha_fin}.csv"'
+    def filas():
+        for fecha, terma_nombre, datos in iterar_comisiones_diarias(
+            fecha_inicio, fecha_fin, terma_id, chunk_size=CHUNK_SIZE_EXPORTACION
+        ):
+            yield [
+                fecha.strftime('%Y-%m-%d'),
+                terma_nombre,
+                datos['plan'],
+                datos['porcentaje_comision'],
+                datos['ventas'],
+                datos['comisiones'],
+                datos['pagado_terma'],
+                datos['transacciones']
+            ]
+
+    return respuesta_csv_streaming(
+        f"comisiones_diarias_{fecha_inicio}_{fecha_fin}.csv",
+        [
+            'Fecha', 'Terma', 'Plan', '% Comisión', 'Ventas Totales',
+            'Comisión Ganada', 'Pagado a Terma', 'Transacciones'
+        ],
+        filas()
     )
-    response.write('\ufeff')  # BOM UTF-8
 
-    writer = csv.writer(response)
-    writer.writerow([
-        'Fecha', 'Terma', 'Plan', '% Comisión', 'Ventas Totales',
-        'Comisión Ganada', 'Pagado a Terma', 'Transacciones'
-    ])
 
-    # Estructura real: lista de días [{'fecha': date, 'termas': {nombre: datos}, 'totales': {...}}, ...]
-    reporte_diario = reporte.get('reporte_diario', [])
-    for dia in reporte_diario:
-        fecha_obj = dia.get('fecha')
-        fecha_str = fecha_obj.strftime('%Y-%m-%d') if hasattr(fecha_obj, 'strftime') else str(fecha_obj)
-        termas_dict = dia.get('termas', {})
-        for terma_nombre, datos in termas_dict.items():
-            writer.writerow([
-                fecha_str,
-                terma_nombre,
-                datos.get('plan', ''),
-                datos.get('porcentaje_comision', ''),
-                datos.get('ventas', 0),
-                datos.get('comisiones', 0),
-                datos.get('pagado_terma', 0),
-                datos.get('transacciones', 0)
-            ])
+@admin_general_required
+@require_http_methods(["POST"])
+def solicitar_reporte_comisiones(request):
+    """Encola el CSV de comisiones diarias para generarse en segundo plano."""
+    from datetime import datetime
+    from ventas.trabajos_reporte import encolar_reporte
+    from usuarios.views_reportes import estado_trabajo_json
+
+    try:
+        fecha_inicio = datetime.strptime(request.POST.get('fecha_inicio', ''), '%Y-%m-%d').date()
+        fecha_fin = datetime.strptime(request.POST.get('fecha_fin', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
+
+    parametros = {'fecha_inicio': fecha_inicio.isoformat(), 'fecha_fin': fecha_fin.isoformat()}
+    terma_id = request.POST.get('terma_id')
+    if terma_id and terma_id.isdigit():
+        parametros['terma_id'] = int(terma_id)
 
-    return response
+    trabajo, creado = encolar_reporte('comisiones_csv', parametros, usuario=request.user)
+    return JsonResponse(estado_trabajo_json(trabajo), status=202 if creado else 200)
 
 
 @admin_general_required
 def usuarios_registrados(request):
     """Vista principal para gestión de usuarios registrados"""
-    from django.core.paginator import Paginator
+    from core.paginacion import paginar_keyset
     from django.db.models import Q, Count
     
     # Filtros
@@ -596,7 +604,7 @@ def usuarios_registrados(request):
     }
     
     # Query base
-    usuarios = Usuario.objects.select_related('rol', 'terma').order_by('-fecha_registro')
+    usuarios = Usuario.objects.select_related('rol', 'terma')
     
     # Aplicar filtros
     if filtros['nombre']:
@@ -618,19 +626,14 @@ def usuarios_registrados(request):
     if filtros['terma']:
         usuarios = usuarios.filter(terma__id=filtros['terma'])
     
-    # Paginación
-    paginator = Paginator(usuarios, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por keyset; el total se estima si el conjunto es grande
+    page_obj = paginar_keyset(
+        request, usuarios, ('-fecha_registro', '-id'), 20, conteo='aproximado'
+    )
     
-    # Estadísticas
-    stats = {
-        'total_usuarios': Usuario.objects.count(),
-        'usuarios_activos': Usuario.objects.filter(estado=True).count(),
-        'usuarios_inactivos': Usuario.objects.filter(estado=False).count(),
-        'admins_terma': Usuario.objects.filter(rol__nombre='administrador_terma').count(),
-        'clientes': Usuario.objects.filter(rol__nombre='cliente').count(),
-    }
+    # Estadísticas (snapshot cacheado, ver core/kpis.py)
+    from core.kpis import obtener_kpis
+    stats = obtener_kpis('usuarios')['usuarios']
     
     # Datos para formularios
     roles = Rol.objects.filter(activo=True).order_by('nombre')
@@ -3,6 +3,13 @@ from django.contrib.auth.hashers import check_password
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.conf import settings
+from .cache_utils import (
+    user_cache_key,
+    user_email_cache_key,
+    rate_limit_ip_key,
+    rate_limit_email_key,
+    incr_counter,
+)
 import logging
 from datetime import datetime, timedelta
 
@@ -102,7 +109,7 @@ class CustomAuthBackend(BaseBackend):
         """
         try:
             # Usar caché muy corto (30 segundos) para evitar problemas
-            cache_key = f"user_{user_id}"
+            cache_key = user_cache_key(user_id)
             usuario = cache.get(cache_key)
             
             if usuario is None:
@@ -124,7 +131,7 @@ class CustomAuthBackend(BaseBackend):
         """
         Obtiene usuario por email con cache mínimo.
         """
-        cache_key = f"user_email_{email}"
+        cache_key = user_email_cache_key(email)
         usuario = cache.get(cache_key)
         
         if usuario is None:
@@ -212,13 +219,12 @@ class CustomAuthBackend(BaseBackend):
         
         ip = self._get_client_ip(request)
         
-        # Rate limit por IP
-        ip_key = f"auth_attempts_ip_{ip}"
-        ip_attempts = cache.get(ip_key, 0)
-        
-        # Rate limit por email
-        email_key = f"auth_attempts_email_{email}"
-        email_attempts = cache.get(email_key, 0)
+        # Rate limit por IP y por email (una sola consulta al cache)
+        ip_key = rate_limit_ip_key(ip)
+        email_key = rate_limit_email_key(email)
+        intentos = cache.get_many([ip_key, email_key])
+        ip_attempts = intentos.get(ip_key, 0)
+        email_attempts = intentos.get(email_key, 0)
         
         # Límites configurables
         max_attempts_per_ip = getattr(settings, 'AUTH_MAX_ATTEMPTS_PER_IP', 20)
@@ -241,12 +247,9 @@ class CustomAuthBackend(BaseBackend):
         
         ip = self._get_client_ip(request)
         
-        # Incrementar contadores
-        ip_key = f"auth_attempts_ip_{ip}"
-        email_key = f"auth_attempts_email_{email}"
-        
-        cache.set(ip_key, cache.get(ip_key, 0) + 1, 3600)  # 1 hora
-        cache.set(email_key, cache.get(email_key, 0) + 1, 1800)  # 30 minutos
+        # Incrementar contadores de forma atómica (compartidos entre workers)
+        incr_counter(rate_limit_ip_key(ip), 3600)  # 1 hora
+        incr_counter(rate_limit_email_key(email), 1800)  # 30 minutos
         
         # Log del evento
         logger.warning(f"Intento de autenticación fallido: {email} desde {ip} - Razón: {reason}")
@@ -269,8 +272,10 @@ class CustomAuthBackend(BaseBackend):
         logger.info(f"Login exitoso: {usuario.email} desde {ip}")
         
         # Limpiar cache del usuario para refrescar datos
-        cache.delete(f"user_{usuario.id}")
-        cache.delete(f"user_email_{usuario.email}")
+        cache.delete_many([
+            user_cache_key(usuario.id),
+            user_email_cache_key(usuario.email),
+        ])
     
     def _clear_failed_attempts(self, request, email):
         """
@@ -281,11 +286,10 @@ class CustomAuthBackend(BaseBackend):
         
         ip = self._get_client_ip(request)
         
-        ip_key = f"auth_attempts_ip_{ip}"
-        email_key = f"auth_attempts_email_{email}"
-        
-        cache.delete(ip_key)
-        cache.delete(email_key)
+        cache.delete_many([
+            rate_limit_ip_key(ip),
+            rate_limit_email_key(email),
+        ])
     
     def _get_client_ip(self, request):
         """
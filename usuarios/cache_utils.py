@@ -2,13 +2,124 @@
 Utilidades para manejo de cache de usuarios y autenticación.
 Estas funciones aseguran que el cache se limpie automáticamente
 cuando se modifican datos críticos para la autenticación.
+
+Todas las operaciones usan solo la API pública de Django (get/set/add/incr/
+delete), por lo que funcionan igual con LocMemCache (desarrollo y tests) que
+con un backend compartido como Redis (producción con varios workers).
 """
 
 from django.core.cache import cache
 import logging
+import time
 
 logger = logging.getLogger('cache')
 
+# Namespaces de cache versionados. Invalidar un namespace completo consiste en
+# incrementar su versión: las claves antiguas quedan huérfanas y expiran solas,
+# sin necesidad de recorrer las claves del backend.
+AUTH_NAMESPACE = 'auth'
+RATE_LIMIT_NAMESPACE = 'auth_attempts'
+
+
+def _version_inicial():
+    """
+    Versión con la que se (re)crea un namespace: milisegundos actuales.
+    Si el backend descarta la clave de versión (LocMemCache hace cull al
+    llenarse), la nueva versión no coincide con ninguna anterior y las
+    claves viejas que sigan en el cache no reviven.
+    """
+    return int(time.time() * 1000)
+
+
+def get_namespace_version(namespace):
+    """
+    Retorna la versión actual de un namespace de cache.
+    
+    Args:
+        namespace: Nombre del namespace (ej: 'auth')
+    """
+    version_key = f"ns_version_{namespace}"
+    version = cache.get(version_key)
+    if version is None:
+        # add() es atómico: si otro proceso la creó primero, se respeta su valor
+        version = _version_inicial()
+        cache.add(version_key, version, None)
+        version = cache.get(version_key, version)
+    return version
+
+
+def bump_namespace_version(namespace):
+    """
+    Invalida todas las claves de un namespace incrementando su versión.
+    
+    Args:
+        namespace: Nombre del namespace a invalidar
+    """
+    version_key = f"ns_version_{namespace}"
+    try:
+        version = cache.incr(version_key)
+    except ValueError:
+        # La versión no existía (o fue descartada): una nueva semilla
+        # invalida cualquier versión anterior
+        version = _version_inicial()
+        if not cache.add(version_key, version, None):
+            version = cache.incr(version_key)
+    logger.info(f"Namespace de cache '{namespace}' invalidado (versión {version})")
+    return version
+
+
+def namespaced_key(namespace, key):
+    """
+    Construye una clave de cache dentro de la versión vigente de un namespace.
+    
+    Args:
+        namespace: Nombre del namespace
+        key: Clave relativa (ej: 'user_15')
+    """
+    return f"{namespace}:{get_namespace_version(namespace)}:{key}"
+
+
+def user_cache_key(user_id):
+    """Clave de cache del usuario por ID."""
+    return namespaced_key(AUTH_NAMESPACE, f"user_{user_id}")
+
+
+def user_email_cache_key(email):
+    """Clave de cache del usuario por email."""
+    return namespaced_key(AUTH_NAMESPACE, f"user_email_{email}")
+
+
+def rate_limit_ip_key(ip):
+    """Clave del contador de intentos fallidos por IP."""
+    return namespaced_key(RATE_LIMIT_NAMESPACE, f"ip_{ip}")
+
+
+def rate_limit_email_key(email):
+    """Clave del contador de intentos fallidos por email."""
+    return namespaced_key(RATE_LIMIT_NAMESPACE, f"email_{email}")
+
+
+def incr_counter(key, timeout):
+    """
+    Incrementa atómicamente un contador de cache y retorna su nuevo valor.
+    
+    El primer incremento crea la clave con el timeout indicado; los siguientes
+    usan incr(), que es atómico en backends compartidos y conserva el TTL.
+    
+    Args:
+        key: Clave del contador
+        timeout: Segundos de vida del contador desde su creación
+    """
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # El contador expiró entre add() e incr()
+        cache.add(key, 1, timeout)
+        return 1
+
+
 def clear_user_cache(usuario):
     """
     Limpia todo el cache relacionado con un usuario específico.
@@ -26,11 +137,11 @@ def clear_user_cache(usuario):
         user_id = None
     
     cache_keys = [
-        f"user_email_{email}",
+        user_email_cache_key(email),
     ]
     
     if user_id:
-        cache_keys.append(f"user_{user_id}")
+        cache_keys.append(user_cache_key(user_id))
     
     for key in cache_keys:
         result = cache.delete(key)
@@ -66,16 +177,10 @@ def clear_all_auth_cache():
     Limpia todo el cache relacionado con autenticación.
     Usar solo cuando sea necesario un reset completo.
     """
-    # Patrones de cache que queremos limpiar
-    patterns = [
-        'user_email_*',
-        'user_*',
-        'auth_attempts_*',
-    ]
-    
-    # Django no soporta wildcards nativamente, así que limpiamos todo
-    cache.clear()
-    logger.warning("Cache completo limpiado - operación drástica realizada")
+    # Invalidar por versión en lugar de recorrer claves o vaciar el backend
+    bump_namespace_version(AUTH_NAMESPACE)
+    bump_namespace_version(RATE_LIMIT_NAMESPACE)
+    logger.warning("Cache de autenticación invalidado - operación drástica realizada")
 
 
 def clear_rate_limit_cache(email, ip=None):
@@ -87,11 +192,11 @@ def clear_rate_limit_cache(email, ip=None):
         ip: IP opcional para limpiar también
     """
     cache_keys = [
-        f"auth_attempts_email_{email}",
+        rate_limit_email_key(email),
     ]
     
     if ip:
-        cache_keys.append(f"auth_attempts_ip_{ip}")
+        cache_keys.append(rate_limit_ip_key(ip))
     
     for key in cache_keys:
         cache.delete(key)
@@ -142,4 +247,31 @@ def auto_clear_cache_on_rol_change(sender, instance, **kwargs):
     for usuario in usuarios_con_rol:
         clear_user_cache(usuario)
     
-    logger.info(f"Auto-limpieza de cache para rol: {instance.nombre}")
\ No newline at end of file
+    logger.info(f"Auto-limpieza de cache para rol: {instance.nombre}")
+
+
+# =================== CONTADORES DEL NAVBAR ===================
+
+SOLICITUDES_PENDIENTES_KEY = 'badge_solicitudes_pendientes'
+
+
+def get_solicitudes_pendientes_count():
+    """
+    Retorna la cantidad de solicitudes de terma pendientes desde el cache.
+    
+    El contador se invalida por signal cuando cambia una SolicitudTerma, por
+    lo que puede cachearse más tiempo que el timeout por defecto.
+    """
+    count = cache.get(SOLICITUDES_PENDIENTES_KEY)
+    if count is None:
+        from termas.models import SolicitudTerma
+        count = SolicitudTerma.objects.filter(estado='pendiente').count()
+        cache.set(SOLICITUDES_PENDIENTES_KEY, count, 600)
+    return count
+
+
+def clear_solicitudes_count_cache(sender=None, instance=None, **kwargs):
+    """
+    Signal handler que invalida el contador de solicitudes pendientes.
+    """
+    cache.delete(SOLICITUDES_PENDIENTES_KEY)
@@ -2,36 +2,47 @@
 Middleware para limpiar variables de sesión específicas entre usuarios.
 """
 import logging
+import time
+from django.conf import settings
 from django.core.cache import cache
+from .cache_utils import user_cache_key, user_email_cache_key, rate_limit_ip_key
 
 logger = logging.getLogger('usuarios')
 
+# Clave de sesión con el timestamp (epoch) de la última renovación de expiración
+SESSION_REFRESH_KEY = '_ultima_renovacion'
+
 
 class CleanRequestMiddleware:
     """
     Middleware que limpia variables específicas del request para evitar
     que se mantengan entre diferentes usuarios o sesiones.
     También limpia automáticamente el caché de autenticación.
+
+    Solo modifica la sesión cuando su contenido cambia realmente, y renueva
+    la expiración como máximo una vez cada SESSION_REFRESH_INTERVAL_MINUTES,
+    de modo que una vista normal no provoca un UPDATE sobre la sesión.
     """
-    
+
     def __init__(self, get_response):
         self.get_response = get_response
-    
+        self.refresh_interval = getattr(settings, 'SESSION_REFRESH_INTERVAL_MINUTES', 5) * 60
+
     def __call__(self, request):
         # Excluir rutas de API móvil para evitar interferencias
         if self.is_api_request(request):
             return self.get_response(request)
-        
+
         # Limpiar variables específicas al inicio de cada request
         self.clean_request_variables(request)
-        
+
         # Limpiar caché de autenticación automáticamente
         self.clean_auth_cache(request)
-        
+
         response = self.get_response(request)
-        
+
         return response
-    
+
     def is_api_request(self, request):
         """
         Determina si la request es para la API móvil
@@ -41,7 +52,7 @@ class CleanRequestMiddleware:
             '/api/',
         ]
         return any(request.path.startswith(path) for path in api_paths)
-    
+
     def clean_request_variables(self, request):
         """
         Limpia variables específicas que no deberían persistir entre requests
@@ -53,36 +64,34 @@ class CleanRequestMiddleware:
             '_user_cache',
             '_auth_cache'
         ]
-        
+
         for var in variables_to_clean:
             if hasattr(request, var):
                 delattr(request, var)
                 logger.debug(f"Variable {var} limpiada del request")
-    
+
     def clean_auth_cache(self, request):
         """
-        Limpia automáticamente el caché de autenticación cuando cambia el usuario.
+        Limpia el caché de autenticación solo cuando el usuario de la sesión
+        ya no coincide con el usuario autenticado (p. ej. fue desactivado).
         """
-        current_user_id = request.user.id if request.user.is_authenticated else None
         session_user_id = request.session.get('_auth_user_id')
-        
-        # Si el usuario en la sesión es diferente al usuario en caché, limpiar
-        if current_user_id != session_user_id:
-            # Limpiar cachés específicos de usuarios
-            if session_user_id:
-                cache.delete(f"user_{session_user_id}")
-                cache.delete(f"user_email_{request.session.get('_last_email', '')}")
-                logger.info(f"Caché de usuario {session_user_id} limpiado")
-            
-            # Limpiar caché general de autenticación cada cierto tiempo
-            if not hasattr(request, '_cache_cleaned'):
-                cache.delete_many([
-                    f"user_{current_user_id}" if current_user_id else None,
-                    'auth_attempts_ip_' + self._get_client_ip(request),
-                ])
-                request._cache_cleaned = True
-                logger.debug("Caché de autenticación limpiado")
-    
+        if session_user_id is None:
+            return
+
+        current_user_id = request.user.id if request.user.is_authenticated else None
+
+        # La sesión guarda el ID como string: comparar en el mismo tipo
+        if str(current_user_id) == str(session_user_id):
+            return
+
+        cache.delete_many([
+            user_cache_key(session_user_id),
+            user_email_cache_key(request.session.get('_last_email', '')),
+            rate_limit_ip_key(self._get_client_ip(request)),
+        ])
+        logger.info(f"Caché de usuario {session_user_id} limpiado")
+
     def _get_client_ip(self, request):
         """Obtiene la IP del cliente"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -91,30 +100,37 @@ class CleanRequestMiddleware:
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip or 'unknown'
-    
+
+    def refresh_session_expiry(self, request):
+        """
+        Renueva la expiración de la sesión como máximo una vez por intervalo.
+
+        Con SESSION_SAVE_EVERY_REQUEST desactivado, la sesión solo se guarda
+        cuando se modifica; escribir el timestamp marca la sesión como
+        modificada y SessionMiddleware extiende su expiración.
+        """
+        ahora = int(time.time())
+        ultima = request.session.get(SESSION_REFRESH_KEY, 0)
+        if ahora - ultima >= self.refresh_interval:
+            request.session[SESSION_REFRESH_KEY] = ahora
+
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
         Se ejecuta antes de que Django llame a la vista.
-        Aquí podemos hacer limpieza adicional si es necesario.
+        Solo escribe en la sesión cuando el valor cambia.
         """
         # Excluir rutas de API móvil
         if self.is_api_request(request):
             return None
-            
-        # Si el usuario cambió desde la última request, limpiar todo
-        if hasattr(request, '_last_user_id') and request.user.is_authenticated:
-            if request._last_user_id != request.user.id:
-                logger.info(f"Usuario cambió de {request._last_user_id} a {request.user.id}, limpiando variables")
-                self.clean_request_variables(request)
-                # Limpiar caché específico del usuario anterior
-                cache.delete(f"user_{request._last_user_id}")
-        
-        # Guardar el ID del usuario actual para la próxima request
+
         if request.user.is_authenticated:
             request._last_user_id = request.user.id
-            request.session['_last_email'] = request.user.email
+            if request.session.get('_last_email') != request.user.email:
+                request.session['_last_email'] = request.user.email
+            self.refresh_session_expiry(request)
         else:
             request._last_user_id = None
+            # pop() solo marca la sesión como modificada si la clave existía
             request.session.pop('_last_email', None)
-        
-        return None
\ No newline at end of file
+
+        return None
@@ -1,65 +1,93 @@
-from termas.models import SolicitudTerma
-from .models import Usuario
+from functools import cached_property
+from .cache_utils import get_solicitudes_pendientes_count
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class NavbarData:
+    """
+    Datos del navbar calculados de forma perezosa y memoizados por request.
+
+    Cada propiedad solo consulta la BD si una plantilla la usa, y como la
+    instancia se guarda en el request, varios renders dentro del mismo
+    request (includes, parciales) reutilizan los mismos resultados.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def usuario(self):
+        """Usuario fresco desde la BD (una sola consulta con rol y terma)."""
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        try:
+            return User.objects.select_related('rol', 'terma').get(id=self.request.user.id)
+        except User.DoesNotExist:
+            return self.request.user
+
+    @cached_property
+    def solicitudes_count(self):
+        try:
+            return get_solicitudes_pendientes_count()
+        except Exception as e:
+            logger.warning(f"Error obteniendo solicitudes pendientes: {str(e)}")
+            return 0
+
+    @cached_property
+    def terma_trabajador(self):
+        if self.usuario.terma:
+            return self.usuario.terma
+        # Fallback a terma activa si no tiene asignada
+        from termas.models import Terma
+        return Terma.objects.filter(estado_suscripcion='activa').first()
+
+
 def navbar_context(request):
     """
     Context processor para el navbar usando Django Auth.
     Proporciona datos del usuario y estadísticas para las plantillas.
+
+    Los valores se entregan como callables: el motor de plantillas los evalúa
+    solo al acceder a la variable, así que las vistas AJAX, los parciales y
+    las páginas de error que no usan el navbar no generan consultas.
     """
     context = {}
-    
+
     try:
         # Usar Django Auth para obtener usuario
         if request.user.is_authenticated:
-            # SIEMPRE obtener datos frescos desde la BD para evitar cache
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            try:
-                usuario_fresco = User.objects.get(id=request.user.id)
-                context['usuario'] = usuario_fresco
-            except User.DoesNotExist:
-                context['usuario'] = request.user
-            
-            # Agregar contexto específico por rol
-            if hasattr(context['usuario'], 'rol') and context['usuario'].rol:
-                context['usuario_rol'] = context['usuario'].rol.nombre
-                
+            datos = getattr(request, '_navbar_data', None)
+            if datos is None:
+                datos = request._navbar_data = NavbarData(request)
+
+            context['usuario'] = lambda: datos.usuario
+
+            # El rol ya viene cargado en request.user (select_related del
+            # backend), así que decidir las claves por rol no consulta la BD
+            rol = getattr(request.user, 'rol', None)
+            if rol:
+                context['usuario_rol'] = rol.nombre
+
                 # Context específico para admin general
-                if context['usuario'].rol.nombre == 'administrador_general':
-                    try:
-                        solicitudes_count = SolicitudTerma.objects.filter(estado='pendiente').count()
-                        context['solicitudes_count'] = solicitudes_count
-                    except Exception as e:
-                        logger.warning(f"Error obteniendo solicitudes pendientes: {str(e)}")
-                        context['solicitudes_count'] = 0
-                
-                # Context específico para admin de terma  
-                elif request.user.rol.nombre == 'administrador_terma':
-                    if request.user.terma:
-                        context['terma_usuario'] = request.user.terma
-                        context['tiene_terma'] = True
-                    else:
-                        context['tiene_terma'] = False
-                
+                if rol.nombre == 'administrador_general':
+                    context['solicitudes_count'] = lambda: datos.solicitudes_count
+
+                # Context específico para admin de terma
+                elif rol.nombre == 'administrador_terma':
+                    context['terma_usuario'] = lambda: datos.usuario.terma
+                    context['tiene_terma'] = lambda: bool(datos.usuario.terma)
+
                 # Context para trabajador
-                elif request.user.rol.nombre == 'trabajador':
+                elif rol.nombre == 'trabajador':
                     context['es_trabajador'] = True
-                    # Obtener terma del trabajador
-                    if hasattr(request.user, 'terma') and request.user.terma:
-                        context['terma'] = request.user.terma
-                    else:
-                        # Fallback a terma activa si no tiene asignada
-                        from termas.models import Terma
-                        terma_activa = Terma.objects.filter(estado_suscripcion='activa').first()
-                        context['terma'] = terma_activa
-                
+                    context['terma'] = lambda: datos.terma_trabajador
+
                 # Context para cliente
-                elif request.user.rol.nombre == 'cliente':
+                elif rol.nombre == 'cliente':
                     context['es_cliente'] = True
-            
+
             # Proporcionar backward compatibility con middleware
             # Esto se eliminará gradualmente
             context['usuario_id'] = request.user.id
@@ -69,7 +97,7 @@ def navbar_context(request):
             # Usuario no autenticado
             context['usuario'] = None
             context['usuario_rol'] = None
-    
+
     except Exception as e:
         logger.error(f"Error en navbar_context: {str(e)}")
         context = {
@@ -77,5 +105,5 @@ def navbar_context(request):
             'usuario_rol': None,
             'solicitudes_count': 0
         }
-    
-    return context
\ No newline at end of file
+
+    return context
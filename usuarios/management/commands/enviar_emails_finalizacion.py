@@ -4,8 +4,8 @@ Comando management para enviar emails cuando las entradas se finalizan
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from ventas.models import RegistroEscaneo, CodigoQR
-from entradas.models import EntradaTipo
+from ventas.grafo_compra import obtener_grafos_compra
+from ventas.models import RegistroEscaneo
 from termas.email_utils import enviar_email_entrada_finalizada
 import logging
 
@@ -37,23 +37,24 @@ class Command(BaseCommand):
             exitoso=True,
             fecha_escaneo__isnull=False,
             email_finalizacion_enviado=False
-        ).select_related(
-            'codigo_qr',
-            'codigo_qr__compra',
-            'codigo_qr__compra__usuario',
-            'codigo_qr__compra__terma'
-        ).order_by('-fecha_escaneo')
+        ).select_related('codigo_qr').order_by('-fecha_escaneo')
+        registros = list(registros)
+        
+        # Grafo de todas las compras de una vez (número fijo de consultas)
+        grafos = obtener_grafos_compra({registro.codigo_qr.compra_id for registro in registros})
         
         emails_enviados = 0
         entradas_procesadas = 0
         
         for registro in registros:
             try:
-                compra = registro.codigo_qr.compra
+                compra = grafos.get(registro.codigo_qr.compra_id)
+                if compra is None:
+                    continue
                 cliente = compra.usuario
                 
                 # Obtener información de la entrada
-                detalle = compra.detalles.first()
+                detalle = compra.detalle_principal
                 if not detalle or not detalle.entrada_tipo:
                     continue
                 
@@ -4,6 +4,7 @@ Comando para limpiar automáticamente el caché de autenticación.
 from django.core.management.base import BaseCommand
 from django.core.cache import cache
 from django.contrib.sessions.models import Session
+from usuarios.cache_utils import bump_namespace_version, AUTH_NAMESPACE, RATE_LIMIT_NAMESPACE
 from datetime import datetime, timedelta
 import logging
 
@@ -50,31 +51,12 @@ class Command(BaseCommand):
 
     def clean_auth_cache(self):
         """Limpia cachés específicos de autenticación"""
-        # Lista de patrones de caché a limpiar
-        cache_patterns = [
-            'user_*',
-            'auth_attempts_*',
-            'user_email_*',
-            'session_*'
-        ]
-        
-        # Como Django cache no tiene delete_pattern, usamos una lista conocida
-        # En producción, podrías usar Redis con SCAN para esto
+        # Se invalidan los namespaces versionados en lugar de recorrer claves,
+        # lo que funciona con cualquier backend (LocMem, Redis, etc.)
         try:
-            # Obtener todas las claves del caché (solo funciona con algunos backends)
-            if hasattr(cache, '_cache') and hasattr(cache._cache, 'keys'):
-                all_keys = cache._cache.keys()
-                auth_keys = [
-                    key for key in all_keys 
-                    if any(pattern.replace('*', '') in str(key) for pattern in cache_patterns)
-                ]
-                cache.delete_many(auth_keys)
-                self.stdout.write(f'Limpiadas {len(auth_keys)} claves de caché de autenticación.')
-            else:
-                # Fallback: limpiar todo el caché si no podemos ser selectivos
-                cache.clear()
-                self.stdout.write('Cache backend no soporta limpieza selectiva, limpiando todo.')
-                
+            bump_namespace_version(AUTH_NAMESPACE)
+            bump_namespace_version(RATE_LIMIT_NAMESPACE)
+            self.stdout.write('Namespaces de caché de autenticación invalidados.')
         except Exception as e:
             logger.error(f"Error al limpiar caché: {e}")
             # Fallback seguro
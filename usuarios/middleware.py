@@ -3,7 +3,7 @@ Middleware para limpiar cache automáticamente en operaciones críticas.
 """
 
 from django.utils.deprecation import MiddlewareMixin
-from django.core.cache import cache
+from .cache_utils import bump_namespace_version, AUTH_NAMESPACE, RATE_LIMIT_NAMESPACE
 import logging
 
 logger = logging.getLogger('cache')
@@ -30,11 +30,9 @@ class AutoCacheClearMiddleware(MiddlewareMixin):
             response.status_code in [200, 302] and
             any(path in request.path for path in self.CACHE_CLEAR_PATHS)):
             
-            # Limpiar cache selectivamente
-            cache.delete_many([
-                key for key in cache._cache.keys() 
-                if key.startswith(('user_', 'auth_attempts_'))
-            ])
+            # Invalidar por versión: funciona con cualquier backend de cache
+            bump_namespace_version(AUTH_NAMESPACE)
+            bump_namespace_version(RATE_LIMIT_NAMESPACE)
             
             logger.info(f"Cache limpiado automáticamente por middleware en ruta: {request.path}")
         
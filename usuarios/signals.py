@@ -36,14 +36,20 @@ def rol_post_save(sender, instance, **kwargs):
 def setup_terma_signals():
     """Configura signals para Terma después de que se importa"""
     try:
-        from termas.models import Terma
-        from .cache_utils import auto_clear_cache_on_terma_change
+        from termas.models import Terma, SolicitudTerma
+        from .cache_utils import auto_clear_cache_on_terma_change, clear_solicitudes_count_cache
         
         @receiver(post_save, sender=Terma)
         def terma_post_save(sender, instance, **kwargs):
             """Limpia cache cuando se modifica una terma"""
             auto_clear_cache_on_terma_change(sender, instance, **kwargs)
         
+        # Contador de solicitudes pendientes del navbar del admin general
+        post_save.connect(clear_solicitudes_count_cache, sender=SolicitudTerma,
+                          dispatch_uid='solicitudes_count_post_save')
+        post_delete.connect(clear_solicitudes_count_cache, sender=SolicitudTerma,
+                            dispatch_uid='solicitudes_count_post_delete')
+        
         logger.info("Signals de Terma configurados correctamente")
         
     except ImportError:
@@ -1,3 +1,214 @@
-from django.test import TestCase
+import io
+import time
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from openpyxl import load_workbook
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from .cache_utils import (
+    AUTH_NAMESPACE,
+    bump_namespace_version,
+    incr_counter,
+    rate_limit_ip_key,
+    user_cache_key,
+)
+from .clean_middleware import CleanRequestMiddleware, SESSION_REFRESH_KEY
+
+
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'miterma-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CacheUtilsTest(TestCase):
+    """Tests de las utilidades de cache independientes del backend."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_incr_counter_es_acumulativo(self):
+        """Los intentos fallidos se cuentan con incr atómico."""
+        key = rate_limit_ip_key('10.0.0.1')
+        self.assertEqual(incr_counter(key, 60), 1)
+        self.assertEqual(incr_counter(key, 60), 2)
+        self.assertEqual(cache.get(key), 2)
+
+    def test_bump_namespace_invalida_claves(self):
+        """Incrementar la versión deja inaccesibles las claves anteriores."""
+        key = user_cache_key(15)
+        cache.set(key, 'usuario', 30)
+
+        bump_namespace_version(AUTH_NAMESPACE)
+
+        self.assertNotEqual(user_cache_key(15), key)
+        self.assertIsNone(cache.get(user_cache_key(15)))
+
+    def test_version_descartada_no_revive_claves(self):
+        """Si el backend descarta la versión, la nueva no coincide con la anterior."""
+        key = user_cache_key(15)
+        cache.set(key, 'usuario', 30)
+
+        cache.delete(f"ns_version_{AUTH_NAMESPACE}")
+        time.sleep(0.002)
+
+        self.assertNotEqual(user_cache_key(15), key)
+        self.assertIsNone(cache.get(user_cache_key(15)))
+
+
+class CleanRequestMiddlewareTest(TestCase):
+    """La sesión solo se marca como modificada cuando su contenido cambia."""
+
+    def setUp(self):
+        self.middleware = CleanRequestMiddleware(lambda request: None)
+        self.user = SimpleNamespace(id=7, email='cliente@miterma.cl', is_authenticated=True)
+
+    def _request(self, session):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = session
+        return request
+
+    def test_request_repetida_no_modifica_sesion(self):
+        session = SessionStore()
+        session['_last_email'] = self.user.email
+        session[SESSION_REFRESH_KEY] = int(time.time())
+        session.modified = False
+
+        self.middleware.process_view(self._request(session), None, (), {})
+
+        self.assertFalse(session.modified)
+
+    def test_renovacion_vencida_marca_sesion(self):
+        session = SessionStore()
+        session['_last_email'] = self.user.email
+        session[SESSION_REFRESH_KEY] = int(time.time()) - self.middleware.refresh_interval
+        session.modified = False
+
+        self.middleware.process_view(self._request(session), None, (), {})
+
+        self.assertTrue(session.modified)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class NavbarContextTest(TestCase):
+    """Los datos del navbar solo consultan la BD si la plantilla los usa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from .models import Rol, Usuario
+
+        rol = Rol.objects.create(nombre='administrador_general')
+        cls.admin = Usuario.objects.create_user('admin@miterma.cl', 'Ana', 'Admin', rol=rol)
+
+    def setUp(self):
+        from .models import Usuario
+
+        cache.clear()
+        # Como el backend de autenticación: el rol ya viene cargado
+        self.user = Usuario.objects.select_related('rol').get(pk=self.admin.pk)
+
+    def _render(self, template_name=None, template_code=None):
+        from django.template import engines
+        from django.template.loader import render_to_string
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        if template_name:
+            return render_to_string(template_name, request=request)
+        return engines['django'].from_string(template_code).render(request=request)
+
+    def test_pagina_sin_navbar_no_consulta(self):
+        with self.assertNumQueries(0):
+            html = self._render(template_code='<p>{{ usuario_nombre }}</p>')
+        self.assertIn('Ana', html)
+
+    def test_navbar_consulta_el_contador_una_vez(self):
+        with self.assertNumQueries(1):
+            self._render('partials/navbar_admin_general.html')
+        # Siguiente request: el contador sale del cache
+        with self.assertNumQueries(0):
+            self._render('partials/navbar_admin_general.html')
+
+    def test_contador_se_actualiza_al_guardar_y_eliminar_solicitud(self):
+        from termas.models import SolicitudTerma
+
+        self.assertIn('>0</span>', self._render('partials/navbar_admin_general.html'))
+
+        solicitud = SolicitudTerma.objects.create(nombre_terma='Termas Nuevas')
+        self.assertIn('>1</span>', self._render('partials/navbar_admin_general.html'))
+
+        solicitud.estado = 'aceptada'
+        solicitud.save()
+        self.assertIn('>0</span>', self._render('partials/navbar_admin_general.html'))
+
+        otra = SolicitudTerma.objects.create(nombre_terma='Termas Otras')
+        self.assertIn('>1</span>', self._render('partials/navbar_admin_general.html'))
+        otra.delete()
+        self.assertIn('>0</span>', self._render('partials/navbar_admin_general.html'))
+
+
+class ExportacionReportesTest(TestCase):
+    """Los exports de ventas se generan por bloques y con el mismo contenido."""
+
+    def setUp(self):
+        from entradas.models import EntradaTipo
+        from termas.models import PlanSuscripcion, Terma
+        from ventas.models import Compra, DetalleCompra
+        from .models import Rol, Usuario
+
+        plan = PlanSuscripcion.objects.create(
+            nombre='premium', descripcion='Premium', porcentaje_comision=Decimal('3.00'), limite_fotos=-1
+        )
+        self.terma = Terma.objects.create(
+            nombre_terma='Termas Reporte', estado_suscripcion='activa', plan_actual=plan
+        )
+        admin = Usuario.objects.create_user(
+            'admin@terma.cl', 'Ana', 'Admin', 'clave-segura-123',
+            rol=Rol.objects.create(nombre='administrador_terma'), terma=self.terma
+        )
+        cliente = Usuario.objects.create_user('cliente@terma.cl', 'Carlos', 'Cliente')
+        entrada = EntradaTipo.objects.create(terma=self.terma, nombre='Día completo', precio=Decimal('10000'))
+
+        for cantidad in (1, 2):
+            compra = Compra.objects.create(
+                usuario=cliente, terma=self.terma, total=Decimal('10000') * cantidad * 2,
+                estado_pago='pagado'
+            )
+            for _ in range(2):
+                DetalleCompra.objects.create(
+                    compra=compra, entrada_tipo=entrada, cantidad=cantidad,
+                    precio_unitario=Decimal('10000'), subtotal=Decimal('10000') * cantidad
+                )
+
+        self.client.force_login(admin)
+        hoy = date.today().isoformat()
+        self.params = {'fecha_inicio': hoy, 'fecha_fin': hoy}
+
+    def test_csv_es_streaming(self):
+        response = self.client.get('/usuarios/exportar-reporte-csv/', self.params)
+
+        self.assertTrue(response.streaming)
+        lineas = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lineas), 5)
+        self.assertTrue(lineas[1].startswith(date.today().strftime('%d/%m/%Y')))
+        self.assertIn('Carlos,Cliente,cliente@terma.cl,Día completo,1,10000.00', lineas[1])
+
+    def test_excel_write_only_conserva_totales(self):
+        response = self.client.get('/usuarios/exportar-reporte-excel/', self.params)
+
+        self.assertEqual(response.status_code, 200)
+        ws = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(ws['A6'].value, 'Fecha Compra')
+        self.assertEqual(ws.max_row, 12)
+        self.assertEqual(ws['F12'].value, 6)
+        self.assertEqual(ws['I12'].value, 60000)
+        self.assertIn('A12:E12', {str(r) for r in ws.merged_cells.ranges})
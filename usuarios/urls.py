@@ -40,6 +40,9 @@ urlpatterns = [
     path('exportar-reporte-csv/', views_reportes.exportar_reporte_csv, name='exportar_reporte_csv'),
     path('exportar-reporte-excel/', views_reportes.exportar_reporte_excel, name='exportar_reporte_excel'),
     path('exportar-reporte-pdf/', views_reportes.exportar_reporte_pdf, name='exportar_reporte_pdf'),
+    path('reportes/solicitar/', views_reportes.solicitar_reporte, name='solicitar_reporte'),
+    path('reportes/estado/<uuid:trabajo_uuid>/', views_reportes.estado_reporte, name='estado_reporte'),
+    path('reportes/descargar/<uuid:trabajo_uuid>/', views_reportes.descargar_reporte, name='descargar_reporte'),
     
     # URLs para trabajadores/operadores
     path('trabajador/', views_trabajador.inicio_trabajador, name='inicio_trabajador'),
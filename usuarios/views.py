@@ -327,10 +327,8 @@ def logout_usuario(request):
     
     # Limpiar caché específico del usuario
     if user_id:
-        from django.core.cache import cache
-        cache.delete(f"user_{user_id}")
-        if user_email:
-            cache.delete(f"user_email_{user_email}")
+        from .cache_utils import clear_user_cache
+        clear_user_cache(request.user)
         logger.info(f"Caché de usuario {user_id} limpiado")
     
     # Logout de Django Auth
@@ -396,10 +394,8 @@ def inicio_cliente(request):
         termas_qs = Terma.objects.filter(estado_suscripcion="activa")
         
         if busqueda:
-            from django.db.models import Q
-            termas_qs = termas_qs.filter(
-                Q(nombre_terma__icontains=busqueda) | Q(descripcion_terma__icontains=busqueda)
-            )
+            from termas.busqueda import filtrar_termas_por_texto
+            termas_qs = filtrar_termas_por_texto(termas_qs, busqueda)
         if region:
             termas_qs = termas_qs.filter(comuna__region__id=region)
         if comuna:
@@ -409,10 +405,8 @@ def inicio_cliente(request):
         termas_qs = Terma.objects.filter(estado_suscripcion="activa").prefetch_related('entradatipo_set')
         
         if busqueda:
-            from django.db.models import Q
-            termas_qs = termas_qs.filter(
-                Q(nombre_terma__icontains=busqueda) | Q(descripcion_terma__icontains=busqueda)
-            )
+            from termas.busqueda import filtrar_termas_por_texto
+            termas_qs = filtrar_termas_por_texto(termas_qs, busqueda)
         if region:
             termas_qs = termas_qs.filter(comuna__region__id=region)
         if comuna:
@@ -726,30 +720,26 @@ def admin_general(request):
     Vista para mostrar la página de administración general del sistema usando Django Auth.
     """
     try:
-        from termas.models import SolicitudTerma, Terma
+        from termas.models import Terma
+        from core.kpis import obtener_kpis
+        from .cache_utils import get_solicitudes_pendientes_count
         
         # El decorador ya verificó autenticación y permisos
         usuario = request.user
         
-        # Obtener estadísticas para el dashboard
-        total_termas = Terma.objects.count()
-        solicitudes_pendientes = SolicitudTerma.objects.filter(estado='pendiente').count()
-        total_usuarios = Usuario.objects.count()
-        
-        # Métricas adicionales
-        termas_activas = Terma.objects.filter(estado_suscripcion='activa').count()
-        termas_inactivas = total_termas - termas_activas
+        # Estadísticas del dashboard (snapshot cacheado, ver core/kpis.py)
+        kpis = obtener_kpis('usuarios', 'termas')
         
         context = {
             'title': 'Administración General - MiTerma',
             'usuario': usuario,
             'stats': {
                 'terma': Terma,
-                'total_termas': total_termas,
-                'termas_activas': termas_activas,
-                'termas_inactivas': termas_inactivas,
-                'solicitudes_pendientes': solicitudes_pendientes,
-                'total_usuarios': total_usuarios,
+                'total_termas': kpis['termas']['total_termas'],
+                'termas_activas': kpis['termas']['termas_activas'],
+                'termas_inactivas': kpis['termas']['total_termas'] - kpis['termas']['termas_activas'],
+                'solicitudes_pendientes': get_solicitudes_pendientes_count(),
+                'total_usuarios': kpis['usuarios']['total_usuarios'],
             }
         }
         
@@ -1081,9 +1071,8 @@ def mercadopago_callback(request):
 def admin_general_termas_asociadas(request):
     """Vista principal para gestionar termas asociadas"""
     from termas.models import Terma, Region, Comuna, PlanSuscripcion
-    from django.core.paginator import Paginator
+    from core.paginacion import paginar_keyset
     from django.db.models import Count, Q
-    from datetime import datetime, timedelta
     
     # Filtros
     nombre_filtro = request.GET.get('nombre', '')
@@ -1107,24 +1096,12 @@ def admin_general_termas_asociadas(request):
     if comuna_filtro:
         termas = termas.filter(comuna_id=comuna_filtro)
     
-    # Ordenar
-    termas = termas.order_by('-fecha_suscripcion', 'nombre_terma')
+    # Paginación por keyset: 12 termas por página, las más recientes primero
+    page_obj = paginar_keyset(request, termas, ('-fecha_suscripcion', '-id'), 12)
     
-    # Paginación
-    paginator = Paginator(termas, 12)  # 12 termas por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Estadísticas
-    today = datetime.now().date()
-    first_day_month = today.replace(day=1)
-    
-    stats = {
-        'total_termas': Terma.objects.count(),
-        'termas_activas': Terma.objects.filter(estado_suscripcion='activa').count(),
-        'termas_inactivas': Terma.objects.filter(estado_suscripcion='inactiva').count(),
-        'termas_mes': Terma.objects.filter(fecha_suscripcion__gte=first_day_month).count(),
-    }
+    # Estadísticas (snapshot cacheado, ver core/kpis.py)
+    from core.kpis import obtener_kpis
+    stats = obtener_kpis('termas')['termas']
     
     # Obtener regiones y comunas para los filtros
     regiones = Region.objects.all().order_by('nombre')
@@ -1743,9 +1720,9 @@ def historial_entradas(request):
         terma = usuario.terma
         
         # Importar modelos necesarios
-        from ventas.models import Compra, DetalleCompra, RegistroEscaneo, CodigoQR
-        from entradas.models import EntradaTipo
-        from django.db.models import Count, Sum, Q
+        from ventas.grafo_compra import obtener_grafos_compra
+        from ventas.models import Compra, RegistroEscaneo
+        from django.db.models import Count
         from datetime import date, timedelta
         from collections import defaultdict
         
@@ -1756,85 +1733,81 @@ def historial_entradas(request):
         else:
             fecha_filtro = date.today()
         
-        # Obtener entradas vendidas para la fecha específica
-        entradas_vendidas = DetalleCompra.objects.filter(
-            compra__terma=terma,
-            compra__fecha_visita=fecha_filtro,
-            compra__estado_pago='pagado'
-        ).select_related(
-            'compra__usuario', 'entrada_tipo', 'compra'
-        ).prefetch_related(
-            'servicios',
-            'servicios_extra__servicio', 
-            'entrada_tipo__servicios'
-        )
+        # Compras pagadas del día con todo su grafo (usuario, detalles, servicios,
+        # QR, escaneos y distribución) en un número fijo de consultas
+        compra_ids = list(Compra.objects.filter(
+            terma=terma,
+            fecha_visita=fecha_filtro,
+            estado_pago='pagado'
+        ).order_by('id').values_list('id', flat=True))
+        grafos = obtener_grafos_compra(compra_ids)
+        compras_dia = [grafos[compra_id] for compra_id in compra_ids if compra_id in grafos]
+
+        def escaneo_en_terma(compra, fecha=None):
+            """Primer escaneo exitoso hecho por un trabajador de esta terma (en la fecha, si se indica)"""
+            for escaneo in compra.escaneos_exitosos:
+                if not escaneo.usuario_scanner or escaneo.usuario_scanner.terma_id != terma.id:
+                    continue
+                if fecha is None or timezone.localtime(escaneo.fecha_escaneo).date() == fecha:
+                    return escaneo
+            return None
 
-        # Calcular total de visitantes y total de cantidades escaneadas
+        # Visitantes (cantidades escaneadas en la fecha), entradas sin escanear nunca,
+        # resumen por tipo de entrada y detalle de cada entrada vendida en una pasada.
+        # El resumen muestra:
+        # - total sin descuento (solo entradas base)
+        # - total pagado (con extras y descuentos)
+        # - total neto para la terma (descontando comisión)
         total_visitantes = 0
         total_cantidades_escaneadas = 0
-        for detalle in entradas_vendidas:
-            compra = detalle.compra
-            codigo_qr = CodigoQR.objects.filter(compra=compra).first()
-            if codigo_qr:
-                escaneo = RegistroEscaneo.objects.filter(
-                    codigo_qr=codigo_qr,
-                    fecha_escaneo__date=fecha_filtro,
-                    exitoso=True,
-                    usuario_scanner__terma=terma
-                ).exists()
+        entradas_sin_escanear = 0
+        resumen_dict = {}
+        entradas_detalle = []
+        for compra in compras_dia:
+            escaneo = escaneo_en_terma(compra, fecha_filtro)
+            escaneada = escaneo is not None or escaneo_en_terma(compra) is not None
+
+            for detalle in compra.detalles:
+                if detalle.entrada_tipo is None:
+                    continue
                 if escaneo:
                     total_visitantes += detalle.cantidad
                     total_cantidades_escaneadas += detalle.cantidad
-
-        # Entradas sin escanear: pagadas, pero sin registro de escaneo exitoso
-        from ventas.models import RegistroEscaneo, CodigoQR
-        entradas_sin_escanear = 0
-        for detalle in entradas_vendidas:
-            compra = detalle.compra
-            codigo_qr = CodigoQR.objects.filter(compra=compra).first()
-            if codigo_qr:
-                escaneo = RegistroEscaneo.objects.filter(
-                    codigo_qr=codigo_qr,
-                    exitoso=True,
-                    usuario_scanner__terma=terma
-                ).exists()
-                if not escaneo:
+                elif compra.codigo_qr and not escaneada:
                     entradas_sin_escanear += detalle.cantidad
-        
 
-        # Calcular resumen por tipo de entrada mostrando:
-        # - total sin descuento (solo entradas base)
-        # - total pagado (con extras y descuentos)
-        # - total neto para la terma (descontando comisión)
-        from ventas.models import DistribucionPago
-        resumen_dict = {}
-        for detalle in entradas_vendidas:
-            tipo_nombre = detalle.entrada_tipo.nombre
-            duracion = detalle.entrada_tipo.duracion_tipo
-            compra_id = detalle.compra.id
-            if (tipo_nombre, duracion) not in resumen_dict:
-                resumen_dict[(tipo_nombre, duracion)] = {
-                    'entrada_tipo__nombre': tipo_nombre,
-                    'entrada_tipo__duracion_tipo': duracion,
-                    'total_vendidas': 0,
-                    'compras_ids': set(),
-                    'total_sin_descuento': 0,
-                    'total_pagado': 0,
-                    'total_neto_terma': 0,
-                }
-            resumen_dict[(tipo_nombre, duracion)]['total_vendidas'] += detalle.cantidad
-            resumen_dict[(tipo_nombre, duracion)]['compras_ids'].add(compra_id)
-            resumen_dict[(tipo_nombre, duracion)]['total_sin_descuento'] += float(detalle.subtotal)
-
-        for key, data in resumen_dict.items():
-            compras = Compra.objects.filter(id__in=data['compras_ids'])
-            total_pagado = sum([float(c.total) for c in compras])
-            data['total_pagado'] = total_pagado
+                clave = (detalle.entrada_tipo.nombre, detalle.entrada_tipo.duracion_tipo)
+                if clave not in resumen_dict:
+                    resumen_dict[clave] = {
+                        'entrada_tipo__nombre': clave[0],
+                        'entrada_tipo__duracion_tipo': clave[1],
+                        'total_vendidas': 0,
+                        'compras': {},
+                        'total_sin_descuento': 0,
+                        'total_pagado': 0,
+                        'total_neto_terma': 0,
+                    }
+                resumen_dict[clave]['total_vendidas'] += detalle.cantidad
+                resumen_dict[clave]['compras'][compra.id] = compra
+                resumen_dict[clave]['total_sin_descuento'] += float(detalle.subtotal)
+
+                servicios_incluidos = [servicio.nombre for servicio in detalle.entrada_tipo.servicios_incluidos]
+                servicios_extras = [f"{servicio.nombre} (x{servicio.cantidad})" for servicio in detalle.servicios_extra]
+                entradas_detalle.append({
+                    'detalle': detalle,
+                    'compra': compra,
+                    'codigo_qr': compra.codigo_qr,
+                    'escaneo': escaneo,
+                    'estado_escaneo': 'Escaneada' if escaneo else 'Pendiente',
+                    'servicios_incluidos': ', '.join(servicios_incluidos) if servicios_incluidos else 'Sin servicios incluidos',
+                    'servicios_extras': ', '.join(servicios_extras) if servicios_extras else 'Sin servicios extras'
+                })
+
+        for data in resumen_dict.values():
+            compras_tipo = data.pop('compras').values()
+            data['total_pagado'] = sum(float(c.total) for c in compras_tipo)
             # Sumar el neto para la terma (descontando comisión)
-            distribuciones = DistribucionPago.objects.filter(compra_id__in=data['compras_ids'])
-            total_neto = sum([float(d.monto_para_terma) for d in distribuciones])
-            data['total_neto_terma'] = total_neto
-            del data['compras_ids']
+            data['total_neto_terma'] = sum(float(c.monto_para_terma) for c in compras_tipo if c.monto_para_terma is not None)
 
         resumen_entradas = list(resumen_dict.values())
         
@@ -1874,48 +1847,6 @@ def historial_entradas(request):
             total_escaneos=Count('id')
         ).order_by('fecha_escaneo__date')
         
-        # Obtener información detallada de cada entrada vendida
-        entradas_detalle = []
-        for detalle in entradas_vendidas:
-            compra = detalle.compra
-            codigo_qr = CodigoQR.objects.filter(compra=compra).first()
-            escaneo = None
-            
-            if codigo_qr:
-                escaneo = RegistroEscaneo.objects.filter(
-                    codigo_qr=codigo_qr,
-                    fecha_escaneo__date=fecha_filtro,
-                    exitoso=True,
-                    usuario_scanner__terma=terma  # Solo escaneos de trabajadores de esta terma
-                ).first()
-            
-            # Obtener servicios incluidos
-            servicios_incluidos = list(detalle.entrada_tipo.servicios.all().values_list('servicio', flat=True))
-            servicios_incluidos_str = ', '.join(servicios_incluidos) if servicios_incluidos else 'Sin servicios incluidos'
-            
-            # Obtener servicios extras
-            servicios_extras = []
-            
-            # Servicios extras del modelo intermedio
-            for extra in detalle.servicios_extra.all():
-                servicios_extras.append(f"{extra.servicio.servicio} (x{extra.cantidad})")
-            
-            # Servicios extras directos
-            for servicio in detalle.servicios.all():
-                servicios_extras.append(servicio.servicio)
-            
-            servicios_extras_str = ', '.join(servicios_extras) if servicios_extras else 'Sin servicios extras'
-            
-            entradas_detalle.append({
-                'detalle': detalle,
-                'compra': compra,
-                'codigo_qr': codigo_qr,
-                'escaneo': escaneo,
-                'estado_escaneo': 'Escaneada' if escaneo else 'Pendiente',
-                'servicios_incluidos': servicios_incluidos_str,
-                'servicios_extras': servicios_extras_str
-            })
-        
         # Datos para gráficos
         datos_grafico = {
             'labels': [item['entrada_tipo__nombre'] for item in resumen_entradas],
@@ -148,25 +148,17 @@ def mostrar_entradas(request):
     if fecha_fin:
         compras_qs = compras_qs.filter(fecha_compra__date__lte=fecha_fin)
 
-    compras_qs = compras_qs.order_by('-fecha_compra').select_related(
+    compras_qs = compras_qs.select_related(
         'terma', 'codigoqr'
     ).prefetch_related('detalles', 'detalles__entrada_tipo', 'detalles__servicios')
 
-    # Paginación
-    from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-    paginator = Paginator(compras_qs, 10)  # 10 compras por página
-    page = request.GET.get('page')
-    try:
-        compras = paginator.page(page)
-    except PageNotAnInteger:
-        compras = paginator.page(1)
-    except EmptyPage:
-        compras = paginator.page(paginator.num_pages)
+    # Paginación por keyset: 10 compras por página, sin contar el total
+    from core.paginacion import paginar_keyset
+    compras = paginar_keyset(request, compras_qs, ('-fecha_compra', '-id'), 10)
 
     context = {
         'title': 'Mis Entradas - MiTerma',
         'compras': compras,
-        'paginator': paginator,
         'page_obj': compras,
         'is_paginated': compras.has_other_pages(),
     }
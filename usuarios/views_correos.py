@@ -11,6 +11,7 @@ from django.utils.decorators import method_decorator
 from django.core.exceptions import PermissionDenied
 import logging
 
+from ventas.grafo_compra import obtener_grafos_compra
 from ventas.models import Compra
 from ventas.utils import enviar_entrada_por_correo
 
@@ -40,8 +41,9 @@ def reenviar_correo_compra(request, compra_uuid):
                 'message': 'Solo se pueden reenviar correos de compras pagadas'
             })
         
-        # Verificar que existe el código QR
-        if not hasattr(compra, 'codigoqr') or not compra.codigoqr:
+        # Verificar que existe el código QR (el grafo se reutiliza para el PDF)
+        grafo = obtener_grafos_compra([compra.id]).get(compra.id)
+        if not grafo or not grafo.codigo_qr:
             return JsonResponse({
                 'success': False,
                 'message': 'No se encontró el código QR para esta compra. Contacta soporte.'
@@ -49,7 +51,7 @@ def reenviar_correo_compra(request, compra_uuid):
         
         # Intentar enviar el correo
         try:
-            exito = enviar_entrada_por_correo(compra)
+            exito = enviar_entrada_por_correo(grafo)
             
             if exito:
                 logger.info(f"Correo reenviado exitosamente para compra {compra_id}")
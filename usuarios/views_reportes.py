@@ -6,11 +6,17 @@ import json
 import csv
 from django.http import HttpResponse
 from django.contrib import messages
-from django.shortcuts import redirect, render
+from django.shortcuts import redirect, render, get_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from .decorators import admin_terma_required
 
+from core.exportacion import CHUNK_SIZE_EXPORTACION, respuesta_csv_streaming, respuesta_xlsx
+
 # Para exportación Excel
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
 
@@ -176,9 +182,289 @@ def reportes_premium(request):
     return render(request, 'administrador_termas/reporte_premium.html', context)
 
 
+ENCABEZADOS_REPORTE_VENTAS = [
+    'Fecha Compra', 'Nombre Cliente', 'Apellido Cliente', 'Email Cliente',
+    'Tipo Entrada', 'Cantidad', 'Precio Unitario', 'Subtotal', 'Total Compra'
+]
+
+
+def _filas_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt):
+    """
+    Genera las filas del reporte de ventas (una por detalle de compra) sin
+    cargar el período completo en memoria.
+    
+    Args:
+        terma: Terma del administrador
+        fecha_inicio_dt: Fecha inicial (inclusive)
+        fecha_fin_dt: Fecha final (inclusive)
+    """
+    from ventas.models import DetalleCompra
+    
+    detalles = DetalleCompra.objects.filter(
+        compra__terma=terma,
+        compra__fecha_compra__date__gte=fecha_inicio_dt,
+        compra__fecha_compra__date__lte=fecha_fin_dt,
+        compra__estado_pago='pagado'
+    ).order_by('compra__fecha_compra', 'compra_id', 'id').values_list(
+        'compra__fecha_compra',
+        'compra__usuario__nombre',
+        'compra__usuario__apellido',
+        'compra__usuario__email',
+        'entrada_tipo__nombre',
+        'cantidad',
+        'precio_unitario',
+        'subtotal',
+        'compra__total',
+    )
+    
+    for fecha_compra, *resto in detalles.iterator(chunk_size=CHUNK_SIZE_EXPORTACION):
+        yield [fecha_compra.strftime('%d/%m/%Y %H:%M'), *resto]
+
+
+def construir_excel_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt):
+    """
+    Construye el Excel del reporte de ventas en modo write-only.
+    
+    Usado por la exportación directa y por los trabajos de reporte en
+    segundo plano.
+    
+    Args:
+        terma: Terma del reporte
+        fecha_inicio_dt: Fecha inicial (inclusive)
+        fecha_fin_dt: Fecha final (inclusive)
+    """
+    # Workbook en modo write-only: cada fila se vuelca a disco al agregarla,
+    # así que no se mantienen objetos de celda en memoria
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Reporte de Ventas")
+    
+    # Configurar estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    border = Border(left=Side(style='thin'), right=Side(style='thin'), 
+                   top=Side(style='thin'), bottom=Side(style='thin'))
+    
+    def celda(valor, font=None, fill=None, alignment=None, borde=None):
+        cell = WriteOnlyCell(ws, value=valor)
+        if font:
+            cell.font = font
+        if fill:
+            cell.fill = fill
+        if alignment:
+            cell.alignment = alignment
+        if borde:
+            cell.border = borde
+        return cell
+    
+    # Ajustar ancho de columnas (debe definirse antes de escribir filas)
+    column_widths = [20, 15, 15, 25, 20, 10, 15, 12, 12]
+    for i, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    
+    # Título del reporte (filas 1-3) e información del período (fila 4)
+    ws.merged_cells.add('A1:I3')
+    ws.append([celda(
+        f"Reporte de Ventas - {terma.nombre_terma}",
+        font=Font(size=16, bold=True),
+        alignment=Alignment(horizontal="center", vertical="center")
+    )])
+    ws.append([])
+    ws.append([])
+    ws.merged_cells.add('A4:I4')
+    ws.append([celda(
+        f"Período: {fecha_inicio_dt.strftime('%d/%m/%Y')} - {fecha_fin_dt.strftime('%d/%m/%Y')}",
+        font=Font(size=12),
+        alignment=Alignment(horizontal="center")
+    )])
+    ws.append([])
+    
+    # Encabezados (fila 6)
+    ws.append([
+        celda(header, font=header_font, fill=header_fill,
+              alignment=Alignment(horizontal="center"), borde=border)
+        for header in ENCABEZADOS_REPORTE_VENTAS
+    ])
+    
+    # Datos
+    total_entradas = 0
+    filas = 0
+    
+    for fila in _filas_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt):
+        fecha, nombre, apellido, email, tipo, cantidad, precio, subtotal, total = fila
+        ws.append([
+            celda(valor, borde=border)
+            for valor in [fecha, nombre, apellido, email, tipo, cantidad,
+                          float(precio), float(subtotal), float(total)]
+        ])
+        filas += 1
+        total_entradas += cantidad
+    
+    # El total general se suma en la BD (una vez por compra)
+    from ventas.models import Compra
+    total_general = float(Compra.objects.filter(
+        terma=terma,
+        fecha_compra__date__gte=fecha_inicio_dt,
+        fecha_compra__date__lte=fecha_fin_dt,
+        estado_pago='pagado'
+    ).aggregate(total=Sum('total'))['total'] or 0)
+    
+    # Totales
+    row = 7 + filas + 1
+    ws.merged_cells.add(f'A{row}:E{row}')
+    ws.merged_cells.add(f'G{row}:H{row}')
+    ws.append([])
+    ws.append([
+        celda("TOTALES:", font=Font(bold=True), alignment=Alignment(horizontal="right")),
+        None, None, None, None,
+        celda(total_entradas, font=Font(bold=True)),
+        celda("TOTAL GENERAL:", font=Font(bold=True), alignment=Alignment(horizontal="right")),
+        None,
+        celda(total_general, font=Font(bold=True, color="008000")),
+    ])
+    
+    return wb
+
+
+def escribir_pdf_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt, destino):
+    """
+    Escribe el PDF del reporte de ventas en un archivo o buffer.
+    
+    Args:
+        terma: Terma del reporte
+        fecha_inicio_dt: Fecha inicial (inclusive)
+        fecha_fin_dt: Fecha final (inclusive)
+        destino: Archivo o buffer binario donde escribir el PDF
+    """
+    from ventas.models import Compra
+    
+    # Obtener compras del período
+    compras = Compra.objects.filter(
+        terma=terma,
+        fecha_compra__date__gte=fecha_inicio_dt,
+        fecha_compra__date__lte=fecha_fin_dt,
+        estado_pago='pagado'
+    ).select_related('usuario').prefetch_related('detalles__entrada_tipo')
+    
+    # Calcular totales
+    total_ingresos = compras.aggregate(total=Sum('total'))['total'] or 0
+    total_entradas = 0
+    total_compras = compras.count()
+    
+    doc = SimpleDocTemplate(destino, pagesize=A4)
+    elements = []
+    
+    # Estilos
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1  # Centrado
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=20,
+        alignment=1  # Centrado
+    )
+    
+    # Título
+    elements.append(Paragraph(f"Reporte de Ventas - {terma.nombre_terma}", title_style))
+    elements.append(Paragraph(
+        f"Período: {fecha_inicio_dt.strftime('%d/%m/%Y')} - {fecha_fin_dt.strftime('%d/%m/%Y')}", 
+        subtitle_style
+    ))
+    
+    # KPIs principales
+    kpi_data = [
+        ['Concepto', 'Valor', 'Concepto', 'Valor'],
+        ['Total Ingresos', f'${total_ingresos:,.2f}', 'Total Compras', str(total_compras)],
+        ['Total Entradas Vendidas', '', 'Promedio por Venta', ''],
+    ]
+    
+    # Calcular total de entradas
+    for compra in compras:
+        for detalle in compra.detalles.all():
+            total_entradas += detalle.cantidad
+    
+    promedio_venta = total_ingresos / total_compras if total_compras > 0 else 0
+    
+    kpi_data[2][1] = str(total_entradas)
+    kpi_data[2][3] = f'${promedio_venta:,.2f}'
+    
+    # Agregar título del resumen ejecutivo antes de la tabla
+    elements.append(Paragraph("Resumen Ejecutivo", styles['Heading2']))
+    elements.append(Spacer(1, 10))
+    
+    kpi_table = Table(kpi_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1.5*inch])
+    kpi_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.navy),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    
+    elements.append(kpi_table)
+    elements.append(Spacer(1, 20))
+    
+    # Tabla de detalles
+    elements.append(Paragraph("Detalle de Ventas", styles['Heading2']))
+    
+    # Encabezados de la tabla de detalles
+    detail_data = [
+        ['Fecha', 'Cliente', 'Tipo Entrada', 'Cant.', 'P. Unit.', 'Subtotal', 'Total']
+    ]
+    
+    # Datos de la tabla
+    for compra in compras:
+        for detalle in compra.detalles.all():
+            detail_data.append([
+                compra.fecha_compra.strftime('%d/%m/%Y'),
+                f"{compra.usuario.nombre} {compra.usuario.apellido}",
+                detalle.entrada_tipo.nombre,
+                str(detalle.cantidad),
+                f'${detalle.precio_unitario:,.0f}',
+                f'${detalle.subtotal:,.0f}',
+                f'${compra.total:,.0f}'
+            ])
+    
+    # Fila de totales
+    detail_data.append([
+        'TOTALES', '', '', str(total_entradas), '', '', f'${total_ingresos:,.0f}'
+    ])
+    
+    detail_table = Table(detail_data, colWidths=[
+        0.8*inch, 1.5*inch, 1.2*inch, 0.5*inch, 0.8*inch, 0.8*inch, 0.8*inch
+    ])
+    
+    detail_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -2), 8),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgreen),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ]))
+    
+    elements.append(detail_table)
+    
+    # Construir PDF
+    doc.build(elements)
+
+
 @admin_terma_required
 def exportar_reporte_csv(request):
-    """Vista para exportar reportes a CSV."""
+    """Vista para exportar reportes a CSV (generado en streaming)."""
     from django.http import JsonResponse
     
     usuario = request.user
@@ -197,49 +483,15 @@ def exportar_reporte_csv(request):
     try:
         fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
         fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-        
-        # Importar modelo Compra
-        from ventas.models import Compra
-        
-        # Obtener compras del período
-        compras = Compra.objects.filter(
-            terma=terma,
-            fecha_compra__date__gte=fecha_inicio_dt,
-            fecha_compra__date__lte=fecha_fin_dt,
-            estado_pago='pagado'
-        ).select_related('usuario').prefetch_related('detalles__entrada_tipo')
-        
-        # Crear respuesta CSV
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="reporte_{terma.nombre_terma}_{fecha_inicio}_{fecha_fin}.csv"'
-        response.write('\ufeff')  # BOM para UTF-8
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Fecha Compra', 'Nombre Cliente', 'Apellido Cliente', 'Email Cliente', 
-            'Tipo Entrada', 'Cantidad', 'Precio Unitario', 'Subtotal', 'Total Compra'
-        ])
-        
-        for compra in compras:
-            for detalle in compra.detalles.all():
-                writer.writerow([
-                    compra.fecha_compra.strftime('%d/%m/%Y %H:%M'),
-                    compra.usuario.nombre,
-                    compra.usuario.apellido,
-                    compra.usuario.email,
-                    detalle.entrada_tipo.nombre,
-                    detalle.cantidad,
-                    detalle.precio_unitario,
-                    detalle.subtotal,
-                    compra.total
-                ])
-        
-        return response
-        
     except ValueError:
         return JsonResponse({'error': 'Formato de fecha inválido.'}, status=400)
-    except Exception as e:
-        return JsonResponse({'error': f'Error al generar CSV: {str(e)}'}, status=500)
+    
+    # Las filas se consultan y escriben por bloques mientras se envía la respuesta
+    return respuesta_csv_streaming(
+        f"reporte_{terma.nombre_terma}_{fecha_inicio}_{fecha_fin}.csv",
+        ENCABEZADOS_REPORTE_VENTAS,
+        _filas_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt)
+    )
 
 
 @admin_terma_required
@@ -264,114 +516,8 @@ def exportar_reporte_excel(request):
         fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
         fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
         
-        from ventas.models import Compra
-        
-        # Obtener compras del período
-        compras = Compra.objects.filter(
-            terma=terma,
-            fecha_compra__date__gte=fecha_inicio_dt,
-            fecha_compra__date__lte=fecha_fin_dt,
-            estado_pago='pagado'
-        ).select_related('usuario').prefetch_related('detalles__entrada_tipo')
-        
-        # Crear workbook de Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Reporte de Ventas"
-        
-        # Configurar estilos
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                       top=Side(style='thin'), bottom=Side(style='thin'))
-        
-        # Título del reporte
-        ws.merge_cells('A1:I3')
-        title_cell = ws['A1']
-        title_cell.value = f"Reporte de Ventas - {terma.nombre_terma}"
-        title_cell.font = Font(size=16, bold=True)
-        title_cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        # Información del período
-        ws.merge_cells('A4:I4')
-        period_cell = ws['A4']
-        period_cell.value = f"Período: {fecha_inicio_dt.strftime('%d/%m/%Y')} - {fecha_fin_dt.strftime('%d/%m/%Y')}"
-        period_cell.font = Font(size=12)
-        period_cell.alignment = Alignment(horizontal="center")
-        
-        # Encabezados
-        headers = [
-            'Fecha Compra', 'Nombre Cliente', 'Apellido Cliente', 'Email Cliente',
-            'Tipo Entrada', 'Cantidad', 'Precio Unitario', 'Subtotal', 'Total Compra'
-        ]
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=6, column=col)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal="center")
-            cell.border = border
-        
-        # Datos
-        row = 7
-        total_general = 0
-        total_entradas = 0
-        
-        for compra in compras:
-            for detalle in compra.detalles.all():
-                ws.cell(row=row, column=1).value = compra.fecha_compra.strftime('%d/%m/%Y %H:%M')
-                ws.cell(row=row, column=2).value = compra.usuario.nombre
-                ws.cell(row=row, column=3).value = compra.usuario.apellido
-                ws.cell(row=row, column=4).value = compra.usuario.email
-                ws.cell(row=row, column=5).value = detalle.entrada_tipo.nombre
-                ws.cell(row=row, column=6).value = detalle.cantidad
-                ws.cell(row=row, column=7).value = float(detalle.precio_unitario)
-                ws.cell(row=row, column=8).value = float(detalle.subtotal)
-                ws.cell(row=row, column=9).value = float(compra.total)
-                
-                total_entradas += detalle.cantidad
-                
-                # Aplicar bordes
-                for col in range(1, 10):
-                    ws.cell(row=row, column=col).border = border
-                
-                row += 1
-            
-            total_general += float(compra.total)
-        
-        # Totales
-        row += 1
-        ws.merge_cells(f'A{row}:E{row}')
-        total_cell = ws[f'A{row}']
-        total_cell.value = "TOTALES:"
-        total_cell.font = Font(bold=True)
-        total_cell.alignment = Alignment(horizontal="right")
-        
-        ws.cell(row=row, column=6).value = total_entradas
-        ws.cell(row=row, column=6).font = Font(bold=True)
-        
-        ws.merge_cells(f'G{row}:H{row}')
-        ws.cell(row=row, column=7).value = "TOTAL GENERAL:"
-        ws.cell(row=row, column=7).font = Font(bold=True)
-        ws.cell(row=row, column=7).alignment = Alignment(horizontal="right")
-        
-        ws.cell(row=row, column=9).value = total_general
-        ws.cell(row=row, column=9).font = Font(bold=True, color="008000")
-        
-        # Ajustar ancho de columnas
-        column_widths = [20, 15, 15, 25, 20, 10, 15, 12, 12]
-        for i, width in enumerate(column_widths, 1):
-            ws.column_dimensions[get_column_letter(i)].width = width
-        
-        # Preparar respuesta
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="reporte_{terma.nombre_terma}_{fecha_inicio}_{fecha_fin}.xlsx"'
-        
-        wb.save(response)
-        return response
+        wb = construir_excel_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt)
+        return respuesta_xlsx(wb, f"reporte_{terma.nombre_terma}_{fecha_inicio}_{fecha_fin}.xlsx")
         
     except ValueError:
         return JsonResponse({'error': 'Formato de fecha inválido.'}, status=400)
@@ -401,133 +547,9 @@ def exportar_reporte_pdf(request):
         fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
         fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d').date()
         
-        from ventas.models import Compra
-        
-        # Obtener compras del período
-        compras = Compra.objects.filter(
-            terma=terma,
-            fecha_compra__date__gte=fecha_inicio_dt,
-            fecha_compra__date__lte=fecha_fin_dt,
-            estado_pago='pagado'
-        ).select_related('usuario').prefetch_related('detalles__entrada_tipo')
-        
-        # Calcular totales
-        total_ingresos = compras.aggregate(total=Sum('total'))['total'] or 0
-        total_entradas = 0
-        total_compras = compras.count()
-        
         # Crear PDF en memoria
         buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        elements = []
-        
-        # Estilos
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1  # Centrado
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Normal'],
-            fontSize=12,
-            spaceAfter=20,
-            alignment=1  # Centrado
-        )
-        
-        # Título
-        elements.append(Paragraph(f"Reporte de Ventas - {terma.nombre_terma}", title_style))
-        elements.append(Paragraph(
-            f"Período: {fecha_inicio_dt.strftime('%d/%m/%Y')} - {fecha_fin_dt.strftime('%d/%m/%Y')}", 
-            subtitle_style
-        ))
-        
-        # KPIs principales
-        kpi_data = [
-            ['Concepto', 'Valor', 'Concepto', 'Valor'],
-            ['Total Ingresos', f'${total_ingresos:,.2f}', 'Total Compras', str(total_compras)],
-            ['Total Entradas Vendidas', '', 'Promedio por Venta', ''],
-        ]
-        
-        # Calcular total de entradas
-        for compra in compras:
-            for detalle in compra.detalles.all():
-                total_entradas += detalle.cantidad
-        
-        promedio_venta = total_ingresos / total_compras if total_compras > 0 else 0
-        
-        kpi_data[2][1] = str(total_entradas)
-        kpi_data[2][3] = f'${promedio_venta:,.2f}'
-        
-        # Agregar título del resumen ejecutivo antes de la tabla
-        elements.append(Paragraph("Resumen Ejecutivo", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        
-        kpi_table = Table(kpi_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1.5*inch])
-        kpi_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.navy),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        
-        elements.append(kpi_table)
-        elements.append(Spacer(1, 20))
-        
-        # Tabla de detalles
-        elements.append(Paragraph("Detalle de Ventas", styles['Heading2']))
-        
-        # Encabezados de la tabla de detalles
-        detail_data = [
-            ['Fecha', 'Cliente', 'Tipo Entrada', 'Cant.', 'P. Unit.', 'Subtotal', 'Total']
-        ]
-        
-        # Datos de la tabla
-        for compra in compras:
-            for detalle in compra.detalles.all():
-                detail_data.append([
-                    compra.fecha_compra.strftime('%d/%m/%Y'),
-                    f"{compra.usuario.nombre} {compra.usuario.apellido}",
-                    detalle.entrada_tipo.nombre,
-                    str(detalle.cantidad),
-                    f'${detalle.precio_unitario:,.0f}',
-                    f'${detalle.subtotal:,.0f}',
-                    f'${compra.total:,.0f}'
-                ])
-        
-        # Fila de totales
-        detail_data.append([
-            'TOTALES', '', '', str(total_entradas), '', '', f'${total_ingresos:,.0f}'
-        ])
-        
-        detail_table = Table(detail_data, colWidths=[
-            0.8*inch, 1.5*inch, 1.2*inch, 0.5*inch, 0.8*inch, 0.8*inch, 0.8*inch
-        ])
-        
-        detail_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -2), 8),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.lightgreen),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ]))
-        
-        elements.append(detail_table)
-        
-        # Construir PDF
-        doc.build(elements)
+        escribir_pdf_reporte_ventas(terma, fecha_inicio_dt, fecha_fin_dt, buffer)
         
         # Preparar respuesta
         buffer.seek(0)
@@ -539,4 +561,100 @@ def exportar_reporte_pdf(request):
     except ValueError:
         return JsonResponse({'error': 'Formato de fecha inválido.'}, status=400)
     except Exception as e:
-        return JsonResponse({'error': f'Error al generar PDF: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Error al generar PDF: {str(e)}'}, status=500)
+
+
+# =================== REPORTES EN SEGUNDO PLANO ===================
+
+TIPOS_REPORTE_TERMA = {
+    'pdf': 'ventas_pdf',
+    'excel': 'ventas_excel',
+}
+
+
+def estado_trabajo_json(trabajo):
+    """Representación JSON del estado de un TrabajoReporte para el polling."""
+    datos = {
+        'job_id': str(trabajo.uuid),
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'url_estado': reverse('usuarios:estado_reporte', args=[trabajo.uuid]),
+    }
+    if trabajo.estado == 'completado':
+        datos['url_descarga'] = reverse('usuarios:descargar_reporte', args=[trabajo.uuid])
+    elif trabajo.estado == 'error':
+        datos['error'] = 'No se pudo generar el reporte. Intenta nuevamente.'
+    return datos
+
+
+def _puede_acceder_trabajo(usuario, trabajo):
+    """El solicitante, los admins de la terma del reporte y el admin general."""
+    rol = usuario.rol.nombre if getattr(usuario, 'rol', None) else None
+    if rol == 'administrador_general' or trabajo.solicitado_por_id == usuario.id:
+        return True
+    return (
+        rol == 'administrador_terma'
+        and trabajo.terma_id is not None
+        and trabajo.terma_id == usuario.terma_id
+    )
+
+
+@admin_terma_required
+@require_POST
+def solicitar_reporte(request):
+    """Encola un reporte de ventas (PDF o Excel) y retorna el ID del trabajo."""
+    from django.http import JsonResponse
+    from ventas.trabajos_reporte import encolar_reporte
+    
+    usuario = request.user
+    terma = usuario.terma
+    
+    if not (terma.plan_actual and terma.plan_actual.nombre == 'premium'):
+        return JsonResponse({'error': 'Esta funcionalidad requiere un plan premium.'}, status=403)
+    
+    tipo = TIPOS_REPORTE_TERMA.get(request.POST.get('tipo'))
+    if not tipo:
+        return JsonResponse({'error': 'Tipo de reporte inválido.'}, status=400)
+    
+    try:
+        fecha_inicio = datetime.strptime(request.POST.get('fecha_inicio', ''), '%Y-%m-%d').date()
+        fecha_fin = datetime.strptime(request.POST.get('fecha_fin', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido.'}, status=400)
+    
+    trabajo, creado = encolar_reporte(
+        tipo,
+        {'fecha_inicio': fecha_inicio.isoformat(), 'fecha_fin': fecha_fin.isoformat()},
+        usuario=usuario,
+        terma=terma
+    )
+    return JsonResponse(estado_trabajo_json(trabajo), status=202 if creado else 200)
+
+
+@login_required
+def estado_reporte(request, trabajo_uuid):
+    """Estado de un trabajo de reporte (para polling desde la interfaz)."""
+    from django.http import JsonResponse
+    from ventas.models import TrabajoReporte
+    
+    trabajo = get_object_or_404(TrabajoReporte, uuid=trabajo_uuid)
+    if not _puede_acceder_trabajo(request.user, trabajo):
+        return JsonResponse({'error': 'No tienes acceso a este reporte.'}, status=403)
+    return JsonResponse(estado_trabajo_json(trabajo))
+
+
+@login_required
+def descargar_reporte(request, trabajo_uuid):
+    """Descarga el archivo de un reporte generado en segundo plano."""
+    from django.http import FileResponse, Http404, HttpResponseForbidden
+    from ventas.models import TrabajoReporte
+    
+    trabajo = get_object_or_404(TrabajoReporte, uuid=trabajo_uuid)
+    if not _puede_acceder_trabajo(request.user, trabajo):
+        return HttpResponseForbidden('No tienes acceso a este reporte.')
+    if trabajo.estado != 'completado' or not trabajo.archivo:
+        raise Http404('El reporte aún no está disponible')
+    
+    extension = trabajo.archivo.name.rsplit('.', 1)[-1]
+    nombre = f"reporte_{trabajo.terma.nombre_terma if trabajo.terma else 'plataforma'}_{trabajo.parametros.get('fecha_inicio')}_{trabajo.parametros.get('fecha_fin')}.{extension}"
+    return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=nombre)
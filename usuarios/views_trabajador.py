@@ -11,6 +11,7 @@ from .models import Usuario
 from .decorators import cliente_required
 import json
 import logging
+from core.metrics import span
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -151,6 +152,7 @@ def inicio_trabajador(request):
 
 @trabajador_required
 @require_POST
+@span('escanear_qr')
 def escanear_qr(request):
     """Vista para procesar el escaneado de códigos QR."""
     try:
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     Compra, CodigoQR, RegistroEscaneo, 
-    DistribucionPago, HistorialPagoTerma, ResumenComisionesPlataforma
+    DistribucionPago, HistorialPagoTerma, ResumenComisionesPlataforma,
+    TrabajoReporte
 )
 
 @admin.register(CodigoQR)
@@ -86,18 +87,13 @@ class DistribucionPagoAdmin(admin.ModelAdmin):
     recalcular_distribucion.short_description = "Recalcular distribuciones pendientes"
     
     def simular_pago_terma(self, request, queryset):
-        """Acción para simular pago a termas"""
-        from .utils import simular_pago_terma
-        count = 0
-        for distribucion in queryset:
-            if distribucion.estado == 'procesado':
-                pago = simular_pago_terma(distribucion)
-                if pago:
-                    count += 1
+        """Acción para simular pago a termas (un pago por terma con lo seleccionado)"""
+        from .liquidacion import ejecutar_ciclo_pagos
+        pagos, distribuciones = ejecutar_ciclo_pagos(queryset, respetar_calendario=False)
         
         self.message_user(
             request,
-            f"Se simularon {count} pagos a termas."
+            f"Se simularon {pagos} pagos a termas ({distribuciones} distribuciones)."
         )
     simular_pago_terma.short_description = "Simular pago a termas (solo procesados)"
 
@@ -105,7 +101,7 @@ class DistribucionPagoAdmin(admin.ModelAdmin):
 @admin.register(HistorialPagoTerma)
 class HistorialPagoTermaAdmin(admin.ModelAdmin):
     list_display = [
-        'id', 'terma', 'monto_pagado', 'fecha_pago', 
+        'id', 'terma', 'monto_pagado', 'cantidad_distribuciones', 'fecha_pago', 
         'metodo_pago_usado', 'referencia_externa', 'exitoso'
     ]
     list_filter = ['exitoso', 'metodo_pago_usado', 'fecha_pago']
@@ -119,8 +115,8 @@ class HistorialPagoTermaAdmin(admin.ModelAdmin):
     fieldsets = (
         ('Información del Pago', {
             'fields': (
-                'distribucion', 'terma', 'monto_pagado', 
-                'fecha_pago', 'exitoso'
+                'distribucion', 'terma', 'monto_pagado', 'cantidad_distribuciones',
+                'periodo_desde', 'periodo_hasta', 'fecha_pago', 'exitoso'
             )
         }),
         ('Detalles del Método de Pago', {
@@ -183,3 +179,11 @@ class ResumenComisionesPlataformaAdmin(admin.ModelAdmin):
             f"Se recalcularon {count} resúmenes mensuales."
         )
     recalcular_resumen.short_description = "Recalcular resúmenes seleccionados"
+
+
+@admin.register(TrabajoReporte)
+class TrabajoReporteAdmin(admin.ModelAdmin):
+    list_display = ['uuid', 'tipo', 'terma', 'solicitado_por', 'estado', 'fecha_creacion', 'fecha_finalizacion']
+    list_filter = ['tipo', 'estado']
+    search_fields = ['terma__nombre_terma', 'solicitado_por__email']
+    readonly_fields = ['uuid', 'huella', 'fecha_creacion', 'fecha_inicio_proceso', 'fecha_finalizacion']
@@ -14,9 +14,95 @@ import logging
 logger = logging.getLogger(__name__)
 import json
 import base64
-from .models import Compra, CodigoQR, RegistroEscaneo
+from .models import CodigoQR, RegistroEscaneo
+from .grafo_compra import CompraGraph
 from .utils import _get_encryption_key
 from django.contrib.auth.hashers import check_password
+from core.metrics import span
+
+
+def _respuesta_entrada_usada(fecha_uso):
+    return JsonResponse({
+        'valid': False,
+        'error': 'Esta entrada ya fue utilizada',
+        'fecha_uso': fecha_uso.isoformat() if fecha_uso else None,
+        'detail': 'La entrada ya fue escaneada previamente'
+    }, status=200)  # ✅ Cambiado de 400 a 200
+
+
+def _informacion_entrada(compra):
+    """
+    Datos de la entrada para la app del trabajador: tipo, duración, horario
+    y servicios incluidos y extra.
+    
+    Args:
+        compra: CompraGraph
+    """
+    detalle = compra.detalle_principal
+    if not detalle or not detalle.entrada_tipo:
+        logger.error(f"No se encontraron detalles para la compra {compra.id}")
+        return {
+            'tipo': 'Entrada General',
+            'duracion': 'Duración no especificada',
+            'duracion_horas': None,
+            'duracion_tipo': None,
+            'hora_inicio': '00:00',
+            'hora_fin': '23:59',
+            'servicios_incluidos': [],
+            'servicios_extra': []
+        }
+    
+    entrada_tipo = detalle.entrada_tipo
+    servicios_incluidos = [
+        {'nombre': servicio.nombre, 'descripcion': servicio.descripcion}
+        for servicio in entrada_tipo.servicios_incluidos
+    ] or [{'nombre': '-', 'descripcion': 'No incluye servicios adicionales'}]
+    servicios_extra = [
+        {
+            'nombre': servicio.nombre,
+            'descripcion': servicio.descripcion,
+            'precio': float(servicio.precio) if servicio.precio else None,
+            'cantidad': servicio.cantidad
+        }
+        for servicio in detalle.servicios_extra
+    ] or [{
+        'nombre': '-',
+        'descripcion': 'No hay servicios extra contratados',
+        'precio': None,
+        'cantidad': 0
+    }]
+    
+    # Generar texto de duración
+    if entrada_tipo.duracion_horas:
+        if entrada_tipo.duracion_horas == 1:
+            duracion_texto = "1 hora"
+        else:
+            duracion_texto = f"{entrada_tipo.duracion_horas} horas"
+        if entrada_tipo.duracion_tipo:
+            duracion_texto += f" ({entrada_tipo.duracion_tipo})"
+    else:
+        duracion_texto = "Duración no especificada"
+    
+    # Calcular horarios basados en duracion_tipo
+    if entrada_tipo.duracion_tipo == 'dia':
+        hora_inicio, hora_fin = '08:00', '20:00'
+    elif entrada_tipo.duracion_tipo == 'noche':
+        hora_inicio, hora_fin = '18:00', '10:00'
+    else:  # dia_completo
+        hora_inicio, hora_fin = '08:00', '08:00'
+    
+    return {
+        'tipo': entrada_tipo.nombre,
+        'duracion': duracion_texto,
+        'duracion_horas': entrada_tipo.duracion_horas,
+        'duracion_tipo': entrada_tipo.duracion_tipo,
+        'hora_inicio': hora_inicio,
+        'hora_fin': hora_fin,
+        'cantidad_entradas': compra.cantidad,
+        'servicios_incluidos': servicios_incluidos,
+        'servicios_extra': servicios_extra,
+    }
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class ValidarEntradaQRView(View):
@@ -49,6 +135,7 @@ class ValidarEntradaQRView(View):
             
         return None
 
+    @span('validar_qr_api')
     def post(self, request, *args, **kwargs):
         # Debug: Imprimir información detallada de la solicitud
         logger.info("-------- Nueva solicitud de validación QR --------")
@@ -115,7 +202,8 @@ class ValidarEntradaQRView(View):
                 print("Datos encriptados recibidos:", datos_encriptados)  # Debug
                 
                 try:
-                    token = fernet.decrypt(datos_encriptados)
+                    with span('qr_fernet_decrypt'):
+                        token = fernet.decrypt(datos_encriptados)
                     print("Datos desencriptados (token firmado):", token.decode())  # Debug
                 except Exception as e:
                     print("Error al desencriptar con Fernet:", str(e))  # Debug
@@ -159,29 +247,27 @@ class ValidarEntradaQRView(View):
                             'detail': f'El ID {compra_id} no es válido'
                         }, status=400)
 
-                    # Intentar obtener la compra
-                    try:
-                        compra = Compra.objects.get(id=compra_id)
-                        logger.info(f"Compra encontrada: {compra.id} - Fecha: {compra.fecha_visita}")
-                    except Compra.DoesNotExist:
+                    # Toda la compra (entrada, servicios, QR, usuario) en un número fijo de consultas
+                    compra = CompraGraph.cargar_uno(compra_id)
+                    if compra is None:
                         logger.error(f"Compra no encontrada: {compra_id}")
                         return JsonResponse({
                             'valid': False,
                             'error': 'Entrada no encontrada',
                             'detail': 'La entrada no existe en el sistema'
                         }, status=404)
+                    logger.info(f"Compra encontrada: {compra.id} - Fecha: {compra.fecha_visita}")
 
                     # Verificar si la entrada ya fue usada
-                    try:
-                        codigo_qr = CodigoQR.objects.get(compra=compra)
-                        logger.info(f"Código QR encontrado - Usado: {codigo_qr.usado}")
-                    except CodigoQR.DoesNotExist:
+                    codigo_qr = compra.codigo_qr
+                    if codigo_qr is None:
                         logger.error(f"Código QR no encontrado para compra: {compra_id}")
                         return JsonResponse({
                             'valid': False,
                             'error': 'Código QR no encontrado',
                             'detail': 'No se encontró el registro del código QR'
                         }, status=404)
+                    logger.info(f"Código QR encontrado - Usado: {codigo_qr.usado}")
 
                     # Verificar que el trabajador pertenezca a la misma terma que la entrada
                     if not user.terma:
@@ -192,12 +278,12 @@ class ValidarEntradaQRView(View):
                             'detail': 'No tienes una terma asignada para validar entradas'
                         }, status=403)
                     
-                    if compra.terma != user.terma:
+                    if compra.terma_id != user.terma_id:
                         logger.warning("Intento de validar entrada de terma incorrecta")
                         return JsonResponse({
                             'valid': False,
                             'error': 'Terma incorrecta',
-                            'detail': f'Esta entrada pertenece a {compra.terma.nombre_terma}, no puedes validarla desde {user.terma.nombre_terma}'
+                            'detail': f'Esta entrada pertenece a {compra.terma.nombre_terma if compra.terma else "otra terma"}, no puedes validarla desde {user.terma.nombre_terma}'
                         }, status=403)
                     
                 except Exception as e:
@@ -210,12 +296,7 @@ class ValidarEntradaQRView(View):
                 # Verificar si ya fue usada
                 if codigo_qr.usado:
                     logger.warning(f"Intento de usar entrada ya utilizada: {compra.id}")
-                    return JsonResponse({
-                        'valid': False,
-                        'error': 'Esta entrada ya fue utilizada',
-                        'fecha_uso': codigo_qr.fecha_uso.isoformat() if codigo_qr.fecha_uso else None,
-                        'detail': 'La entrada ya fue escaneada previamente'
-                    }, status=200)  # ✅ Cambiado de 400 a 200
+                    return _respuesta_entrada_usada(codigo_qr.fecha_uso)
 
                 # Verificar el estado de la compra
                 logger.info(f"Estado de pago de la compra: {compra.estado_pago}")
@@ -252,16 +333,23 @@ class ValidarEntradaQRView(View):
                 from django.db import transaction
                 try:
                     with transaction.atomic():
-                        # Marcar como usado y guardar fecha de uso
-                        fecha_actual = timezone.localtime(timezone.now())
-                        codigo_qr.usado = True
-                        codigo_qr.fecha_uso = fecha_actual
-                        codigo_qr.save()
+                        # Marcar como usado con un UPDATE condicional: si dos
+                        # trabajadores escanean a la vez, solo uno lo consigue
+                        fecha_uso = timezone.localtime(timezone.now())
+                        marcado = CodigoQR.objects.filter(pk=codigo_qr.id, usado=False).update(
+                            usado=True,
+                            fecha_uso=fecha_uso
+                        )
+                        if not marcado:
+                            logger.warning(f"Entrada usada en un escaneo simultáneo: {compra.id}")
+                            return _respuesta_entrada_usada(
+                                CodigoQR.objects.filter(pk=codigo_qr.id).values_list('fecha_uso', flat=True).first()
+                            )
 
                         # Registrar el escaneo exitoso
                         try:
                             registro = RegistroEscaneo.objects.create(
-                                codigo_qr=codigo_qr,
+                                codigo_qr_id=codigo_qr.id,
                                 usuario_scanner=request.user,
                                 exitoso=True,
                                 mensaje='Entrada validada correctamente',
@@ -272,161 +360,8 @@ class ValidarEntradaQRView(View):
                         except Exception as e:
                             logger.error(f"Error al crear registro de escaneo: {str(e)}")
 
-                        # Obtener los detalles de la compra y servicios de la terma
-                        try:
-                            logger.info(f"Buscando información para la compra {compra.id}")
-                            
-                            # Intentar obtener detalles específicos de la compra
-                            detalles = compra.detalles.select_related(
-                                'entrada_tipo'
-                            ).prefetch_related(
-                                'servicios',
-                                'entrada_tipo__servicios'
-                            ).first()
-                            
-                            if not detalles:
-                                logger.error(f"No se encontraron detalles para la compra {compra.id}")
-                                raise Exception("No se encontraron detalles de la compra")
-                                
-                            logger.info(f"Detalles encontrados para compra {compra.id}")
-                            logger.info(f"Tipo de entrada: {detalles.entrada_tipo.nombre}")
-                            logger.info(f"Servicios incluidos: {[s.servicio for s in detalles.entrada_tipo.servicios.all()]}")
-                            logger.info(f"Servicios extra: {[s.servicio for s in detalles.servicios.all()]}")
-                                
-                            if detalles:
-                                # Obtener servicios incluidos del tipo de entrada
-                                servicios_incluidos = detalles.entrada_tipo.servicios.all()
-                                logger.info(f"[DEBUG] ID del detalle: {detalles.id}")
-                                logger.info(f"[DEBUG] ID de la compra: {compra.id}")
-                                logger.info(f"[DEBUG] ID del entrada_tipo: {detalles.entrada_tipo.id}")
-                                
-                                servicios_incluidos_list = [
-                                    {
-                                        'nombre': servicio.servicio,
-                                        'descripcion': servicio.descripcion
-                                    }
-                                    for servicio in servicios_incluidos
-                                ] if servicios_incluidos.exists() else [
-                                    {'nombre': '-', 'descripcion': 'No incluye servicios adicionales'}
-                                ]
-                                
-                                # Obtener servicios extra contratados
-                                servicios_extra = detalles.servicios.all().select_related()
-                                servicios_extra_list = []
-                                if servicios_extra.exists():
-                                    for servicio in servicios_extra:
-                                        servicio_data = {
-                                            'nombre': servicio.servicio,
-                                            'descripcion': servicio.descripcion,
-                                            'precio': float(servicio.precio) if servicio.precio else None,
-                                            'cantidad': 1
-                                        }
-                                        servicios_extra_list.append(servicio_data)
-                                else:
-                                    servicios_extra_list = [{
-                                        'nombre': '-',
-                                        'descripcion': 'No hay servicios extra contratados',
-                                        'precio': None,
-                                        'cantidad': 0
-                                    }]
-                                
-                                # Preparar información de la entrada
-                                entrada_tipo = detalles.entrada_tipo
-                                
-                                # Generar texto de duración
-                                duracion_texto = ""
-                                if entrada_tipo.duracion_horas:
-                                    if entrada_tipo.duracion_horas == 1:
-                                        duracion_texto = "1 hora"
-                                    else:
-                                        duracion_texto = f"{entrada_tipo.duracion_horas} horas"
-                                    
-                                    if entrada_tipo.duracion_tipo:
-                                        duracion_texto += f" ({entrada_tipo.duracion_tipo})"
-                                else:
-                                    duracion_texto = "Duración no especificada"
-                                
-                                # Calcular horarios basados en duracion_tipo
-                                if entrada_tipo.duracion_tipo == 'dia':
-                                    hora_inicio, hora_fin = '08:00', '20:00'
-                                elif entrada_tipo.duracion_tipo == 'noche':
-                                    hora_inicio, hora_fin = '18:00', '10:00'
-                                else:  # dia_completo
-                                    hora_inicio, hora_fin = '08:00', '08:00'
-                                
-                                entrada_info = {
-                                    'tipo': entrada_tipo.nombre,
-                                    'duracion': duracion_texto,
-                                    'duracion_horas': entrada_tipo.duracion_horas,
-                                    'duracion_tipo': entrada_tipo.duracion_tipo,
-                                    'hora_inicio': hora_inicio,
-                                    'hora_fin': hora_fin,
-                                    'cantidad_entradas': compra.cantidad,
-                                    'servicios_incluidos': servicios_incluidos_list,
-                                }
-                                
-                                # Obtener los servicios extra usando el nuevo modelo
-                                servicios_extra_nuevos = detalles.servicios_extra.all().select_related('servicio')
-                                logger.info(f"Recuperando servicios extra con cantidades para detalle {detalles.id}")
-                                logger.info(f"Servicios extra con cantidades encontrados: {[(s.servicio.servicio, s.cantidad) for s in servicios_extra_nuevos]}")
-                                
-                                if servicios_extra_nuevos.exists():
-                                    entrada_info['servicios_extra'] = [
-                                        {
-                                            'nombre': extra.servicio.servicio,
-                                            'descripcion': extra.servicio.descripcion,
-                                            'precio': float(extra.precio_unitario) if extra.precio_unitario else None,
-                                            'cantidad': extra.cantidad
-                                        }
-                                        for extra in servicios_extra_nuevos
-                                    ]
-                                else:
-                                    # Fallback para servicios guardados con el método anterior
-                                    servicios_extra = detalles.servicios.all().select_related()
-                                    logger.info(f"Fallback: Recuperando servicios extra para detalle {detalles.id}")
-                                    logger.info(f"Servicios extra raw query: {servicios_extra.query}")
-                                    logger.info(f"Servicios extra encontrados: {[{'id': s.id, 'servicio': s.servicio} for s in servicios_extra]}")
-                                    
-                                    if servicios_extra.exists():
-                                        entrada_info['servicios_extra'] = [
-                                            {
-                                                'nombre': s.servicio,
-                                                'descripcion': s.descripcion,
-                                                'precio': float(s.precio) if s.precio else None,
-                                                'cantidad': 1
-                                            }
-                                            for s in servicios_extra
-                                        ]
-                                    else:
-                                        entrada_info['servicios_extra'] = [{
-                                            'nombre': '-',
-                                            'descripcion': 'No hay servicios extra contratados',
-                                            'precio': None,
-                                            'cantidad': 0
-                                        }]
-                                
-                                # Log detallado para debug
-                                logger.info(f"Entrada info final: {entrada_info}")
-                                if servicios_extra_nuevos.exists():
-                                    logger.info(f"Servicios extra nuevos en detalle: {[(s.servicio.servicio, s.cantidad) for s in servicios_extra_nuevos]}")
-                                else:
-                                    logger.info(f"Servicios extra antiguos en detalle: {[s.servicio for s in detalles.servicios.all()]}")
-                            else:
-                                # Este caso no debería ocurrir ya que ahora lanzamos una excepción si no hay detalles
-                                logger.error(f"No se encontraron detalles para la compra {compra.id}")
-                                raise Exception("No se encontraron detalles de la compra")
-                        except Exception as e:
-                            logger.error(f"Error al obtener detalles de la compra {compra.id}: {str(e)}")
-                            entrada_info = {
-                                'tipo': 'Entrada General',
-                                'duracion': 'Duración no especificada',
-                                'duracion_horas': None,
-                                'duracion_tipo': None,
-                                'hora_inicio': '00:00',
-                                'hora_fin': '23:59',
-                                'servicios_incluidos': [],
-                                'servicios_extra': []
-                            }
+                        entrada_info = _informacion_entrada(compra)
+                        logger.info(f"Entrada info final: {entrada_info}")
                         
                         # Preparar respuesta
                         response_data = {
@@ -435,7 +370,7 @@ class ValidarEntradaQRView(View):
                             'terma': compra.terma.nombre_terma,
                             'fecha_visita': str(compra.fecha_visita),
                             'usuario': f"{compra.usuario.nombre} {compra.usuario.apellido}",
-                            'cantidad': compra.cantidad if hasattr(compra, 'cantidad') else 1,
+                            'cantidad': compra.cantidad,
                             'entrada': entrada_info,
                             'total_pagado': float(compra.monto_pagado) if compra.monto_pagado else float(compra.total),
                             'mensaje': 'Entrada validada correctamente'
@@ -449,7 +384,7 @@ class ValidarEntradaQRView(View):
                 except Exception as e:
                     # Si algo falla durante la transacción, registrar el intento fallido
                     RegistroEscaneo.objects.create(
-                        codigo_qr=codigo_qr,
+                        codigo_qr_id=codigo_qr.id,
                         usuario_scanner=request.user,
                         exitoso=False,
                         mensaje=f'Error al procesar: {str(e)}',
@@ -457,15 +392,6 @@ class ValidarEntradaQRView(View):
                         dispositivo=request.META.get('HTTP_USER_AGENT', '')
                     )
                     raise
-
-                return JsonResponse({
-                    'valid': True,
-                    'compra_id': compra.id,
-                    'terma': compra.terma.nombre_terma,
-                    'fecha_visita': str(compra.fecha_visita),
-                    'usuario': f"{compra.usuario.nombre} {compra.usuario.apellido}",
-                    'cantidad': compra.cantidad if hasattr(compra, 'cantidad') else 1
-                })
                 
             except Exception as e:
                 return JsonResponse({
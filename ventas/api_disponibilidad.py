@@ -13,7 +13,8 @@ from ventas.disponibilidad_utils import (
     calcular_disponibilidad_terma,
     validar_cantidad_disponible,
     obtener_termas_con_disponibilidad,
-    limpiar_compras_pendientes_vencidas
+    limpiar_compras_pendientes_vencidas,
+    inicio_reservas_vigentes
 )
 
 
@@ -139,7 +140,7 @@ def limpiar_compras_vencidas_api(request):
     
     try:
         data = json.loads(request.body) if request.body else {}
-        horas = data.get('horas', 1)
+        horas = data.get('horas')
         
         cantidad_canceladas = limpiar_compras_pendientes_vencidas(horas)
         
@@ -169,7 +170,6 @@ def estadisticas_disponibilidad(request):
         from termas.models import Terma
         from ventas.models import Compra
         from django.db.models import Count, Sum
-        from datetime import timedelta
         
         # Estadísticas básicas
         total_termas = Terma.objects.filter(estado_suscripcion='activa').count()
@@ -184,11 +184,10 @@ def estadisticas_disponibilidad(request):
         # Compras pendientes
         compras_pendientes = Compra.objects.filter(estado_pago='pendiente').count()
         
-        # Compras pendientes vencidas (>1 hora)
-        hace_1_hora = timezone.now() - timedelta(hours=1)
+        # Compras pendientes con la reserva vencida (ya no cuentan en la disponibilidad)
         compras_vencidas = Compra.objects.filter(
             estado_pago='pendiente',
-            fecha_compra__lt=hace_1_hora
+            fecha_compra__lt=inicio_reservas_vigentes()
         ).count()
         
         return JsonResponse({
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class VentasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ventas'
+
+    def ready(self):
+        """Conecta los signals que invalidan el grafo de compra en cache"""
+        from . import grafo_compra
+        grafo_compra.conectar_signals()
@@ -1,12 +1,30 @@
 """
 Utilidades para control de disponibilidad de entradas por día
 """
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional
+from django.conf import settings
 from django.db.models import Sum, Q
+from django.utils import timezone
 from ventas.models import Compra, DetalleCompra
 from entradas.models import EntradaTipo
 from termas.models import Terma
+from core.metrics import span
+
+
+def inicio_reservas_vigentes(horas_vencimiento: Optional[int] = None) -> datetime:
+    """
+    Momento desde el cual una compra pendiente sigue reservando entradas:
+    las creadas antes ya vencieron, aunque sigan en estado 'pendiente'
+    
+    Args:
+        horas_vencimiento: Horas de reserva (default: settings.RESERVA_COMPRA_PENDIENTE_MINUTOS)
+    """
+    if horas_vencimiento is None:
+        duracion = timedelta(minutes=settings.RESERVA_COMPRA_PENDIENTE_MINUTOS)
+    else:
+        duracion = timedelta(hours=horas_vencimiento)
+    return timezone.now() - duracion
 
 
 def calcular_entradas_vendidas_por_dia(terma_id, fecha: date) -> int:
@@ -47,7 +65,8 @@ def calcular_entradas_vendidas_por_dia(terma_id, fecha: date) -> int:
 def calcular_entradas_pendientes_por_dia(terma_id, fecha: date) -> int:
     """
     Calcula el total de entradas en estado pendiente para una terma en una fecha específica
-    Esto incluye compras que están siendo procesadas
+    Solo cuentan las compras cuya reserva sigue vigente (ver inicio_reservas_vigentes):
+    las abandonadas liberan la disponibilidad sin esperar la limpieza
     
     Args:
         terma_id: int o UUID de la terma
@@ -67,7 +86,8 @@ def calcular_entradas_pendientes_por_dia(terma_id, fecha: date) -> int:
         total_pendientes = DetalleCompra.objects.filter(
             compra__terma_id=terma_id,
             compra__fecha_visita=fecha,
-            compra__estado_pago='pendiente'
+            compra__estado_pago='pendiente',
+            compra__fecha_compra__gt=inicio_reservas_vigentes()
         ).aggregate(
             total=Sum('cantidad')
         )['total'] or 0
@@ -79,6 +99,7 @@ def calcular_entradas_pendientes_por_dia(terma_id, fecha: date) -> int:
         return 0
 
 
+@span('calcular_disponibilidad_terma')
 def calcular_disponibilidad_terma(terma_id, fecha: date = None) -> Dict:
     """
     Calcula la disponibilidad actual de una terma para una fecha específica
@@ -282,30 +303,50 @@ def obtener_proximas_fechas_disponibles(terma_id: int, desde: date = None, dias:
     return fechas_disponibles
 
 
-def limpiar_compras_pendientes_vencidas(horas_vencimiento: int = 1) -> int:
+def limpiar_compras_pendientes_vencidas(horas_vencimiento: Optional[int] = None,
+                                        entrada_tipo_id: Optional[int] = None) -> int:
     """
-    Marca como canceladas las compras pendientes que han estado más tiempo sin pagar
-    Esto libera cupos para nuevas ventas
+    Marca como canceladas las compras pendientes cuya reserva venció y devuelve
+    sus cupos a cada entrada. La disponibilidad diaria ya las ignora al vencer,
+    así que esto solo deja el estado al día y repone los cupos por entrada
     
     Args:
         horas_vencimiento: Horas después de las cuales una compra pendiente se considera vencida
+            (default: settings.RESERVA_COMPRA_PENDIENTE_MINUTOS)
+        entrada_tipo_id: Si se indica, solo las compras con detalle de esa entrada
         
     Returns:
         Cantidad de compras canceladas
     """
-    from datetime import datetime, timedelta
-    from django.utils import timezone
-    
-    tiempo_vencimiento = timezone.now() - timedelta(hours=horas_vencimiento)
+    from django.db import transaction
     
-    compras_vencidas = Compra.objects.filter(
+    tiempo_vencimiento = inicio_reservas_vigentes(horas_vencimiento)
+    vencidas = Compra.objects.filter(
         estado_pago='pendiente',
         fecha_compra__lt=tiempo_vencimiento
     )
+    if entrada_tipo_id is not None:
+        vencidas = vencidas.filter(id__in=DetalleCompra.objects.filter(
+            entrada_tipo_id=entrada_tipo_id
+        ).values('compra_id'))
     
-    cantidad_canceladas = compras_vencidas.update(
-        estado_pago='cancelado_timeout',
-        fecha_actualizacion=timezone.now()
-    )
+    with transaction.atomic():
+        # Las compras que el webhook está pagando en este momento quedan bloqueadas
+        # y se saltan; la cancelación y la devolución de cupos van juntas
+        compras_ids = list(vencidas.select_for_update(skip_locked=True, of=('self',)).values_list('id', flat=True))
+        if not compras_ids:
+            return 0
+        
+        cupos_por_entrada = dict(DetalleCompra.objects.filter(
+            compra_id__in=compras_ids,
+            entrada_tipo__isnull=False
+        ).values('entrada_tipo_id').annotate(
+            total=Sum('cantidad')
+        ).values_list('entrada_tipo_id', 'total'))
+        
+        cantidad_canceladas = Compra.objects.filter(id__in=compras_ids).update(
+            estado_pago='cancelado_timeout'
+        )
+        EntradaTipo.liberar_cupos(cupos_por_entrada)
     
-    return cantidad_canceladas
\ No newline at end of file
+    return cantidad_canceladas
@@ -1,7 +1,123 @@
 from django import forms
+from decimal import Decimal
+import re
 
 class VentaForm(forms.Form):
     """Formulario básico para ventas."""
     cliente = forms.CharField(max_length=100)
     fecha = forms.DateField()
-    total = forms.DecimalField(max_digits=10, decimal_places=2)
\ No newline at end of file
+    total = forms.DecimalField(max_digits=10, decimal_places=2)
+
+
+# Tope de servicios extra distintos y de unidades por servicio en un checkout
+MAX_SERVICIOS_CHECKOUT = 50
+MAX_UNIDADES_SERVICIO = 99
+
+
+def precio_servicio(servicio):
+    """ServicioTerma.precio es texto (p. ej. '17.000'): se deja solo el número."""
+    precio_limpio = re.sub(r'[^\d]', '', servicio.precio or '')
+    return Decimal(precio_limpio or '0')
+
+
+class CheckoutForm(forms.Form):
+    """
+    Datos del checkout: entrada, fecha, cantidad y servicios extra.
+
+    Los servicios llegan como JSON [{"uuid": "...", "cantidad": 2}, ...]. La
+    entrada y los servicios se validan contra la terma (una consulta cada
+    uno, sin importar el tamaño del catálogo) y el total se calcula con los
+    precios de la base de datos, no con los enviados por el navegador.
+    """
+    entrada_id = forms.UUIDField()
+    fecha = forms.DateField(input_formats=['%Y-%m-%d'])
+    cantidad = forms.IntegerField(min_value=1)
+    servicios = forms.JSONField(required=False)
+    # Generada por el navegador para cada carrito: los reintentos la repiten
+    clave_idempotencia = forms.UUIDField(error_messages={
+        'required': 'La página de compra expiró. Recárgala e inténtalo nuevamente.'
+    })
+
+    def __init__(self, *args, terma=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.terma = terma
+
+    def clean_servicios(self):
+        """Normaliza a {uuid: cantidad}, sumando los repetidos."""
+        servicios = self.cleaned_data.get('servicios') or []
+        if not isinstance(servicios, list) or len(servicios) > MAX_SERVICIOS_CHECKOUT:
+            raise forms.ValidationError('Los servicios extra enviados no son válidos.')
+
+        cantidades = {}
+        for item in servicios:
+            try:
+                servicio_uuid = forms.UUIDField().clean(item['uuid'])
+                cantidad = int(item.get('cantidad', 1))
+            except (KeyError, TypeError, ValueError, forms.ValidationError):
+                raise forms.ValidationError('Los servicios extra enviados no son válidos.')
+            if cantidad < 1:
+                raise forms.ValidationError('La cantidad de cada servicio extra debe ser mayor a 0.')
+            cantidades[servicio_uuid] = cantidades.get(servicio_uuid, 0) + cantidad
+
+        if any(cantidad > MAX_UNIDADES_SERVICIO for cantidad in cantidades.values()):
+            raise forms.ValidationError(f'Máximo {MAX_UNIDADES_SERVICIO} unidades por servicio extra.')
+        return cantidades
+
+    def clean(self):
+        from entradas.models import EntradaTipo
+        from termas.models import ServicioTerma
+
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+
+        entrada_tipo = EntradaTipo.objects.filter(
+            uuid=cleaned_data['entrada_id'], terma=self.terma, estado=True
+        ).first()
+        if not entrada_tipo:
+            raise forms.ValidationError('El tipo de entrada seleccionado no es válido para esta terma.')
+
+        cantidades = cleaned_data.get('servicios') or {}
+        servicios = {}
+        if cantidades:
+            servicios = ServicioTerma.objects.filter(terma=self.terma).in_bulk(
+                list(cantidades), field_name='uuid'
+            )
+            if len(servicios) != len(cantidades):
+                raise forms.ValidationError('Alguno de los servicios extra no pertenece a esta terma.')
+
+        cleaned_data['entrada_tipo'] = entrada_tipo
+        # [(servicio, cantidad, precio_unitario)] en el orden enviado
+        cleaned_data['servicios_extra'] = [
+            (servicios[servicio_uuid], cantidad, precio_servicio(servicios[servicio_uuid]))
+            for servicio_uuid, cantidad in cantidades.items()
+        ]
+        return cleaned_data
+
+    @property
+    def precio_unitario(self):
+        return self.cleaned_data['entrada_tipo'].precio
+
+    @property
+    def subtotal_entradas(self):
+        return self.precio_unitario * self.cleaned_data['cantidad']
+
+    @property
+    def total(self):
+        return self.subtotal_entradas + sum(
+            precio * cantidad for _, cantidad, precio in self.cleaned_data['servicios_extra']
+        )
+
+    def descripcion_extras(self):
+        """Texto de los servicios extra para el resumen y la preferencia de pago."""
+        extras = [
+            f"{servicio.servicio} x{cantidad} (${precio * cantidad} CLP)"
+            for servicio, cantidad, precio in self.cleaned_data['servicios_extra']
+        ]
+        return ', '.join(extras) or '-'
+
+    def primer_error(self):
+        """Primer mensaje de error, para mostrarlo como compra_error."""
+        for errores in self.errors.values():
+            return errores[0]
+        return ''
@@ -0,0 +1,310 @@
+"""
+Grafo completo de una compra para PDF, correos, escaneo y reportes.
+
+Cada consumidor cargaba por su cuenta usuario, terma, detalles, entrada,
+servicios incluidos, extras, código QR y distribución (y con el patrón
+.exists() + iterar, dos veces). CompraGraph.cargar() trae todo eso para N
+compras con un número fijo de consultas:
+
+    1. Compras con usuario, terma, comuna, código QR y distribución (JOINs)
+    2. Detalles con su entrada
+    3. Servicios incluidos de cada entrada
+    4. Servicios extra con cantidad (ServicioExtraDetalle)
+    5. Servicios extra antiguos (M2M DetalleCompra.servicios)
+    6. Escaneos exitosos con el trabajador que escaneó
+
+El resultado son dataclasses congeladas con tipos simples: no consultan la
+BD al leerse y se pueden guardar en cache (obtener_grafos_compra). Los
+atributos anidados repiten los nombres de los modelos (compra.terma.nombre_terma,
+detalle.entrada_tipo.nombre) para que los templates no cambien.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .forms import precio_servicio
+
+# Las signals invalidan al confirmar; el TTL acota lo que no pasa por ellas (update())
+TTL_GRAFO_COMPRA = 300
+
+PREFIJO_CACHE = 'grafo_compra'
+
+
+@dataclass(frozen=True)
+class PersonaGrafo:
+    id: int
+    nombre: str
+    apellido: str
+    email: str
+    terma_id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class TermaGrafo:
+    id: int
+    uuid: str
+    nombre_terma: str
+    email_terma: Optional[str]
+    telefono_terma: Optional[str]
+    comuna: Optional[str]
+
+
+@dataclass(frozen=True)
+class ServicioGrafo:
+    nombre: str
+    descripcion: Optional[str]
+    precio: Optional[Decimal]
+    cantidad: int = 1
+
+
+@dataclass(frozen=True)
+class EntradaGrafo:
+    id: int
+    nombre: str
+    duracion_horas: Optional[int]
+    duracion_tipo: Optional[str]
+    servicios_incluidos: Tuple[ServicioGrafo, ...]
+
+
+@dataclass(frozen=True)
+class DetalleGrafo:
+    id: int
+    entrada_tipo: Optional[EntradaGrafo]
+    cantidad: int
+    precio_unitario: Decimal
+    subtotal: Decimal
+    servicios_extra: Tuple[ServicioGrafo, ...]
+
+
+@dataclass(frozen=True)
+class CodigoQRGrafo:
+    id: int
+    codigo: str
+    usado: bool
+    fecha_uso: Optional[datetime]
+
+
+@dataclass(frozen=True)
+class EscaneoGrafo:
+    id: int
+    fecha_escaneo: datetime
+    usuario_scanner: Optional[PersonaGrafo]
+
+
+@dataclass(frozen=True)
+class CompraGraph:
+    id: int
+    uuid: str
+    estado_pago: str
+    fecha_compra: datetime
+    fecha_visita: Optional[date]
+    total: Decimal
+    monto_pagado: Optional[Decimal]
+    cantidad: int
+    usuario: PersonaGrafo
+    terma: Optional[TermaGrafo]
+    detalles: Tuple[DetalleGrafo, ...]
+    codigo_qr: Optional[CodigoQRGrafo]
+    monto_para_terma: Optional[Decimal]
+    escaneos_exitosos: Tuple[EscaneoGrafo, ...]
+
+    @property
+    def terma_id(self):
+        return self.terma.id if self.terma else None
+
+    @property
+    def detalle_principal(self):
+        """Primer detalle (las compras actuales tienen uno solo)."""
+        return self.detalles[0] if self.detalles else None
+
+    @classmethod
+    def cargar(cls, compra_ids: Iterable[int]) -> Dict[int, 'CompraGraph']:
+        """
+        Carga el grafo de varias compras en 6 consultas, sin importar cuántas sean.
+
+        Args:
+            compra_ids: IDs de las compras
+
+        Returns:
+            dict {compra_id: CompraGraph} (las que no existen se omiten)
+        """
+        from .models import Compra, DetalleCompra, RegistroEscaneo, ServicioExtraDetalle
+
+        compra_ids = list(compra_ids)
+        if not compra_ids:
+            return {}
+
+        detalles = DetalleCompra.objects.select_related('entrada_tipo').prefetch_related(
+            'entrada_tipo__servicios',
+            Prefetch('servicios_extra', queryset=ServicioExtraDetalle.objects.select_related('servicio')),
+            'servicios',
+        ).order_by('id')
+        compras = Compra.objects.filter(id__in=compra_ids).select_related(
+            'usuario', 'terma__comuna', 'codigoqr', 'distribucion_pago'
+        ).prefetch_related(
+            Prefetch('detalles', queryset=detalles),
+            Prefetch(
+                'codigoqr__registroescaneo_set',
+                queryset=RegistroEscaneo.objects.filter(exitoso=True).select_related(
+                    'usuario_scanner'
+                ).order_by('fecha_escaneo'),
+                to_attr='escaneos_exitosos'
+            ),
+        )
+        return {compra.id: cls._desde_modelo(compra) for compra in compras}
+
+    @classmethod
+    def cargar_uno(cls, compra_id: int) -> Optional['CompraGraph']:
+        return cls.cargar([compra_id]).get(compra_id)
+
+    @classmethod
+    def de(cls, compra) -> Optional['CompraGraph']:
+        """Acepta una Compra (se recarga completa) o un CompraGraph ya cargado."""
+        return compra if isinstance(compra, cls) else cls.cargar_uno(compra.id)
+
+    @classmethod
+    def _desde_modelo(cls, compra):
+        terma = compra.terma
+        codigo_qr = getattr(compra, 'codigoqr', None)
+        distribucion = getattr(compra, 'distribucion_pago', None)
+        return cls(
+            id=compra.id,
+            uuid=str(compra.uuid),
+            estado_pago=compra.estado_pago,
+            fecha_compra=compra.fecha_compra,
+            fecha_visita=compra.fecha_visita,
+            total=compra.total,
+            monto_pagado=compra.monto_pagado,
+            cantidad=compra.cantidad,
+            usuario=_persona(compra.usuario),
+            terma=TermaGrafo(
+                id=terma.id,
+                uuid=str(terma.uuid),
+                nombre_terma=terma.nombre_terma,
+                email_terma=terma.email_terma,
+                telefono_terma=terma.telefono_terma,
+                comuna=terma.comuna.nombre if terma.comuna else None,
+            ) if terma else None,
+            detalles=tuple(_detalle(detalle) for detalle in compra.detalles.all()),
+            codigo_qr=CodigoQRGrafo(
+                id=codigo_qr.id,
+                codigo=codigo_qr.codigo,
+                usado=codigo_qr.usado,
+                fecha_uso=codigo_qr.fecha_uso,
+            ) if codigo_qr else None,
+            monto_para_terma=distribucion.monto_para_terma if distribucion else None,
+            escaneos_exitosos=tuple(
+                EscaneoGrafo(
+                    id=escaneo.id,
+                    fecha_escaneo=escaneo.fecha_escaneo,
+                    usuario_scanner=_persona(escaneo.usuario_scanner) if escaneo.usuario_scanner else None,
+                )
+                for escaneo in (codigo_qr.escaneos_exitosos if codigo_qr else ())
+            ),
+        )
+
+
+def _persona(usuario):
+    return PersonaGrafo(
+        id=usuario.id,
+        nombre=usuario.nombre,
+        apellido=usuario.apellido,
+        email=usuario.email,
+        terma_id=usuario.terma_id,
+    )
+
+
+def _detalle(detalle):
+    entrada = detalle.entrada_tipo
+    # Extras con cantidad; las compras antiguas solo tienen el M2M directo
+    extras = tuple(
+        ServicioGrafo(extra.servicio.servicio, extra.servicio.descripcion, extra.precio_unitario, extra.cantidad)
+        for extra in detalle.servicios_extra.all()
+    ) or tuple(
+        ServicioGrafo(servicio.servicio, servicio.descripcion, precio_servicio(servicio))
+        for servicio in detalle.servicios.all()
+    )
+    return DetalleGrafo(
+        id=detalle.id,
+        entrada_tipo=EntradaGrafo(
+            id=entrada.id,
+            nombre=entrada.nombre,
+            duracion_horas=entrada.duracion_horas,
+            duracion_tipo=entrada.duracion_tipo,
+            servicios_incluidos=tuple(
+                ServicioGrafo(servicio.servicio, servicio.descripcion, precio_servicio(servicio))
+                for servicio in entrada.servicios.all()
+            ),
+        ) if entrada else None,
+        cantidad=detalle.cantidad,
+        precio_unitario=detalle.precio_unitario,
+        subtotal=detalle.subtotal,
+        servicios_extra=extras,
+    )
+
+
+# =================== CACHE ===================
+
+def _clave(compra_id):
+    return f'{PREFIJO_CACHE}:{compra_id}'
+
+
+def obtener_grafos_compra(compra_ids: Iterable[int]) -> Dict[int, CompraGraph]:
+    """
+    Como CompraGraph.cargar(), pero leyendo primero del cache y cargando
+    solo las compras que falten. No usar donde se decide sobre el estado
+    (pago, escaneo): ahí se carga fresco.
+    """
+    compra_ids = list(compra_ids)
+    en_cache = cache.get_many([_clave(compra_id) for compra_id in compra_ids])
+    grafos = {grafo.id: grafo for grafo in en_cache.values()}
+
+    faltantes = CompraGraph.cargar(compra_id for compra_id in compra_ids if compra_id not in grafos)
+    if faltantes:
+        cache.set_many({_clave(compra_id): grafo for compra_id, grafo in faltantes.items()}, TTL_GRAFO_COMPRA)
+        grafos.update(faltantes)
+    return grafos
+
+
+def invalidar_grafo_compra(compra_id):
+    """Descarta el grafo en cache de una compra al confirmar la transacción actual."""
+    if compra_id is not None:
+        transaction.on_commit(lambda: cache.delete(_clave(compra_id)))
+
+
+def _compra_de_escaneo(registro):
+    """Id de la compra de un escaneo sin cargar el CodigoQR completo si no está en memoria."""
+    from .models import CodigoQR
+
+    if registro.__class__.codigo_qr.is_cached(registro):
+        return registro.codigo_qr.compra_id
+    return CodigoQR.objects.filter(pk=registro.codigo_qr_id).values_list('compra_id', flat=True).first()
+
+
+# modelo -> cómo llegar al id de la compra desde una instancia
+_COMPRA_DE = {
+    'ventas.Compra': lambda instancia: instancia.pk,
+    'ventas.DetalleCompra': lambda instancia: instancia.compra_id,
+    'ventas.CodigoQR': lambda instancia: instancia.compra_id,
+    'ventas.DistribucionPago': lambda instancia: instancia.compra_id,
+    'ventas.RegistroEscaneo': _compra_de_escaneo,
+}
+
+
+def conectar_signals():
+    """Conecta los signals que invalidan el grafo en cache al cambiar alguna de sus partes."""
+    from django.apps import apps
+    from django.db.models.signals import post_delete, post_save
+
+    for modelo, compra_de in _COMPRA_DE.items():
+        def al_cambiar(sender, instance, compra_de=compra_de, **kwargs):
+            invalidar_grafo_compra(compra_de(instance))
+
+        modelo = apps.get_model(modelo)
+        post_save.connect(al_cambiar, sender=modelo, weak=False, dispatch_uid=f'grafo_compra_guardar_{modelo.__name__}')
+        post_delete.connect(al_cambiar, sender=modelo, weak=False, dispatch_uid=f'grafo_compra_eliminar_{modelo.__name__}')
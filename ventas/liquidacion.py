@@ -0,0 +1,252 @@
+"""
+Liquidación por lotes de compras pagadas y ciclos de pago a termas.
+
+Liquidación: en vez de procesar una compra a la vez, un lote completo se
+liquida dentro de una transacción:
+
+    1. bulk_create de las DistribucionPago, ya en estado 'procesado'.
+    2. Un UPDATE con F() por mes al resumen de comisiones.
+
+Ciclo de pagos: cada cierto tiempo (settings.CICLO_PAGO_TERMAS_HORAS) todas
+las distribuciones 'procesado' de una terma se pagan juntas en un solo
+HistorialPagoTerma, del que quedan como líneas. Los pagos crecen con los
+ciclos y no con las ventas.
+
+Las filas se toman con SELECT ... FOR UPDATE SKIP LOCKED, así que varios
+procesos pueden trabajar en paralelo sin tomar la misma fila dos veces.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.kpis import invalidar_kpis
+
+from .models import Compra, DistribucionPago, HistorialPagoTerma
+from .utils import acumular_resumen_comisiones
+
+logger = logging.getLogger(__name__)
+
+# Compras (o distribuciones) por transacción
+TAMAÑO_LOTE_LIQUIDACION = 500
+
+METODO_PAGO_SIMULADO = "Transferencia Bancaria"
+
+
+def _nueva_referencia():
+    return f"SIM-{uuid.uuid4().hex[:8].upper()}"
+
+
+def _nombre_plan(plan):
+    return plan.nombre if plan else 'Sin plan'
+
+
+def _construir_distribucion(compra, ahora):
+    """Distribución de una compra con los montos según el plan actual de la terma."""
+    terma = compra.terma
+    plan = terma.plan_actual
+    porcentaje = plan.porcentaje_comision if plan else terma.porcentaje_comision_actual
+
+    comision = (compra.total * porcentaje) / Decimal('100')
+    return DistribucionPago(
+        compra=compra,
+        terma=terma,
+        plan_utilizado=plan,
+        monto_total=compra.total,
+        porcentaje_comision=porcentaje,
+        monto_comision_plataforma=comision,
+        monto_para_terma=compra.total - comision,
+        estado='procesado',
+        fecha_procesado=ahora,
+    )
+
+
+def _sumar_a_resumenes(distribuciones):
+    """Un UPDATE por mes con la suma de todas las distribuciones del lote."""
+    por_mes = defaultdict(lambda: [Decimal('0'), Decimal('0'), Decimal('0'), 0])
+    for distribucion in distribuciones:
+        # Mes en hora local, como recalcular_resumen() y .dates('fecha_calculo', 'month')
+        fecha = timezone.localtime(distribucion.fecha_calculo)
+        totales = por_mes[(fecha.month, fecha.year)]
+        totales[0] += distribucion.monto_total
+        totales[1] += distribucion.monto_comision_plataforma
+        totales[2] += distribucion.monto_para_terma
+        totales[3] += 1
+
+    for (mes, año), (ventas, comisiones, pagado, cantidad) in por_mes.items():
+        acumular_resumen_comisiones(mes, año, ventas, comisiones, pagado, cantidad)
+
+
+def liquidar_lote_compras(tamaño_lote=TAMAÑO_LOTE_LIQUIDACION, omitir=None):
+    """
+    Liquida un lote de compras pagadas sin distribución: crea sus
+    distribuciones y actualiza los resúmenes mensuales. Las distribuciones
+    quedan 'procesado' hasta el próximo ciclo de pagos.
+
+    Una compra que no se puede liquidar se registra en el log y queda fuera
+    del lote; el resto se liquida igual. Las compras sin terma (eliminada)
+    no se toman.
+
+    Args:
+        tamaño_lote: Máximo de compras a liquidar en esta transacción
+        omitir: Set opcional de IDs a no tomar. Se le agregan las compras
+            que fallan, así las siguientes llamadas de la misma pasada no
+            las vuelven a intentar (y cuentan como tomadas)
+
+    Returns:
+        int: Cantidad de compras liquidadas, más las fallidas si se pasó
+            `omitir` (0 si no quedan pendientes)
+    """
+    with transaction.atomic():
+        compras = list(
+            Compra.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                estado_pago='pagado',
+                distribucion_pago__isnull=True,
+                terma__isnull=False
+            ).exclude(id__in=omitir or ()).select_related('terma__plan_actual').order_by('id')[:tamaño_lote]
+        )
+        if not compras:
+            return 0
+
+        ahora = timezone.now()
+        nuevas = []
+        fallidas = []
+        for compra in compras:
+            try:
+                nuevas.append(_construir_distribucion(compra, ahora))
+            except Exception:
+                logger.exception(f"No se pudo liquidar la compra {compra.id}; se omite del lote")
+                fallidas.append(compra.id)
+        if omitir is not None:
+            omitir.update(fallidas)
+
+        distribuciones = DistribucionPago.objects.bulk_create(nuevas)
+        _sumar_a_resumenes(distribuciones)
+        # bulk_create no emite signals
+        invalidar_kpis('distribuciones')
+
+    logger.info(f"Lote liquidado: {len(distribuciones)} compras ({len(fallidas)} con error)")
+    return len(distribuciones) + (len(fallidas) if omitir is not None else 0)
+
+
+def _termas_con_pago_reciente(ahora, horas):
+    """IDs de termas que ya recibieron un pago dentro del intervalo del ciclo."""
+    return HistorialPagoTerma.objects.filter(
+        exitoso=True,
+        fecha_pago__gt=ahora - timedelta(hours=horas)
+    ).values('terma_id')
+
+
+def ejecutar_ciclo_pagos(distribuciones=None, respetar_calendario=True):
+    """
+    Paga a las termas lo acumulado: agrupa las distribuciones 'procesado' de
+    cada terma en un solo HistorialPagoTerma (una transferencia simulada) y
+    las enlaza como sus líneas, dejándolas 'completado'.
+
+    Args:
+        distribuciones: QuerySet opcional para acotar qué distribuciones pagar
+        respetar_calendario: Si es True, omite las termas que ya recibieron un
+            pago en las últimas settings.CICLO_PAGO_TERMAS_HORAS horas
+
+    Returns:
+        tuple: (pagos creados, distribuciones pagadas)
+    """
+    from termas.models import Terma
+
+    if distribuciones is None:
+        distribuciones = DistribucionPago.objects.all()
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        pendientes = distribuciones.select_for_update(skip_locked=True, of=('self',)).filter(
+            estado='procesado',
+            pago_terma__isnull=True
+        )
+        if respetar_calendario:
+            pendientes = pendientes.exclude(
+                terma_id__in=_termas_con_pago_reciente(ahora, settings.CICLO_PAGO_TERMAS_HORAS)
+            )
+
+        # terma_id -> [monto, ids, desde, hasta]
+        por_terma = {}
+        for pk, terma_id, monto, procesado in pendientes.order_by().values_list(
+            'pk', 'terma_id', 'monto_para_terma', 'fecha_procesado'
+        ):
+            grupo = por_terma.setdefault(terma_id, [Decimal('0'), [], procesado, procesado])
+            grupo[0] += monto
+            grupo[1].append(pk)
+            if procesado and (grupo[2] is None or procesado < grupo[2]):
+                grupo[2] = procesado
+            if procesado and (grupo[3] is None or procesado > grupo[3]):
+                grupo[3] = procesado
+        if not por_terma:
+            return 0, 0
+
+        termas = Terma.objects.select_related('plan_actual').in_bulk(por_terma)
+        pagos = []
+        for terma_id, (monto, ids, desde, hasta) in por_terma.items():
+            terma = termas[terma_id]
+            nombre_plan = _nombre_plan(terma.plan_actual)
+            pagos.append(HistorialPagoTerma(
+                terma=terma,
+                monto_pagado=monto,
+                cantidad_distribuciones=len(ids),
+                periodo_desde=desde,
+                periodo_hasta=hasta,
+                metodo_pago_usado=METODO_PAGO_SIMULADO,
+                referencia_externa=_nueva_referencia(),
+                info_pago_terma={
+                    'email_terma': terma.email_terma,
+                    'rut_empresa': terma.rut_empresa,
+                    'nombre_terma': terma.nombre_terma,
+                    'plan_utilizado': nombre_plan,
+                },
+                observaciones=f"Pago simulado del ciclo - {len(ids)} ventas - Plan: {nombre_plan}",
+                exitoso=True,
+            ))
+        HistorialPagoTerma.objects.bulk_create(pagos)
+
+        # Un UPDATE por terma enlaza sus líneas con el pago del ciclo
+        for pago in pagos:
+            DistribucionPago.objects.filter(pk__in=por_terma[pago.terma_id][1]).update(
+                pago_terma=pago,
+                estado='completado',
+                fecha_pago_terma=ahora,
+                referencia_pago_terma=pago.referencia_externa,
+            )
+
+    pagadas = sum(pago.cantidad_distribuciones for pago in pagos)
+    logger.info(f"Ciclo de pagos: {len(pagos)} termas, {pagadas} distribuciones")
+    return len(pagos), pagadas
+
+
+def procesar_en_lotes(funcion_lote, tamaño_lote=TAMAÑO_LOTE_LIQUIDACION, al_terminar_lote=None):
+    """
+    Ejecuta una función de lote hasta que no queden elementos y mide el
+    rendimiento.
+
+    Args:
+        funcion_lote: Función (tamaño_lote) -> cantidad procesada
+        tamaño_lote: Elementos por transacción
+        al_terminar_lote: Callback opcional (cantidad, segundos) por lote
+
+    Returns:
+        tuple: (total procesado, segundos totales)
+    """
+    total = 0
+    inicio = time.perf_counter()
+    while True:
+        inicio_lote = time.perf_counter()
+        cantidad = funcion_lote(tamaño_lote)
+        if not cantidad:
+            break
+        total += cantidad
+        if al_terminar_lote:
+            al_terminar_lote(cantidad, time.perf_counter() - inicio_lote)
+    return total, time.perf_counter() - inicio
@@ -0,0 +1,133 @@
+"""
+Benchmark del costo de logging por request en los flujos de escaneo y checkout.
+
+Compara la configuración anterior (StreamHandler síncrono duplicado en loggers
+padre e hijo, todo en DEBUG) con la actual (un único QueueListenerHandler en el
+logger raíz). Reproduce los registros que emite cada flujo y mide el tiempo que
+paga el hilo del request.
+"""
+import logging
+import logging.config
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from MiTerma.log_handlers import QueueListenerHandler, VERBOSE_FORMAT
+
+
+# Registros emitidos por request: (logger, nivel, cantidad).
+# Escaneo: ValidarEntradaQRView + decorador de trabajador + middleware.
+# Checkout: pago_exitoso -> procesar_pago_completo -> enviar_entrada_por_correo.
+PERFILES = {
+    'escaneo': [
+        ('ventas.api', logging.INFO, 30),
+        ('usuarios.views_trabajador', logging.INFO, 1),
+        ('security', logging.INFO, 1),
+        ('usuarios', logging.DEBUG, 1),
+    ],
+    'checkout': [
+        ('ventas.views', logging.INFO, 2),
+        ('ventas.utils', logging.INFO, 4),
+        ('security', logging.INFO, 1),
+        ('termas.views', logging.DEBUG, 2),
+        ('usuarios.views', logging.DEBUG, 2),
+        ('usuarios', logging.DEBUG, 1),
+    ],
+}
+
+
+def configuracion_anterior(stream):
+    """LOGGING previo: handler de consola en padres e hijos con propagate."""
+    loggers = {}
+    for nombre in ['ventas', 'security', 'usuarios', 'usuarios.views',
+                   'termas', 'termas.views', 'termas.email_utils']:
+        loggers[nombre] = {'handlers': ['console'], 'level': 'DEBUG', 'propagate': True}
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'verbose': {'format': VERBOSE_FORMAT, 'style': '{'},
+        },
+        'handlers': {
+            'console': {
+                'class': 'logging.StreamHandler',
+                'formatter': 'verbose',
+                'stream': stream,
+            },
+        },
+        # Antes el logger raíz no tenía handlers
+        'root': {'handlers': [], 'level': 'WARNING'},
+        'loggers': loggers,
+    }
+
+
+def configuracion_actual(stream):
+    """settings.LOGGING con el handler de cola escribiendo en el stream dado."""
+    config = dict(settings.LOGGING)
+    config['handlers'] = {
+        'queue': dict(settings.LOGGING['handlers']['queue'], stream=stream),
+    }
+    return config
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de logging por request antes y después de la cola asíncrona'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Cantidad de requests simulados por flujo (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        n_requests = options['requests']
+
+        self.stdout.write(self.style.SUCCESS('\n=== BENCHMARK DE LOGGING POR REQUEST ===\n'))
+        self.stdout.write(f"{'Flujo':<10} {'Config':<10} {'Registros':>10} {'µs/request':>12} {'Drenado (ms)':>14}")
+
+        try:
+            for perfil, registros in PERFILES.items():
+                for nombre, fabrica in [('anterior', configuracion_anterior), ('actual', configuracion_actual)]:
+                    with tempfile.TemporaryFile('w+') as stream:
+                        logging.config.dictConfig(fabrica(stream))
+                        escritos_antes = stream.tell()
+                        por_request, drenado = self.medir(registros, n_requests)
+                        lineas = self.contar_lineas(stream, escritos_antes)
+                    self.stdout.write(
+                        f"{perfil:<10} {nombre:<10} {lineas // n_requests:>10} "
+                        f"{por_request:>12.1f} {drenado:>14.1f}"
+                    )
+        finally:
+            # Restaurar la configuración del proyecto
+            logging.config.dictConfig(settings.LOGGING)
+
+    def medir(self, registros, n_requests):
+        """Retorna (µs por request en el hilo llamador, ms hasta vaciar la cola)."""
+        loggers = [(logging.getLogger(nombre), nivel, cantidad) for nombre, nivel, cantidad in registros]
+
+        inicio = time.perf_counter()
+        for i in range(n_requests):
+            for logger, nivel, cantidad in loggers:
+                for j in range(cantidad):
+                    logger.log(nivel, "Request %s - registro %s de benchmark", i, j)
+        fin_llamador = time.perf_counter()
+
+        # Cerrar el handler detiene el listener tras escribir todo lo encolado
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, QueueListenerHandler):
+                handler.close()
+        fin_total = time.perf_counter()
+
+        return (
+            (fin_llamador - inicio) / n_requests * 1_000_000,
+            (fin_total - fin_llamador) * 1000,
+        )
+
+    def contar_lineas(self, stream, desde):
+        stream.flush()
+        stream.seek(desde)
+        return sum(1 for _ in stream)
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db.models import Q
 from ventas.models import Compra, DistribucionPago
-from ventas.utils import procesar_pago_completo, simular_pago_terma
+from ventas.liquidacion import TAMAÑO_LOTE_LIQUIDACION
+from ventas.utils import procesar_pago_completo
 from django.utils import timezone
 
 
@@ -18,7 +19,13 @@ class Command(BaseCommand):
         parser.add_argument(
             '--simular-pagos',
             action='store_true',
-            help='Simular pagos a termas para distribuciones procesadas'
+            help='Ejecutar un ciclo de pagos: un pago por terma con sus distribuciones procesadas'
+        )
+        
+        parser.add_argument(
+            '--ignorar-calendario',
+            action='store_true',
+            help='Con --simular-pagos, pagar también a termas con un pago dentro del ciclo actual'
         )
         
         parser.add_argument(
@@ -38,6 +45,32 @@ class Command(BaseCommand):
             action='store_true',
             help='Recalcular distribuciones pendientes'
         )
+        
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=TAMAÑO_LOTE_LIQUIDACION,
+            help=f'Compras o distribuciones por transacción (por defecto {TAMAÑO_LOTE_LIQUIDACION})'
+        )
+        
+        parser.add_argument(
+            '--recalcular-resumen',
+            action='store_true',
+            help='Reconstruir los resúmenes mensuales de comisiones desde las distribuciones'
+        )
+        
+        parser.add_argument(
+            '--mes',
+            type=int,
+            help='Mes a reconstruir con --recalcular-resumen (requiere --año)'
+        )
+        
+        parser.add_argument(
+            '--año',
+            type=int,
+            dest='anio',
+            help='Año a reconstruir con --recalcular-resumen'
+        )
     
     def handle(self, *args, **options):
         if options['estadisticas']:
@@ -47,13 +80,16 @@ class Command(BaseCommand):
             self.procesar_compra_especifica(options['compra_id'])
         
         elif options['procesar_pendientes']:
-            self.procesar_compras_pendientes()
+            self.procesar_compras_pendientes(options['batch_size'])
         
         elif options['simular_pagos']:
-            self.simular_pagos_pendientes()
+            self.simular_pagos_pendientes(not options['ignorar_calendario'])
         
         elif options['recalcular']:
-            self.recalcular_distribuciones()
+            self.recalcular_distribuciones(options['batch_size'])
+        
+        elif options['recalcular_resumen']:
+            self.recalcular_resumenes(options['mes'], options['anio'])
         
         else:
             self.stdout.write(
@@ -158,14 +194,16 @@ class Command(BaseCommand):
                 self.style.ERROR(f"Error al procesar compra {compra_id}: {str(e)}")
             )
     
-    def procesar_compras_pendientes(self):
-        """Procesa todas las compras pagadas que no tienen distribución"""
-        compras_pendientes = Compra.objects.filter(
-            estado_pago='pagado',
-            distribucion_pago__isnull=True
-        )
+    def procesar_compras_pendientes(self, tamaño_lote):
+        """Liquida por lotes todas las compras pagadas que no tienen distribución"""
+        from functools import partial
+        from ventas.liquidacion import liquidar_lote_compras
         
-        total = compras_pendientes.count()
+        total = Compra.objects.filter(
+            estado_pago='pagado',
+            distribucion_pago__isnull=True,
+            terma__isnull=False
+        ).count()
         
         if total == 0:
             self.stdout.write(
@@ -173,86 +211,71 @@ class Command(BaseCommand):
             )
             return
         
-        self.stdout.write(f"Procesando {total} compras pendientes...")
+        self.stdout.write(f"Procesando {total} compras pendientes en lotes de {tamaño_lote}...")
+        # Las compras que fallan se omiten en el resto de la pasada (no bloquean a las siguientes)
+        omitidas = set()
+        self.ejecutar_lotes(partial(liquidar_lote_compras, omitir=omitidas), tamaño_lote, 'compras')
+        if omitidas:
+            self.stdout.write(self.style.WARNING(f"⚠️ Compras que no se pudieron liquidar: {sorted(omitidas)}"))
+    
+    def simular_pagos_pendientes(self, respetar_calendario=True):
+        """Ejecuta un ciclo de pagos: un pago por terma con sus distribuciones procesadas"""
+        import time
+        from ventas.liquidacion import ejecutar_ciclo_pagos
         
-        exitosas = 0
-        errores = 0
+        inicio = time.perf_counter()
+        pagos, distribuciones = ejecutar_ciclo_pagos(respetar_calendario=respetar_calendario)
+        segundos = time.perf_counter() - inicio
         
-        for compra in compras_pendientes:
-            try:
-                distribucion = procesar_pago_completo(compra)
-                exitosas += 1
-                self.stdout.write(f"✅ Compra {compra.id} -> Distribución {distribucion.id}")
-                
-            except Exception as e:
-                errores += 1
-                self.stdout.write(
-                    self.style.ERROR(f"❌ Error en compra {compra.id}: {str(e)}")
-                )
+        if pagos == 0:
+            self.stdout.write(
+                self.style.SUCCESS("✅ No hay termas con pagos pendientes en este ciclo")
+            )
+            return
         
         self.stdout.write(
             self.style.SUCCESS(
-                f"\n📊 Procesamiento completado:\n"
-                f"   Exitosas: {exitosas}\n"
-                f"   Errores: {errores}\n"
-                f"   Total: {total}"
+                f"\n📊 Ciclo de pagos completado:\n"
+                f"   Pagos a termas: {pagos}\n"
+                f"   Distribuciones pagadas: {distribuciones}\n"
+                f"   Tiempo: {segundos:.2f}s"
             )
         )
     
-    def simular_pagos_pendientes(self):
-        """Simula pagos para distribuciones que están procesadas"""
-        distribuciones_pendientes = DistribucionPago.objects.filter(
-            estado='procesado'
-        )
+    def ejecutar_lotes(self, funcion_lote, tamaño_lote, unidad):
+        """Ejecuta los lotes hasta terminar e informa el rendimiento"""
+        from ventas.liquidacion import procesar_en_lotes
         
-        total = distribuciones_pendientes.count()
+        def informar_lote(cantidad, segundos):
+            self.stdout.write(
+                f"✅ Lote de {cantidad} {unidad} en {segundos:.2f}s "
+                f"({cantidad / segundos if segundos else cantidad:.0f}/s)"
+            )
         
-        if total == 0:
+        try:
+            total, segundos = procesar_en_lotes(funcion_lote, tamaño_lote, informar_lote)
+        except Exception as e:
             self.stdout.write(
-                self.style.SUCCESS("✅ No hay distribuciones pendientes de pago")
+                self.style.ERROR(f"❌ Error en el lote (se revirtió completo): {str(e)}")
             )
             return
         
-        self.stdout.write(f"Simulando pagos para {total} distribuciones...")
-        
-        exitosas = 0
-        errores = 0
-        
-        for distribucion in distribuciones_pendientes:
-            try:
-                pago = simular_pago_terma(distribucion)
-                if pago:
-                    exitosas += 1
-                    self.stdout.write(
-                        f"✅ Distribución {distribucion.id} -> Pago {pago.id} "
-                        f"(${distribucion.monto_para_terma} a {distribucion.terma.nombre_terma})"
-                    )
-                else:
-                    errores += 1
-                    self.stdout.write(
-                        self.style.ERROR(f"❌ Error en distribución {distribucion.id}")
-                    )
-                
-            except Exception as e:
-                errores += 1
-                self.stdout.write(
-                    self.style.ERROR(f"❌ Error en distribución {distribucion.id}: {str(e)}")
-                )
-        
         self.stdout.write(
             self.style.SUCCESS(
-                f"\n📊 Simulación de pagos completada:\n"
-                f"   Exitosas: {exitosas}\n"
-                f"   Errores: {errores}\n"
-                f"   Total: {total}"
+                f"\n📊 Procesamiento completado:\n"
+                f"   Total: {total} {unidad}\n"
+                f"   Tiempo: {segundos:.2f}s\n"
+                f"   Rendimiento: {total / segundos if segundos else total:.0f} {unidad}/s"
             )
         )
     
-    def recalcular_distribuciones(self):
-        """Recalcula distribuciones pendientes"""
+    def recalcular_distribuciones(self, tamaño_lote):
+        """Recalcula distribuciones pendientes con el plan actual de cada terma"""
+        from decimal import Decimal
+        
         distribuciones_pendientes = DistribucionPago.objects.filter(
             estado='pendiente'
-        )
+        ).select_related('compra', 'terma__plan_actual')
         
         total = distribuciones_pendientes.count()
         
@@ -264,16 +287,61 @@ class Command(BaseCommand):
         
         self.stdout.write(f"Recalculando {total} distribuciones...")
         
-        for distribucion in distribuciones_pendientes:
-            try:
-                distribucion.calcular_distribucion()
-                self.stdout.write(f"✅ Distribución {distribucion.id} recalculada")
-                
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f"❌ Error en distribución {distribucion.id}: {str(e)}")
-                )
+        lote = []
+        campos = [
+            'monto_total', 'porcentaje_comision', 'plan_utilizado',
+            'monto_comision_plataforma', 'monto_para_terma'
+        ]
+        for distribucion in distribuciones_pendientes.iterator(chunk_size=tamaño_lote):
+            terma = distribucion.terma
+            if terma.plan_actual:
+                distribucion.porcentaje_comision = terma.plan_actual.porcentaje_comision
+                distribucion.plan_utilizado = terma.plan_actual
+            else:
+                distribucion.porcentaje_comision = terma.porcentaje_comision_actual
+            distribucion.monto_total = distribucion.compra.total
+            distribucion.monto_comision_plataforma = (
+                distribucion.monto_total * distribucion.porcentaje_comision
+            ) / Decimal('100')
+            distribucion.monto_para_terma = distribucion.monto_total - distribucion.monto_comision_plataforma
+            lote.append(distribucion)
+            
+            if len(lote) >= tamaño_lote:
+                DistribucionPago.objects.bulk_update(lote, campos)
+                lote = []
+        
+        if lote:
+            DistribucionPago.objects.bulk_update(lote, campos)
         
         self.stdout.write(
             self.style.SUCCESS(f"📊 Recálculo completado para {total} distribuciones")
+        )
+    
+    def recalcular_resumenes(self, mes=None, año=None):
+        """Reconstruye los resúmenes mensuales (uno o todos los meses con distribuciones)"""
+        from ventas.utils import recalcular_resumen
+        
+        if mes and año:
+            meses = [(mes, año)]
+        else:
+            meses = [
+                (fecha.month, fecha.year)
+                for fecha in DistribucionPago.objects.dates('fecha_calculo', 'month')
+            ]
+        
+        if not meses:
+            self.stdout.write(
+                self.style.SUCCESS("✅ No hay distribuciones para resumir")
+            )
+            return
+        
+        for mes, año in meses:
+            resumen = recalcular_resumen(mes, año)
+            self.stdout.write(
+                f"✅ {mes:02d}/{año}: {resumen.cantidad_transacciones} transacciones, "
+                f"comisiones ${resumen.total_comisiones}"
+            )
+        
+        self.stdout.write(
+            self.style.SUCCESS(f"📊 Resúmenes reconstruidos: {len(meses)}")
         )
\ No newline at end of file
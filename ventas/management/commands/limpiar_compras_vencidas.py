@@ -1,10 +1,13 @@
 """
-Comando para limpiar compras pendientes vencidas y liberar cupos
+Comando para limpiar compras pendientes vencidas y liberar cupos.
+
+La disponibilidad diaria ya ignora las reservas vencidas; este comando solo
+las marca como canceladas y repone los cupos de cada entrada.
 """
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from ventas.disponibilidad_utils import limpiar_compras_pendientes_vencidas
+from ventas.disponibilidad_utils import inicio_reservas_vigentes, limpiar_compras_pendientes_vencidas
 from ventas.models import Compra
 
 
@@ -15,8 +18,9 @@ class Command(BaseCommand):
         parser.add_argument(
             '--horas',
             type=int,
-            default=1,
-            help='Horas de vencimiento para compras pendientes (default: 1)'
+            default=None,
+            help='Horas de vencimiento para compras pendientes '
+                 '(default: settings.RESERVA_COMPRA_PENDIENTE_MINUTOS)'
         )
         parser.add_argument(
             '--dry-run',
@@ -27,10 +31,14 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         horas_vencimiento = options['horas']
         dry_run = options['dry_run']
+        if horas_vencimiento is None:
+            vencimiento = f"{settings.RESERVA_COMPRA_PENDIENTE_MINUTOS}min"
+        else:
+            vencimiento = f"{horas_vencimiento}h"
         
         self.stdout.write(
             self.style.SUCCESS(
-                f"🧹 Iniciando limpieza de compras pendientes vencidas (>{horas_vencimiento}h)"
+                f"🧹 Iniciando limpieza de compras pendientes vencidas (>{vencimiento})"
             )
         )
         
@@ -40,7 +48,7 @@ class Command(BaseCommand):
             )
         
         # Buscar compras pendientes vencidas
-        tiempo_vencimiento = timezone.now() - timedelta(hours=horas_vencimiento)
+        tiempo_vencimiento = inicio_reservas_vigentes(horas_vencimiento)
         
         compras_vencidas = Compra.objects.filter(
             estado_pago='pendiente',
@@ -70,7 +78,7 @@ class Command(BaseCommand):
         
         if not dry_run:
             # Ejecutar limpieza
-            cantidad_canceladas = limpiar_compras_pendientes_vencidas()
+            cantidad_canceladas = limpiar_compras_pendientes_vencidas(horas_vencimiento)
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -0,0 +1,64 @@
+"""
+Comando worker que genera los reportes encolados en segundo plano
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.trabajos_reporte import (
+    liberar_trabajos_colgados,
+    procesar_trabajos_pendientes,
+    purgar_trabajos_antiguos,
+)
+
+
+class Command(BaseCommand):
+    help = 'Genera los reportes pendientes (PDF, Excel, CSV) solicitados desde la web'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Seguir esperando trabajos nuevos en lugar de terminar al vaciar la cola'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos entre revisiones de la cola en modo --loop (default: 2)'
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=None,
+            help='Máximo de trabajos a procesar en esta ejecución'
+        )
+        parser.add_argument(
+            '--purgar-dias',
+            type=int,
+            default=None,
+            help='Eliminar trabajos y archivos con más de N días antes de procesar'
+        )
+
+    def handle(self, *args, **options):
+        if options['purgar_dias'] is not None:
+            eliminados = purgar_trabajos_antiguos(options['purgar_dias'])
+            self.stdout.write(f"🗑️ Trabajos antiguos eliminados: {eliminados}")
+
+        liberados = liberar_trabajos_colgados()
+        if liberados:
+            self.stdout.write(self.style.WARNING(f"⚠️ Trabajos colgados devueltos a la cola: {liberados}"))
+
+        total = 0
+        while True:
+            restantes = None if options['limite'] is None else options['limite'] - total
+            procesados = procesar_trabajos_pendientes(limite=restantes)
+            total += procesados
+            if procesados:
+                self.stdout.write(f"📄 Reportes generados: {procesados}")
+
+            if not options['loop'] or (options['limite'] is not None and total >= options['limite']):
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Procesamiento finalizado. Total: {total}"))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:08
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0022_terma_busqueda'),
+        ('ventas', '0018_compra_uuid_distribucionpago_uuid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True)),
+                ('tipo', models.CharField(choices=[('ventas_pdf', 'Reporte de ventas (PDF)'), ('ventas_excel', 'Reporte de ventas (Excel)'), ('comisiones_csv', 'Comisiones diarias (CSV)')], max_length=30)),
+                ('parametros', models.JSONField(default=dict)),
+                ('huella', models.CharField(db_index=True, max_length=64)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('archivo', models.FileField(blank=True, null=True, upload_to='reportes/')),
+                ('mensaje_error', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio_proceso', models.DateTimeField(blank=True, null=True)),
+                ('fecha_finalizacion', models.DateTimeField(blank=True, null=True)),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('terma', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='termas.terma')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Reporte',
+                'verbose_name_plural': 'Trabajos de Reportes',
+                'ordering': ['-fecha_creacion'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado', 'error'), _negated=True), fields=('huella',), name='trabajo_reporte_huella_vigente_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def enlazar_pagos_antiguos(apps, schema_editor):
+    """Cada pago antiguo (uno por venta) queda como línea de su distribución."""
+    DistribucionPago = apps.get_model('ventas', 'DistribucionPago')
+    HistorialPagoTerma = apps.get_model('ventas', 'HistorialPagoTerma')
+    DistribucionPago.objects.filter(pago_terma__isnull=True).update(
+        pago_terma=models.Subquery(
+            HistorialPagoTerma.objects.filter(
+                distribucion=models.OuterRef('pk')
+            ).order_by('-fecha_pago').values('pk')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0019_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='distribucionpago',
+            name='pago_terma',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='distribuciones', to='ventas.historialpagoterma'),
+        ),
+        migrations.AddField(
+            model_name='historialpagoterma',
+            name='cantidad_distribuciones',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='historialpagoterma',
+            name='periodo_desde',
+            field=models.DateTimeField(blank=True, help_text='Procesamiento de la distribución más antigua incluida', null=True),
+        ),
+        migrations.AddField(
+            model_name='historialpagoterma',
+            name='periodo_hasta',
+            field=models.DateTimeField(blank=True, help_text='Procesamiento de la distribución más reciente incluida', null=True),
+        ),
+        migrations.AlterField(
+            model_name='historialpagoterma',
+            name='distribucion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pagos_realizados', to='ventas.distribucionpago'),
+        ),
+        migrations.AlterField(
+            model_name='historialpagoterma',
+            name='monto_pagado',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.RunPython(enlazar_pagos_antiguos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0023_indices_consultas'),
+        ('ventas', '0020_pago_terma_por_ciclo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['terma', 'fecha_visita', 'estado_pago'], name='compra_terma_visita_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['terma', 'estado_pago', 'fecha_compra'], name='compra_terma_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(fields=['usuario', 'fecha_compra'], name='compra_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(condition=models.Q(('mercado_pago_id__isnull', False)), fields=['mercado_pago_id'], name='compra_mp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(condition=models.Q(('payment_id__isnull', False)), fields=['payment_id'], name='compra_payment_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(condition=models.Q(('estado_pago', 'pendiente')), fields=['fecha_compra'], name='compra_pendiente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='distribucionpago',
+            index=models.Index(fields=['terma', 'fecha_calculo'], name='distribucion_terma_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='distribucionpago',
+            index=models.Index(fields=['fecha_calculo', 'id'], name='distribucion_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='distribucionpago',
+            index=models.Index(condition=models.Q(('estado', 'procesado'), ('pago_terma__isnull', True)), fields=['terma'], name='distribucion_por_pagar_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroescaneo',
+            index=models.Index(fields=['codigo_qr', 'exitoso', 'fecha_escaneo'], name='escaneo_qr_exitoso_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0023_indices_consultas'),
+        ('ventas', '0021_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compra',
+            name='clave_idempotencia',
+            field=models.UUIDField(blank=True, editable=False, help_text='Clave generada por el navegador para cada intento de checkout', null=True),
+        ),
+        migrations.AddField(
+            model_name='compra',
+            name='mercado_pago_url',
+            field=models.URLField(blank=True, help_text='Enlace de pago (init_point) de la preferencia creada', max_length=500, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='compra',
+            constraint=models.UniqueConstraint(condition=models.Q(('clave_idempotencia__isnull', False)), fields=('usuario', 'clave_idempotencia'), name='compra_clave_idempotencia_unica'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('termas', '0023_indices_consultas'),
+        ('ventas', '0022_compra_clave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='compra',
+            index=models.Index(condition=models.Q(('estado_pago', 'pendiente')), fields=['terma', 'fecha_visita', 'fecha_compra'], name='compra_reserva_vigente_idx'),
+        ),
+    ]
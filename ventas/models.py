@@ -37,6 +37,39 @@ class Compra(models.Model):
     monto_pagado = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     fecha_confirmacion_pago = models.DateTimeField(null=True, blank=True)
     payment_id = models.CharField(max_length=100, null=True, blank=True, help_text="Payment ID de Mercado Pago")
+    clave_idempotencia = models.UUIDField(null=True, blank=True, editable=False,
+                                          help_text="Clave generada por el navegador para cada intento de checkout")
+    mercado_pago_url = models.URLField(max_length=500, null=True, blank=True,
+                                       help_text="Enlace de pago (init_point) de la preferencia creada")
+
+    class Meta:
+        constraints = [
+            # Un reintento con la misma clave devuelve la compra original
+            models.UniqueConstraint(
+                fields=['usuario', 'clave_idempotencia'],
+                condition=models.Q(clave_idempotencia__isnull=False),
+                name='compra_clave_idempotencia_unica'
+            ),
+        ]
+        indexes = [
+            # Disponibilidad: vendidas/pendientes de una terma para una fecha de visita
+            models.Index(fields=['terma', 'fecha_visita', 'estado_pago'], name='compra_terma_visita_idx'),
+            # Paneles y reportes: ventas pagadas de una terma en un rango de fechas
+            models.Index(fields=['terma', 'estado_pago', 'fecha_compra'], name='compra_terma_estado_idx'),
+            # Historial del cliente (mostrar_entradas)
+            models.Index(fields=['usuario', 'fecha_compra'], name='compra_usuario_fecha_idx'),
+            # Webhook de Mercado Pago: solo las compras que tienen el ID
+            models.Index(fields=['mercado_pago_id'], name='compra_mp_id_idx',
+                         condition=models.Q(mercado_pago_id__isnull=False)),
+            models.Index(fields=['payment_id'], name='compra_payment_id_idx',
+                         condition=models.Q(payment_id__isnull=False)),
+            # Limpieza de reservas vencidas: las pendientes son pocas
+            models.Index(fields=['fecha_compra'], name='compra_pendiente_fecha_idx',
+                         condition=models.Q(estado_pago='pendiente')),
+            # Reservas vigentes del día (disponibilidad): solo filas pendientes
+            models.Index(fields=['terma', 'fecha_visita', 'fecha_compra'], name='compra_reserva_vigente_idx',
+                         condition=models.Q(estado_pago='pendiente')),
+        ]
 
 
 
@@ -59,6 +92,12 @@ class RegistroEscaneo(models.Model):
     email_finalizacion_enviado = models.BooleanField(default=False, help_text="Indica si se envió el email cuando la entrada se finalizó")
     fecha_email_finalizacion = models.DateTimeField(null=True, blank=True, help_text="Fecha y hora cuando se envió el email de finalización")
 
+    class Meta:
+        indexes = [
+            # Validación de QR: escaneos exitosos de un código (y del día)
+            models.Index(fields=['codigo_qr', 'exitoso', 'fecha_escaneo'], name='escaneo_qr_exitoso_idx'),
+        ]
+
 
 class CuponDescuento(models.Model):
     codigo = models.CharField(max_length=50, unique=True)
@@ -139,11 +178,23 @@ class DistribucionPago(models.Model):
     observaciones = models.TextField(null=True, blank=True)
     referencia_pago_terma = models.CharField(max_length=100, null=True, blank=True, 
                                            help_text="Referencia del pago enviado a la terma")
+    # Pago del ciclo que incluyó esta distribución (es una de sus líneas)
+    pago_terma = models.ForeignKey('HistorialPagoTerma', on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='distribuciones')
     
     class Meta:
         verbose_name = "Distribución de Pago"
         verbose_name_plural = "Distribuciones de Pago"
         ordering = ['-fecha_calculo']
+        indexes = [
+            # Reportes de comisiones por terma y período
+            models.Index(fields=['terma', 'fecha_calculo'], name='distribucion_terma_fecha_idx'),
+            # Listado paginado por (fecha_calculo, id)
+            models.Index(fields=['fecha_calculo', 'id'], name='distribucion_fecha_id_idx'),
+            # Ciclo de pagos: distribuciones procesadas aún sin pago
+            models.Index(fields=['terma'], name='distribucion_por_pagar_idx',
+                         condition=models.Q(estado='procesado', pago_terma__isnull=True)),
+        ]
     
     def __str__(self):
         return f"Distribución #{self.id} - Compra #{self.compra.id} - {self.terma.nombre_terma}"
@@ -190,12 +241,22 @@ class DistribucionPago(models.Model):
 
 class HistorialPagoTerma(models.Model):
     """
-    Registro histórico de todos los pagos realizados a las termas
+    Registro histórico de todos los pagos realizados a las termas.
+    
+    Cada ciclo de pago genera un registro por terma que agrupa todas sus
+    distribuciones procesadas (related_name 'distribuciones'). `distribucion`
+    solo se usa en los pagos antiguos, que eran de una venta cada uno.
     """
-    distribucion = models.ForeignKey(DistribucionPago, on_delete=models.CASCADE, related_name='pagos_realizados')
+    distribucion = models.ForeignKey(DistribucionPago, on_delete=models.CASCADE, related_name='pagos_realizados',
+                                     null=True, blank=True)
     terma = models.ForeignKey("termas.Terma", on_delete=models.CASCADE)
     
-    monto_pagado = models.DecimalField(max_digits=10, decimal_places=2)
+    monto_pagado = models.DecimalField(max_digits=12, decimal_places=2)
+    cantidad_distribuciones = models.IntegerField(default=1)
+    periodo_desde = models.DateTimeField(null=True, blank=True,
+                                         help_text="Procesamiento de la distribución más antigua incluida")
+    periodo_hasta = models.DateTimeField(null=True, blank=True,
+                                         help_text="Procesamiento de la distribución más reciente incluida")
     fecha_pago = models.DateTimeField(auto_now_add=True)
     metodo_pago_usado = models.CharField(max_length=100, help_text="Método usado para pagar a la terma")
     referencia_externa = models.CharField(max_length=200, null=True, blank=True, 
@@ -239,3 +300,56 @@ class ResumenComisionesPlataforma(models.Model):
     
     def __str__(self):
         return f"Comisiones {self.mes}/{self.año} - ${self.total_comisiones}"
+
+
+class TrabajoReporte(models.Model):
+    """
+    Reporte solicitado para generarse en segundo plano (ver ventas/trabajos_reporte.py).
+    
+    La huella identifica el reporte (tipo, terma, parámetros y versión de los
+    datos): solicitudes idénticas reutilizan el mismo trabajo hasta que entren
+    nuevas ventas en ese rango.
+    """
+    TIPOS = [
+        ('ventas_pdf', 'Reporte de ventas (PDF)'),
+        ('ventas_excel', 'Reporte de ventas (Excel)'),
+        ('comisiones_csv', 'Comisiones diarias (CSV)'),
+    ]
+    
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, db_index=True)
+    tipo = models.CharField(max_length=30, choices=TIPOS)
+    parametros = models.JSONField(default=dict)
+    huella = models.CharField(max_length=64, db_index=True)
+    terma = models.ForeignKey("termas.Terma", on_delete=models.CASCADE, null=True, blank=True)
+    solicitado_por = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
+    
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    archivo = models.FileField(upload_to='reportes/', null=True, blank=True)
+    mensaje_error = models.TextField(null=True, blank=True)
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio_proceso = models.DateTimeField(null=True, blank=True)
+    fecha_finalizacion = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Trabajo de Reporte"
+        verbose_name_plural = "Trabajos de Reportes"
+        ordering = ['-fecha_creacion']
+        constraints = [
+            # Un solo trabajo vigente por huella; los fallidos pueden reintentarse
+            models.UniqueConstraint(
+                fields=['huella'],
+                condition=~models.Q(estado='error'),
+                name='trabajo_reporte_huella_vigente_unica'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.estado} ({self.fecha_creacion.strftime('%d/%m/%Y %H:%M')})"
@@ -1,3 +1,623 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from .models import Compra, DistribucionPago, ResumenComisionesPlataforma, TrabajoReporte
+from .trabajos_reporte import encolar_reporte, procesar_trabajos_pendientes
+
+
+MEDIA_TEMPORAL = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEMPORAL)
+class TrabajosReporteTest(TestCase):
+    """Reportes encolados: deduplicación, generación y descarga."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_TEMPORAL, ignore_errors=True)
+
+    def setUp(self):
+        from termas.models import PlanSuscripcion, Terma
+        from usuarios.models import Rol, Usuario
+
+        plan = PlanSuscripcion.objects.create(
+            nombre='premium', descripcion='Premium', porcentaje_comision=Decimal('3.00'), limite_fotos=-1
+        )
+        self.terma = Terma.objects.create(nombre_terma='Termas Cola', estado_suscripcion='activa', plan_actual=plan)
+        self.admin = Usuario.objects.create_user(
+            'admin@cola.cl', 'Ana', 'Admin', 'clave-segura-123',
+            rol=Rol.objects.create(nombre='administrador_terma'), terma=self.terma
+        )
+        self.cliente = Usuario.objects.create_user(
+            'cliente@cola.cl', 'Carlos', 'Cliente', rol=Rol.objects.create(nombre='cliente')
+        )
+        self.vender()
+
+        hoy = date.today().isoformat()
+        self.parametros = {'fecha_inicio': hoy, 'fecha_fin': hoy}
+
+    def vender(self):
+        Compra.objects.create(usuario=self.cliente, terma=self.terma, total=Decimal('15000'), estado_pago='pagado')
+
+    def test_solicitudes_identicas_se_deduplican(self):
+        trabajo, creado = encolar_reporte('ventas_excel', self.parametros, self.admin, self.terma)
+        repetido, creado_repetido = encolar_reporte('ventas_excel', self.parametros, self.admin, self.terma)
+
+        self.assertTrue(creado)
+        self.assertFalse(creado_repetido)
+        self.assertEqual(trabajo.pk, repetido.pk)
+
+    def test_nueva_venta_invalida_el_reporte(self):
+        trabajo, _ = encolar_reporte('ventas_pdf', self.parametros, self.admin, self.terma)
+        self.vender()
+        nuevo, creado = encolar_reporte('ventas_pdf', self.parametros, self.admin, self.terma)
+
+        self.assertTrue(creado)
+        self.assertNotEqual(trabajo.huella, nuevo.huella)
+
+    def test_flujo_completo_solicitar_procesar_descargar(self):
+        self.client.force_login(self.admin)
+
+        respuesta = self.client.post('/usuarios/reportes/solicitar/', dict(self.parametros, tipo='pdf'))
+        self.assertEqual(respuesta.status_code, 202)
+        estado = self.client.get(respuesta.json()['url_estado']).json()
+        self.assertEqual(estado['estado'], 'pendiente')
+
+        self.assertEqual(procesar_trabajos_pendientes(), 1)
+
+        estado = self.client.get(respuesta.json()['url_estado']).json()
+        self.assertEqual(estado['estado'], 'completado')
+        descarga = self.client.get(estado['url_descarga'])
+        self.assertEqual(b''.join(descarga.streaming_content)[:4], b'%PDF')
+
+    def test_reporte_comisiones_agrupado_en_una_consulta(self):
+        from .utils import crear_distribucion_pago, obtener_reporte_comisiones_diarias
+
+        self.vender()
+        for compra in Compra.objects.all():
+            crear_distribucion_pago(compra)
+
+        with self.assertNumQueries(1):
+            reporte = obtener_reporte_comisiones_diarias(date.today(), date.today())
+
+        [dia] = reporte['reporte_diario']
+        datos = dia['termas']['Termas Cola']
+        self.assertEqual(datos['ventas'], Decimal('30000'))
+        self.assertEqual(datos['comisiones'], Decimal('900'))
+        self.assertEqual(datos['transacciones'], 2)
+        self.assertEqual(datos['plan'], 'Premium')
+        self.assertEqual(reporte['totales_periodo'], dia['totales'])
+        self.assertEqual(reporte['totales_periodo']['total_pagado_termas'], Decimal('29100'))
+
+    def test_otro_usuario_no_accede_al_reporte(self):
+        trabajo, _ = encolar_reporte('ventas_pdf', self.parametros, self.admin, self.terma)
+        self.client.force_login(self.cliente)
+
+        respuesta = self.client.get(f'/usuarios/reportes/estado/{trabajo.uuid}/')
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertEqual(TrabajoReporte.objects.count(), 1)
+
+
+class LiquidacionLotesTest(TestCase):
+    """Liquidación de compras pagadas por lotes."""
+
+    def setUp(self):
+        from termas.models import PlanSuscripcion, Terma
+        from usuarios.models import Usuario
+
+        plan = PlanSuscripcion.objects.create(
+            nombre='basico', descripcion='Básico', porcentaje_comision=Decimal('10.00'), limite_fotos=-1
+        )
+        cliente = Usuario.objects.create_user('cliente@lote.cl', 'Lara', 'Cliente')
+        for nombre in ('Termas Norte', 'Termas Sur'):
+            terma = Terma.objects.create(nombre_terma=nombre, estado_suscripcion='activa', plan_actual=plan)
+            for _ in range(3):
+                Compra.objects.create(usuario=cliente, terma=terma, total=Decimal('1000'), estado_pago='pagado')
+
+    def test_lote_completo_con_consultas_constantes(self):
+        from django.utils import timezone
+        from .liquidacion import liquidar_lote_compras, procesar_en_lotes
+
+        hoy = timezone.localtime()
+        ResumenComisionesPlataforma.objects.create(mes=hoy.month, año=hoy.year)
+
+        # Select con lock, insert y resumen (más savepoint)
+        with self.assertNumQueries(5):
+            self.assertEqual(liquidar_lote_compras(100), 6)
+
+        self.assertEqual(DistribucionPago.objects.filter(estado='procesado').count(), 6)
+        resumen = ResumenComisionesPlataforma.objects.get()
+        self.assertEqual(resumen.total_comisiones, Decimal('600'))
+        self.assertEqual(resumen.cantidad_transacciones, 6)
+
+        # Nada pendiente: una segunda pasada no hace nada
+        self.assertEqual(procesar_en_lotes(liquidar_lote_compras, 4)[0], 0)
+
+    def test_compra_con_error_no_bloquea_las_siguientes(self):
+        from functools import partial
+        from unittest import mock
+        from termas.models import Terma
+        from . import liquidacion
+
+        # Terma eliminada: sus compras (las primeras) quedan sin terma
+        Terma.objects.get(nombre_terma='Termas Norte').delete()
+        compras = list(Compra.objects.filter(terma__isnull=False).order_by('id'))
+        construir = liquidacion._construir_distribucion
+
+        def construir_o_fallar(compra, ahora):
+            if compra.id == compras[0].id:
+                raise ValueError('compra corrupta')
+            return construir(compra, ahora)
+
+        omitidas = set()
+        with mock.patch.object(liquidacion, '_construir_distribucion', construir_o_fallar), \
+                self.assertLogs('ventas.liquidacion', level='ERROR'):
+            total, _ = liquidacion.procesar_en_lotes(partial(liquidacion.liquidar_lote_compras, omitir=omitidas), 1)
+
+        self.assertEqual(total, 3)
+        self.assertEqual(omitidas, {compras[0].id})
+        self.assertEqual(
+            set(DistribucionPago.objects.values_list('compra_id', flat=True)),
+            {compra.id for compra in compras[1:]}
+        )
+
+    def test_resumen_por_mes_local(self):
+        from datetime import datetime, timezone as tz
+        from .liquidacion import _sumar_a_resumenes
+
+        # 1 de febrero 01:00 UTC = 31 de enero 22:00 en Santiago
+        _sumar_a_resumenes([DistribucionPago(
+            monto_total=Decimal('1000'), monto_comision_plataforma=Decimal('100'), monto_para_terma=Decimal('900'),
+            fecha_calculo=datetime(2025, 2, 1, 1, 0, tzinfo=tz.utc),
+        )])
+        resumen = ResumenComisionesPlataforma.objects.get()
+        self.assertEqual((resumen.mes, resumen.año, resumen.cantidad_transacciones), (1, 2025, 1))
+
+    def test_ciclo_paga_una_vez_por_terma(self):
+        from .liquidacion import ejecutar_ciclo_pagos, liquidar_lote_compras
+        from .models import HistorialPagoTerma
+
+        liquidar_lote_compras()
+        self.assertEqual(ejecutar_ciclo_pagos(), (2, 6))
+
+        pago = HistorialPagoTerma.objects.get(terma__nombre_terma='Termas Norte')
+        self.assertEqual(pago.monto_pagado, Decimal('2700'))
+        self.assertEqual(pago.cantidad_distribuciones, 3)
+        self.assertEqual(pago.distribuciones.filter(estado='completado').count(), 3)
+
+        # Una venta nueva espera al próximo ciclo, salvo que se fuerce
+        Compra.objects.create(usuario=pago.distribuciones.first().compra.usuario, terma=pago.terma,
+                              total=Decimal('1000'), estado_pago='pagado')
+        liquidar_lote_compras()
+        self.assertEqual(ejecutar_ciclo_pagos(), (0, 0))
+        self.assertEqual(ejecutar_ciclo_pagos(respetar_calendario=False), (1, 1))
+        self.assertEqual(HistorialPagoTerma.objects.count(), 3)
+
+
+class CheckoutFormTest(TestCase):
+    """Checkout estructurado: validación acotada a la terma y precios del servidor."""
+
+    def setUp(self):
+        from entradas.models import EntradaTipo
+        from termas.models import ServicioTerma, Terma
+
+        self.terma = Terma.objects.create(nombre_terma='Termas Checkout', estado_suscripcion='activa')
+        otra = Terma.objects.create(nombre_terma='Termas Vecinas', estado_suscripcion='activa')
+        self.entrada = EntradaTipo.objects.create(terma=self.terma, nombre='General', precio=Decimal('10000'))
+        self.masaje = ServicioTerma.objects.create(terma=self.terma, servicio='Masaje', precio='15.000')
+        self.toalla = ServicioTerma.objects.create(terma=self.terma, servicio='Toalla', precio='2000')
+        self.ajeno = ServicioTerma.objects.create(terma=otra, servicio='Masaje', precio='1')
+
+    def formulario(self, servicios):
+        import json
+        from .forms import CheckoutForm
+
+        return CheckoutForm({
+            'entrada_id': str(self.entrada.uuid),
+            'fecha': '2030-01-15',
+            'cantidad': '2',
+            'servicios': json.dumps(servicios),
+            'clave_idempotencia': '6f1c2b1e-8a55-4b7e-9d0a-3c1f0e2a9b77',
+            # Lo que mande el navegador como total se ignora
+            'input_total': '1',
+        }, terma=self.terma)
+
+    def test_total_calculado_con_una_consulta_por_catalogo(self):
+        formulario = self.formulario([
+            {'uuid': str(self.masaje.uuid), 'cantidad': 1},
+            {'uuid': str(self.toalla.uuid), 'cantidad': 2},
+            {'uuid': str(self.masaje.uuid), 'cantidad': 1},
+        ])
+        # Entrada + servicios (in_bulk)
+        with self.assertNumQueries(2):
+            self.assertTrue(formulario.is_valid(), formulario.errors)
+
+        self.assertEqual(formulario.total, Decimal('54000'))
+        self.assertEqual(
+            [(servicio.servicio, cantidad) for servicio, cantidad, _ in formulario.cleaned_data['servicios_extra']],
+            [('Masaje', 2), ('Toalla', 2)]
+        )
+
+    def test_servicio_de_otra_terma_se_rechaza(self):
+        formulario = self.formulario([{'uuid': str(self.ajeno.uuid), 'cantidad': 1}])
+        self.assertFalse(formulario.is_valid())
+        self.assertIn('no pertenece a esta terma', formulario.primer_error())
+
+    def test_servicios_extra_se_guardan_en_bloque(self):
+        from usuarios.models import Usuario
+        from .models import DetalleCompra
+        from .utils import registrar_servicios_extra
+
+        formulario = self.formulario([
+            {'uuid': str(self.masaje.uuid), 'cantidad': 1},
+            {'uuid': str(self.toalla.uuid), 'cantidad': 3},
+        ])
+        self.assertTrue(formulario.is_valid())
+        cliente = Usuario.objects.create_user('cliente@checkout.cl', 'Clara', 'Cliente')
+        compra = Compra.objects.create(usuario=cliente, terma=self.terma, total=formulario.total, estado_pago='pendiente')
+        detalle = DetalleCompra.objects.create(compra=compra, entrada_tipo=self.entrada, cantidad=2,
+                                               precio_unitario=formulario.precio_unitario,
+                                               subtotal=formulario.subtotal_entradas)
+
+        # Borrado de extras previos, limpieza del M2M e inserción en bloque
+        with self.assertNumQueries(3):
+            registrar_servicios_extra(detalle, formulario.cleaned_data['servicios_extra'])
+
+        self.assertEqual(
+            sorted(detalle.servicios_extra.values_list('servicio__servicio', 'cantidad', 'precio_unitario')),
+            [('Masaje', 1, Decimal('15000')), ('Toalla', 3, Decimal('2000'))]
+        )
+
+
+class CheckoutIdempotenteTest(TestCase):
+    """Los reintentos con la misma clave devuelven la compra y el enlace originales."""
+
+    def setUp(self):
+        import uuid
+        from entradas.models import EntradaTipo
+        from termas.models import Terma
+        from usuarios.models import Rol, Usuario
+
+        self.terma = Terma.objects.create(nombre_terma='Termas Reintento', estado_suscripcion='activa')
+        plantilla = EntradaTipo.objects.create(terma=self.terma, nombre='General', precio=Decimal('8000'))
+        self.cliente = Usuario.objects.create_user(
+            'cliente@reintento.cl', 'Rita', 'Cliente', rol=Rol.objects.create(nombre='cliente')
+        )
+        self.datos = {
+            'entrada_id': str(plantilla.uuid),
+            'fecha': '2030-03-10',
+            'cantidad': '2',
+            'servicios': '[]',
+            'clave_idempotencia': str(uuid.uuid4()),
+        }
+
+    def test_doble_envio_crea_una_compra_y_una_preferencia(self):
+        from unittest import mock
+
+        self.client.force_login(self.cliente)
+        url = f'/ventas/pago/{self.terma.uuid}/'
+        with mock.patch.dict('os.environ', {'MP_ACCESS_TOKEN': 'TEST-token-123'}), \
+                mock.patch('ventas.views.mercadopago.SDK') as sdk:
+            sdk.return_value.preference.return_value.create.return_value = {
+                'response': {'init_point': 'https://mp.example/pagar/1'}
+            }
+            primera = self.client.post(url, self.datos)
+            with self.assertNumQueries(4):
+                # Sesión, terma, entrada (formulario) y la búsqueda por clave
+                segunda = self.client.post(url, self.datos)
+
+        compra = Compra.objects.get()
+        self.assertEqual(compra.total, Decimal('16000'))
+        self.assertEqual(compra.mercado_pago_url, 'https://mp.example/pagar/1')
+        self.assertEqual(primera.context['mercadopago_url'], segunda.context['mercadopago_url'])
+        self.assertEqual(sdk.return_value.preference.return_value.create.call_count, 1)
+
+
+class ReservaPendienteTest(TestCase):
+    """Las compras pendientes reservan entradas solo mientras su reserva está vigente."""
+
+    def setUp(self):
+        from termas.models import Terma
+        from usuarios.models import Usuario
+
+        self.terma = Terma.objects.create(nombre_terma='Termas Reserva', estado_suscripcion='activa',
+                                          limite_ventas_diario=4)
+        self.cliente = Usuario.objects.create_user('reserva@cliente.cl', 'Rita', 'Reserva')
+
+    def _compra_pendiente(self, cantidad, minutos):
+        from datetime import timedelta
+        from .models import DetalleCompra
+
+        compra = Compra.objects.create(usuario=self.cliente, terma=self.terma, fecha_visita=date.today(),
+                                       total=Decimal('5000') * cantidad, estado_pago='pendiente',
+                                       cantidad=cantidad)
+        DetalleCompra.objects.create(compra=compra, cantidad=cantidad, precio_unitario=Decimal('5000'),
+                                     subtotal=Decimal('5000') * cantidad)
+        Compra.objects.filter(pk=compra.pk).update(fecha_compra=compra.fecha_compra - timedelta(minutes=minutos))
+        return compra
+
+    @override_settings(RESERVA_COMPRA_PENDIENTE_MINUTOS=30)
+    def test_reserva_vencida_libera_sin_limpieza(self):
+        from .disponibilidad_utils import calcular_disponibilidad_terma, validar_cantidad_disponible
+
+        self._compra_pendiente(3, minutos=45)
+        self._compra_pendiente(1, minutos=5)
+
+        disponibilidad = calcular_disponibilidad_terma(self.terma.id, date.today())
+        self.assertEqual(disponibilidad['pendientes'], 1)
+        self.assertTrue(validar_cantidad_disponible(self.terma.id, 3)['es_valida'])
+        self.assertEqual(Compra.objects.filter(estado_pago='pendiente').count(), 2)
+
+
+class ResumenComisionesConcurrenteTest(TransactionTestCase):
+    """El resumen mensual no pierde sumas con pagos simultáneos."""
+
+    HILOS = 8
+
+    def setUp(self):
+        from termas.models import PlanSuscripcion, Terma
+        from usuarios.models import Usuario
+        from .utils import crear_distribucion_pago
+
+        plan = PlanSuscripcion.objects.create(
+            nombre='estandar', descripcion='Estándar', porcentaje_comision=Decimal('5.00'), limite_fotos=-1
+        )
+        terma = Terma.objects.create(nombre_terma='Termas Río', estado_suscripcion='activa', plan_actual=plan)
+        cliente = Usuario.objects.create_user('cliente@rio.cl', 'Carla', 'Cliente')
+        for _ in range(self.HILOS):
+            compra = Compra.objects.create(usuario=cliente, terma=terma, total=Decimal('10000'), estado_pago='pagado')
+            crear_distribucion_pago(compra)
+
+    def test_pagos_simultaneos_no_pierden_actualizaciones(self):
+        from .utils import procesar_distribucion_pago, recalcular_resumen
+
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def procesar(distribucion):
+            try:
+                barrera.wait()
+                resultados.append(procesar_distribucion_pago(distribucion))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=procesar, args=(d,)) for d in DistribucionPago.objects.all()]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(resultados, [True] * self.HILOS)
+        resumen = ResumenComisionesPlataforma.objects.get()
+        self.assertEqual(resumen.cantidad_transacciones, self.HILOS)
+        self.assertEqual(resumen.total_ventas, Decimal('80000'))
+        self.assertEqual(resumen.total_comisiones, Decimal('4000'))
+
+        # Reconstruir desde las distribuciones da el mismo resultado
+        ResumenComisionesPlataforma.objects.update(total_ventas=0, cantidad_transacciones=0)
+        recalculado = recalcular_resumen(resumen.mes, resumen.año)
+        self.assertEqual(recalculado.total_ventas, Decimal('80000'))
+        self.assertEqual(recalculado.cantidad_transacciones, self.HILOS)
+
+
+class ResumenComisionesMesLocalTest(TestCase):
+    """El resumen incremental usa el mismo mes (hora local) que la reconstrucción."""
+
+    def test_venta_de_fin_de_mes_en_la_noche(self):
+        from datetime import datetime, timezone as tz
+        from termas.models import PlanSuscripcion, Terma
+        from usuarios.models import Usuario
+        from .utils import crear_distribucion_pago, procesar_distribucion_pago, recalcular_resumen
+
+        plan = PlanSuscripcion.objects.create(
+            nombre='estandar', descripcion='Estándar', porcentaje_comision=Decimal('5.00'), limite_fotos=-1
+        )
+        terma = Terma.objects.create(nombre_terma='Termas Noche', estado_suscripcion='activa', plan_actual=plan)
+        cliente = Usuario.objects.create_user('cliente@noche.cl', 'Nora', 'Cliente')
+        compra = Compra.objects.create(usuario=cliente, terma=terma, total=Decimal('10000'), estado_pago='pagado')
+        distribucion = crear_distribucion_pago(compra)
+        # 1 de febrero 01:00 UTC = 31 de enero 22:00 en Santiago
+        DistribucionPago.objects.filter(pk=distribucion.pk).update(fecha_calculo=datetime(2025, 2, 1, 1, 0, tzinfo=tz.utc))
+        distribucion.refresh_from_db()
+
+        self.assertTrue(procesar_distribucion_pago(distribucion))
+        incremental = ResumenComisionesPlataforma.objects.get()
+        self.assertEqual((incremental.mes, incremental.año), (1, 2025))
+
+        recalculado = recalcular_resumen(1, 2025)
+        self.assertEqual(recalculado.pk, incremental.pk)
+        self.assertEqual((recalculado.cantidad_transacciones, recalculado.total_ventas), (1, incremental.total_ventas))
+
+
+class CompraGraphTest(TestCase):
+    """Grafo de compra cargado en consultas fijas e inmutable."""
+
+    def setUp(self):
+        from entradas.models import EntradaTipo
+        from termas.models import ServicioTerma, Terma
+        from usuarios.models import Usuario
+        from .models import CodigoQR, DetalleCompra, RegistroEscaneo, ServicioExtraDetalle
+
+        terma = Terma.objects.create(nombre_terma='Termas Grafo', estado_suscripcion='activa')
+        piscina = ServicioTerma.objects.create(terma=terma, servicio='Piscina', precio='0')
+        masaje = ServicioTerma.objects.create(terma=terma, servicio='Masaje', precio='12.000')
+        entrada = EntradaTipo.objects.create(terma=terma, nombre='General', precio=Decimal('8000'),
+                                             duracion_horas=4, duracion_tipo='dia')
+        entrada.servicios.add(piscina)
+        trabajador = Usuario.objects.create_user('trabajador@grafo.cl', 'Tomas', 'Trabajador')
+        Usuario.objects.filter(pk=trabajador.pk).update(terma=terma)
+
+        self.ids = []
+        for i in range(3):
+            cliente = Usuario.objects.create_user(f'cliente{i}@grafo.cl', 'Gala', f'Cliente {i}')
+            compra = Compra.objects.create(usuario=cliente, terma=terma, fecha_visita=date.today(),
+                                           total=Decimal('20000'), estado_pago='pagado', cantidad=1)
+            detalle = DetalleCompra.objects.create(compra=compra, entrada_tipo=entrada, cantidad=1,
+                                                   precio_unitario=Decimal('8000'), subtotal=Decimal('8000'))
+            ServicioExtraDetalle.objects.create(detalle_compra=detalle, servicio=masaje, cantidad=1,
+                                                precio_unitario=Decimal('12000'))
+            codigo = CodigoQR.objects.create(compra=compra, codigo=f'qr-{i}')
+            RegistroEscaneo.objects.create(codigo_qr=codigo, usuario_scanner=trabajador, exitoso=True)
+            self.ids.append(compra.id)
+
+    def test_carga_varias_compras_en_consultas_fijas(self):
+        import pickle
+        from dataclasses import FrozenInstanceError
+        from .grafo_compra import CompraGraph
+
+        with self.assertNumQueries(6):
+            grafos = CompraGraph.cargar(self.ids)
+
+        grafo = grafos[self.ids[0]]
+        with self.assertNumQueries(0):
+            detalle = grafo.detalle_principal
+            self.assertEqual(detalle.entrada_tipo.servicios_incluidos[0].nombre, 'Piscina')
+            self.assertEqual(detalle.servicios_extra[0].precio, Decimal('12000'))
+            self.assertEqual(grafo.codigo_qr.codigo, 'qr-0')
+            self.assertEqual(grafo.escaneos_exitosos[0].usuario_scanner.terma_id, grafo.terma_id)
+        with self.assertRaises(FrozenInstanceError):
+            grafo.estado_pago = 'pendiente'
+        self.assertEqual(pickle.loads(pickle.dumps(grafo)), grafo)
+
+    def test_pdf_no_consulta_con_el_grafo(self):
+        from .grafo_compra import CompraGraph
+        from .utils import generar_pdf_entrada
+
+        grafo = CompraGraph.cargar_uno(self.ids[0])
+        with self.assertNumQueries(0):
+            self.assertTrue(generar_pdf_entrada(grafo).getvalue().startswith(b'%PDF'))
+
+    def test_escaneo_invalida_el_grafo_en_cache(self):
+        from django.core.cache import cache
+        from .grafo_compra import _clave, obtener_grafos_compra
+        from .models import CodigoQR, RegistroEscaneo
+
+        compra_id = self.ids[1]
+        obtener_grafos_compra([compra_id])
+        self.assertIsNotNone(cache.get(_clave(compra_id)))
+
+        codigo_id = CodigoQR.objects.get(compra_id=compra_id).pk
+        with self.captureOnCommitCallbacks(execute=True):
+            # INSERT + lectura del compra_id (sin cargar el CodigoQR completo)
+            with self.assertNumQueries(2):
+                RegistroEscaneo.objects.create(codigo_qr_id=codigo_id, exitoso=False)
+        self.assertIsNone(cache.get(_clave(compra_id)))
+
+
+class IndicesConsultasTest(TestCase):
+    """Las consultas frecuentes usan los índices definidos en los modelos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import timedelta
+        from django.utils import timezone
+        from entradas.models import EntradaTipo
+        from termas.models import Calificacion, Terma
+        from usuarios.models import Usuario
+        from .models import CodigoQR, RegistroEscaneo
+
+        # Suficientes filas variadas para que las estadísticas favorezcan los índices
+        termas = [Terma(nombre_terma=f'Termas {i}', estado_suscripcion='activa') for i in range(20)]
+        termas = Terma.objects.bulk_create(termas)
+        cls.terma = termas[0]
+        cliente = Usuario.objects.create_user('cliente@indice.cl', 'Iris', 'Cliente')
+
+        hoy = timezone.localdate()
+        # Como en producción, las pendientes son una fracción pequeña (1 de cada 50)
+        estados = ['pagado', 'pagado', 'pagado', 'cancelado']
+        compras = Compra.objects.bulk_create([
+            Compra(usuario=cliente, terma=termas[i % 20], total=Decimal('1000'),
+                   estado_pago='pendiente' if i % 50 == 49 else estados[i % 4],
+                   fecha_visita=hoy - timedelta(days=i % 60))
+            for i in range(2000)
+        ])
+        codigos = CodigoQR.objects.bulk_create([CodigoQR(compra=c, codigo=str(c.pk)) for c in compras[:500]])
+        RegistroEscaneo.objects.bulk_create([
+            RegistroEscaneo(codigo_qr=codigos[i % 500], exitoso=bool(i % 3)) for i in range(2000)
+        ])
+        EntradaTipo.objects.bulk_create([
+            EntradaTipo(terma=termas[i % 20], nombre=f'Entrada {i // 20 % 2}', precio=Decimal('5000'),
+                        estado=bool(i % 4), fecha=hoy - timedelta(days=i // 40))
+            for i in range(2400)
+        ])
+        Calificacion.objects.bulk_create([
+            Calificacion(usuario=cliente, terma=termas[i % 20], puntuacion=5) for i in range(1000)
+        ])
+        DistribucionPago.objects.bulk_create([
+            DistribucionPago(compra=c, terma=c.terma, monto_total=c.total, porcentaje_comision=Decimal('5'),
+                             monto_comision_plataforma=Decimal('50'), monto_para_terma=Decimal('950'),
+                             estado='procesado' if i % 20 == 0 else 'completado')
+            for i, c in enumerate(compras[:1000])
+        ])
+
+        with connection.cursor() as cursor:
+            # auto_now_add deja todo en el mismo instante: repartir en 60 días
+            for tabla, campo in (('ventas_compra', 'fecha_compra'), ('ventas_distribucionpago', 'fecha_calculo')):
+                cursor.execute(f"UPDATE {tabla} SET {campo} = {campo} - (id % 60) * interval '1 day'")
+            for tabla in ('ventas_compra', 'ventas_registroescaneo', 'ventas_distribucionpago',
+                          'entradas_entradatipo', 'termas_calificacion', 'termas_terma'):
+                cursor.execute(f'ANALYZE {tabla}')
+        cls.codigo_qr = codigos[0]
+
+    def assertUsaIndice(self, queryset, *indices):
+        """El plan (sin forzar al planificador) recorre alguno de los índices."""
+        plan = queryset.explain()
+        self.assertTrue(any(indice in plan for indice in indices), plan)
+
+    def test_indices_de_compra(self):
+        from django.utils import timezone
+        from .utils import rango_de_dias
+
+        hoy = timezone.localdate()
+        inicio_dia, _ = rango_de_dias(hoy, hoy)
+        compras = Compra.objects.filter(terma=self.terma)
+
+        self.assertUsaIndice(
+            compras.filter(fecha_visita=hoy, estado_pago='pagado'), 'compra_terma_visita_idx'
+        )
+        self.assertUsaIndice(
+            compras.filter(estado_pago='pagado', fecha_compra__gte=inicio_dia), 'compra_terma_estado_idx'
+        )
+        self.assertUsaIndice(Compra.objects.filter(payment_id='123'), 'compra_payment_id_idx')
+        self.assertUsaIndice(Compra.objects.filter(mercado_pago_id='pref-1'), 'compra_mp_id_idx')
+        self.assertUsaIndice(
+            Compra.objects.filter(estado_pago='pendiente', fecha_compra__lt=timezone.now()),
+            # Ambos índices parciales cubren solo las pendientes: cuál gana es un empate de costos
+            'compra_pendiente_fecha_idx', 'compra_reserva_vigente_idx'
+        )
+
+    def test_indices_de_escaneo_distribucion_y_catalogo(self):
+        from django.utils import timezone
+        from entradas.models import EntradaTipo
+        from termas.models import Calificacion
+        from .models import RegistroEscaneo
+
+        from .utils import rango_de_dias
+
+        hoy = timezone.localdate()
+        inicio, fin = rango_de_dias(hoy, hoy)
+        self.assertUsaIndice(
+            RegistroEscaneo.objects.filter(codigo_qr=self.codigo_qr, exitoso=True, fecha_escaneo__date=hoy),
+            'escaneo_qr_exitoso_idx'
+        )
+        self.assertUsaIndice(
+            DistribucionPago.objects.filter(terma=self.terma, fecha_calculo__gte=inicio, fecha_calculo__lt=fin),
+            'distribucion_terma_fecha_idx'
+        )
+        self.assertUsaIndice(
+            DistribucionPago.objects.filter(estado='procesado', pago_terma__isnull=True, terma=self.terma).order_by(),
+            'distribucion_por_pagar_idx'
+        )
+        self.assertUsaIndice(
+            Calificacion.objects.filter(terma=self.terma).order_by('-fecha')[:5], 'calificacion_terma_fecha_idx'
+        )
+        self.assertUsaIndice(
+            EntradaTipo.objects.filter(terma=self.terma, estado=True, fecha=hoy), 'entradatipo_terma_estado_idx'
+        )
@@ -0,0 +1,272 @@
+"""
+Generación de reportes en segundo plano.
+
+Flujo:
+    1. La vista llama a encolar_reporte(): se guarda un TrabajoReporte
+       'pendiente' y se responde de inmediato con su UUID.
+    2. El comando `python manage.py procesar_reportes` toma los pendientes,
+       genera el archivo en MEDIA_ROOT/reportes/ y lo marca 'completado'.
+    3. La interfaz consulta el estado y descarga el archivo cuando está listo.
+
+Deduplicación: la huella del trabajo combina tipo, terma, parámetros y una
+versión de los datos (cantidad, último ID y suma de las ventas del rango).
+Mientras no entren ventas nuevas para esa terma y rango, solicitudes
+idénticas reutilizan el mismo trabajo y su archivo.
+"""
+import hashlib
+import io
+import json
+import logging
+import tempfile
+from datetime import date, timedelta
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import Compra, DistribucionPago, TrabajoReporte
+
+logger = logging.getLogger(__name__)
+
+# Un trabajo 'procesando' más antiguo que esto se considera abandonado
+MINUTOS_TRABAJO_COLGADO = 30
+
+
+def _fechas(parametros):
+    return (
+        date.fromisoformat(parametros['fecha_inicio']),
+        date.fromisoformat(parametros['fecha_fin']),
+    )
+
+
+# =================== GENERADORES ===================
+
+def _generar_ventas_pdf(trabajo, destino):
+    from usuarios.views_reportes import escribir_pdf_reporte_ventas
+    fecha_inicio, fecha_fin = _fechas(trabajo.parametros)
+    escribir_pdf_reporte_ventas(trabajo.terma, fecha_inicio, fecha_fin, destino)
+
+
+def _generar_ventas_excel(trabajo, destino):
+    from usuarios.views_reportes import construir_excel_reporte_ventas
+    fecha_inicio, fecha_fin = _fechas(trabajo.parametros)
+    construir_excel_reporte_ventas(trabajo.terma, fecha_inicio, fecha_fin).save(destino)
+
+
+def _generar_comisiones_csv(trabajo, destino):
+    import csv
+    from .utils import iterar_comisiones_diarias
+
+    fecha_inicio, fecha_fin = _fechas(trabajo.parametros)
+    texto = io.TextIOWrapper(destino, encoding='utf-8-sig', newline='')
+    writer = csv.writer(texto)
+    writer.writerow([
+        'Fecha', 'Terma', 'Plan', '% Comisión', 'Ventas Totales',
+        'Comisión Ganada', 'Pagado a Terma', 'Transacciones'
+    ])
+    for fecha, terma_nombre, datos in iterar_comisiones_diarias(
+        fecha_inicio, fecha_fin, trabajo.parametros.get('terma_id')
+    ):
+        writer.writerow([
+            fecha.strftime('%Y-%m-%d'), terma_nombre, datos['plan'],
+            datos['porcentaje_comision'], datos['ventas'], datos['comisiones'],
+            datos['pagado_terma'], datos['transacciones']
+        ])
+    # Soltar el archivo sin cerrarlo: lo sigue usando el procesador
+    texto.flush()
+    texto.detach()
+
+
+# tipo -> (extensión, generador(trabajo, archivo_binario))
+GENERADORES = {
+    'ventas_pdf': ('pdf', _generar_ventas_pdf),
+    'ventas_excel': ('xlsx', _generar_ventas_excel),
+    'comisiones_csv': ('csv', _generar_comisiones_csv),
+}
+
+
+# =================== ENCOLADO ===================
+
+def _version_datos(tipo, terma_id, parametros):
+    """
+    Resume los datos que alimentan el reporte. Cambia cuando entra (o cambia
+    de estado) una venta de esa terma dentro del rango.
+    """
+    from .utils import rango_de_dias
+
+    inicio, fin = rango_de_dias(*_fechas(parametros))
+
+    if tipo == 'comisiones_csv':
+        datos = DistribucionPago.objects.filter(
+            fecha_calculo__gte=inicio,
+            fecha_calculo__lt=fin
+        )
+        if parametros.get('terma_id'):
+            datos = datos.filter(terma_id=parametros['terma_id'])
+        resumen = datos.aggregate(n=Count('id'), ultimo=Max('id'), suma=Sum('monto_total'))
+    else:
+        resumen = Compra.objects.filter(
+            terma_id=terma_id,
+            fecha_compra__gte=inicio,
+            fecha_compra__lt=fin,
+            estado_pago='pagado'
+        ).aggregate(n=Count('id'), ultimo=Max('id'), suma=Sum('total'))
+
+    return [resumen['n'], resumen['ultimo'], str(resumen['suma'] or 0)]
+
+
+def calcular_huella(tipo, terma_id, parametros):
+    """
+    Huella SHA-256 del reporte solicitado, incluida la versión de los datos.
+
+    Args:
+        tipo: Tipo de reporte (clave de GENERADORES)
+        terma_id: ID de la terma del reporte (None para reportes globales)
+        parametros: Dict serializable con fecha_inicio/fecha_fin (ISO) y filtros
+    """
+    contenido = json.dumps({
+        'tipo': tipo,
+        'terma_id': terma_id,
+        'parametros': parametros,
+        'version_datos': _version_datos(tipo, terma_id, parametros),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def encolar_reporte(tipo, parametros, usuario=None, terma=None):
+    """
+    Registra un reporte para generarse en segundo plano.
+
+    Si ya existe un trabajo vigente (pendiente, procesando o completado) con
+    la misma huella, lo retorna en lugar de crear otro.
+
+    Args:
+        tipo: Tipo de reporte (clave de GENERADORES)
+        parametros: Dict con fecha_inicio/fecha_fin (ISO) y filtros opcionales
+        usuario: Usuario que solicita el reporte
+        terma: Terma del reporte (None para reportes globales)
+
+    Returns:
+        tuple: (TrabajoReporte, creado)
+    """
+    if tipo not in GENERADORES:
+        raise ValueError(f"Tipo de reporte desconocido: {tipo}")
+
+    terma_id = terma.id if terma else None
+    huella = calcular_huella(tipo, terma_id, parametros)
+
+    existente = TrabajoReporte.objects.filter(huella=huella).exclude(estado='error').first()
+    if existente:
+        return existente, False
+
+    try:
+        with transaction.atomic():
+            trabajo = TrabajoReporte.objects.create(
+                tipo=tipo,
+                parametros=parametros,
+                huella=huella,
+                terma=terma,
+                solicitado_por=usuario,
+            )
+    except IntegrityError:
+        # Otra request idéntica lo creó al mismo tiempo
+        return TrabajoReporte.objects.exclude(estado='error').get(huella=huella), False
+
+    logger.info(f"Reporte {tipo} encolado: {trabajo.uuid}")
+    return trabajo, True
+
+
+# =================== PROCESAMIENTO ===================
+
+def _tomar_siguiente_trabajo():
+    """Marca como 'procesando' el pendiente más antiguo sin bloquear a otros workers."""
+    with transaction.atomic():
+        trabajo = TrabajoReporte.objects.select_for_update(skip_locked=True).filter(
+            estado='pendiente'
+        ).order_by('fecha_creacion').first()
+        if trabajo is None:
+            return None
+        trabajo.estado = 'procesando'
+        trabajo.fecha_inicio_proceso = timezone.now()
+        trabajo.save(update_fields=['estado', 'fecha_inicio_proceso'])
+        return trabajo
+
+
+def procesar_trabajo(trabajo):
+    """
+    Genera el archivo de un trabajo y actualiza su estado.
+
+    Args:
+        trabajo: TrabajoReporte en estado 'procesando'
+    """
+    extension, generador = GENERADORES[trabajo.tipo]
+    try:
+        # El generador escribe en disco; el archivo se copia luego al storage
+        with tempfile.TemporaryFile() as temporal:
+            generador(trabajo, temporal)
+            temporal.seek(0)
+            trabajo.archivo.save(f"{trabajo.tipo}_{trabajo.uuid}.{extension}", File(temporal), save=False)
+
+        trabajo.estado = 'completado'
+        trabajo.fecha_finalizacion = timezone.now()
+        trabajo.save(update_fields=['archivo', 'estado', 'fecha_finalizacion'])
+        logger.info(f"Reporte {trabajo.uuid} generado en {trabajo.fecha_finalizacion - trabajo.fecha_inicio_proceso}")
+    except Exception as e:
+        logger.error(f"Error generando reporte {trabajo.uuid}: {str(e)}")
+        trabajo.estado = 'error'
+        trabajo.mensaje_error = str(e)
+        trabajo.fecha_finalizacion = timezone.now()
+        trabajo.save(update_fields=['estado', 'mensaje_error', 'fecha_finalizacion'])
+
+
+def procesar_trabajos_pendientes(limite=None):
+    """
+    Procesa trabajos pendientes hasta vaciar la cola (o llegar al límite).
+    Es seguro ejecutarlo en varios procesos a la vez.
+
+    Args:
+        limite: Máximo de trabajos a procesar (None = todos)
+
+    Returns:
+        int: Cantidad de trabajos procesados
+    """
+    procesados = 0
+    while limite is None or procesados < limite:
+        trabajo = _tomar_siguiente_trabajo()
+        if trabajo is None:
+            break
+        procesar_trabajo(trabajo)
+        procesados += 1
+    return procesados
+
+
+def liberar_trabajos_colgados(minutos=MINUTOS_TRABAJO_COLGADO):
+    """
+    Devuelve a 'pendiente' los trabajos cuyo worker murió a medio proceso.
+
+    Args:
+        minutos: Antigüedad mínima del inicio de proceso
+    """
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return TrabajoReporte.objects.filter(
+        estado='procesando',
+        fecha_inicio_proceso__lt=limite
+    ).update(estado='pendiente', fecha_inicio_proceso=None)
+
+
+def purgar_trabajos_antiguos(dias):
+    """
+    Elimina trabajos (y sus archivos) más antiguos que la cantidad de días dada.
+
+    Args:
+        dias: Antigüedad en días desde la creación
+    """
+    limite = timezone.now() - timedelta(days=dias)
+    eliminados = 0
+    for trabajo in TrabajoReporte.objects.filter(fecha_creacion__lt=limite).exclude(estado='procesando'):
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.delete()
+        eliminados += 1
+    return eliminados
@@ -17,6 +17,7 @@ from django.core.mail import EmailMessage
 from django.conf import settings
 from django.core.signing import TimestampSigner
 from django.utils import timezone
+from core.metrics import span
 
 # Configurar logger
 logger = logging.getLogger(__name__)
@@ -31,11 +32,11 @@ def _get_encryption_key():
     return key
 
 def generar_datos_qr(compra):
-    """Genera los datos encriptados que contendrá el QR"""
+    """Genera los datos encriptados que contendrá el QR (compra: Compra o CompraGraph)"""
     from .models import CodigoQR
     
     # Verificar si ya existe un código QR para esta compra
-    codigo_qr_existente = CodigoQR.objects.filter(compra=compra).first()
+    codigo_qr_existente = CodigoQR.objects.filter(compra_id=compra.id).first()
     if codigo_qr_existente:
         logger.info("Código QR existente encontrado")
         return codigo_qr_existente.codigo
@@ -44,7 +45,7 @@ def generar_datos_qr(compra):
     datos = {
         'ticket_id': f"{compra.id}-{timezone.now().timestamp()}",
         'fecha_visita': str(compra.fecha_visita),
-        'terma_id': compra.terma.id
+        'terma_id': compra.terma_id
     }
     
     # Crear un token firmado con timestamp
@@ -59,7 +60,7 @@ def generar_datos_qr(compra):
     # Crear registro en la base de datos
     try:
         CodigoQR.objects.create(
-            compra=compra,
+            compra_id=compra.id,
             codigo=datos_qr,
             fecha_generacion=timezone.now()
         )
@@ -71,6 +72,7 @@ def generar_datos_qr(compra):
     return datos_qr
 
 
+@span('generar_qr')
 def generar_qr(datos):
     """Genera un código QR a partir de los datos proporcionados"""
     qr = qrcode.QRCode(
@@ -90,11 +92,20 @@ def generar_qr(datos):
     return img_buffer
 
 
+@span('generar_pdf_entrada')
 def generar_pdf_entrada(compra):
-    """Genera un PDF con el código QR y los detalles de la entrada"""
+    """
+    Genera un PDF con el código QR y los detalles de la entrada
+    
+    Args:
+        compra: Compra o CompraGraph (ver ventas/grafo_compra.py)
+    """
     from reportlab.lib import colors
     from reportlab.lib.units import inch
     from reportlab.platypus import Table, TableStyle
+    from .grafo_compra import CompraGraph
+    
+    compra = CompraGraph.de(compra)
     
     buffer = BytesIO()
     c = canvas.Canvas(buffer, pagesize=letter)
@@ -149,8 +160,8 @@ def generar_pdf_entrada(compra):
     y_position = height - 280
     
     # Mostrar detalles de la entrada
-    detalles = compra.detalles.first()
-    if detalles:
+    detalles = compra.detalle_principal
+    if detalles and detalles.entrada_tipo:
         c.setFillColor(colors.black)
         c.setFont("Helvetica-Bold", 12)
         c.drawString(70, y_position, "Tipo de Entrada:")
@@ -162,35 +173,34 @@ def generar_pdf_entrada(compra):
         c.setFont("Helvetica-Bold", 12)
         c.drawString(70, y_position, "Cantidad:")
         c.setFont("Helvetica", 12)
-        c.drawString(250, y_position, f"{compra.cantidad if hasattr(compra, 'cantidad') else 1} entrada(s)")
+        c.drawString(250, y_position, f"{compra.cantidad} entrada(s)")
         y_position -= 25
         
         # Servicios incluidos
-        servicios_incluidos = detalles.entrada_tipo.servicios.all()
-        if servicios_incluidos.exists():
+        if detalles.entrada_tipo.servicios_incluidos:
             c.setFont("Helvetica-Bold", 12)
             c.drawString(70, y_position, "Servicios Incluidos:")
             c.setFont("Helvetica", 10)
-            for servicio in servicios_incluidos:
-                c.drawString(250, y_position, f"• {servicio.servicio}")
+            for servicio in detalles.entrada_tipo.servicios_incluidos:
+                c.drawString(250, y_position, f"• {servicio.nombre}")
                 y_position -= 15
             y_position -= 10
         
         # Servicios extra contratados
-        servicios_extra = detalles.servicios.all()
-        if servicios_extra.exists():
+        if detalles.servicios_extra:
             c.setFillColor(colors.blue)
             c.setFont("Helvetica-Bold", 12)
             c.drawString(70, y_position, "Servicios Extra:")
             c.setFillColor(colors.black)
             c.setFont("Helvetica", 10)
-            for servicio in servicios_extra:
-                precio_formateado = "{:,.0f}".format(float(servicio.precio))
-                c.drawString(250, y_position, f"• {servicio.servicio} (${precio_formateado} CLP)")
+            for servicio in detalles.servicios_extra:
+                precio_formateado = "{:,.0f}".format(float(servicio.precio or 0))
+                cantidad = f" x{servicio.cantidad}" if servicio.cantidad > 1 else ""
+                c.drawString(250, y_position, f"• {servicio.nombre}{cantidad} (${precio_formateado} CLP)")
                 y_position -= 15
     
     # Generar y colocar el QR
-    qr_data = generar_datos_qr(compra)
+    qr_data = compra.codigo_qr.codigo if compra.codigo_qr else generar_datos_qr(compra)
     qr_img = generar_qr(qr_data)
     img = ImageReader(qr_img)
     
@@ -253,11 +263,20 @@ def generar_pdf_entrada(compra):
     return buffer
 
 
+@span('enviar_entrada_por_correo')
 def enviar_entrada_por_correo(compra):
-    """Envía el PDF con la entrada por correo electrónico"""
+    """
+    Envía el PDF con la entrada por correo electrónico
+    
+    Args:
+        compra: Compra o CompraGraph; el grafo se carga una sola vez y lo
+            reutiliza el PDF
+    """
+    from .grafo_compra import CompraGraph
     logger = logging.getLogger(__name__)
     
     try:
+        compra = CompraGraph.de(compra)
         print(f"[EMAIL] Iniciando envío de correo para compra {compra.id}")
         logger.info("[EMAIL] Enviando correo de confirmación")
         print(f"[EMAIL] FROM_EMAIL: {settings.DEFAULT_FROM_EMAIL}")
@@ -266,13 +285,7 @@ def enviar_entrada_por_correo(compra):
         if compra.estado_pago != 'pagado':
             raise ValueError(f"La compra {compra.id} no está marcada como pagada")
         
-        # Verificar que existe el código QR (debería existir ya)
-        from .models import CodigoQR
-        if not CodigoQR.objects.filter(compra=compra).exists():
-            print(f"[EMAIL] Código QR no existe, generando uno nuevo para compra {compra.id}")
-            generar_datos_qr(compra)
-        
-        # Generar el PDF
+        # Generar el PDF (si el código QR aún no existe, lo crea)
         try:
             pdf_buffer = generar_pdf_entrada(compra)
             print("[EMAIL] PDF generado correctamente")
@@ -327,6 +340,33 @@ Por favor, presenta este código QR al llegar a la terma.
     return True  # Indicar que fue exitoso
 
 
+# =================== CHECKOUT ===================
+
+def registrar_servicios_extra(detalle, servicios_extra):
+    """
+    Reemplaza los servicios extra de un detalle de compra con un solo
+    DELETE y un bulk_create.
+    
+    Args:
+        detalle: DetalleCompra
+        servicios_extra: [(servicio, cantidad, precio_unitario)] ya validados
+            (ver CheckoutForm)
+    """
+    from .models import ServicioExtraDetalle
+    
+    detalle.servicios_extra.all().delete()
+    detalle.servicios.clear()
+    ServicioExtraDetalle.objects.bulk_create([
+        ServicioExtraDetalle(
+            detalle_compra=detalle,
+            servicio=servicio,
+            cantidad=cantidad,
+            precio_unitario=precio
+        )
+        for servicio, cantidad, precio in servicios_extra
+    ])
+
+
 # =================== SISTEMA DE DISTRIBUCIÓN DE PAGOS ===================
 
 def crear_distribucion_pago(compra):
@@ -381,92 +421,127 @@ def crear_distribucion_pago(compra):
         raise
 
 
-def procesar_distribucion_pago(distribucion):
+# Estados de una distribución que ya sumó al resumen mensual
+ESTADOS_DISTRIBUCION_CONTABILIZADOS = ('procesado', 'pagado_terma', 'completado')
+
+
+def acumular_resumen_comisiones(mes, año, total_ventas, total_comisiones, total_pagado_termas, cantidad=1):
     """
-    Procesa la distribución de pago (marca como procesado y actualiza resúmenes)
+    Suma montos al resumen mensual de comisiones con un UPDATE atómico
+    (expresiones F), sin leer la fila antes. Pagos concurrentes del mismo mes
+    no se pisan entre sí y el bloqueo de la fila dura solo esa sentencia.
+    
+    Args:
+        mes: Mes del resumen (1-12)
+        año: Año del resumen
+        total_ventas: Monto a sumar a las ventas
+        total_comisiones: Monto a sumar a las comisiones
+        total_pagado_termas: Monto a sumar a lo pagado a termas
+        cantidad: Transacciones a sumar
     """
     from .models import ResumenComisionesPlataforma
+    from django.db import IntegrityError, transaction
+    from django.db.models import F
     from django.utils import timezone
-    from datetime import datetime
     
-    try:
-        # Marcar como procesado
-        distribucion.marcar_como_procesado()
-        
-        # Actualizar resumen mensual de comisiones
-        fecha = distribucion.fecha_calculo
-        mes = fecha.month
-        año = fecha.year
-        
-        resumen, created = ResumenComisionesPlataforma.objects.get_or_create(
-            mes=mes,
-            año=año,
-            defaults={
-                'total_ventas': 0,
-                'total_comisiones': 0,
-                'total_pagado_termas': 0,
-                'cantidad_transacciones': 0
-            }
+    def sumar():
+        return ResumenComisionesPlataforma.objects.filter(mes=mes, año=año).update(
+            total_ventas=F('total_ventas') + total_ventas,
+            total_comisiones=F('total_comisiones') + total_comisiones,
+            total_pagado_termas=F('total_pagado_termas') + total_pagado_termas,
+            cantidad_transacciones=F('cantidad_transacciones') + cantidad,
+            fecha_actualizacion=timezone.now()
         )
-        
-        # Actualizar totales
-        resumen.total_ventas += distribucion.monto_total
-        resumen.total_comisiones += distribucion.monto_comision_plataforma
-        resumen.total_pagado_termas += distribucion.monto_para_terma
-        resumen.cantidad_transacciones += 1
-        resumen.save()
-        
-        logging.info(f"Distribución {distribucion.id} procesada y resumen mensual actualizado")
-        
-        return True
-        
-    except Exception as e:
-        logging.error(f"Error al procesar distribución {distribucion.id}: {str(e)}")
-        return False
+    
+    if sumar():
+        return
+    
+    # Primer pago del mes: crear la fila. Si otro proceso la creó primero,
+    # la restricción única lo detecta y se vuelve a sumar sobre la existente.
+    try:
+        with transaction.atomic():
+            ResumenComisionesPlataforma.objects.create(
+                mes=mes,
+                año=año,
+                total_ventas=total_ventas,
+                total_comisiones=total_comisiones,
+                total_pagado_termas=total_pagado_termas,
+                cantidad_transacciones=cantidad
+            )
+    except IntegrityError:
+        sumar()
+
+
+def recalcular_resumen(mes, año):
+    """
+    Reconstruye el resumen mensual desde DistribucionPago con una sola
+    consulta de agregación. Sirve para corregir desvíos (distribuciones
+    editadas, eliminadas o marcadas con error después de sumarse).
+    
+    Args:
+        mes: Mes del resumen (1-12)
+        año: Año del resumen
+    
+    Returns:
+        ResumenComisionesPlataforma: El resumen actualizado
+    """
+    from .models import DistribucionPago, ResumenComisionesPlataforma
+    from django.db.models import Count, Sum
+    from decimal import Decimal
+    
+    totales = DistribucionPago.objects.filter(
+        fecha_calculo__year=año,
+        fecha_calculo__month=mes,
+        estado__in=ESTADOS_DISTRIBUCION_CONTABILIZADOS
+    ).aggregate(
+        total_ventas=Sum('monto_total'),
+        total_comisiones=Sum('monto_comision_plataforma'),
+        total_pagado_termas=Sum('monto_para_terma'),
+        cantidad_transacciones=Count('id')
+    )
+    
+    resumen, _ = ResumenComisionesPlataforma.objects.update_or_create(
+        mes=mes,
+        año=año,
+        defaults={
+            'total_ventas': totales['total_ventas'] or Decimal('0'),
+            'total_comisiones': totales['total_comisiones'] or Decimal('0'),
+            'total_pagado_termas': totales['total_pagado_termas'] or Decimal('0'),
+            'cantidad_transacciones': totales['cantidad_transacciones']
+        }
+    )
+    return resumen
 
 
-def simular_pago_terma(distribucion, metodo_pago="Transferencia Bancaria", referencia=None):
+def procesar_distribucion_pago(distribucion):
     """
-    Simula el envío de pago a la terma (para ambiente de testing)
-    En producción, aquí se integraría con el sistema de pagos real
+    Procesa la distribución de pago (marca como procesado y actualiza resúmenes)
     """
-    from .models import HistorialPagoTerma
-    from django.utils import timezone
-    import uuid
+    from django.db import transaction
     
     try:
-        # Generar referencia si no se proporciona
-        if not referencia:
-            referencia = f"SIM-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Crear registro de pago
-        pago = HistorialPagoTerma.objects.create(
-            distribucion=distribucion,
-            terma=distribucion.terma,
-            monto_pagado=distribucion.monto_para_terma,
-            metodo_pago_usado=metodo_pago,
-            referencia_externa=referencia,
-            info_pago_terma={
-                'email_terma': distribucion.terma.email_terma,
-                'rut_empresa': distribucion.terma.rut_empresa,
-                'nombre_terma': distribucion.terma.nombre_terma,
-                'plan_utilizado': distribucion.plan_utilizado.nombre if distribucion.plan_utilizado else 'Sin plan'
-            },
-            observaciones=f"Pago simulado para testing - Plan: {distribucion.plan_utilizado.nombre if distribucion.plan_utilizado else 'Sin plan'}",
-            exitoso=True
-        )
-        
-        # Marcar distribución como pagada
-        distribucion.marcar_pago_terma_enviado(referencia)
+        # El cambio de estado y la suma al resumen van juntos o no van
+        with transaction.atomic():
+            distribucion.marcar_como_procesado()
+            
+            # Actualizar resumen mensual de comisiones. El mes es el de la hora
+            # local, igual que el filtro __month de recalcular_resumen()
+            fecha = timezone.localtime(distribucion.fecha_calculo)
+            acumular_resumen_comisiones(
+                fecha.month,
+                fecha.year,
+                distribucion.monto_total,
+                distribucion.monto_comision_plataforma,
+                distribucion.monto_para_terma
+            )
         
-        logging.info(f"Pago simulado enviado a {distribucion.terma.nombre_terma}: "
-                    f"${distribucion.monto_para_terma} - Ref: {referencia}")
+        logging.info(f"Distribución {distribucion.id} procesada y resumen mensual actualizado")
         
-        return pago
+        return True
         
     except Exception as e:
-        logging.error(f"Error al simular pago para distribución {distribucion.id}: {str(e)}")
-        return None
+        logging.error(f"Error al procesar distribución {distribucion.id}: {str(e)}")
+        return False
 
 
 def completar_distribucion_pago(distribucion):
@@ -489,6 +564,10 @@ def procesar_pago_completo(compra):
     """
     Función principal que maneja todo el flujo de distribución de pago
     Esta función debe ser llamada cuando una compra cambia a estado 'pagado'
+    
+    La distribución queda 'procesado'; el pago a la terma se hace en el
+    siguiente ciclo de pagos (ver ventas/liquidacion.py), junto con el resto
+    de sus ventas.
     """
     try:
         logging.info(f"Iniciando procesamiento completo de pago para compra {compra.id}")
@@ -500,16 +579,7 @@ def procesar_pago_completo(compra):
         if not procesar_distribucion_pago(distribucion):
             raise Exception("Error al procesar distribución")
         
-        # 3. Simular envío de pago a la terma (en testing)
-        pago = simular_pago_terma(distribucion)
-        if not pago:
-            raise Exception("Error al simular pago a terma")
-        
-        # 4. Completar el proceso
-        if not completar_distribucion_pago(distribucion):
-            raise Exception("Error al completar distribución")
-        
-        logging.info(f"Pago procesado completamente para compra {compra.id}")
+        logging.info(f"Pago procesado para compra {compra.id}; queda pendiente del ciclo de pagos")
         return distribucion
         
     except Exception as e:
@@ -572,15 +642,108 @@ def obtener_resumen_comisiones_terma(terma, mes=None, año=None):
     return resumen
 
 
-def obtener_reporte_comisiones_diarias(fecha_inicio=None, fecha_fin=None, terma_id=None):
+def rango_de_dias(fecha_inicio, fecha_fin):
     """
-    Obtiene reporte detallado de comisiones diarias por terma
+    Límites [inicio, fin) en datetime con zona horaria que cubren los días
+    indicados. Filtrar con campo__gte/campo__lt sobre estos límites usa los
+    índices del campo; campo__date__gte aplica una función a la columna y no.
+    
+    Args:
+        fecha_inicio: Fecha inicial (inclusive)
+        fecha_fin: Fecha final (inclusive)
+    
+    Returns:
+        tuple: (datetime inicio, datetime fin exclusivo)
+    """
+    from datetime import datetime, time, timedelta
+    
+    inicio = timezone.make_aware(datetime.combine(fecha_inicio, time.min))
+    fin = timezone.make_aware(datetime.combine(fecha_fin + timedelta(days=1), time.min))
+    return inicio, fin
+
+
+def consultar_comisiones_diarias(fecha_inicio, fecha_fin, terma_id=None):
+    """
+    Agrupa las distribuciones por día y terma en una sola consulta.
+    
+    Retorna un queryset de dicts (uno por día y terma) con las sumas en
+    Decimal, ordenado por fecha descendente y nombre de terma. Es la fuente
+    común del reporte del administrador y de su exportación CSV.
+    
+    Args:
+        fecha_inicio: Fecha inicial (inclusive)
+        fecha_fin: Fecha final (inclusive)
+        terma_id: ID de terma opcional para filtrar
     """
     from .models import DistribucionPago
-    from django.db.models import Sum, Count, Q
+    from django.db.models import Count, Max, Sum
+    from django.db.models.functions import TruncDate
+    
+    inicio, fin = rango_de_dias(fecha_inicio, fecha_fin)
+    distribuciones = DistribucionPago.objects.filter(
+        fecha_calculo__gte=inicio,
+        fecha_calculo__lt=fin
+    )
+    if terma_id:
+        distribuciones = distribuciones.filter(terma_id=terma_id)
+    
+    # El plan y el porcentaje no cambian dentro de un día salvo un cambio de
+    # plan a mitad de jornada; en ese caso se informa el mayor.
+    return distribuciones.annotate(
+        fecha=TruncDate('fecha_calculo')
+    ).values('fecha', 'terma_id', 'terma__nombre_terma').annotate(
+        ventas=Sum('monto_total'),
+        comisiones=Sum('monto_comision_plataforma'),
+        pagado_terma=Sum('monto_para_terma'),
+        transacciones=Count('id'),
+        plan=Max('plan_utilizado__nombre'),
+        porcentaje_comision=Max('porcentaje_comision'),
+    ).order_by('-fecha', 'terma__nombre_terma', 'terma_id')
+
+
+def iterar_comisiones_diarias(fecha_inicio, fecha_fin, terma_id=None, chunk_size=2000):
+    """
+    Genera (fecha, nombre_terma, datos) por día y terma a partir de la
+    consulta agrupada. Los montos de `datos` son Decimal exactos.
+    
+    Args:
+        fecha_inicio: Fecha inicial (inclusive)
+        fecha_fin: Fecha final (inclusive)
+        terma_id: ID de terma opcional para filtrar
+        chunk_size: Filas leídas por viaje a la BD
+    """
+    from termas.models import PlanSuscripcion
+    
+    nombres_plan = dict(PlanSuscripcion.TIPOS_PLAN)
+    
+    filas = consultar_comisiones_diarias(fecha_inicio, fecha_fin, terma_id)
+    for fila in filas.iterator(chunk_size=chunk_size):
+        plan = fila['plan']
+        yield fila['fecha'], fila['terma__nombre_terma'], {
+            'ventas': fila['ventas'],
+            'comisiones': fila['comisiones'],
+            'pagado_terma': fila['pagado_terma'],
+            'transacciones': fila['transacciones'],
+            'plan': nombres_plan.get(plan, plan) if plan else 'Sin plan',
+            'porcentaje_comision': fila['porcentaje_comision'],
+        }
+
+
+def obtener_reporte_comisiones_diarias(fecha_inicio=None, fecha_fin=None, terma_id=None):
+    """
+    Obtiene reporte detallado de comisiones diarias por terma.
+    
+    Los totales por día y del período se suman en Decimal sobre las filas ya
+    agrupadas (una por día y terma), sin volver a consultar la BD.
+    
+    Args:
+        fecha_inicio: Fecha inicial (por defecto, 30 días antes de fecha_fin)
+        fecha_fin: Fecha final (por defecto, hoy)
+        terma_id: ID de terma opcional para filtrar
+    """
+    from decimal import Decimal
     from django.utils import timezone
-    from datetime import datetime, timedelta
-    from collections import defaultdict
+    from datetime import timedelta
     
     # Fechas por defecto (último mes)
     if not fecha_fin:
@@ -588,64 +751,29 @@ def obtener_reporte_comisiones_diarias(fecha_inicio=None, fecha_fin=None, terma_
     if not fecha_inicio:
         fecha_inicio = fecha_fin - timedelta(days=30)
     
-    # Query base
-    query = Q(fecha_calculo__date__gte=fecha_inicio, fecha_calculo__date__lte=fecha_fin)
-    if terma_id:
-        query &= Q(terma_id=terma_id)
-    
-    distribuciones = DistribucionPago.objects.filter(query).select_related('terma', 'plan_utilizado')
-    
-    # Agrupar por fecha y terma
-    reporte_diario = defaultdict(lambda: defaultdict(lambda: {
-        'ventas': 0,
-        'comisiones': 0,
-        'pagado_terma': 0,
-        'transacciones': 0,
-        'plan': 'Sin plan',
-        'porcentaje_comision': 0
-    }))
-    
-    totales_dia = defaultdict(lambda: {
-        'total_ventas': 0,
-        'total_comisiones': 0,
-        'total_pagado_termas': 0,
-        'total_transacciones': 0
-    })
-    
-    for dist in distribuciones:
-        fecha = dist.fecha_calculo.date()
-        terma_nombre = dist.terma.nombre_terma
-        
-        reporte_diario[fecha][terma_nombre]['ventas'] += float(dist.monto_total)
-        reporte_diario[fecha][terma_nombre]['comisiones'] += float(dist.monto_comision_plataforma)
-        reporte_diario[fecha][terma_nombre]['pagado_terma'] += float(dist.monto_para_terma)
-        reporte_diario[fecha][terma_nombre]['transacciones'] += 1
-        reporte_diario[fecha][terma_nombre]['plan'] = dist.plan_utilizado.get_nombre_display() if dist.plan_utilizado else 'Sin plan'
-        reporte_diario[fecha][terma_nombre]['porcentaje_comision'] = float(dist.porcentaje_comision)
-        
-        # Totales del día
-        totales_dia[fecha]['total_ventas'] += float(dist.monto_total)
-        totales_dia[fecha]['total_comisiones'] += float(dist.monto_comision_plataforma)
-        totales_dia[fecha]['total_pagado_termas'] += float(dist.monto_para_terma)
-        totales_dia[fecha]['total_transacciones'] += 1
-    
-    # Convertir a formato de lista ordenada
-    reporte_final = []
-    for fecha in sorted(reporte_diario.keys(), reverse=True):
-        dia_data = {
-            'fecha': fecha,
-            'termas': dict(reporte_diario[fecha]),
-            'totales': totales_dia[fecha]
+    def totales_vacios():
+        return {
+            'total_ventas': Decimal('0'),
+            'total_comisiones': Decimal('0'),
+            'total_pagado_termas': Decimal('0'),
+            'total_transacciones': 0
         }
-        reporte_final.append(dia_data)
     
-    # Calcular totales generales del período
-    totales_periodo = distribuciones.aggregate(
-        total_ventas=Sum('monto_total'),
-        total_comisiones=Sum('monto_comision_plataforma'),
-        total_pagado_termas=Sum('monto_para_terma'),
-        total_transacciones=Count('id')
-    )
+    reporte_final = []
+    totales_periodo = totales_vacios()
+    
+    # Las filas llegan ordenadas por fecha: se abre un día nuevo al cambiar
+    for fecha, terma_nombre, datos in iterar_comisiones_diarias(fecha_inicio, fecha_fin, terma_id):
+        if not reporte_final or reporte_final[-1]['fecha'] != fecha:
+            reporte_final.append({'fecha': fecha, 'termas': {}, 'totales': totales_vacios()})
+        dia = reporte_final[-1]
+        dia['termas'][terma_nombre] = datos
+        
+        for totales in (dia['totales'], totales_periodo):
+            totales['total_ventas'] += datos['ventas']
+            totales['total_comisiones'] += datos['comisiones']
+            totales['total_pagado_termas'] += datos['pagado_terma']
+            totales['total_transacciones'] += datos['transacciones']
     
     return {
         'fecha_inicio': fecha_inicio,
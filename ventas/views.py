@@ -12,6 +12,7 @@ from usuarios.models import Usuario
 from usuarios.models import Usuario
 from usuarios.decorators import cliente_required
 from ventas.models import Compra
+from core.metrics import span
 
 # Cargar variables de entorno
 load_dotenv()
@@ -19,6 +20,137 @@ load_dotenv()
 # Configurar logger
 logger = logging.getLogger(__name__)
 
+def _registrar_compra(checkout, usuario, terma, clave, mercado_pago_id):
+    """
+    Descuenta los cupos de la entrada y crea la compra pendiente con su
+    detalle y servicios extra. Debe ejecutarse dentro de transaction.atomic().
+    
+    Args:
+        checkout: CheckoutForm ya validado
+        usuario: Usuario comprador (o invitado)
+        terma: Terma de la compra
+        clave: Clave de idempotencia enviada por el navegador
+        mercado_pago_id: Referencia externa para Mercado Pago
+    
+    Returns:
+        Compra creada
+    """
+    from entradas.models import EntradaTipo
+    from ventas.disponibilidad_utils import limpiar_compras_pendientes_vencidas
+    from ventas.models import DetalleCompra, MetodoPago
+    from ventas.utils import registrar_servicios_extra
+    
+    cantidad = checkout.cleaned_data['cantidad']
+    
+    # Obtener o crear la entrada específica para la fecha
+    entrada_tipo = EntradaTipo.get_entrada_para_fecha(
+        terma=terma,
+        nombre=checkout.cleaned_data['entrada_tipo'].nombre,
+        fecha=checkout.cleaned_data['fecha']
+    )
+    if not entrada_tipo:
+        raise ValueError("No se pudo crear la entrada para la fecha especificada")
+    
+    # Reservar los cupos primero: el UPDATE condicional bloquea la fila de la
+    # entrada solo hasta el commit y, si no alcanzan, no se escribe nada más.
+    # Si faltan, se recuperan en el momento los cupos de las reservas vencidas
+    # de esta entrada antes de rechazar la compra
+    if not entrada_tipo.reducir_cupos(cantidad) and not (
+        limpiar_compras_pendientes_vencidas(entrada_tipo_id=entrada_tipo.pk)
+        and entrada_tipo.reducir_cupos(cantidad)
+    ):
+        raise ValueError("No quedan cupos suficientes para la fecha seleccionada")
+    
+    compra = Compra.objects.create(
+        usuario=usuario,
+        metodo_pago=MetodoPago.objects.filter(nombre__icontains="Mercado Pago").first(),
+        terma=terma,
+        fecha_visita=checkout.cleaned_data['fecha'],
+        total=checkout.total,
+        estado_pago="pendiente",
+        mercado_pago_id=mercado_pago_id,
+        cantidad=cantidad,
+        clave_idempotencia=clave,
+    )
+    detalle = DetalleCompra.objects.create(
+        compra=compra,
+        entrada_tipo=entrada_tipo,
+        cantidad=cantidad,
+        precio_unitario=checkout.precio_unitario,
+        subtotal=checkout.subtotal_entradas
+    )
+    registrar_servicios_extra(detalle, checkout.cleaned_data['servicios_extra'])
+    return compra
+
+
+def _crear_preferencia_pago(sdk, request, compra, usuario, terma, incluidos=None):
+    """
+    Crea la preferencia de Mercado Pago de una compra ya confirmada en la BD y
+    guarda su enlace de pago, para que los reintentos lo reutilicen.
+    
+    Args:
+        sdk: mercadopago.SDK
+        request: HttpRequest (para armar las URLs de retorno)
+        compra: Compra pendiente
+        usuario: Usuario comprador
+        terma: Terma de la compra
+        incluidos: Texto opcional con los servicios incluidos
+    
+    Returns:
+        tuple: (url de pago o None, mensaje de error o None)
+    """
+    env_base = os.getenv('MP_BASE_URL')
+    if env_base:
+        base_url = env_base.rstrip('/')
+    else:
+        base_url = request.build_absolute_uri('/')[:-1]
+    
+    detalle = compra.detalles.select_related('entrada_tipo').prefetch_related('servicios_extra__servicio').first()
+    nombre_entrada = detalle.entrada_tipo.nombre if detalle and detalle.entrada_tipo else 'Entrada'
+    extras = [
+        f"{extra.servicio.servicio} x{extra.cantidad} (${extra.precio_unitario * extra.cantidad} CLP)"
+        for extra in (detalle.servicios_extra.all() if detalle else [])
+    ]
+    
+    # Un solo ítem con el total calculado en el servidor
+    items = [{
+        "title": f"Reserva: {nombre_entrada} - {compra.cantidad} entrada(s)",
+        "quantity": 1,
+        "unit_price": float(compra.total),
+        "currency_id": "CLP",
+        "description": f"Incluye: {incluidos or '-'}. Servicios extra: {', '.join(extras) or '-'}"
+    }]
+    
+    preference_data = {
+        "items": items,
+        "external_reference": compra.mercado_pago_id,
+        "back_urls": {
+            "success": f"{base_url}/ventas/pago/success/",  
+            "failure": f"{base_url}/ventas/pago/failure/",
+            "pending": f"{base_url}/ventas/pago/pending/"
+        },
+        "auto_return": "approved",
+        "notification_url": f"{base_url}/ventas/webhook/mercadopago/",  
+        "statement_descriptor": "TERMAS",
+        "metadata": {
+            "compra_uuid": str(compra.uuid),
+            "usuario_uuid": str(usuario.uuid),
+            "terma_uuid": str(terma.uuid)
+        }
+    }
+    
+    with span('mercadopago_preference_create'):
+        preference_response = sdk.preference().create(preference_data)
+    response_data = preference_response.get("response", {})
+    
+    if "init_point" not in response_data:
+        return None, response_data.get("message", "No se pudo generar el enlace de pago. Intenta nuevamente.")
+    
+    compra.mercado_pago_url = response_data["init_point"]
+    Compra.objects.filter(pk=compra.pk).update(mercado_pago_url=compra.mercado_pago_url)
+    return compra.mercado_pago_url, None
+
+
 def pago(request, terma_uuid=None):
     datos = {}
     
@@ -104,428 +236,89 @@ def pago(request, terma_uuid=None):
             datos['compra_error'] = "Debes iniciar sesión o proporcionar un email para realizar una compra."
             return render(request, 'ventas/pago.html', datos)
         
-        # Obtener datos críticos para verificación
-        entrada_id = datos.get('entrada_id')
-        fecha_visita = datos.get('fecha')
-        total_amount = datos.get('total')
-        
-        if not all([entrada_id, fecha_visita, total_amount]):
-            datos['compra_error'] = "Faltan datos requeridos para procesar el pago."
+        if not terma:
+            datos['compra_error'] = "No se encontró la terma seleccionada para la compra."
             return render(request, 'ventas/pago.html', datos)
         
-        # VERIFICAR SI YA EXISTE UNA COMPRA ACTIVA/EXITOSA PARA ESTOS MISMOS PARÁMETROS
-        from ventas.models import Compra
-        from datetime import datetime
-        
-        try:
-            fecha_visita_obj = datetime.strptime(fecha_visita, '%Y-%m-%d').date()
-        except ValueError:
-            datos['compra_error'] = "Fecha de visita inválida."
+        # Validar el checkout completo: entrada, fecha, cantidad y servicios extra
+        # (se validan contra la terma y se valorizan con los precios de la BD)
+        from ventas.forms import CheckoutForm
+        checkout = CheckoutForm(request.POST, terma=terma)
+        if not checkout.is_valid():
+            datos['compra_error'] = checkout.primer_error() or "Faltan datos requeridos para procesar el pago."
             return render(request, 'ventas/pago.html', datos)
         
-        # VALIDACIÓN ANTI-SPAM: Solo bloquear clicks múltiples accidentales inmediatos
-        # Buscar compra muy reciente (últimos 15 minutos) con parámetros idénticos
-        from datetime import timedelta
+        fecha_visita_obj = checkout.cleaned_data['fecha']
+        cantidad_entradas = checkout.cleaned_data['cantidad']
+        servicios_extra = checkout.cleaned_data['servicios_extra']
+        total = checkout.total
+        datos['entrada_tipo'] = checkout.cleaned_data['entrada_tipo']
+        datos['precio'] = checkout.precio_unitario
+        datos['total'] = total
+        datos['extras_descripcion'] = checkout.descripcion_extras()
+        datos['extras'] = datos['extras_descripcion'] if servicios_extra else None
         
-        tiempo_limite = timezone.now() - timedelta(minutes=15)
-        compra_reciente = Compra.objects.filter(
-            usuario=usuario,
-            terma=terma,
-            fecha_visita=fecha_visita_obj,
-            estado_pago__in=['pendiente', 'pagado'],
-            detalles__entrada_tipo__uuid=entrada_id,
-            cantidad=int(datos.get('cantidad_entradas', 1)),
-            fecha_compra__gt=tiempo_limite  # Solo últimos 15 minutos
-        ).first()
+        # IDEMPOTENCIA: un reintento (doble clic, recarga, reenvío) trae la misma
+        # clave y recibe la compra original; cuesta una búsqueda por índice
+        clave = checkout.cleaned_data['clave_idempotencia']
+        compra = Compra.objects.filter(usuario=usuario, clave_idempotencia=clave).first()
         
-        if compra_reciente:
-            if compra_reciente.estado_pago == 'pagado':
-                datos['compra_error'] = f"Ya realizaste esta compra (ID: {compra_reciente.id}). Revisa tu historial de compras."
-                return render(request, 'ventas/pago.html', datos)
-            elif compra_reciente.estado_pago == 'pendiente':
-                datos['compra_error'] = f"Ya tienes una compra pendiente idéntica (ID: {compra_reciente.id}). No hagas múltiples pagos."
-                return render(request, 'ventas/pago.html', datos)
-        
-        # Buscar compra pendiente para reutilizar
-        compra_existente = Compra.objects.filter(
-            usuario=usuario,
-            terma=terma,
-            fecha_visita=fecha_visita_obj,
-            estado_pago='pendiente',
-            detalles__entrada_tipo__uuid=entrada_id,
-            cantidad=int(datos.get('cantidad_entradas', 1))
-        ).first()
-        
-        if compra_existente:
-            # Verificar si la compra pendiente es reciente (últimos 30 minutos)
-            tiempo_limite_pendiente = timezone.now() - timedelta(minutes=30)
-            if compra_existente.fecha_compra > tiempo_limite_pendiente:
-                # Usar la compra existente
-                compra = compra_existente
-                datos['compra_existente'] = True
-                datos['compra_id'] = compra.id
-                print(f"[SEGURIDAD] Usando compra existente ID: {compra.id}")
-                
-                # Generar nueva preferencia para la compra existente
-                if compra.mercado_pago_id:
-                    mercado_pago_id = compra.mercado_pago_id
-                else:
-                    import uuid
-                    mercado_pago_id = f"{access_token[:10]}-{uuid.uuid4()}"
-                    compra.mercado_pago_id = mercado_pago_id
-                    compra.save()
-            else:
-                # Compra pendiente muy antigua, marcar como cancelada y crear nueva
-                compra_existente.estado_pago = 'cancelado'
-                compra_existente.save()
-                print(f"[SEGURIDAD] Compra {compra_existente.id} cancelada por timeout")
-                compra = None
-        
-        # Obtener descripción detallada de servicios extra
-        from termas.models import ServicioTerma
-        if datos.get('extras') and datos['extras'].strip():
-            try:
-                print(f"\n[DEBUG] Procesando servicios extra: {datos['extras']}")
-                
-                # Procesar múltiples servicios separados por coma
-                servicios_texto = datos['extras'].strip()
-                if servicios_texto == '-':
-                    datos['extras_descripcion'] = '-'
-                    datos['servicios_extra_ids'] = []
-                else:
-                    # Dividir por comas para obtener cada servicio
-                    servicios_individuales = [s.strip() for s in servicios_texto.split(',') if s.strip()]
-                    servicios_encontrados = []
-                    servicios_ids = []
-                    
-                    for servicio_texto in servicios_individuales:
-                        print(f"[DEBUG] Procesando servicio individual: {servicio_texto}")
-                        
-                        # Extraer nombre del servicio (antes de 'x' y los paréntesis)
-                        # Ejemplo: "Gimnasio x1 ($17.000)" -> "Gimnasio"
-                        # Ejemplo: "Masajes relajantes x2 ($28.000)" -> "Masajes relajantes"
-                        if ' x' in servicio_texto:
-                            nombre_servicio = servicio_texto.split(' x')[0].strip()
-                        else:
-                            nombre_servicio = servicio_texto.split('(')[0].strip()
-                        
-                        print(f"[DEBUG] Buscando servicio con nombre: {nombre_servicio}")
-                        
-                        # Extraer cantidad
-                        cantidad = 1
-                        if ' x' in servicio_texto:
-                            try:
-                                cantidad_texto = servicio_texto.split(' x')[1].split(' ')[0]
-                                cantidad = int(cantidad_texto)
-                            except:
-                                cantidad = 1
-                        
-                        # Buscar el servicio en la base de datos
-                        servicio = ServicioTerma.objects.filter(servicio__icontains=nombre_servicio).first()
-                        if servicio:
-                            print(f"[DEBUG] Servicio encontrado - UUID: {servicio.uuid}, Nombre: {servicio.servicio}, Cantidad: {cantidad}")
-                            # Agregar el servicio tantas veces como la cantidad especificada
-                            for _ in range(cantidad):
-                                servicios_ids.append(str(servicio.uuid))
-                            servicios_encontrados.append(f"{servicio.servicio} x{cantidad} (${servicio.precio} CLP)")
-                        else:
-                            print(f"[DEBUG] No se encontró el servicio: {nombre_servicio}")
-                    
-                    if servicios_encontrados:
-                        datos['extras_descripcion'] = ', '.join(servicios_encontrados)
-                        datos['servicios_extra_ids'] = servicios_ids
-                        # Guardar los IDs en la sesión
-                        request.session['servicios_extra_ids'] = servicios_ids
-                        print(f"[DEBUG] Servicios guardados en sesión: {servicios_ids}")
-                    else:
-                        datos['extras_descripcion'] = '-'
-                        datos['servicios_extra_ids'] = []
-                        
-            except Exception as e:
-                print(f"[DEBUG] Error al procesar servicios extra: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-                datos['extras_descripcion'] = '-'
-                datos['servicios_extra_ids'] = []
-        else:
-            datos['extras_descripcion'] = '-'
-            datos['servicios_extra_ids'] = []        
-
-        # Validar datos antes de crear la compra
-        if not usuario:
-            datos['compra_error'] = "No se encontró el usuario para la compra. Debes iniciar sesión."
-            return render(request, 'ventas/pago.html', datos)
-        
-        # Validar datos requeridos
-        if not datos.get('entrada_id'):
-            datos['compra_error'] = "No se especificó la entrada a comprar."
-            return render(request, 'ventas/pago.html', datos)
-
-        if not datos.get('total'):
-            datos['compra_error'] = "No se recibió el monto total de la compra."
-            return render(request, 'ventas/pago.html', datos)
-
-        if not terma:
-            datos['compra_error'] = "No se encontró la terma seleccionada para la compra."
-            return render(request, 'ventas/pago.html', datos)
-            
-            # Validar que la entrada exista
-        from entradas.models import EntradaTipo
-        try:
-            # Primero validar que sea un UUID válido
-            entrada_id = str(datos.get('entrada_id')).strip()
-            if not entrada_id:
-                datos['compra_error'] = "No se seleccionó ningún tipo de entrada."
-                return render(request, 'ventas/pago.html', datos)
-
-            # Validar que el tipo de entrada exista y pertenezca a la terma (buscar por UUID)
-            entrada_tipo = EntradaTipo.objects.filter(uuid=entrada_id, terma=terma, estado=True).first()
-            if not entrada_tipo:
-                datos['compra_error'] = "El tipo de entrada seleccionado no es válido para esta terma."
-                return render(request, 'ventas/pago.html', datos)
-
-            # Todo está correcto, asignar la entrada validada
-            datos['entrada_tipo'] = entrada_tipo
-
-        except (ValueError, EntradaTipo.DoesNotExist):
-            datos['compra_error'] = "La entrada seleccionada no es válida."
-            return render(request, 'ventas/pago.html', datos)
-
-        # Verificar disponibilidad usando el nuevo sistema centralizado
-        fecha_visita_para_validacion = datos.get('fecha')
-        if fecha_visita_para_validacion:
-            from datetime import datetime
+        if compra is None:
+            from django.db import IntegrityError, transaction
             from ventas.disponibilidad_utils import validar_cantidad_disponible
-            
-            fecha_visita_obj = datetime.strptime(fecha_visita_para_validacion, '%Y-%m-%d').date()
-            cantidad_solicitada = int(datos.get('cantidad_entradas', 1))
+            import uuid
             
             # Usar solo nuestro sistema de validación de disponibilidad
-            validacion = validar_cantidad_disponible(terma.id, cantidad_solicitada, fecha_visita_obj)
-            
+            validacion = validar_cantidad_disponible(terma.id, cantidad_entradas, fecha_visita_obj)
             if not validacion['es_valida']:
                 datos['compra_error'] = validacion['mensaje']
                 return render(request, 'ventas/pago.html', datos)
-
-            # CREAR LA COMPRA ANTES de generar la preferencia (solo si no existe una)
-        if not locals().get('compra'):  # Solo crear si no hay compra existente
+            
             try:
-                from ventas.models import Compra, MetodoPago, DetalleCompra
-                from entradas.models import EntradaTipo
-                from termas.models import ServicioTerma
-                import uuid
-
-                metodo_pago = MetodoPago.objects.filter(nombre__icontains="Mercado Pago").first()
-
-                # Generar un ID único para esta compra ANTES de crear la preferencia
-                mercado_pago_id = f"{access_token[:10]}-{uuid.uuid4()}"
-
-                # Validar y obtener o crear la entrada para la fecha específica
-                if not datos.get('entrada_id') or not datos.get('fecha'):
-                    raise ValueError("No se especificó el ID de la entrada o la fecha")
-
-                try:
-                    entrada_template = EntradaTipo.objects.get(uuid=datos['entrada_id'])
-                    fecha_visita = datetime.strptime(datos['fecha'], '%Y-%m-%d').date()
-                    
-                    # Obtener o crear la entrada específica para esta fecha
-                    entrada_tipo = EntradaTipo.get_entrada_para_fecha(
-                        terma=entrada_template.terma,
-                        nombre=entrada_template.nombre,
-                        fecha=fecha_visita
+                # Reserva y registro de la compra en una transacción corta; la
+                # preferencia de Mercado Pago se crea después del commit
+                with transaction.atomic():
+                    compra = _registrar_compra(
+                        checkout, usuario, terma, clave,
+                        mercado_pago_id=f"{access_token[:10]}-{uuid.uuid4()}"
                     )
-
-                    if not entrada_tipo:
-                        raise ValueError("No se pudo crear la entrada para la fecha especificada")
-
-                except Exception as e:
-                    raise ValueError(f"Error al obtener o crear la entrada para la fecha: {str(e)}")
-                
-                # Calcular precio con extras si hay
-                try:
-                    precio_unitario = float(datos['precio'].replace(',', '.')) if datos.get('precio') else 0.0
-                    cantidad = int(datos['cantidad_entradas']) if datos.get('cantidad_entradas') else 1
-                    if cantidad <= 0:
-                        raise ValueError("La cantidad debe ser mayor a 0")
-                    subtotal = precio_unitario * cantidad
-                except (ValueError, TypeError) as e:
-                    raise ValueError(f"Error en los datos de precio o cantidad: {str(e)}")
-                    raise ValueError(f"Error en los datos de precio o cantidad: {str(e)}")
-
-                # Crear la compra
-                compra = Compra.objects.create(
-                    usuario=usuario,
-                    metodo_pago=metodo_pago,
-                    terma=terma,
-                    fecha_visita=datos['fecha'] if datos['fecha'] else None,
-                    total=datos['total'] if datos['total'] else 0,
-                    estado_pago="pendiente",
-                    mercado_pago_id=mercado_pago_id,
-                    cantidad=cantidad,
-                )
-                
-                # Crear el detalle de compra
-                print(f"\n[DEBUG] Creando detalle de compra...")
-                detalle = DetalleCompra.objects.create(
-                    compra=compra,
-                    entrada_tipo=entrada_tipo,
-                    cantidad=cantidad,
-                    precio_unitario=precio_unitario,
-                    subtotal=subtotal
-                )
-                print(f"[DEBUG] Detalle creado: ID={detalle.id}")
-                
-                # Reducir cupos disponibles
-                entrada_tipo.reducir_cupos(cantidad)
-                
                 print(f"[NUEVA COMPRA] Compra creada: id={compra.id}, mercado_pago_id={compra.mercado_pago_id}")
-
-            except Exception as e:
+            except IntegrityError:
+                # Un envío simultáneo con la misma clave ganó la carrera
+                compra = Compra.objects.filter(usuario=usuario, clave_idempotencia=clave).first()
+                if compra is None:
+                    raise
+            except ValueError as e:
                 datos['compra_error'] = f"Error al guardar la compra: {str(e)}"
                 return render(request, 'ventas/pago.html', datos)
         else:
-            print(f"[COMPRA EXISTENTE] Usando compra existente: id={compra.id}, estado={compra.estado_pago}")
-            # Para compra existente, obtener el detalle para procesar servicios extra
-            detalle = compra.detalles.first()
-            if not detalle:
-                datos['compra_error'] = "Error: La compra existente no tiene detalles válidos."
-                return render(request, 'ventas/pago.html', datos)
-            
-        # Procesar servicios extra (tanto para compras nuevas como existentes)
-        # Debug de datos recibidos
-        print(f"[DEBUG] Datos de extras recibidos: {datos.get('extras', 'No hay extras')}")
-        print(f"[DEBUG] Tipo de datos extras: {type(datos.get('extras', ''))}")
+            logger.info(f"Reintento idempotente de la compra {compra.id} (estado: {compra.estado_pago})")
         
-        # Agregar servicios extra
-        try:
-            if 'servicios_extra_ids' in request.session and request.session['servicios_extra_ids']:
-                from .models import ServicioExtraDetalle
-                servicios_ids = request.session['servicios_extra_ids']
-                print(f"\n[DEBUG] Recuperando servicios_extra_ids de sesión: {servicios_ids}")
-                
-                # Crear diccionario para contar servicios
-                servicios_conteo = {}
-                for servicio_id in servicios_ids:
-                    servicios_conteo[servicio_id] = servicios_conteo.get(servicio_id, 0) + 1
-                
-                print(f"[DEBUG] Conteo de servicios: {servicios_conteo}")
-                
-                # Limpiar servicios existentes del método anterior
-                detalle.servicios.clear()
-                
-                # Crear registros en ServicioExtraDetalle
-                for servicio_id, cantidad in servicios_conteo.items():
-                    try:
-                        servicio = ServicioTerma.objects.get(uuid=servicio_id)
-                        ServicioExtraDetalle.objects.create(
-                            detalle_compra=detalle,
-                            servicio=servicio,
-                            cantidad=cantidad,
-                            precio_unitario=servicio.precio
-                        )
-                        print(f"[DEBUG] ServicioExtraDetalle creado: {servicio.servicio} x{cantidad}")
-                    except ServicioTerma.DoesNotExist:
-                        print(f"[DEBUG] Servicio no encontrado con UUID: {servicio_id}")
-                
-                # Guardar explícitamente
-                detalle.save()
-                
-                # Verificar que se guardaron
-                servicios_extra_guardados = detalle.servicios_extra.all()
-                print(f"[DEBUG] Total servicios extra guardados: {len(servicios_extra_guardados)}")
-                for extra in servicios_extra_guardados:
-                    print(f"[DEBUG] - {extra.servicio.servicio} x{extra.cantidad}")
-                
-                # Limpiar la sesión
-                del request.session['servicios_extra_ids']
-            
-            # Mantener compatibilidad con el código anterior (servicios individuales)
-            elif 'servicio_extra_id' in request.session:
-                servicio_id = request.session['servicio_extra_id']
-                print(f"\n[DEBUG] Recuperando servicio_extra_id individual de sesión: {servicio_id}")
-                
-                servicio = ServicioTerma.objects.get(uuid=servicio_id)
-                print(f"[DEBUG] Servicio encontrado para agregar: {servicio.servicio}")
-                
-                # Limpiar servicios existentes y agregar el nuevo
-                detalle.servicios.clear()
-                detalle.servicios.add(servicio)
-                
-                # Guardar explícitamente
-                detalle.save()
-                
-                # Verificar que se guardó
-                servicios_guardados = list(detalle.servicios.all())
-                print(f"[DEBUG] Servicios guardados en detalle {detalle.id}: {[s.servicio for s in servicios_guardados]}")
-                
-                # Limpiar la sesión
-                del request.session['servicio_extra_id']
-        except Exception as e:
-            print(f"[DEBUG] Error al agregar servicios extra: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            try:
-                # Asegurarnos de limpiar la sesión en caso de error
-                if 'servicios_extra_ids' in request.session:
-                    del request.session['servicios_extra_ids']
-                if 'servicio_extra_id' in request.session:
-                    del request.session['servicio_extra_id']
-            except:
-                pass
-
-        # Mercado Pago integración
-        env_base = os.getenv('MP_BASE_URL')
-        if env_base:
-            base_url = env_base.rstrip('/')
-        else:
-            base_url = request.build_absolute_uri('/')[:-1]
-        
-        # Obtener el total real desde el input_total que incluye entradas y servicios
-        total = float(datos.get('total', '0').replace('.', '').replace(',', '.'))
-        
-        # Crear un solo ítem con el total completo
-        items = [{
-            "title": f"Reserva: {datos['experiencia']} - {datos.get('cantidad_entradas', 1)} entrada(s)",
-            "quantity": 1,
-            "unit_price": total,
-            "currency_id": "CLP",
-            "description": f"Incluye: {datos.get('incluidos', '-')}. Servicios extra: {datos.get('extras_descripcion', '-')}"
-        }]
-
-        preference_data = {
-            "items": items,
-            "external_reference": mercado_pago_id,  
-            "back_urls": {
-                "success": f"{base_url}/ventas/pago/success/",  
-                "failure": f"{base_url}/ventas/pago/failure/",
-                "pending": f"{base_url}/ventas/pago/pending/"
-            },
-            "auto_return": "approved",
-            "notification_url": f"{base_url}/ventas/webhook/mercadopago/",  
-            "statement_descriptor": "TERMAS",
-            "metadata": {
-                "compra_uuid": str(compra.uuid),
-                "usuario_uuid": str(usuario.uuid),
-                "terma_uuid": str(terma.uuid)
-            }
-        }
-        
-        preference_response = sdk.preference().create(preference_data)
-        response_data = preference_response.get("response", {})
+        datos['compra_id'] = compra.id
+        if compra.estado_pago == 'pagado':
+            datos['compra_error'] = f"Ya realizaste esta compra (ID: {compra.id}). Revisa tu historial de compras."
+            return render(request, 'ventas/pago.html', datos)
+        if compra.estado_pago != 'pendiente':
+            datos['compra_error'] = "Esta reserva ya no está vigente. Recarga la página para iniciar una nueva compra."
+            return render(request, 'ventas/pago.html', datos)
         
-        if "init_point" in response_data:
-            datos['mercadopago_url'] = response_data["init_point"]
+        if compra.mercado_pago_url:
+            datos['mercadopago_url'] = compra.mercado_pago_url
         else:
-            datos['mercadopago_error'] = response_data.get("message", "No se pudo generar el enlace de pago. Intenta nuevamente.")
-            compra.estado_pago = "error"
-            compra.save()
+            # Si falla, la compra queda pendiente sin enlace y un reintento con
+            # la misma clave vuelve a intentarlo
+            url, error = _crear_preferencia_pago(sdk, request, compra, usuario, terma, datos.get('incluidos'))
+            if url:
+                datos['mercadopago_url'] = url
+            else:
+                datos['mercadopago_error'] = error
 
     # Si no está en POST, no hay datos adicionales que procesar
     
     # Agregar información de duración si tenemos la entrada
     if datos.get('entrada_id'):
         from entradas.models import EntradaTipo
-        entrada_tipo = EntradaTipo.objects.filter(uuid=datos['entrada_id']).first()
+        entrada_tipo = datos.get('entrada_tipo') or EntradaTipo.objects.filter(uuid=datos['entrada_id']).first()
         if entrada_tipo:
             datos['duracion_horas'] = entrada_tipo.duracion_horas
             datos['duracion_tipo'] = entrada_tipo.get_duracion_tipo_display()
@@ -623,7 +416,8 @@ def mercadopago_webhook(request):
             if resource_type == 'payment' and resource_id:
                 # SIEMPRE consultar la API de MP
                 sdk = mercadopago.SDK(access_token)
-                payment_info = sdk.payment().get(resource_id)
+                with span('mercadopago_payment_get'):
+                    payment_info = sdk.payment().get(resource_id)
                 if payment_info['status'] == 200:
                     payment_data = payment_info['response']
                     external_reference = payment_data.get('external_reference')
@@ -709,6 +503,7 @@ def mercadopago_webhook(request):
 def pago_exitoso(request):
     import os
     import mercadopago
+    from ventas.grafo_compra import CompraGraph
     from ventas.models import Compra
     from django.utils import timezone
     
@@ -721,6 +516,7 @@ def pago_exitoso(request):
     print(f"[PAGO_EXITOSO] payment_id: {payment_id}, preference_id: {preference_id}, status: {status}")
     
     compra = None
+    grafo = None
     error_message = None
     
     # Si el pago fue aprobado, actualizar la compra y enviar correo
@@ -729,7 +525,8 @@ def pago_exitoso(request):
             # Consultar la API de Mercado Pago para obtener el external_reference
             access_token = os.getenv("MP_ACCESS_TOKEN")
             sdk = mercadopago.SDK(access_token)
-            payment_info = sdk.payment().get(payment_id)
+            with span('mercadopago_payment_get'):
+                payment_info = sdk.payment().get(payment_id)
             
             if payment_info['status'] == 200:
                 payment_data = payment_info['response']
@@ -738,12 +535,9 @@ def pago_exitoso(request):
                 print(f"[PAGO_EXITOSO] external_reference: {external_reference}")
                 
                 if external_reference:
-                    # Buscar la compra por el external_reference con todas sus relaciones
-                    compra = Compra.objects.select_related('terma').prefetch_related(
-                        'detalles',
-                        'detalles__entrada_tipo',
-                        'detalles__entrada_tipo__terma'
-                    ).filter(
+                    # Buscar la compra por el external_reference; sus relaciones
+                    # se cargan después en un solo CompraGraph
+                    compra = Compra.objects.filter(
                         mercado_pago_id=str(external_reference),
                         estado_pago="pendiente"
                     ).first()
@@ -805,12 +599,15 @@ def pago_exitoso(request):
                                 print(f"[PAGO_EXITOSO] Error en distribución de pago: {str(e)}")
                                 print(traceback.format_exc())
                             
+                            # El grafo (con QR y distribución) sirve al correo y a la página
+                            grafo = CompraGraph.cargar_uno(compra.id)
+                            
                             # Enviar correo con la entrada
                             try:
                                 from ventas.utils import enviar_entrada_por_correo
                                 print(f"[PAGO_EXITOSO] Preparando envío de correo para compra {compra.id}")
                                 logger.info("[PAGO_EXITOSO] Procesando compra de usuario")
-                                correo_enviado = enviar_entrada_por_correo(compra)
+                                correo_enviado = enviar_entrada_por_correo(grafo)
                                 if correo_enviado:
                                     print(f"[PAGO_EXITOSO] Correo enviado exitosamente para la compra {compra.id}")
                                 else:
@@ -873,14 +670,17 @@ def pago_exitoso(request):
     elif status != 'approved':
         error_message = f"El pago no fue aprobado. Estado: {status}"
     
+    if compra is not None and grafo is None:
+        grafo = CompraGraph.cargar_uno(compra.id)
+    
     context = {
         'payment_id': payment_id,
         'collection_id': collection_id,
         'preference_id': preference_id,
         'status': status,
-        'compra': compra,
+        'compra': grafo,
         'error_message': error_message,
-        'success': compra is not None and compra.estado_pago == 'pagado'
+        'success': grafo is not None and grafo.estado_pago == 'pagado'
     }
     
     return render(request, 'ventas/pago_exitoso.html', context)
@@ -918,7 +718,8 @@ def pago_pendiente(request):
             
             access_token = os.getenv("MP_ACCESS_TOKEN")
             sdk = mercadopago.SDK(access_token)
-            payment_info = sdk.payment().get(payment_id)
+            with span('mercadopago_payment_get'):
+                payment_info = sdk.payment().get(payment_id)
             
             if payment_info['status'] == 200:
                 payment_data = payment_info['response']